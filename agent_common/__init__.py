@@ -0,0 +1,3 @@
+"""
+Shared runtime support for the ADK/A2A agent services.
+"""
@@ -0,0 +1,302 @@
+"""Prompt-prefix caching for agents whose requests repeat a long static prefix.
+
+The grading agent's instruction and a class's topics block are identical for
+every submission in that class. The backend marks the topics block with the
+class and a knowledge version:
+
+    <Topics class_id="12" version="3f9a...">[...]</Topics>
+
+Before each model call, the block and the system instruction are moved into
+cached content keyed by (model, class, version). The request then references
+the cache by name. Caches are refreshed before their TTL runs out. A new
+knowledge version replaces the class's old cache. If caching fails (prefix
+below the model's minimum, unsupported model, API error) the request goes out
+unchanged and that key is not retried for PROMPT_CACHE_RETRY_SECONDS.
+
+PROMPT_CACHE picks the backend: `genai` (default; the Gemini caching API),
+`local` (an in-process stand-in with the same behaviour, for tests and the
+stub agent) or `off`.
+"""
+import asyncio
+import logging
+import os
+import re
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+PROMPT_CACHE = os.getenv("PROMPT_CACHE", "genai").lower()
+PROMPT_CACHE_TTL_SECONDS = int(os.getenv("PROMPT_CACHE_TTL_SECONDS", "3600"))
+PROMPT_CACHE_RETRY_SECONDS = int(os.getenv("PROMPT_CACHE_RETRY_SECONDS", "600"))
+# Gemini won't cache fewer tokens than this; the local stand-in enforces it too
+PROMPT_CACHE_MIN_TOKENS = int(os.getenv("PROMPT_CACHE_MIN_TOKENS", "1024"))
+REFRESH_FRACTION = 0.2  # Extend the TTL once less than this share of it is left
+EXPIRY_MARGIN_SECONDS = 30  # Never hand out a cache this close to expiring
+
+SNAPSHOT_RE = re.compile(
+    r'<Topics class_id="(?P<class_id>[^"]+)" version="(?P<version>[^"]+)">.*?</Topics>',
+    re.DOTALL,
+)
+
+CacheKey = Tuple[str, str, str]  # (model, class_id, version)
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters a token) for the local stand-in."""
+    return max(1, len(text) // 4)
+
+
+def find_snapshot(text: str) -> Optional[re.Match]:
+    return SNAPSHOT_RE.search(text or "")
+
+
+class CacheUnavailable(Exception):
+    """The prefix could not be cached; send the request uncached."""
+
+
+@dataclass
+class CacheEntry:
+    name: str
+    expires_at: float
+    tokens: int
+
+
+# ==========================================
+# Backends
+# ==========================================
+
+
+class LocalCacheBackend:
+    """In-process stand-in for the caching API: names, TTLs, minimum size and token counts."""
+
+    def __init__(self, min_tokens: int = PROMPT_CACHE_MIN_TOKENS):
+        self.min_tokens = min_tokens
+        self.caches: Dict[str, CacheEntry] = {}
+        self.created = 0
+
+    async def create(self, model: str, system_instruction: str, prefix: str, ttl: int, display_name: str) -> CacheEntry:
+        tokens = estimate_tokens(system_instruction or "") + estimate_tokens(prefix)
+        if tokens < self.min_tokens:
+            raise CacheUnavailable(f"{tokens} tokens is below the minimum of {self.min_tokens}")
+        self.created += 1
+        entry = CacheEntry(f"cachedContents/local-{self.created}", time.time() + ttl, tokens)
+        self.caches[entry.name] = entry
+        return entry
+
+    async def refresh(self, entry: CacheEntry, ttl: int) -> CacheEntry:
+        if entry.name not in self.caches:
+            raise CacheUnavailable(f"{entry.name} has expired")
+        entry = CacheEntry(entry.name, time.time() + ttl, entry.tokens)
+        self.caches[entry.name] = entry
+        return entry
+
+    async def delete(self, entry: CacheEntry) -> None:
+        self.caches.pop(entry.name, None)
+
+    def tokens(self, name: str) -> int:
+        """Cached tokens a request referencing this cache would be billed for, 0 if it has expired."""
+        entry = self.caches.get(name)
+        return entry.tokens if entry and entry.expires_at > time.time() else 0
+
+
+class GenaiCacheBackend:
+    """Gemini explicit context caching through google-genai's async client."""
+
+    def __init__(self, client=None):
+        self._client = client
+
+    @property
+    def client(self):
+        if self._client is None:
+            from google import genai
+
+            self._client = genai.Client()
+        return self._client
+
+    async def create(self, model: str, system_instruction, prefix: str, ttl: int, display_name: str) -> CacheEntry:
+        from google.genai import types
+
+        try:
+            cache = await self.client.aio.caches.create(
+                model=model,
+                config=types.CreateCachedContentConfig(
+                    display_name=display_name,
+                    system_instruction=system_instruction,
+                    contents=[types.Content(role="user", parts=[types.Part(text=prefix)])],
+                    ttl=f"{ttl}s",
+                ),
+            )
+        except Exception as e:
+            raise CacheUnavailable(str(e)) from e
+        tokens = cache.usage_metadata.total_token_count if cache.usage_metadata else 0
+        return CacheEntry(cache.name, time.time() + ttl, tokens or 0)
+
+    async def refresh(self, entry: CacheEntry, ttl: int) -> CacheEntry:
+        from google.genai import types
+
+        try:
+            await self.client.aio.caches.update(name=entry.name, config=types.UpdateCachedContentConfig(ttl=f"{ttl}s"))
+        except Exception as e:
+            raise CacheUnavailable(str(e)) from e
+        return CacheEntry(entry.name, time.time() + ttl, entry.tokens)
+
+    async def delete(self, entry: CacheEntry) -> None:
+        try:
+            await self.client.aio.caches.delete(name=entry.name)
+        except Exception as e:
+            logger.warning(f"Could not delete prompt cache {entry.name}: {e}")
+
+
+# ==========================================
+# Cache
+# ==========================================
+
+
+class PromptPrefixCache:
+    """Cached-content handles by (model, class, knowledge version), plus per-call token accounting."""
+
+    def __init__(self, backend, ttl: int = PROMPT_CACHE_TTL_SECONDS, retry_seconds: int = PROMPT_CACHE_RETRY_SECONDS):
+        self.backend = backend
+        self.ttl = ttl
+        self.retry_seconds = retry_seconds
+        self.entries: Dict[CacheKey, CacheEntry] = {}
+        self.unavailable_until: Dict[CacheKey, float] = {}
+        self._locks: Dict[CacheKey, asyncio.Lock] = {}
+        self.stats = {
+            "calls": 0,
+            "cache_hits": 0,
+            "cache_creates": 0,
+            "cache_refreshes": 0,
+            "fallbacks": 0,
+            "cached_tokens": 0,
+            "uncached_tokens": 0,
+            "output_tokens": 0,
+        }
+
+    async def get(self, key: CacheKey, system_instruction, prefix: str) -> Optional[CacheEntry]:
+        """A live cache for key, created or refreshed as needed; None means send uncached."""
+        now = time.time()
+        if self.unavailable_until.get(key, 0) > now:
+            self.stats["fallbacks"] += 1
+            return None
+        # One create per key even when a whole class submits at once
+        async with self._locks.setdefault(key, asyncio.Lock()):
+            entry = self.entries.get(key)
+            if entry and entry.expires_at - EXPIRY_MARGIN_SECONDS > time.time():
+                if entry.expires_at - time.time() < max(self.ttl * REFRESH_FRACTION, 2 * EXPIRY_MARGIN_SECONDS):
+                    entry = await self._refresh(key, entry)
+                if entry:
+                    self.stats["cache_hits"] += 1
+                    return entry
+            return await self._create(key, system_instruction, prefix)
+
+    async def _refresh(self, key: CacheKey, entry: CacheEntry) -> Optional[CacheEntry]:
+        try:
+            entry = await self.backend.refresh(entry, self.ttl)
+        except CacheUnavailable as e:
+            logger.info(f"Prompt cache refresh failed for {key}, recreating: {e}")
+            self.entries.pop(key, None)
+            return None
+        self.entries[key] = entry
+        self.stats["cache_refreshes"] += 1
+        return entry
+
+    async def _create(self, key: CacheKey, system_instruction, prefix: str) -> Optional[CacheEntry]:
+        model, class_id, version = key
+        try:
+            entry = await self.backend.create(model, system_instruction, prefix, self.ttl, f"class-{class_id}-{version}")
+        except CacheUnavailable as e:
+            logger.info(f"Prompt caching unavailable for {key}, sending uncached: {e}")
+            self.unavailable_until[key] = time.time() + self.retry_seconds
+            self.stats["fallbacks"] += 1
+            return None
+        self.stats["cache_creates"] += 1
+        logger.info(f"Created prompt cache {entry.name} for {key} ({entry.tokens} tokens)")
+        # The class's knowledge changed; its older snapshots won't be used again
+        for old_key in [k for k in self.entries if k[:2] == key[:2] and k != key]:
+            self._locks.pop(old_key, None)
+            await self.backend.delete(self.entries.pop(old_key))
+        self.entries[key] = entry
+        return entry
+
+    def record_usage(self, prompt_tokens: int, cached_tokens: int, output_tokens: int) -> dict:
+        usage = {
+            "cached_tokens": cached_tokens,
+            "uncached_tokens": max(0, prompt_tokens - cached_tokens),
+            "output_tokens": output_tokens,
+        }
+        self.stats["calls"] += 1
+        for name, value in usage.items():
+            self.stats[name] += value
+        return usage
+
+
+def create_prompt_cache(mode: str = PROMPT_CACHE) -> Optional[PromptPrefixCache]:
+    if mode == "off":
+        return None
+    if mode == "local":
+        return PromptPrefixCache(LocalCacheBackend())
+    return PromptPrefixCache(GenaiCacheBackend())
+
+
+# ==========================================
+# ADK callbacks
+# ==========================================
+
+
+def _request_texts(llm_request):
+    for content in llm_request.contents or []:
+        if content.role == "user":
+            for part in content.parts or []:
+                if part.text:
+                    yield part.text
+
+
+def _strip_snapshots(llm_request):
+    # Contents may share objects with the session's events, so they are copied, not edited
+    for i, content in enumerate(llm_request.contents or []):
+        if content.role != "user" or not any(p.text and find_snapshot(p.text) for p in content.parts or []):
+            continue
+        parts = [
+            p.model_copy(update={"text": SNAPSHOT_RE.sub("", p.text)}) if p.text else p
+            for p in content.parts
+        ]
+        llm_request.contents[i] = content.model_copy(update={"parts": parts})
+
+
+def prompt_cache_callbacks(cache: Optional[PromptPrefixCache]):
+    """(before_model_callback, after_model_callback) for an LlmAgent."""
+
+    async def before_model(callback_context, llm_request):
+        if cache is None:
+            return None
+        texts = list(_request_texts(llm_request))
+        # The latest message's snapshot is the one to cache
+        match = next((m for m in (find_snapshot(t) for t in reversed(texts)) if m), None)
+        if match is None:
+            return None
+        key = (llm_request.model, match["class_id"], match["version"])
+        entry = await cache.get(key, llm_request.config.system_instruction, match.group(0))
+        if entry is None:
+            return None
+        # Cached content carries the instruction; the API rejects both at once
+        llm_request.config.cached_content = entry.name
+        llm_request.config.system_instruction = None
+        _strip_snapshots(llm_request)
+        return None
+
+    async def after_model(callback_context, llm_response):
+        usage = llm_response.usage_metadata
+        if cache is None or usage is None or llm_response.partial:
+            return None
+        counts = cache.record_usage(
+            usage.prompt_token_count or 0,
+            usage.cached_content_token_count or 0,
+            usage.candidates_token_count or 0,
+        )
+        logger.info(f"Model call tokens for {callback_context.agent_name}: {counts}")
+        return None
+
+    return before_model, after_model
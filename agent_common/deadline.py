@@ -0,0 +1,76 @@
+"""Deadline propagation for the agents' A2A apps.
+
+The backend sends its remaining budget for each call as `X-Request-Timeout`
+(seconds). Work on a request is cancelled once that budget is spent, so a
+model call nobody is waiting for stops using a slot; requests that arrive
+already expired are rejected without starting.
+"""
+import asyncio
+import json
+import logging
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+TIMEOUT_HEADER = b"x-request-timeout"
+
+request_deadline: ContextVar[Optional[float]] = ContextVar("request_deadline", default=None)
+
+
+def remaining_seconds() -> Optional[float]:
+    """Time left for the request being handled, or None when the caller set no deadline."""
+    deadline = request_deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+class DeadlineMiddleware:
+    """ASGI middleware enforcing the caller's X-Request-Timeout."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        timeout = None
+        for name, value in scope.get("headers", []):
+            if name == TIMEOUT_HEADER:
+                try:
+                    timeout = float(value)
+                except ValueError:
+                    pass
+        if timeout is None:
+            return await self.app(scope, receive, send)
+        if timeout <= 0:
+            return await self._reject(send)
+
+        started = [False]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                started[0] = True
+            await send(message)
+
+        token = request_deadline.set(time.monotonic() + timeout)
+        try:
+            await asyncio.wait_for(self.app(scope, receive, send_wrapper), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Request to {scope.get('path')} cancelled at its {timeout:.1f}s deadline")
+            if not started[0]:
+                await self._reject(send)
+        finally:
+            request_deadline.reset(token)
+
+    async def _reject(self, send):
+        body = json.dumps({"detail": "Deadline exceeded"}).encode()
+        await send({"type": "http.response.start", "status": 504,
+                    "headers": [(b"content-type", b"application/json")]})
+        await send({"type": "http.response.body", "body": body})
+
+
+def with_deadlines(app):
+    """Adds DeadlineMiddleware to a Starlette app and returns it."""
+    app.add_middleware(DeadlineMiddleware)
+    return app
@@ -0,0 +1,79 @@
+"""
+Output schemas the agents request as structured output (LlmAgent
+output_schema), so replies are plain JSON in a known shape. The backend
+validates against lenient copies in backend/app/services/agent_output.py;
+keep the two in step.
+"""
+from typing import List, Optional
+
+from pydantic import BaseModel, Field
+
+
+# ==========================================
+# Grading
+# ==========================================
+
+
+class QuestionScore(BaseModel):
+    question_id: int
+    marks: float = Field(ge=0.0, le=10.0)
+    feedback: str
+    confidence: float = Field(ge=0.0, le=1.0)  # How sure the grader is of the marks
+
+
+class TopicScore(BaseModel):
+    topic_id: int
+    marks: float = Field(ge=0.0, le=10.0)
+    feedback: str
+
+
+class GradingResult(BaseModel):
+    """Field order is the order the model writes them; question scores come first so they can be streamed."""
+
+    question_scores: List[QuestionScore]
+    topic_scores: List[TopicScore]
+    assignment_marks: float
+    feedback: str
+
+
+# ==========================================
+# Resource analysis
+# ==========================================
+
+
+class AnalysisTopic(BaseModel):
+    id: str
+    name: str
+    outline: str
+
+
+class AnalysisKeyConcept(BaseModel):
+    id: str
+    name: str
+    description: str
+    occurence_id: str  # Spelling used by the analyser prompts; the backend accepts either
+    timestamp_start: Optional[int] = None
+    timestamp_end: Optional[int] = None
+    page_number: Optional[int] = None
+    section: Optional[str] = None
+
+
+class AnalysisOccurrence(BaseModel):
+    id: str
+    topic_id: str
+    resource_id: Optional[str] = None
+
+
+class AnalysisResult(BaseModel):
+    summary: str
+    topics: List[AnalysisTopic]
+    key_concepts: List[AnalysisKeyConcept]
+    occurrences: List[AnalysisOccurrence]
+
+
+class AnalysisEvaluation(BaseModel):
+    """The evaluator agent's verdict on an analysis, for sampled quality checks."""
+
+    score: int = Field(ge=1, le=5)
+    complete: bool
+    issues: List[str]
@@ -0,0 +1,154 @@
+"""Soak test of the grading agent's session stores, on a stub model.
+
+    python -m agent_common.session_soak --submissions 10000 --contexts 2000
+
+sends submissions for random (assignment, student) contexts, so most are
+resubmissions, through the grading agent. Each goes in as the A2A executor
+sends it: the session is looked up by contextId, or created. The test runs
+once per store: `unbounded` (ADK's InMemorySessionService, the old behaviour)
+and agent_common.sessions' `memory`, `stateless` and `sql`. Each store gets
+its own process, so their RSS can be compared.
+
+Every --report submissions it prints the sessions and events held, the bytes
+they take, and the mean, p95 and max prompt tokens of the model calls in that
+window.
+"""
+import argparse
+import asyncio
+import json
+import os
+import pickle
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+MODES = ("unbounded", "memory", "stateless", "sql")
+
+
+def _topics(assignment: int) -> list:
+    return [
+        {"topic_id": assignment * 10 + t, "topic_name": f"Topic {t} of assignment {assignment}",
+         "key_concepts": [f"Concept {t}.{c}: " + "definition and worked example " * 4 for c in range(4)]}
+        for t in range(3)
+    ]
+
+
+def submission_text(assignment: int, student: int, attempt: int) -> str:
+    """The backend's grading prompt (agent_service.build_grading_payload) for one submission."""
+    submission = [
+        {f"question{i}": f"Question {i} of assignment {assignment}?",
+         f"answer{i}": f"Attempt {attempt} by student {student}: " + "an explanation of the idea " * 6,
+         "question_id": assignment * 100 + i}
+        for i in range(1, 6)
+    ]
+    return (f"<Topics>\n{json.dumps(_topics(assignment), indent=4)}\n</Topics>\n\n"
+            "Please grade the following assignment submission based on the provided grading guide.\n\n"
+            f"<Submission>\n{json.dumps(submission, indent=4)}\n</Submission>")
+
+
+def session_service_for(mode: str, args):
+    from google.adk.sessions import InMemorySessionService
+
+    from agent_common.sessions import BoundedSessionService, _database_session_service
+
+    limits = {"max_sessions": args.max_sessions, "ttl_seconds": args.ttl, "history": args.history}
+    if mode == "unbounded":
+        return InMemorySessionService()
+    if mode == "stateless":
+        return BoundedSessionService(**{**limits, "history": 0})
+    if mode == "sql":
+        return _database_session_service()(f"sqlite:///{args.db}", **limits, sweep_seconds=args.sweep)
+    return BoundedSessionService(**limits)
+
+
+def held(service, mode: str, args) -> dict:
+    if mode == "sql":
+        return {**service.stats(), "bytes": os.path.getsize(args.db)}
+    sessions = [s for users in service.sessions.values() for ss in users.values() for s in ss.values()]
+    return {
+        "sessions": len(sessions),
+        "events": sum(len(s.events) for s in sessions),
+        "bytes": len(pickle.dumps(service.sessions)),
+    }
+
+
+async def run_mode(args) -> list:
+    os.environ.setdefault("GOOGLE_API_KEY", "stub")
+    os.environ["PROMPT_CACHE"] = "off"
+    from google.adk.runners import Runner
+    from google.genai import types
+
+    from agent_common.stub_model import StubLlm, use_stub_model
+    from grading_agent.agent import root_agent
+
+    model = use_stub_model(root_agent, StubLlm())
+    service = session_service_for(args.mode, args)
+    runner = Runner(app_name=root_agent.name, agent=root_agent, session_service=service)
+    rng = random.Random(args.seed)
+    attempts, window, reports = {}, [], []
+    started = time.perf_counter()
+
+    for n in range(1, args.submissions + 1):
+        context = rng.randrange(args.contexts)
+        assignment, student = divmod(context, 100)
+        attempts[context] = attempts.get(context, 0) + 1
+        context_id, user_id = f"grade_{assignment}_{student}", f"A2A_USER_grade_{assignment}_{student}"
+        # As A2aAgentExecutor._prepare_session does
+        session = await service.get_session(app_name=runner.app_name, user_id=user_id, session_id=context_id)
+        if session is None:
+            await service.create_session(app_name=runner.app_name, user_id=user_id, state={}, session_id=context_id)
+        message = types.Content(role="user", parts=[types.Part(text=submission_text(assignment, student, attempts[context]))])
+        tokens_before = model.prompt_tokens
+        async for _ in runner.run_async(user_id=user_id, session_id=context_id, new_message=message):
+            pass
+        window.append(model.prompt_tokens - tokens_before)
+
+        if n % args.report == 0:
+            window.sort()
+            reports.append({
+                "mode": args.mode,
+                "submissions": n,
+                **held(service, args.mode, args),
+                "rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024),
+                "prompt_tokens_mean": round(statistics.mean(window)),
+                "prompt_tokens_p95": window[int(len(window) * 0.95) - 1],
+                "prompt_tokens_max": window[-1],
+                "seconds": round(time.perf_counter() - started, 1),
+            })
+            window = []
+    return reports
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mode", choices=MODES + ("all",), default="all")
+    parser.add_argument("--submissions", type=int, default=10000)
+    parser.add_argument("--contexts", type=int, default=2000, help="Distinct (assignment, student) pairs")
+    parser.add_argument("--report", type=int, default=2000, help="Submissions between reports")
+    parser.add_argument("--max-sessions", type=int, default=1000)
+    parser.add_argument("--ttl", type=int, default=3600)
+    parser.add_argument("--history", type=int, default=2)
+    parser.add_argument("--sweep", type=float, default=1.0, help="Seconds between the sql store's evictions")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--db", default=os.path.join(tempfile.gettempdir(), "session_soak.db"))
+    args = parser.parse_args(argv)
+
+    if args.mode != "all":
+        if args.mode == "sql" and os.path.exists(args.db):
+            os.remove(args.db)
+        for report in asyncio.run(run_mode(args)):
+            print(json.dumps(report), flush=True)
+        return
+    for mode in MODES:
+        cmd = [sys.executable, "-m", "agent_common.session_soak", "--mode", mode] + [
+            f"--{name.replace('_', '-')}={value}" for name, value in vars(args).items() if name != "mode"
+        ]
+        subprocess.run(cmd, check=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,303 @@
+"""Bounded ADK session stores for the A2A agents.
+
+ADK's to_a2a() keeps every session in memory for the life of the process.
+The session key is the A2A contextId the backend sends (`ctx_{resource_id}`,
+`grade_{assignment}_{student}`), so the store grows with every resource and
+student. A resubmission also replays its whole growing history to the model.
+
+AGENT_SESSIONS picks the store:
+
+* `memory` (default): in-process. Keeps at most AGENT_SESSION_MAX sessions
+  (least recently used go first). Sessions unused for
+  AGENT_SESSION_TTL_SECONDS are dropped.
+* `stateless`: `memory` with no history. Each request sees only its own
+  messages, which suits one-shot work like grading.
+* `sql`: ADK's DatabaseSessionService at AGENT_SESSION_DB_URL, bounded the
+  same way by a sweep in a worker thread at most every
+  AGENT_SESSION_SWEEP_SECONDS. Sessions survive restarts and can be shared
+  by replicas.
+
+All three keep only the last AGENT_SESSION_HISTORY earlier invocations of a
+session, both in what is stored and in what is replayed to the model. An
+invocation is one A2A request with its agent turns. A session's state is
+kept.
+
+to_a2a() builds the agent's A2A app like ADK's to_a2a(), on one of these
+stores. Its task store is capped at AGENT_SESSION_MAX tasks too.
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Any, List, Optional, Tuple
+
+from google.adk.events import Event
+from google.adk.sessions import InMemorySessionService, Session
+from google.adk.sessions.base_session_service import GetSessionConfig
+
+logger = logging.getLogger(__name__)
+
+AGENT_SESSIONS = os.getenv("AGENT_SESSIONS", "").lower()
+AGENT_SESSION_MAX = int(os.getenv("AGENT_SESSION_MAX", "1000"))
+AGENT_SESSION_TTL_SECONDS = int(os.getenv("AGENT_SESSION_TTL_SECONDS", "3600"))
+AGENT_SESSION_HISTORY = int(os.getenv("AGENT_SESSION_HISTORY", "2"))
+AGENT_SESSION_SWEEP_SECONDS = float(os.getenv("AGENT_SESSION_SWEEP_SECONDS", "30"))
+AGENT_SESSION_DB_URL = os.getenv("AGENT_SESSION_DB_URL", "sqlite:///./agent_sessions.db")
+
+SessionKey = Tuple[str, str, str]  # (app_name, user_id, session_id)
+
+
+def split_history(events: List[Event], history: int) -> Tuple[List[Event], List[Event]]:
+    """(dropped, kept): kept is the events of the session's last `history` invocations."""
+    invocations = list(dict.fromkeys(e.invocation_id for e in events))
+    keep = set(invocations[-history:]) if history > 0 else set()
+    return [e for e in events if e.invocation_id not in keep], [e for e in events if e.invocation_id in keep]
+
+
+class BoundedSessionService(InMemorySessionService):
+    """InMemorySessionService with LRU size, idle TTL and history limits."""
+
+    def __init__(self, max_sessions: int = AGENT_SESSION_MAX, ttl_seconds: int = AGENT_SESSION_TTL_SECONDS,
+                 history: int = AGENT_SESSION_HISTORY):
+        super().__init__()
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.history = history
+        self.last_used: "OrderedDict[SessionKey, float]" = OrderedDict()
+        self.evicted = 0
+
+    def _touch(self, key: SessionKey):
+        self.last_used[key] = time.monotonic()
+        self.last_used.move_to_end(key)
+
+    def _forget(self, key: SessionKey):
+        app_name, user_id, session_id = key
+        self.last_used.pop(key, None)
+        users = self.sessions.get(app_name, {})
+        users.get(user_id, {}).pop(session_id, None)
+        # A2A gives every context its own user, so empty users pile up too
+        if user_id in users and not users[user_id]:
+            del users[user_id]
+            self.user_state.get(app_name, {}).pop(user_id, None)
+
+    def _evict(self):
+        cutoff = time.monotonic() - self.ttl_seconds
+        while self.last_used:
+            key, used = next(iter(self.last_used.items()))
+            if used >= cutoff and len(self.last_used) <= self.max_sessions:
+                break
+            self._forget(key)
+            self.evicted += 1
+
+    async def create_session(self, *, app_name: str, user_id: str, state: Optional[dict[str, Any]] = None,
+                             session_id: Optional[str] = None) -> Session:
+        session = await super().create_session(app_name=app_name, user_id=user_id, state=state, session_id=session_id)
+        self._touch((app_name, user_id, session.id))
+        self._evict()
+        return session
+
+    async def get_session(self, *, app_name: str, user_id: str, session_id: str,
+                          config: Optional[GetSessionConfig] = None) -> Optional[Session]:
+        key = (app_name, user_id, session_id)
+        self._evict()
+        if key not in self.last_used:
+            return None
+        stored = self.sessions[app_name][user_id][session_id]
+        # Called as a request starts, so every stored invocation is an earlier one
+        _, stored.events = split_history(stored.events, self.history)
+        self._touch(key)
+        return await super().get_session(app_name=app_name, user_id=user_id, session_id=session_id, config=config)
+
+    async def delete_session(self, *, app_name: str, user_id: str, session_id: str) -> None:
+        self._forget((app_name, user_id, session_id))
+
+    def stats(self) -> dict:
+        return {
+            "sessions": len(self.last_used),
+            "events": sum(len(s.events) for users in self.sessions.values() for ss in users.values() for s in ss.values()),
+            "evicted": self.evicted,
+        }
+
+
+def _database_session_service():
+    from google.adk.sessions.database_session_service import DatabaseSessionService, StorageEvent, StorageSession
+    from sqlalchemy import delete, func, select, tuple_
+
+    class BoundedDatabaseSessionService(DatabaseSessionService):
+        """DatabaseSessionService with size, idle TTL and history limits."""
+
+        def __init__(self, db_url: str, max_sessions: int = AGENT_SESSION_MAX,
+                     ttl_seconds: int = AGENT_SESSION_TTL_SECONDS, history: int = AGENT_SESSION_HISTORY,
+                     sweep_seconds: float = AGENT_SESSION_SWEEP_SECONDS):
+            super().__init__(db_url)
+            self.max_sessions = max_sessions
+            self.ttl_seconds = ttl_seconds
+            self.history = history
+            self.sweep_seconds = sweep_seconds
+            self.evicted = 0
+            self._sweep: Optional[asyncio.Task] = None
+            self._next_sweep = 0.0
+
+        def _delete(self, sql_session, keys: List[SessionKey]):
+            # Events go explicitly: SQLite ignores the ON DELETE CASCADE unless
+            # foreign keys are switched on
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                sql_session.execute(delete(StorageEvent).where(
+                    tuple_(StorageEvent.app_name, StorageEvent.user_id, StorageEvent.session_id).in_(batch)))
+                sql_session.execute(delete(StorageSession).where(
+                    tuple_(StorageSession.app_name, StorageSession.user_id, StorageSession.id).in_(batch)))
+
+        def _evict(self):
+            key = (StorageSession.app_name, StorageSession.user_id, StorageSession.id)
+            with self.database_session_factory() as sql_session:
+                # In the database's own clock and time zone, as update_time is
+                cutoff = sql_session.scalar(select(func.now())) - timedelta(seconds=self.ttl_seconds)
+                stale = [tuple(k) for k in sql_session.execute(select(*key).where(StorageSession.update_time < cutoff))]
+                excess = sql_session.scalar(select(func.count()).select_from(StorageSession)) - len(stale) - self.max_sessions
+                if excess > 0:
+                    stale += [tuple(k) for k in sql_session.execute(
+                        select(*key).where(StorageSession.update_time >= cutoff).order_by(StorageSession.update_time).limit(excess))]
+                if stale:
+                    self._delete(sql_session, stale)
+                    sql_session.commit()
+                    self.evicted += len(stale)
+
+        async def _sweep_in_background(self):
+            try:
+                await asyncio.to_thread(self._evict)
+            except Exception as e:
+                logger.warning(f"Evicting agent sessions failed: {e}")
+            finally:
+                self._sweep = None
+
+        async def create_session(self, *, app_name: str, user_id: str, state: Optional[dict[str, Any]] = None,
+                                 session_id: Optional[str] = None) -> Session:
+            session = await super().create_session(app_name=app_name, user_id=user_id, state=state, session_id=session_id)
+            # Evicting counts and scans the table, so it runs off the event loop
+            # at most every sweep_seconds; the store can run over max_sessions
+            # by what is created in between
+            if self._sweep is None and time.monotonic() >= self._next_sweep:
+                self._next_sweep = time.monotonic() + self.sweep_seconds
+                self._sweep = asyncio.create_task(self._sweep_in_background())
+            return session
+
+        async def get_session(self, *, app_name: str, user_id: str, session_id: str,
+                              config: Optional[GetSessionConfig] = None) -> Optional[Session]:
+            session = await super().get_session(app_name=app_name, user_id=user_id, session_id=session_id, config=config)
+            if session is None:
+                return None
+            if session.last_update_time < time.time() - self.ttl_seconds:
+                with self.database_session_factory() as sql_session:
+                    self._delete(sql_session, [(app_name, user_id, session_id)])
+                    sql_session.commit()
+                self.evicted += 1
+                return None
+            dropped, session.events = split_history(session.events, self.history)
+            if dropped:
+                with self.database_session_factory() as sql_session:
+                    sql_session.execute(delete(StorageEvent).where(
+                        StorageEvent.app_name == app_name,
+                        StorageEvent.user_id == user_id,
+                        StorageEvent.session_id == session_id,
+                        StorageEvent.id.in_([e.id for e in dropped]),
+                    ))
+                    sql_session.commit()
+            return session
+
+        def stats(self) -> dict:
+            with self.database_session_factory() as sql_session:
+                return {
+                    "sessions": sql_session.scalar(select(func.count()).select_from(StorageSession)),
+                    "events": sql_session.scalar(select(func.count()).select_from(StorageEvent)),
+                    "evicted": self.evicted,
+                }
+
+    return BoundedDatabaseSessionService
+
+
+def bounded_task_store(max_tasks: int = AGENT_SESSION_MAX):
+    """A2A's InMemoryTaskStore, which also keeps every task forever, holding only the last max_tasks saved."""
+    from a2a.server.tasks import InMemoryTaskStore
+
+    class BoundedTaskStore(InMemoryTaskStore):
+        async def save(self, task) -> None:
+            async with self.lock:
+                self.tasks.pop(task.id, None)
+                self.tasks[task.id] = task
+                while len(self.tasks) > max_tasks:
+                    del self.tasks[next(iter(self.tasks))]
+
+    return BoundedTaskStore()
+
+
+def create_session_service(default: str = "memory", **kwargs):
+    """The session store AGENT_SESSIONS (or else `default`) names; kwargs override the env limits."""
+    mode = AGENT_SESSIONS or default
+    if mode == "stateless":
+        kwargs["history"] = 0
+        service = BoundedSessionService(**kwargs)
+    elif mode == "sql":
+        service = _database_session_service()(kwargs.pop("db_url", AGENT_SESSION_DB_URL), **kwargs)
+    elif mode == "memory":
+        service = BoundedSessionService(**kwargs)
+    else:
+        raise ValueError(f"Unknown AGENT_SESSIONS {mode!r}: use memory, stateless or sql")
+    logger.info(f"Agent sessions: {mode}, at most {service.max_sessions}, idle TTL {service.ttl_seconds}s, "
+                f"{service.history} earlier invocations of history")
+    return service
+
+
+def to_a2a(agent, port: int, session_service=None, host: str = "localhost", protocol: str = "http",
+           streaming: bool = False):
+    """ADK's to_a2a(), with sessions kept in `session_service`.
+
+    With streaming, the card advertises message/stream (refused otherwise) and
+    the model's reply is streamed too: ADK's executor runs every request with
+    a plain RunConfig(), which waits for the whole reply, so the runner swaps
+    in SSE mode and each chunk goes out as a partial event.
+    """
+    from a2a.server.apps import A2AStarletteApplication
+    from a2a.server.request_handlers import DefaultRequestHandler
+    from a2a.types import AgentCapabilities
+    from google.adk.a2a.executor.a2a_agent_executor import A2aAgentExecutor
+    from google.adk.a2a.utils.agent_card_builder import AgentCardBuilder
+    from google.adk.agents.run_config import RunConfig, StreamingMode
+    from google.adk.artifacts import InMemoryArtifactService
+    from google.adk.auth.credential_service.in_memory_credential_service import InMemoryCredentialService
+    from google.adk.memory import InMemoryMemoryService
+    from google.adk.runners import Runner
+    from starlette.applications import Starlette
+
+    session_service = session_service or create_session_service()
+
+    class StreamingRunner(Runner):
+        def run_async(self, **kwargs):
+            # Partial events aren't saved to the session, only the final reply
+            return super().run_async(**{**kwargs, "run_config": RunConfig(streaming_mode=StreamingMode.SSE)})
+
+    async def create_runner() -> Runner:
+        return (StreamingRunner if streaming else Runner)(
+            app_name=agent.name or "adk_agent",
+            agent=agent,
+            artifact_service=InMemoryArtifactService(),
+            session_service=session_service,
+            memory_service=InMemoryMemoryService(),
+            credential_service=InMemoryCredentialService(),
+        )
+
+    request_handler = DefaultRequestHandler(agent_executor=A2aAgentExecutor(runner=create_runner),
+                                            task_store=bounded_task_store())
+    card_builder = AgentCardBuilder(agent=agent, rpc_url=f"{protocol}://{host}:{port}/",
+                                    capabilities=AgentCapabilities(streaming=streaming))
+    app = Starlette()
+
+    async def setup_a2a():
+        agent_card = await card_builder.build()
+        A2AStarletteApplication(agent_card=agent_card, http_handler=request_handler).add_routes_to_app(app)
+
+    app.add_event_handler("startup", setup_a2a)
+    app.state.session_service = session_service
+    return app
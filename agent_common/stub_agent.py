@@ -0,0 +1,635 @@
+"""Stand-in A2A agents for testing without model access.
+
+Serves the same JSON-RPC surface as the ADK agents (`message/send`,
+`message/stream` and the agent card) and answers with grading or analysis
+JSON that follows the agents' output formats. Latency, failures and malformed
+output are drawn at random so the backend's queueing, retries and timeouts
+can be exercised offline:
+
+    python -m agent_common.stub_agent grading --port 10001 --latency lognormal:4:0.5 --error-rate 0.05
+    python -m agent_common.stub_agent analysis --port 10000 --latency uniform:20:60 --malformed-rate 0.1
+
+or, configured through STUB_* environment variables,
+
+    uvicorn agent_common.stub_agent:grading_app --port 10001
+    uvicorn agent_common.stub_agent:learner_app --port 10000
+
+Latency specs are `fixed:S`, `uniform:LOW:HIGH`, `exponential:MEAN` or
+`lognormal:MEDIAN:SIGMA`, in seconds. Analysis requests additionally take
+`--seconds-per-video-minute` per minute of video analysed: the whole
+`--video-seconds` by default, or just the segment named in a segment request
+(see agent_common.video_segments). `--seconds-per-1k-tokens` adds latency
+per thousand estimated prompt tokens, counting 560 for each PDF page sent as
+a document (`--pdf-pages` for a PDF sent by URI). GET /stub/stats reports request counts
+and peak concurrency; POST /stub/config changes settings on a running stub.
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import math
+import os
+import random
+import re
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+from agent_common.context_cache import create_prompt_cache, estimate_tokens, find_snapshot
+from agent_common.deadline import with_deadlines
+from agent_common.video_segments import find_segment
+
+logger = logging.getLogger(__name__)
+
+MALFORMED_KINDS = ("truncated", "prose", "missing_field", "trailing_comma")
+PDF_PAGE_TOKENS = 560
+PAGE_TAG_RE = re.compile(r'<Page number="(\d+)"(?: attached="true"/>|>\s*(.*?)\s*</Page>)', re.DOTALL)
+
+
+def parse_latency(spec: str):
+    """Turns a latency spec into a function of a Random returning seconds."""
+    name, *args = spec.split(":")
+    values = [float(a) for a in args]
+    if name == "fixed" and len(values) == 1:
+        return lambda rng: values[0]
+    if name == "uniform" and len(values) == 2:
+        return lambda rng: rng.uniform(values[0], values[1])
+    if name == "exponential" and len(values) == 1:
+        return lambda rng: rng.expovariate(1.0 / values[0]) if values[0] > 0 else 0.0
+    if name == "lognormal" and len(values) == 2:
+        return lambda rng: rng.lognormvariate(math.log(values[0]), values[1]) if values[0] > 0 else 0.0
+    raise ValueError(f"Invalid latency spec {spec!r}")
+
+
+class StubSettings:
+    """Behaviour of one stub agent; every field can be changed at runtime."""
+
+    def __init__(
+        self,
+        kind: str,
+        latency: str = "fixed:0",
+        error_rate: float = 0.0,
+        malformed_rate: float = 0.0,
+        max_concurrency: int = 0,
+        stream_chunks: int = 8,
+        video_seconds: float = 5400,
+        seconds_per_video_minute: float = 0.0,
+        pdf_pages: int = 300,
+        seconds_per_1k_tokens: float = 0.0,
+        seed: int | None = None,
+    ):
+        if kind not in ("grading", "analysis"):
+            raise ValueError(f"Unknown stub kind {kind!r}")
+        self.kind = kind
+        self.latency = latency
+        self.sample_latency = parse_latency(latency)
+        self.error_rate = error_rate
+        self.malformed_rate = malformed_rate
+        self.max_concurrency = max_concurrency
+        self.stream_chunks = stream_chunks
+        self.video_seconds = video_seconds
+        self.seconds_per_video_minute = seconds_per_video_minute
+        self.pdf_pages = pdf_pages
+        self.seconds_per_1k_tokens = seconds_per_1k_tokens
+        self.rng = random.Random(seed)
+
+    @classmethod
+    def from_env(cls, kind: str) -> "StubSettings":
+        seed = os.getenv("STUB_SEED")
+        return cls(
+            kind,
+            latency=os.getenv("STUB_LATENCY", "fixed:0"),
+            error_rate=float(os.getenv("STUB_ERROR_RATE", "0")),
+            malformed_rate=float(os.getenv("STUB_MALFORMED_RATE", "0")),
+            max_concurrency=int(os.getenv("STUB_MAX_CONCURRENCY", "0")),
+            stream_chunks=int(os.getenv("STUB_STREAM_CHUNKS", "8")),
+            video_seconds=float(os.getenv("STUB_VIDEO_SECONDS", "5400")),
+            seconds_per_video_minute=float(os.getenv("STUB_SECONDS_PER_VIDEO_MINUTE", "0")),
+            pdf_pages=int(os.getenv("STUB_PDF_PAGES", "300")),
+            seconds_per_1k_tokens=float(os.getenv("STUB_SECONDS_PER_1K_TOKENS", "0")),
+            seed=int(seed) if seed else None,
+        )
+
+    def update(self, changes: dict):
+        for key in ("error_rate", "malformed_rate", "video_seconds", "seconds_per_video_minute", "seconds_per_1k_tokens"):
+            if key in changes:
+                setattr(self, key, float(changes[key]))
+        for key in ("max_concurrency", "stream_chunks", "pdf_pages"):
+            if key in changes:
+                setattr(self, key, int(changes[key]))
+        if "latency" in changes:
+            self.sample_latency = parse_latency(changes["latency"])
+            self.latency = changes["latency"]
+        if "seed" in changes:
+            self.rng.seed(changes["seed"])
+
+    def as_dict(self) -> dict:
+        return {
+            "kind": self.kind,
+            "latency": self.latency,
+            "error_rate": self.error_rate,
+            "malformed_rate": self.malformed_rate,
+            "max_concurrency": self.max_concurrency,
+            "stream_chunks": self.stream_chunks,
+            "video_seconds": self.video_seconds,
+            "seconds_per_video_minute": self.seconds_per_video_minute,
+            "pdf_pages": self.pdf_pages,
+            "seconds_per_1k_tokens": self.seconds_per_1k_tokens,
+        }
+
+
+# ==========================================
+# Results
+# ==========================================
+
+
+def _message_text(message: dict) -> str:
+    return "\n".join(p.get("text", "") for p in message.get("parts", []) if p.get("kind") == "text")
+
+
+def tagged_json(text: str, tag: str):
+    match = re.search(rf"<{tag}(?:\s[^>]*)?>\s*(.*?)\s*</{tag}>", text, re.DOTALL)
+    if not match:
+        return []
+    try:
+        return json.loads(match.group(1))
+    except json.JSONDecodeError:
+        return []
+
+
+def _score(*parts) -> float:
+    """Stable pseudo-mark in [0, 10] so repeated gradings agree."""
+    digest = hashlib.sha256("|".join(str(p) for p in parts).encode()).digest()
+    return round(digest[0] / 255 * 10, 1)
+
+
+def grading_result(message: dict) -> dict:
+    """Grading output for the submission and topics in the backend's prompt."""
+    text = _message_text(message)
+    submission = tagged_json(text, "Submission")
+    topics = tagged_json(text, "Topics")
+
+    question_scores = []
+    for i, item in enumerate(submission, 1):
+        answer = item.get(f"answer{i}", "")
+        question_scores.append({
+            "question_id": item.get("question_id", i),
+            "marks": _score(item.get("question_id", i), answer),
+            "feedback": f"Stub feedback for question {i}: the answer covers part of the expected material.",
+            "confidence": 0.9,
+        })
+
+    topic_scores = [
+        {
+            "topic_id": t.get("topic_id", t.get("id")),
+            "marks": _score("topic", t.get("topic_id", t.get("id")), len(submission)),
+            "feedback": f"Stub feedback on {t.get('topic_name', t.get('name', 'this topic'))}.",
+        }
+        for t in topics
+        if t.get("topic_id", t.get("id")) is not None
+    ]
+
+    return {
+        "question_scores": question_scores,
+        "topic_scores": topic_scores,
+        "assignment_marks": round(sum(q["marks"] for q in question_scores), 1),
+        "feedback": "Stub overall feedback: a fair attempt with room to connect the key concepts.",
+    }
+
+
+def _message_source(message: dict) -> str:
+    return next(
+        (p["file"].get("uri") for p in message.get("parts", []) if p.get("kind") == "file" and p.get("file")),
+        None,
+    ) or _message_text(message)
+
+
+def segment_analysis_result(message: dict, segment: tuple, concept_seconds: int = 90, topic_seconds: int = 900) -> dict:
+    """
+    Analysis of one video segment, with timestamps relative to the segment start.
+    Topics and concepts are named after their place in the whole video, so
+    overlapping segments report the same ones, as a model would.
+    """
+    label = hashlib.sha256(_message_source(message).encode()).hexdigest()[:6]
+    start, end = segment
+    result = {"summary": f"Stub summary of {start}-{end}s of resource {label}.", "topics": [], "occurrences": [], "key_concepts": []}
+    for slot in range(-(-start // concept_seconds), -(-end // concept_seconds)):
+        slot_start = slot * concept_seconds
+        topic = slot_start // topic_seconds + 1
+        if not any(t["id"] == f"t{topic}" for t in result["topics"]):
+            result["topics"].append({"id": f"t{topic}", "name": f"Stub topic {label}-{topic}", "outline": f"Outline of stub topic {topic}."})
+            result["occurrences"].append({"id": f"o{topic}", "topic_id": f"t{topic}", "resource_id": label})
+        result["key_concepts"].append({
+            "id": f"c{slot}",
+            "name": f"Stub concept {slot}",
+            "description": f"Details of stub concept {slot} of topic {topic}.",
+            "occurence_id": f"o{topic}",
+            "timestamp_start": slot_start - start,
+            "timestamp_end": min(slot_start + concept_seconds, end) - start,
+            "page_number": None,
+            "section": None,
+        })
+    return result
+
+
+def pages_analysis_result(message: dict, pages: list, chapter_pages: int = 25) -> dict:
+    """
+    Analysis of a range of PDF pages, one concept per page. Topics
+    are chapters of the whole document, so ranges that split a chapter
+    report the same topic.
+    """
+    label = hashlib.sha256(_message_source(message).encode()).hexdigest()[:6]
+    result = {"summary": f"Stub summary of pages {pages[0][0]}-{pages[-1][0]}.", "topics": [], "occurrences": [], "key_concepts": []}
+    for number, text in pages:
+        chapter = (number - 1) // chapter_pages + 1
+        if not any(t["id"] == f"t{chapter}" for t in result["topics"]):
+            result["topics"].append({"id": f"t{chapter}", "name": f"Stub chapter {chapter}", "outline": f"Outline of stub chapter {chapter}."})
+            result["occurrences"].append({"id": f"o{chapter}", "topic_id": f"t{chapter}", "resource_id": label})
+        result["key_concepts"].append({
+            "id": f"c{number}",
+            "name": f"Stub concept on page {number}",
+            "description": text[:80] or f"Figure on page {number}.",
+            "occurence_id": f"o{chapter}",
+            "timestamp_start": None,
+            "timestamp_end": None,
+            "page_number": number,
+            "section": f"{chapter}. Stub chapter {chapter}",
+        })
+    return result
+
+
+def analysis_result(message: dict, topics: int = 4, concepts_per_topic: int = 3) -> dict:
+    """Analysis output in the analyser's flattened topics/occurrences/key_concepts format."""
+    text = _message_text(message)
+    segment = find_segment(text)
+    if segment:
+        return segment_analysis_result(message, segment)
+    pages = [(int(n), t) for n, t in PAGE_TAG_RE.findall(text)]
+    if pages:
+        return pages_analysis_result(message, pages)
+    source = _message_source(message)
+    is_pdf = ".pdf" in source.lower() or "application/pdf" in json.dumps(message.get("parts", []))
+    label = hashlib.sha256(source.encode()).hexdigest()[:6]
+
+    result = {"summary": f"Stub summary of resource {label}.", "topics": [], "occurrences": [], "key_concepts": []}
+    for t in range(1, topics + 1):
+        result["topics"].append({"id": f"t{t}", "name": f"Stub topic {label}-{t}", "outline": f"Outline of stub topic {t}."})
+        result["occurrences"].append({"id": f"o{t}", "topic_id": f"t{t}", "resource_id": label})
+        for k in range(1, concepts_per_topic + 1):
+            start = ((t - 1) * concepts_per_topic + k - 1) * 90
+            result["key_concepts"].append({
+                "id": f"c{t}.{k}",
+                "name": f"Stub concept {t}.{k}",
+                "description": f"Details of stub concept {k} of topic {t}.",
+                "occurence_id": f"o{t}",
+                "timestamp_start": None if is_pdf else start,
+                "timestamp_end": None if is_pdf else start + 90,
+                "page_number": start // 90 + 1 if is_pdf else None,
+                "section": f"{t}. Stub section" if is_pdf else None,
+            })
+    return result
+
+
+def render_output(result: dict, malformed: str | None) -> str:
+    """The agent's reply text: fenced JSON, or one of the ways models get it wrong."""
+    if malformed == "missing_field":
+        result = {k: v for i, (k, v) in enumerate(result.items()) if i != len(result) - 1}
+    body = json.dumps(result, indent=2)
+    if malformed == "truncated":
+        body = body[: max(1, len(body) * 2 // 3)]
+    elif malformed == "trailing_comma":
+        body = body[:-2] + ",\n}"
+    elif malformed == "prose":
+        return "I have reviewed the material. Overall it looks good, with a few areas to revisit."
+    return f"```json\n{body}\n```"
+
+
+# ==========================================
+# A2A protocol
+# ==========================================
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _agent_message(text: str, context_id: str, task_id: str, metadata: dict | None = None) -> dict:
+    message = {
+        "kind": "message",
+        "role": "agent",
+        "messageId": uuid.uuid4().hex,
+        "parts": [{"kind": "text", "text": text}],
+        "contextId": context_id,
+        "taskId": task_id,
+    }
+    if metadata:
+        message["metadata"] = metadata
+    return message
+
+
+def _rpc_result(request_id, result: dict) -> dict:
+    return {"jsonrpc": "2.0", "id": request_id, "result": result}
+
+
+def _rpc_error(request_id, code: int, message: str) -> dict:
+    return {"jsonrpc": "2.0", "id": request_id, "error": {"code": code, "message": message}}
+
+
+class StubAgent:
+    """Starlette app serving one stub agent."""
+
+    def __init__(self, settings: StubSettings, port: int):
+        self.settings = settings
+        self.port = port
+        self.in_flight = 0
+        self.queued = 0
+        self._semaphore = None
+        self._semaphore_size = None
+        self.stats = {
+            "requests": 0,
+            "completed": 0,
+            "errors": 0,
+            "malformed": 0,
+            "queued_peak": 0,
+            "in_flight_peak": 0,
+            "latency_seconds_total": 0.0,
+        }
+        # Grading requests report token usage the way ADK does, with the
+        # instruction and topics block cached through the local stand-in
+        self.prompt_cache = create_prompt_cache("local") if settings.kind == "grading" else None
+        self.app = Starlette(routes=[
+            Route("/", self.handle_rpc, methods=["POST"]),
+            Route("/.well-known/agent-card.json", self.agent_card, methods=["GET"]),
+            Route("/.well-known/agent.json", self.agent_card, methods=["GET"]),
+            Route("/stub/stats", self.get_stats, methods=["GET"]),
+            Route("/stub/config", self.set_config, methods=["POST"]),
+        ])
+
+    def _limit(self):
+        # Rebuilt when max_concurrency changes; 0 means unlimited
+        size = self.settings.max_concurrency
+        if size <= 0:
+            return None
+        if self._semaphore is None or self._semaphore_size != size:
+            self._semaphore = asyncio.Semaphore(size)
+            self._semaphore_size = size
+        return self._semaphore
+
+    def _draw(self, message: dict):
+        rng = self.settings.rng
+        latency = max(0.0, self.settings.sample_latency(rng))
+        latency += self.settings.seconds_per_1k_tokens * self._prompt_tokens(message) / 1000
+        if self.settings.kind == "analysis" and self.settings.seconds_per_video_minute:
+            # Model time grows with the length of video analysed
+            segment = find_segment(_message_text(message))
+            seconds = segment[1] - segment[0] if segment else self.settings.video_seconds
+            latency += self.settings.seconds_per_video_minute * seconds / 60
+        failed = rng.random() < self.settings.error_rate
+        malformed = None
+        if not failed and rng.random() < self.settings.malformed_rate:
+            malformed = rng.choice(MALFORMED_KINDS)
+        return latency, failed, malformed
+
+    def _result(self, message: dict) -> dict:
+        if self.settings.kind == "grading":
+            return grading_result(message)
+        return analysis_result(message)
+
+    def _prompt_tokens(self, message: dict) -> int:
+        """Estimated prompt tokens: the text, plus a fixed charge per PDF page sent as a document."""
+        pages = 0
+        for part in message.get("parts", []):
+            file = part.get("file") if part.get("kind") == "file" else None
+            if not file or "pdf" not in json.dumps({k: v for k, v in file.items() if k != "bytes"}):
+                continue
+            if file.get("bytes"):
+                pages += len(re.findall(rb"/Type\s*/Page(?![a-zA-Z])", base64.b64decode(file["bytes"])))
+            else:
+                pages += self.settings.pdf_pages
+        return estimate_tokens(self.instruction) + estimate_tokens(_message_text(message)) + PDF_PAGE_TOKENS * pages
+
+    async def _usage(self, message: dict, reply: str) -> dict:
+        """adk_usage_metadata for one reply, with token counts estimated from the text."""
+        prompt = _message_text(message)
+        prompt_tokens = self._prompt_tokens(message)
+        cached = 0
+        match = find_snapshot(prompt)
+        if self.prompt_cache is not None and match:
+            key = ("stub", match["class_id"], match["version"])
+            entry = await self.prompt_cache.get(key, self.instruction, match.group(0))
+            cached = entry.tokens if entry else 0
+            self.prompt_cache.record_usage(prompt_tokens, cached, estimate_tokens(reply))
+        return {"adk_usage_metadata": {
+            "promptTokenCount": prompt_tokens,
+            "cachedContentTokenCount": cached,
+            "candidatesTokenCount": estimate_tokens(reply),
+        }}
+
+    @property
+    def instruction(self) -> str:
+        if self.settings.kind != "grading":
+            return ""
+        from grading_agent.prompt import GRADING_AGENT_PROMPT
+
+        return GRADING_AGENT_PROMPT
+
+    async def agent_card(self, request: Request):
+        name = "grading_agent" if self.settings.kind == "grading" else "learner_agent"
+        return JSONResponse({
+            "name": name,
+            "description": f"Stub {self.settings.kind} agent",
+            "url": f"http://localhost:{self.port}/",
+            "version": "stub",
+            "protocolVersion": "0.3.0",
+            "capabilities": {"streaming": True},
+            "defaultInputModes": ["text/plain"],
+            "defaultOutputModes": ["text/plain"],
+            "skills": [],
+        })
+
+    async def get_stats(self, request: Request):
+        stats = {**self.stats, "in_flight": self.in_flight, "queued": self.queued, "settings": self.settings.as_dict()}
+        if self.prompt_cache is not None:
+            stats["prompt_cache"] = self.prompt_cache.stats
+        return JSONResponse(stats)
+
+    async def set_config(self, request: Request):
+        try:
+            self.settings.update(await request.json())
+        except (ValueError, TypeError) as e:
+            return JSONResponse({"detail": str(e)}, status_code=400)
+        return JSONResponse(self.settings.as_dict())
+
+    async def handle_rpc(self, request: Request):
+        try:
+            body = await request.json()
+        except json.JSONDecodeError:
+            return JSONResponse(_rpc_error(None, -32700, "Parse error"))
+        request_id = body.get("id")
+        method = body.get("method")
+        message = (body.get("params") or {}).get("message")
+        if method not in ("message/send", "message/stream"):
+            return JSONResponse(_rpc_error(request_id, -32601, "Method not found"))
+        if not isinstance(message, dict):
+            return JSONResponse(_rpc_error(request_id, -32602, "Invalid params"))
+
+        self.stats["requests"] += 1
+        latency, failed, malformed = self._draw(message)
+        if method == "message/stream":
+            return StreamingResponse(
+                self._stream(request_id, message, latency, failed, malformed),
+                media_type="text/event-stream",
+            )
+
+        async with self._slot():
+            await asyncio.sleep(latency)
+            self.stats["latency_seconds_total"] += latency
+            if failed:
+                self.stats["errors"] += 1
+                # Half the failures are transport-level, half JSON-RPC errors
+                if self.settings.rng.random() < 0.5:
+                    return JSONResponse({"detail": "Stub agent unavailable"}, status_code=503)
+                return JSONResponse(_rpc_error(request_id, -32603, "Stub model call failed"))
+            if malformed:
+                self.stats["malformed"] += 1
+
+            context_id = message.get("contextId") or uuid.uuid4().hex
+            task_id = uuid.uuid4().hex
+            text = render_output(self._result(message), malformed)
+            usage = await self._usage(message, text)
+            self.stats["completed"] += 1
+            return JSONResponse(_rpc_result(request_id, {
+                "kind": "task",
+                "id": task_id,
+                "contextId": context_id,
+                "status": {"state": "completed", "timestamp": _now()},
+                "history": [message, _agent_message(text, context_id, task_id, usage)],
+                "artifacts": [{"artifactId": uuid.uuid4().hex, "parts": [{"kind": "text", "text": text}]}],
+            }))
+
+    @asynccontextmanager
+    async def _slot(self):
+        """Holds a model slot while a reply is produced; waits when --max-concurrency is reached."""
+        semaphore = self._limit()
+        if semaphore is not None:
+            self.queued += 1
+            self.stats["queued_peak"] = max(self.stats["queued_peak"], self.queued if semaphore.locked() else 0)
+            try:
+                await semaphore.acquire()
+            finally:
+                self.queued -= 1
+        self.in_flight += 1
+        self.stats["in_flight_peak"] = max(self.stats["in_flight_peak"], self.in_flight)
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            if semaphore is not None:
+                semaphore.release()
+
+    async def _stream(self, request_id, message: dict, latency: float, failed: bool, malformed):
+        """SSE events in the order ADK emits them: task, working, text chunks, completed."""
+        def event(result: dict) -> str:
+            return f"data: {json.dumps(_rpc_result(request_id, result))}\n\n"
+
+        context_id = message.get("contextId") or uuid.uuid4().hex
+        task_id = uuid.uuid4().hex
+        async with self._slot():
+            yield event({"kind": "task", "id": task_id, "contextId": context_id,
+                         "status": {"state": "submitted", "timestamp": _now()}, "history": [message]})
+            yield event({"kind": "status-update", "taskId": task_id, "contextId": context_id,
+                         "status": {"state": "working", "timestamp": _now()}, "final": False})
+
+            text = render_output(self._result(message), malformed)
+            chunks = max(1, self.settings.stream_chunks)
+            size = -(-len(text) // chunks)
+            pieces = [text[i:i + size] for i in range(0, len(text), size)]
+            # Failures happen part-way through, like a dropped model stream
+            fail_at = self.settings.rng.randrange(len(pieces)) if failed else None
+            artifact_id = uuid.uuid4().hex
+            for i, piece in enumerate(pieces):
+                await asyncio.sleep(latency / len(pieces))
+                if i == fail_at:
+                    self.stats["errors"] += 1
+                    self.stats["latency_seconds_total"] += latency * i / len(pieces)
+                    yield f"data: {json.dumps(_rpc_error(request_id, -32603, 'Stub model stream failed'))}\n\n"
+                    return
+                yield event({
+                    "kind": "artifact-update", "taskId": task_id, "contextId": context_id,
+                    "artifact": {"artifactId": artifact_id, "parts": [{"kind": "text", "text": piece}]},
+                    "append": i > 0, "lastChunk": i == len(pieces) - 1,
+                })
+
+            self.stats["latency_seconds_total"] += latency
+            if malformed:
+                self.stats["malformed"] += 1
+            self.stats["completed"] += 1
+            usage = await self._usage(message, text)
+            yield event({"kind": "status-update", "taskId": task_id, "contextId": context_id,
+                         "status": {"state": "completed", "timestamp": _now(),
+                                    "message": _agent_message(text, context_id, task_id, usage)},
+                         "final": True})
+
+
+def create_stub_app(kind: str, port: int, settings: StubSettings | None = None) -> Starlette:
+    return with_deadlines(StubAgent(settings or StubSettings.from_env(kind), port).app)
+
+
+grading_app = create_stub_app("grading", 10001)
+learner_app = create_stub_app("analysis", 10000)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stub A2A grading/analysis agent")
+    parser.add_argument("kind", choices=["grading", "analysis"])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, help="Defaults to the real agent's port")
+    parser.add_argument("--latency", default=os.getenv("STUB_LATENCY", "fixed:0"))
+    parser.add_argument("--error-rate", type=float, default=float(os.getenv("STUB_ERROR_RATE", "0")))
+    parser.add_argument("--malformed-rate", type=float, default=float(os.getenv("STUB_MALFORMED_RATE", "0")))
+    parser.add_argument("--max-concurrency", type=int, default=int(os.getenv("STUB_MAX_CONCURRENCY", "0")),
+                        help="Requests served at once; the rest queue (0 = unlimited)")
+    parser.add_argument("--stream-chunks", type=int, default=int(os.getenv("STUB_STREAM_CHUNKS", "8")))
+    parser.add_argument("--video-seconds", type=float, default=float(os.getenv("STUB_VIDEO_SECONDS", "5400")),
+                        help="Length of the video a whole-video analysis request stands for")
+    parser.add_argument("--seconds-per-video-minute", type=float,
+                        default=float(os.getenv("STUB_SECONDS_PER_VIDEO_MINUTE", "0")),
+                        help="Extra analysis latency per minute of video analysed")
+    parser.add_argument("--pdf-pages", type=int, default=int(os.getenv("STUB_PDF_PAGES", "300")),
+                        help="Pages of a PDF sent by URI, for token estimates")
+    parser.add_argument("--seconds-per-1k-tokens", type=float,
+                        default=float(os.getenv("STUB_SECONDS_PER_1K_TOKENS", "0")),
+                        help="Extra latency per thousand estimated prompt tokens")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args(argv)
+
+    import uvicorn
+
+    port = args.port or (10001 if args.kind == "grading" else 10000)
+    settings = StubSettings(
+        args.kind,
+        latency=args.latency,
+        error_rate=args.error_rate,
+        malformed_rate=args.malformed_rate,
+        max_concurrency=args.max_concurrency,
+        stream_chunks=args.stream_chunks,
+        video_seconds=args.video_seconds,
+        seconds_per_video_minute=args.seconds_per_video_minute,
+        pdf_pages=args.pdf_pages,
+        seconds_per_1k_tokens=args.seconds_per_1k_tokens,
+        seed=args.seed,
+    )
+    logging.basicConfig(format="[%(levelname)s]: %(message)s", level=logging.INFO)
+    logger.info(f"--- 🧪 Stub {args.kind} agent on port {port}: {settings.as_dict()} ---")
+    uvicorn.run(create_stub_app(args.kind, port, settings), host=args.host, port=port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""Stand-in model for running the ADK agents offline.
+
+StubLlm answers an LlmAgent's model calls the way the agents' prompts ask
+for, without model access:
+
+* agents with sub-agents transfer to the analyser matching the resource's
+  MIME type (a routing hop, like the real model makes),
+* analysers answer with analysis JSON (agent_common.stub_agent's formats),
+* the evaluator answers with an AnalysisEvaluation,
+* the graders grade the latest submission. With `mark_noise` each mark is
+  off the reference grade by up to that much, more for longer answers,
+  differently per `model` name, and the less sure the grader says it is;
+  this stands in for a smaller model's grading.
+
+Prompt tokens are estimated the way Gemini bills them: text at about four
+characters a token, `--pdf-pages` x 560 for a PDF and `--video-seconds` x
+263 for a video sent by URI. Latency is `base_latency` plus
+`seconds_per_1k_tokens` per thousand prompt tokens and
+`seconds_per_1k_output_tokens` per thousand reply tokens. Asked to stream
+(RunConfig SSE mode), it sends text replies in `stream_chunks` partial
+responses spread over the output time, then the whole reply, as Gemini does.
+use_stub_model() swaps it into every LlmAgent of an agent tree.
+"""
+import asyncio
+import hashlib
+import json
+import re
+from typing import AsyncGenerator, Optional
+
+from google.adk.models.base_llm import BaseLlm
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
+from google.genai import types
+
+from agent_common.context_cache import estimate_tokens
+from agent_common.stub_agent import PDF_PAGE_TOKENS, tagged_json, analysis_result, grading_result, render_output
+
+VIDEO_TOKENS_PER_SECOND = 263
+AGENT_NAME_RE = re.compile(r'Your internal name is "([^"]+)"')
+
+
+def _mime_type(parts) -> Optional[str]:
+    for part in parts:
+        data = part.file_data or part.inline_data
+        if data and data.mime_type:
+            return data.mime_type
+    return None
+
+
+class StubLlm(BaseLlm):
+    """Deterministic model stand-in; see the module docstring."""
+
+    model: str = "stub"
+    base_latency: float = 0.0
+    seconds_per_1k_tokens: float = 0.0
+    pdf_pages: int = 300
+    video_seconds: int = 3600
+    seconds_per_1k_output_tokens: float = 0.0
+    mark_noise: float = 0.0
+    stream_chunks: int = 16
+    calls: int = 0
+    prompt_tokens: int = 0
+    output_tokens: int = 0
+
+    def _agent_name(self, llm_request: LlmRequest) -> str:
+        instruction = llm_request.config.system_instruction if llm_request.config else None
+        match = AGENT_NAME_RE.search(instruction if isinstance(instruction, str) else str(instruction or ""))
+        return match.group(1) if match else ""
+
+    def _parts(self, llm_request: LlmRequest) -> list:
+        return [p for c in llm_request.contents or [] if c.role == "user" for p in c.parts or []]
+
+    def _count_prompt_tokens(self, llm_request: LlmRequest) -> int:
+        instruction = llm_request.config.system_instruction if llm_request.config else None
+        tokens = estimate_tokens(str(instruction or ""))
+        for content in llm_request.contents or []:
+            for part in content.parts or []:
+                if part.text:
+                    tokens += estimate_tokens(part.text)
+                data = part.file_data or part.inline_data
+                mime_type = (data.mime_type or "") if data else ""
+                if mime_type == "application/pdf":
+                    pages = (
+                        len(re.findall(rb"/Type\s*/Page(?![a-zA-Z])", part.inline_data.data))
+                        if part.inline_data else self.pdf_pages
+                    )
+                    tokens += PDF_PAGE_TOKENS * pages
+                elif mime_type.startswith("video/"):
+                    tokens += VIDEO_TOKENS_PER_SECOND * self.video_seconds
+        return tokens
+
+    def _reply(self, llm_request: LlmRequest) -> types.Part:
+        parts = self._parts(llm_request)
+        if "transfer_to_agent" in llm_request.tools_dict:
+            mime_type = _mime_type(parts) or ""
+            name = self._agent_name(llm_request)
+            if name == "analyser_agent":
+                target = "pdf_analyser_agent" if mime_type == "application/pdf" else "video_analyser_agent"
+            else:
+                target = "analyser_agent"
+            return types.Part(function_call=types.FunctionCall(name="transfer_to_agent", args={"agent_name": target}))
+        if self._agent_name(llm_request) == "evaluator_agent":
+            return types.Part(text=json.dumps({"score": 4, "complete": True, "issues": []}))
+        if self._agent_name(llm_request).startswith("grading"):
+            latest = parts[-1].text if parts and parts[-1].text else ""
+            return types.Part(text=json.dumps(self._grade(latest)))
+        message = {"parts": [
+            {"kind": "text", "text": p.text} if p.text else
+            {"kind": "file", "file": {"uri": (p.file_data.file_uri if p.file_data else "inline"), "mime_type": _mime_type([p])}}
+            for p in parts if p.text or p.file_data or p.inline_data
+        ]}
+        return types.Part(text=render_output(analysis_result(message), None))
+
+    def _grade(self, text: str) -> dict:
+        result = grading_result({"parts": [{"kind": "text", "text": text}]})
+        if not self.mark_noise:
+            return result
+        answers = {}
+        for i, item in enumerate(tagged_json(text, "Submission"), 1):
+            answers[item.get("question_id", i)] = item.get(f"answer{i}", "")
+        for score in result["question_scores"]:
+            answer = answers.get(score["question_id"], "")
+            digest = hashlib.sha256(f"{self.model}|{score['question_id']}|{answer}".encode()).digest()
+            # Uniform in [-1, 1], scaled up to full noise for answers of 600+ characters
+            error = (digest[0] / 255 * 2 - 1) * self.mark_noise * min(1.0, 0.25 + len(answer) / 800)
+            score["marks"] = round(min(10.0, max(0.0, score["marks"] + error)), 1)
+            score["confidence"] = round(max(0.0, 0.95 - abs(error) / 4), 2)
+        result["assignment_marks"] = round(sum(q["marks"] for q in result["question_scores"]), 1)
+        return result
+
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        prompt_tokens = self._count_prompt_tokens(llm_request)
+        self.calls += 1
+        self.prompt_tokens += prompt_tokens
+        reply = self._reply(llm_request)
+        output_tokens = estimate_tokens(reply.text or json.dumps(reply.function_call.args))
+        self.output_tokens += output_tokens
+        await asyncio.sleep(self.base_latency + self.seconds_per_1k_tokens * prompt_tokens / 1000)
+        output_seconds = self.seconds_per_1k_output_tokens * output_tokens / 1000
+        if stream and reply.text:
+            size = -(-len(reply.text) // self.stream_chunks)
+            for start in range(0, len(reply.text), size):
+                await asyncio.sleep(output_seconds / self.stream_chunks)
+                yield LlmResponse(
+                    content=types.Content(role="model", parts=[types.Part(text=reply.text[start:start + size])]),
+                    partial=True,
+                )
+        else:
+            await asyncio.sleep(output_seconds)
+        yield LlmResponse(
+            content=types.Content(role="model", parts=[reply]),
+            usage_metadata=types.GenerateContentResponseUsageMetadata(
+                prompt_token_count=prompt_tokens,
+                candidates_token_count=output_tokens,
+            ),
+        )
+
+
+def use_stub_model(agent, model: StubLlm) -> StubLlm:
+    """Points every LlmAgent under agent (inclusive) at model."""
+    if hasattr(agent, "model"):
+        agent.model = model
+    for sub_agent in agent.sub_agents:
+        use_stub_model(sub_agent, model)
+    return model
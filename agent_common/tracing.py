@@ -0,0 +1,86 @@
+"""OpenTelemetry setup shared by the agents, the backend and the MCP server.
+
+OTEL_TRACES_EXPORTER picks where spans go: "none" (default) leaves tracing
+off entirely; "otlp" ships to a collector at OTEL_EXPORTER_OTLP_ENDPOINT;
+"file" appends JSON lines to OTEL_TRACES_FILE for offline analysis;
+"console" prints spans. Each service names itself with OTEL_SERVICE_NAME,
+or its default.
+"""
+import logging
+import os
+import threading
+from typing import Sequence
+
+from opentelemetry import trace
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import ReadableSpan, TracerProvider
+from opentelemetry.sdk.trace.export import (
+    BatchSpanProcessor,
+    ConsoleSpanExporter,
+    SpanExporter,
+    SpanExportResult,
+)
+
+logger = logging.getLogger(__name__)
+
+TRACES_EXPORTER = os.getenv("OTEL_TRACES_EXPORTER", "none").lower()
+TRACES_FILE = os.getenv("OTEL_TRACES_FILE", "traces.jsonl")
+
+
+class JsonLinesSpanExporter(SpanExporter):
+    """Writes one finished span per line as JSON."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, spans: Sequence[ReadableSpan]) -> SpanExportResult:
+        lines = "".join(span.to_json(indent=None) + "\n" for span in spans)
+        with self._lock, open(self.path, "a") as f:
+            f.write(lines)
+        return SpanExportResult.SUCCESS
+
+    def shutdown(self) -> None:
+        pass
+
+
+def build_exporter():
+    """The exporter TRACES_EXPORTER names, or None when tracing is off."""
+    if TRACES_EXPORTER == "otlp":
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+
+        return OTLPSpanExporter()
+    if TRACES_EXPORTER == "file":
+        return JsonLinesSpanExporter(TRACES_FILE)
+    if TRACES_EXPORTER == "console":
+        return ConsoleSpanExporter()
+    return None
+
+
+def setup_tracing(service_name: str) -> bool:
+    """Installs the global tracer provider for a service; False when tracing is off."""
+    exporter = build_exporter()
+    if exporter is None:
+        return False
+
+    service_name = os.getenv("OTEL_SERVICE_NAME", service_name)
+    provider = TracerProvider(resource=Resource.create({"service.name": service_name}))
+    provider.add_span_processor(BatchSpanProcessor(exporter))
+    trace.set_tracer_provider(provider)
+    logger.info(f"--- 🔭 Tracing enabled ({TRACES_EXPORTER} exporter) as {service_name} ---")
+    return True
+
+
+def instrument_a2a_app(app, service_name: str):
+    """Enables tracing for an agent's A2A Starlette app.
+
+    The ASGI middleware continues the caller's trace from the W3C traceparent
+    header, and ADK's own agent/LLM/tool spans nest under it.
+    """
+    if not setup_tracing(service_name):
+        return app
+
+    from opentelemetry.instrumentation.asgi import OpenTelemetryMiddleware
+
+    app.add_middleware(OpenTelemetryMiddleware)
+    return app
@@ -0,0 +1,56 @@
+"""Segment clipping for the video analyser.
+
+The backend analyses long videos in overlapping segments, one request per
+segment. Each request carries the full video file part plus a tag naming the
+segment:
+
+    <Segment start_seconds="570" end_seconds="1170"/>
+
+Before the model call, the video part is clipped to that range (Gemini
+video_metadata offsets), so the model only processes the segment. Timestamps
+in the reply are relative to the segment start; the backend moves them back
+to video time.
+"""
+import re
+from typing import Optional, Tuple
+
+SEGMENT_RE = re.compile(r'<Segment start_seconds="(?P<start>\d+)" end_seconds="(?P<end>\d+)"\s*/>')
+
+
+def find_segment(text: str) -> Optional[Tuple[int, int]]:
+    match = SEGMENT_RE.search(text or "")
+    return (int(match["start"]), int(match["end"])) if match else None
+
+
+def _request_segment(llm_request) -> Optional[Tuple[int, int]]:
+    # The latest user message's tag applies
+    for content in reversed(llm_request.contents or []):
+        if content.role != "user":
+            continue
+        for part in content.parts or []:
+            segment = find_segment(part.text) if part.text else None
+            if segment:
+                return segment
+    return None
+
+
+def segment_clip_callback(callback_context, llm_request):
+    """before_model_callback limiting video file parts to the requested segment."""
+    segment = _request_segment(llm_request)
+    if segment is None:
+        return None
+    from google.genai import types
+
+    start, end = segment
+    clip = types.VideoMetadata(start_offset=f"{start}s", end_offset=f"{end}s")
+    # Contents may share objects with the session's events, so they are copied, not edited
+    for i, content in enumerate(llm_request.contents or []):
+        if content.role != "user":
+            continue
+        parts = [
+            p.model_copy(update={"video_metadata": clip})
+            if p.file_data and (p.file_data.mime_type or "").startswith("video/") else p
+            for p in content.parts or []
+        ]
+        llm_request.contents[i] = content.model_copy(update={"parts": parts})
+    return None
@@ -0,0 +1,65 @@
+"""Add ON DELETE CASCADE foreign keys and FK indexes
+
+Revision ID: b7d41e9c2a10
+Revises: 479bd71c8df9
+Create Date: 2026-10-19 10:12:40.118302
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7d41e9c2a10'
+down_revision: Union[str, Sequence[str], None] = '479bd71c8df9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# (table, column, referred table, ondelete)
+FOREIGN_KEYS = [
+    ('class', 'teacher_id', 'user', 'SET NULL'),
+    ('classenrollment', 'class_id', 'class', 'CASCADE'),
+    ('classenrollment', 'student_id', 'user', 'CASCADE'),
+    ('resource', 'class_id', 'class', 'CASCADE'),
+    ('occurrence', 'topic_id', 'topic', 'CASCADE'),
+    ('occurrence', 'resource_id', 'resource', 'CASCADE'),
+    ('keyconcept', 'occurrence_id', 'occurrence', 'CASCADE'),
+    ('assignment', 'class_id', 'class', 'CASCADE'),
+    ('question', 'assignment_id', 'assignment', 'CASCADE'),
+    ('questionresponse', 'student_id', 'user', 'CASCADE'),
+    ('questionresponse', 'question_id', 'question', 'CASCADE'),
+    ('topicscore', 'topic_id', 'topic', 'CASCADE'),
+    ('topicscore', 'response_id', 'questionresponse', 'CASCADE'),
+    ('assignmentgrade', 'assignment_id', 'assignment', 'CASCADE'),
+    ('assignmentgrade', 'student_id', 'user', 'CASCADE'),
+    ('gradereviewcomment', 'response_id', 'questionresponse', 'CASCADE'),
+    ('gradereviewcomment', 'user_id', 'user', 'CASCADE'),
+]
+
+# Cascades walk child tables by FK, so every cascading FK column needs an index
+# or a single parent delete turns into a sequential scan per child table.
+INDEXED_COLUMNS = [(table, column) for table, column, _, ondelete in FOREIGN_KEYS if ondelete == 'CASCADE']
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    for table, column, referred, ondelete in FOREIGN_KEYS:
+        name = f'{table}_{column}_fkey'
+        op.drop_constraint(name, table, type_='foreignkey')
+        op.create_foreign_key(name, table, referred, [column], ['id'], ondelete=ondelete)
+
+    for table, column in INDEXED_COLUMNS:
+        op.create_index(op.f(f'ix_{table}_{column}'), table, [column], unique=False, if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table, column in reversed(INDEXED_COLUMNS):
+        op.drop_index(op.f(f'ix_{table}_{column}'), table_name=table, if_exists=True)
+
+    for table, column, referred, _ in reversed(FOREIGN_KEYS):
+        name = f'{table}_{column}_fkey'
+        op.drop_constraint(name, table, type_='foreignkey')
+        op.create_foreign_key(name, table, referred, [column], ['id'])
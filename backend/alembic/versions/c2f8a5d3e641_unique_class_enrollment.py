@@ -0,0 +1,36 @@
+"""Unique (class_id, student_id) on classenrollment
+
+Revision ID: c2f8a5d3e641
+Revises: b7d41e9c2a10
+Create Date: 2026-10-19 11:03:27.540916
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c2f8a5d3e641'
+down_revision: Union[str, Sequence[str], None] = 'b7d41e9c2a10'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Drop duplicate enrollments left by earlier check-then-insert races, keeping the oldest
+    op.execute("""
+        DELETE FROM classenrollment ce
+        USING (
+            SELECT id, ROW_NUMBER() OVER (PARTITION BY class_id, student_id ORDER BY id) AS rn
+            FROM classenrollment
+        ) ranked
+        WHERE ce.id = ranked.id AND ranked.rn > 1
+    """)
+    op.create_unique_constraint('uq_classenrollment_class_student', 'classenrollment', ['class_id', 'student_id'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_constraint('uq_classenrollment_class_student', 'classenrollment', type_='unique')
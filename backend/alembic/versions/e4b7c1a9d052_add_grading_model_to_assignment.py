@@ -0,0 +1,29 @@
+"""Add grading_model to assignment
+
+Revision ID: e4b7c1a9d052
+Revises: c2f8a5d3e641
+Create Date: 2026-10-19 15:42:08.214530
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e4b7c1a9d052'
+down_revision: Union[str, Sequence[str], None] = 'c2f8a5d3e641'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('assignment', sa.Column('grading_model', sqlmodel.sql.sqltypes.AutoString(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('assignment', 'grading_model')
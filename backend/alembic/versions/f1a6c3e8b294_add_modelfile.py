@@ -0,0 +1,42 @@
+"""Add modelfile
+
+Revision ID: f1a6c3e8b294
+Revises: e4b7c1a9d052
+Create Date: 2026-10-19 17:05:31.402118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f1a6c3e8b294'
+down_revision: Union[str, Sequence[str], None] = 'e4b7c1a9d052'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('modelfile',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('resource_id', sa.Integer(), nullable=False),
+    sa.Column('source_key', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('name', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('uri', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('mime_type', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('expires_at', sa.DateTime(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['resource_id'], ['resource.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_modelfile_resource_id'), 'modelfile', ['resource_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_modelfile_resource_id'), table_name='modelfile')
+    op.drop_table('modelfile')
@@ -1,4 +1,4 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
 
@@ -22,18 +22,45 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-from .database import create_db_and_tables
+from .metrics import MetricsMiddleware, register_pool_metrics, render_metrics
+from .query_stats import QueryStatsMiddleware, instrument_engine
+from .database import create_db_and_tables, engine
+from .tracing import setup_tracing
+from .services.notification_service import hub
+from .services.agent_registry import agent_registry
+from .services.agent_debug_log import agent_debug_log
+
+instrument_engine(engine)
+register_pool_metrics(engine)
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(QueryStatsMiddleware) # Outermost, so MetricsMiddleware sees the request's DB stats
+setup_tracing(app, engine)
 
 @app.on_event("startup")
-def on_startup():
+async def on_startup():
     create_db_and_tables()
+    await hub.start()
+    await agent_registry.start()
+    agent_debug_log.start()
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    await hub.stop()
+    await agent_registry.stop()
+    agent_debug_log.stop()
 
 app.include_router(auth.router)
-from .routers import admin, teacher, student
+from .routers import admin, teacher, student, notifications
 app.include_router(admin.router)
 app.include_router(teacher.router)
 app.include_router(student.router)
+app.include_router(notifications.router)
 
 @app.get("/")
 def read_root():
     return {"message": "Agentic LMS Backend is running"}
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
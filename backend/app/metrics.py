@@ -0,0 +1,376 @@
+import os
+import time
+import logging
+from contextlib import contextmanager
+from typing import Optional
+from prometheus_client import (
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    REGISTRY,
+    CONTENT_TYPE_LATEST,
+    generate_latest,
+    multiprocess,
+)
+from prometheus_client.core import GaugeMetricFamily
+from sqlalchemy.engine import Engine
+
+from .query_stats import current_db_stats
+
+logger = logging.getLogger(__name__)
+
+# ==========================================
+# HTTP
+# ==========================================
+
+REQUEST_LATENCY = Histogram(
+    "lms_http_request_duration_seconds",
+    "HTTP request latency by route template",
+    ["method", "route", "status"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "lms_http_requests_in_flight",
+    "HTTP requests currently being served",
+    ["method"],
+    multiprocess_mode="livesum",
+)
+
+# ==========================================
+# Database
+# ==========================================
+
+# Counters rather than histograms keep the per-request cost down; divide by
+# lms_http_request_duration_seconds_count for the per-request average.
+DB_QUERIES = Counter(
+    "lms_db_queries",
+    "SQL statements executed while serving HTTP requests",
+    ["route"],
+)
+DB_TIME = Counter(
+    "lms_db_query_seconds",
+    "Time spent in SQL statements while serving HTTP requests",
+    ["route"],
+)
+
+_pool_collectors = []
+
+def register_pool_metrics(engine: Engine):
+    collector = PoolCollector(engine)
+    _pool_collectors.append(collector)
+    REGISTRY.register(collector)
+
+class PoolCollector:
+    """
+    Reports connection-pool occupancy at scrape time.
+    """
+    def __init__(self, engine: Engine):
+        self.engine = engine
+
+    def collect(self):
+        pool = self.engine.pool
+        for name, doc, getter in (
+            ("lms_db_pool_size", "Configured pool size", "size"),
+            ("lms_db_pool_checked_out", "Connections currently checked out", "checkedout"),
+            ("lms_db_pool_checked_in", "Idle connections in the pool", "checkedin"),
+            ("lms_db_pool_overflow", "Connections open beyond pool_size", "overflow"),
+        ):
+            # Not every pool class has these as methods; SingletonThreadPool.size is an int
+            method = getattr(pool, getter, None)
+            if callable(method):
+                yield GaugeMetricFamily(name, doc, value=method())
+
+# ==========================================
+# Agents
+# ==========================================
+
+AGENT_CALL_LATENCY = Histogram(
+    "lms_agent_call_duration_seconds",
+    "Latency of calls to A2A agents",
+    ["agent", "operation"],
+    buckets=(0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300, 600, 1800),
+)
+AGENT_CALL_ERRORS = Counter(
+    "lms_agent_call_errors_total",
+    "Failed calls to A2A agents",
+    ["agent", "operation", "reason"],
+)
+AGENT_OUTPUT_PARSE = Counter(
+    "lms_agent_output_parse",
+    "Agent replies parsed, by outcome (ok, repaired, no_json, invalid)",
+    ["agent", "operation", "outcome"],
+)
+AGENT_BREAKER_STATE = Gauge(
+    "lms_agent_breaker_state",
+    "Circuit breaker state per agent: 0 closed, 1 half open, 2 open",
+    ["agent"],
+    multiprocess_mode="livemax",
+)
+AGENT_BREAKER_TRANSITIONS = Counter(
+    "lms_agent_breaker_transitions",
+    "Circuit breaker state changes, by the state entered",
+    ["agent", "state"],
+)
+AGENT_TIMEOUT_SECONDS = Gauge(
+    "lms_agent_timeout_seconds",
+    "Current adaptive timeout for agent calls",
+    ["agent", "operation"],
+    multiprocess_mode="livemax",
+)
+AGENT_HEDGES = Counter(
+    "lms_agent_hedges",
+    "Hedged agent requests sent, and those that answered first",
+    ["agent", "outcome"],
+)
+AGENT_REPLICA_OUTSTANDING = Gauge(
+    "lms_agent_replica_outstanding",
+    "Calls in flight to each agent replica",
+    ["agent", "replica"],
+    multiprocess_mode="livesum",
+)
+AGENT_REPLICA_STATE = Gauge(
+    "lms_agent_replica_state",
+    "Agent replica state: 0 available, 1 failing health checks, 2 ejected",
+    ["agent", "replica"],
+    multiprocess_mode="livemax",
+)
+AGENT_REPLICA_CALLS = Counter(
+    "lms_agent_replica_calls",
+    "Calls to each agent replica, by outcome (ok, failed)",
+    ["agent", "replica", "outcome"],
+)
+AGENT_REPLICA_EJECTIONS = Counter(
+    "lms_agent_replica_ejections",
+    "Times an agent replica was taken out of rotation after consecutive failures",
+    ["agent", "replica"],
+)
+AGENT_QUEUE_DEPTH = Gauge(
+    "lms_agent_queue_depth",
+    "Agent calls waiting for a slot, by priority class",
+    ["agent", "priority"],
+    multiprocess_mode="livesum",
+)
+AGENT_QUEUE_WAIT = Histogram(
+    "lms_agent_queue_wait_seconds",
+    "Time agent calls waited for a slot, by priority class",
+    ["agent", "priority"],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600),
+)
+AGENT_SCHEDULED_IN_FLIGHT = Gauge(
+    "lms_agent_scheduled_in_flight",
+    "Agent calls holding a slot, by priority class",
+    ["agent", "priority"],
+    multiprocess_mode="livesum",
+)
+AGENT_QUEUE_REJECTED = Counter(
+    "lms_agent_queue_rejected",
+    "Agent calls turned away by the scheduler, by reason (queue_full, deadline)",
+    ["agent", "priority", "reason"],
+)
+AGENT_TOKEN_BUDGET = Gauge(
+    "lms_agent_token_budget",
+    "Model tokens left in an agent's per-minute budget",
+    ["agent"],
+    multiprocess_mode="livesum",
+)
+ANALYSIS_PARTS = Counter(
+    "lms_analysis_parts",
+    "Parts of resources analysed separately (video segments, PDF page ranges), by outcome (ok, retried, failed)",
+    ["operation", "outcome"],
+)
+AGENT_TOKENS = Counter(
+    "lms_agent_tokens",
+    "Model tokens used by agent calls; cached prompt tokens are billed at a discount",
+    ["agent", "kind"],
+)
+GRADING_ROUTES = Counter(
+    "lms_grading_routes",
+    "Gradings by strategy and the model tiers that graded them (fast, pro or fast+pro)",
+    ["strategy", "tiers"],
+)
+GRADING_ESCALATIONS = Counter(
+    "lms_grading_escalations",
+    "Reasons a grading went to the pro model",
+    ["reason"],
+)
+GRADING_TIER_TOKENS = Counter(
+    "lms_grading_tier_tokens",
+    "Grading model tokens by tier, including fast grades the pro model replaced",
+    ["tier", "kind"],
+)
+MODEL_FILE_UPLOADS = Counter(
+    "lms_model_file_uploads",
+    "Resources copied from storage to the model's file store, by mode (ranged, streamed, tempfile) and outcome",
+    ["mode", "outcome"],
+)
+MODEL_FILE_BYTES = Counter(
+    "lms_model_file_bytes",
+    "Bytes moved copying resources to the model's file store, by direction (download, upload)",
+    ["direction"],
+)
+MODEL_FILE_THROUGHPUT = Histogram(
+    "lms_model_file_throughput_mb_per_second",
+    "End-to-end throughput of resource copies to the model's file store, in MB a second",
+    ["mode"],
+    buckets=(1, 2.5, 5, 10, 25, 50, 100, 250, 500),
+)
+MODEL_FILE_BUFFERED = Gauge(
+    "lms_model_file_buffered_bytes",
+    "Bytes held in memory between the storage download and the model file upload",
+    multiprocess_mode="livesum",
+)
+MODEL_FILE_RETRIES = Counter(
+    "lms_model_file_retries",
+    "Retried range downloads and resumed chunk uploads while copying resources to the model's file store",
+    ["direction"],
+)
+MODEL_FILE_CACHE = Counter(
+    "lms_model_file_cache",
+    "Model file cache lookups and upkeep, by result (hit, miss, uncacheable, stale, gone, refreshed, deleted)",
+    ["result"],
+)
+AGENT_DEBUG_RECORDS = Counter(
+    "lms_agent_debug_records",
+    "Agent debug log records by outcome (logged, sampled_out, archived, dropped)",
+    ["outcome"],
+)
+
+@contextmanager
+def observe_agent_call(agent: str, operation: str):
+    """
+    Times the enclosed agent call; an exception escaping the block is counted as
+    an error and re-raised.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        AGENT_CALL_ERRORS.labels(agent, operation, type(e).__name__).inc()
+        raise
+    finally:
+        AGENT_CALL_LATENCY.labels(agent, operation).observe(time.perf_counter() - started)
+
+def record_agent_error(agent: str, operation: str, reason: str):
+    AGENT_CALL_ERRORS.labels(agent, operation, reason).inc()
+
+def record_agent_tokens(agent: str, usage: Optional[dict]):
+    """
+    usage has cached, uncached and output token counts, as returned by
+    agent_output.agent_result_usage.
+    """
+    if not usage:
+        return
+    for kind, count in usage.items():
+        AGENT_TOKENS.labels(agent, kind).inc(count)
+    logger.info(f"{agent} tokens: {usage['cached']} cached, {usage['uncached']} uncached prompt, {usage['output']} output")
+
+def record_grading_route(route: Optional[dict], operation: str):
+    """
+    route is the grading agent's routing decision, as returned by
+    agent_output.agent_result_route.
+    """
+    if not route:
+        return
+    tiers = "+".join(route.get("tiers", [])) or "none"
+    GRADING_ROUTES.labels(route.get("strategy", "unknown"), tiers).inc()
+    if "pro" in route.get("tiers", []):
+        for reason in route.get("reasons", []):
+            GRADING_ESCALATIONS.labels(reason).inc()
+    for tier, counts in route.get("tokens", {}).items():
+        for kind, count in counts.items():
+            GRADING_TIER_TOKENS.labels(tier, kind).inc(count)
+    logger.info(f"Grading route for {operation}: {route.get('strategy')} strategy, graded by {tiers}"
+                f"{' (' + ', '.join(route['reasons']) + ')' if route.get('reasons') else ''} in {route.get('seconds')}s")
+
+# ==========================================
+# Notifications
+# ==========================================
+
+NOTIFICATION_CONNECTIONS = Gauge(
+    "lms_notification_connections",
+    "Open WebSocket/SSE notification connections",
+    multiprocess_mode="livesum",
+)
+NOTIFICATIONS_SENT = Counter(
+    "lms_notifications_sent",
+    "Notifications queued to connected clients",
+    ["type"],
+)
+NOTIFICATIONS_DROPPED = Counter(
+    "lms_notifications_dropped",
+    "Notifications dropped because a client's queue was full",
+)
+
+# ==========================================
+# ASGI middleware and exposition
+# ==========================================
+
+class MetricsMiddleware:
+    """
+    Plain ASGI middleware (no BaseHTTPMiddleware) to keep per-request overhead
+    to a few label lookups and two clock reads.
+    """
+    def __init__(self, app):
+        self.app = app
+        # labels() takes a lock and builds a key on every call, so children are
+        # resolved once per (method, route, status) and reused
+        self._children = {}
+        self._in_flight = {}
+
+    def _request_children(self, method: str, route_path: str, status: int):
+        key = (method, route_path, status)
+        children = self._children.get(key)
+        if children is None:
+            children = self._children[key] = (
+                REQUEST_LATENCY.labels(method, route_path, str(status)),
+                DB_QUERIES.labels(route_path),
+                DB_TIME.labels(route_path),
+            )
+        return children
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        method = scope["method"]
+        status_holder = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status_holder[0] = message["status"]
+            await send(message)
+
+        in_flight = self._in_flight.get(method)
+        if in_flight is None:
+            in_flight = self._in_flight[method] = REQUESTS_IN_FLIGHT.labels(method)
+
+        # Set up by QueryStatsMiddleware, which wraps this one
+        stats = current_db_stats.get()
+        in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            in_flight.dec()
+            # Route template rather than raw path keeps label cardinality bounded
+            route_path = getattr(scope.get("route"), "path", "unmatched")
+            latency, queries, db_time = self._request_children(method, route_path, status_holder[0])
+            latency.observe(elapsed)
+            if stats is not None and stats.queries:
+                queries.inc(stats.queries)
+                db_time.inc(stats.seconds)
+
+def render_metrics():
+    """
+    Returns (body, content_type). Aggregates across uvicorn workers when
+    PROMETHEUS_MULTIPROC_DIR is set.
+    """
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        for collector in _pool_collectors:
+            registry.register(collector) # Pool stats of the worker that served the scrape
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
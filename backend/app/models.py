@@ -1,5 +1,6 @@
 from typing import Optional, List, Dict, Any
 from sqlmodel import SQLModel, Field, Relationship, JSON
+from sqlalchemy import UniqueConstraint
 from datetime import datetime
 from enum import Enum
 
@@ -16,11 +17,11 @@ class User(UserBase, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     password_hash: str
     
-    classes_taught: List["Class"] = Relationship(back_populates="teacher")
-    enrollments: List["ClassEnrollment"] = Relationship(back_populates="student")
-    scores: List["AssignmentGrade"] = Relationship(back_populates="student")
-    question_responses: List["QuestionResponse"] = Relationship(back_populates="student")
-    grade_comments: List["GradeReviewComment"] = Relationship(back_populates="user")
+    classes_taught: List["Class"] = Relationship(back_populates="teacher", passive_deletes=True)
+    enrollments: List["ClassEnrollment"] = Relationship(back_populates="student", passive_deletes=True)
+    scores: List["AssignmentGrade"] = Relationship(back_populates="student", passive_deletes=True)
+    question_responses: List["QuestionResponse"] = Relationship(back_populates="student", passive_deletes=True)
+    grade_comments: List["GradeReviewComment"] = Relationship(back_populates="user", passive_deletes=True)
 
 class ClassBase(SQLModel):
     name: str
@@ -28,17 +29,19 @@ class ClassBase(SQLModel):
 
 class Class(ClassBase, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
-    teacher_id: Optional[int] = Field(default=None, foreign_key="user.id")
+    teacher_id: Optional[int] = Field(default=None, foreign_key="user.id", ondelete="SET NULL")
     
     teacher: Optional[User] = Relationship(back_populates="classes_taught")
-    students: List["ClassEnrollment"] = Relationship(back_populates="class_")
-    resources: List["Resource"] = Relationship(back_populates="class_")
-    assignments: List["Assignment"] = Relationship(back_populates="class_")
+    students: List["ClassEnrollment"] = Relationship(back_populates="class_", passive_deletes=True)
+    resources: List["Resource"] = Relationship(back_populates="class_", passive_deletes=True)
+    assignments: List["Assignment"] = Relationship(back_populates="class_", passive_deletes=True)
 
 class ClassEnrollment(SQLModel, table=True):
+    __table_args__ = (UniqueConstraint("class_id", "student_id", name="uq_classenrollment_class_student"),)
+    
     id: Optional[int] = Field(default=None, primary_key=True)
-    class_id: int = Field(foreign_key="class.id")
-    student_id: int = Field(foreign_key="user.id")
+    class_id: int = Field(foreign_key="class.id", ondelete="CASCADE", index=True)
+    student_id: int = Field(foreign_key="user.id", ondelete="CASCADE", index=True)
     
     class_: Class = Relationship(back_populates="students")
     student: User = Relationship(back_populates="enrollments")
@@ -48,7 +51,7 @@ class Topic(SQLModel, table=True):
     name: str
     outline: Optional[str] = None
     
-    occurrences: List["Occurrence"] = Relationship(back_populates="topic")
+    occurrences: List["Occurrence"] = Relationship(back_populates="topic", passive_deletes=True)
 
 class ResourceType(str, Enum):
     VIDEO = "video"
@@ -63,26 +66,26 @@ class ResourceBase(SQLModel):
 
 class Resource(ResourceBase, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
-    class_id: int = Field(foreign_key="class.id")
+    class_id: int = Field(foreign_key="class.id", ondelete="CASCADE", index=True)
     
     class_: Class = Relationship(back_populates="resources")
-    occurrences: List["Occurrence"] = Relationship(back_populates="resource")
+    occurrences: List["Occurrence"] = Relationship(back_populates="resource", passive_deletes=True)
 
 
 
 class Occurrence(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
-    topic_id: int = Field(foreign_key="topic.id")
-    resource_id: Optional[int] = Field(default=None, foreign_key="resource.id")
+    topic_id: int = Field(foreign_key="topic.id", ondelete="CASCADE", index=True)
+    resource_id: Optional[int] = Field(default=None, foreign_key="resource.id", ondelete="CASCADE", index=True)
     
     topic: Topic = Relationship(back_populates="occurrences")
     resource: Optional[Resource] = Relationship(back_populates="occurrences")
-    key_concepts: List["KeyConcept"] = Relationship(back_populates="occurrence")
+    key_concepts: List["KeyConcept"] = Relationship(back_populates="occurrence", passive_deletes=True)
 
 class TopicScore(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
-    topic_id: int = Field(foreign_key="topic.id")
-    response_id: int = Field(foreign_key="questionresponse.id")
+    topic_id: int = Field(foreign_key="topic.id", ondelete="CASCADE", index=True)
+    response_id: int = Field(foreign_key="questionresponse.id", ondelete="CASCADE", index=True)
     marks: float
     
     topic: Topic = Relationship()
@@ -92,7 +95,7 @@ class KeyConcept(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     name: str
     description: Optional[str] = None
-    occurrence_id: int = Field(foreign_key="occurrence.id")
+    occurrence_id: int = Field(foreign_key="occurrence.id", ondelete="CASCADE", index=True)
     timestamp_start: Optional[int] = None
     timestamp_end: Optional[int] = None
     page_number: Optional[int] = None
@@ -102,25 +105,26 @@ class KeyConcept(SQLModel, table=True):
 
 class Assignment(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
-    class_id: int = Field(foreign_key="class.id")
+    class_id: int = Field(foreign_key="class.id", ondelete="CASCADE", index=True)
     title: str
+    grading_model: Optional[str] = None # fast, pro or tiered; None leaves it to the grading agent's GRADING_STRATEGY
     
     class_: Class = Relationship(back_populates="assignments")
-    questions: List["Question"] = Relationship(back_populates="assignment")
-    grades: List["AssignmentGrade"] = Relationship(back_populates="assignment")
+    questions: List["Question"] = Relationship(back_populates="assignment", passive_deletes=True)
+    grades: List["AssignmentGrade"] = Relationship(back_populates="assignment", passive_deletes=True)
 
 class Question(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
-    assignment_id: int = Field(foreign_key="assignment.id")
+    assignment_id: int = Field(foreign_key="assignment.id", ondelete="CASCADE", index=True)
     content: str
     
     assignment: Assignment = Relationship(back_populates="questions")
-    responses: List["QuestionResponse"] = Relationship(back_populates="question")
+    responses: List["QuestionResponse"] = Relationship(back_populates="question", passive_deletes=True)
 
 class QuestionResponse(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
-    student_id: int = Field(foreign_key="user.id")
-    question_id: int = Field(foreign_key="question.id")
+    student_id: int = Field(foreign_key="user.id", ondelete="CASCADE", index=True)
+    question_id: int = Field(foreign_key="question.id", ondelete="CASCADE", index=True)
     graded: bool = Field(default=False)
     grader: str = Field(default="ai")
     marks: Optional[float] = None
@@ -129,13 +133,13 @@ class QuestionResponse(SQLModel, table=True):
     
     student: User = Relationship(back_populates="question_responses")
     question: Question = Relationship(back_populates="responses")
-    topic_scores: List["TopicScore"] = Relationship(back_populates="response")
-    comments: List["GradeReviewComment"] = Relationship(back_populates="response")
+    topic_scores: List["TopicScore"] = Relationship(back_populates="response", passive_deletes=True)
+    comments: List["GradeReviewComment"] = Relationship(back_populates="response", passive_deletes=True)
 
 class AssignmentGrade(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
-    assignment_id: int = Field(foreign_key="assignment.id")
-    student_id: int = Field(foreign_key="user.id")
+    assignment_id: int = Field(foreign_key="assignment.id", ondelete="CASCADE", index=True)
+    student_id: int = Field(foreign_key="user.id", ondelete="CASCADE", index=True)
     marks: float
     feedback: Optional[str] = None
     
@@ -144,10 +148,22 @@ class AssignmentGrade(SQLModel, table=True):
 
 class GradeReviewComment(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
-    response_id: int = Field(foreign_key="questionresponse.id")
-    user_id: int = Field(foreign_key="user.id")
+    response_id: int = Field(foreign_key="questionresponse.id", ondelete="CASCADE", index=True)
+    user_id: int = Field(foreign_key="user.id", ondelete="CASCADE", index=True)
     content: str
     created_at: datetime = Field(default_factory=datetime.utcnow)
     
     response: QuestionResponse = Relationship(back_populates="comments")
     user: User = Relationship(back_populates="grade_comments")
+
+# A resource's copy in the Gemini Files API (AI Studio mode), reused by later
+# analyses of the same stored object until it expires
+class ModelFile(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    resource_id: int = Field(foreign_key="resource.id", ondelete="CASCADE", index=True)
+    source_key: str # The object's URL and version (generation, content hash or ETag)
+    name: str # files/..., for the Files API
+    uri: str
+    mime_type: str
+    expires_at: datetime
+    created_at: datetime = Field(default_factory=datetime.utcnow)
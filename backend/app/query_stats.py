@@ -0,0 +1,111 @@
+import os
+import time
+import logging
+from contextvars import ContextVar
+from typing import Optional
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+slow_query_logger = logging.getLogger("app.slow_queries")
+
+# X-Query-Count / Server-Timing headers are only sent outside production
+APP_ENV = os.getenv("APP_ENV", "development").lower()
+EXPOSE_QUERY_HEADERS = APP_ENV != "production"
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+SLOW_QUERY_PARAMS_MAX_CHARS = 500
+
+class RequestDBStats:
+    """
+    Mutable per-request counters. Held in a ContextVar so statements run from
+    threadpool helpers (which copy the context) still count towards the request.
+    """
+    __slots__ = ("queries", "seconds", "scope")
+
+    def __init__(self, scope: Optional[dict] = None):
+        self.queries = 0
+        self.seconds = 0.0
+        self.scope = scope
+
+    @property
+    def route(self) -> str:
+        if self.scope is None:
+            return "-"
+        return getattr(self.scope.get("route"), "path", self.scope.get("path", "-"))
+
+current_db_stats: ContextVar[Optional[RequestDBStats]] = ContextVar("current_db_stats", default=None)
+
+def query_budget(max_queries: int):
+    """
+    Declares how many SQL statements an endpoint may issue. Place it under the
+    router decorator. Exceeding it is logged, reported in the X-Query-Budget
+    header outside production, and fails tests using the query_budget fixture.
+    """
+    def decorator(fn):
+        fn.__query_budget__ = max_queries
+        return fn
+    return decorator
+
+def declared_query_budget(scope: dict) -> Optional[int]:
+    route = scope.get("route")
+    return getattr(getattr(route, "endpoint", None), "__query_budget__", None)
+
+def instrument_engine(engine: Engine):
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start_time"].pop()
+        stats = current_db_stats.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.seconds += elapsed
+        if elapsed * 1000 >= SLOW_QUERY_MS:
+            params = repr(parameters)
+            if len(params) > SLOW_QUERY_PARAMS_MAX_CHARS:
+                params = params[:SLOW_QUERY_PARAMS_MAX_CHARS] + "...(truncated)"
+            slow_query_logger.warning(
+                f"Slow query {elapsed * 1000:.1f}ms on route {stats.route if stats else '-'}: "
+                f"{' '.join(statement.split())} | params={params}"
+            )
+
+class QueryStatsMiddleware:
+    """
+    Tracks SQL statements for each request. Outside production it adds
+    X-Query-Count, X-Query-Budget and Server-Timing headers to the response.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = RequestDBStats(scope)
+        token = current_db_stats.set(stats)
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                budget = declared_query_budget(scope)
+                if budget is not None and stats.queries > budget:
+                    logger.warning(f"Query budget exceeded on {stats.route}: {stats.queries} > {budget}")
+                if EXPOSE_QUERY_HEADERS:
+                    total_ms = (time.perf_counter() - started) * 1000
+                    headers = list(message.get("headers", []))
+                    headers.append((b"x-query-count", str(stats.queries).encode()))
+                    if budget is not None:
+                        headers.append((b"x-query-budget", str(budget).encode()))
+                    headers.append((
+                        b"server-timing",
+                        f'db;dur={stats.seconds * 1000:.1f};desc="{stats.queries} queries", app;dur={total_ms:.1f}'.encode(),
+                    ))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_db_stats.reset(token)
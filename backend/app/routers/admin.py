@@ -1,10 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, BackgroundTasks
+from fastapi.concurrency import run_in_threadpool
 from sqlmodel import Session, select, SQLModel
+from sqlalchemy import delete
 from typing import List, Annotated, Optional
 
 from ..database import get_session
 from ..models import User, UserRole, Class, ClassEnrollment
 from ..auth import get_current_user
+from ..services.provisioning_service import parse_rows, provision_users, enroll_students
+from ..services.agent_registry import agent_registry
+from ..services.agent_scheduler import agent_scheduler
+from ..services.model_files import class_model_files, delete_model_files
 
 router = APIRouter(
     prefix="/admin",
@@ -16,7 +22,7 @@ def check_admin_role(user: User):
     if user.role != UserRole.ADMIN:
         raise HTTPException(status_code=403, detail="Not authorized")
 
-from ..auth import get_password_hash
+from ..auth import get_password_hash_async
 
 @router.post("/users", response_model=User)
 async def create_user(
@@ -29,7 +35,7 @@ async def create_user(
     if session.exec(select(User).where(User.username == user_data.username)).first():
         raise HTTPException(status_code=400, detail="Username exists")
         
-    user_data.password_hash = get_password_hash(user_data.password_hash)
+    user_data.password_hash = await get_password_hash_async(user_data.password_hash)
     
     session.add(user_data)
     session.commit()
@@ -77,8 +83,7 @@ async def update_user(
         db_user.role = user_update.role
         
     if user_update.password:
-        from ..auth import get_password_hash
-        db_user.password_hash = get_password_hash(user_update.password)
+        db_user.password_hash = await get_password_hash_async(user_update.password)
         
     session.add(db_user)
     session.commit()
@@ -95,7 +100,8 @@ async def delete_user(
     user = session.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    session.delete(user)
+    # Enrollments, responses, grades and comments cascade; taught classes are unassigned
+    session.exec(delete(User).where(User.id == user_id))
     session.commit()
     return {"ok": True}
 
@@ -123,14 +129,20 @@ async def list_classes(
 async def delete_class(
     class_id: int,
     current_user: Annotated[User, Depends(get_current_user)],
+    background_tasks: BackgroundTasks,
     session: Session = Depends(get_session)
 ):
     check_admin_role(current_user)
     class_obj = session.get(Class, class_id)
     if not class_obj:
         raise HTTPException(status_code=404, detail="Class not found")
-    session.delete(class_obj)
+    # Enrollments, resources and assignments (with their dependants) cascade;
+    # the resources' copies in the model's file store are deleted afterwards
+    file_names = class_model_files(session, class_id)
+    session.exec(delete(Class).where(Class.id == class_id))
     session.commit()
+    if file_names:
+        background_tasks.add_task(delete_model_files, file_names)
     return {"ok": True}
 
 @router.post("/classes/{class_id}/enroll", response_model=ClassEnrollment)
@@ -189,3 +201,131 @@ async def list_class_students(
         .where(ClassEnrollment.class_id == class_id)
     )
     return session.exec(statement).all()
+
+# ==========================================
+# Bulk provisioning
+# ==========================================
+
+class BulkUserItem(SQLModel):
+    username: str
+    password: str
+    role: UserRole = UserRole.STUDENT
+
+class BulkUsers(SQLModel):
+    users: List[BulkUserItem]
+
+class BulkEnrollmentItem(SQLModel):
+    class_id: int
+    student_id: Optional[int] = None
+    username: Optional[str] = None
+
+class BulkEnrollments(SQLModel):
+    enrollments: List[BulkEnrollmentItem]
+
+def _summarise(report: list) -> dict:
+    counts = {}
+    for entry in report:
+        counts[entry["status"]] = counts.get(entry["status"], 0) + 1
+    return {"summary": counts, "rows": report}
+
+async def _read_upload(file: UploadFile) -> list:
+    content = (await file.read()).decode("utf-8-sig")
+    fmt = "json" if (file.filename or "").lower().endswith(".json") else "csv"
+    try:
+        return parse_rows(content, fmt)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Could not parse {fmt} upload: {e}")
+
+@router.post("/users/bulk")
+async def bulk_create_users(
+    bulk: BulkUsers,
+    current_user: Annotated[User, Depends(get_current_user)],
+    session: Session = Depends(get_session)
+):
+    check_admin_role(current_user)
+    rows = [u.model_dump(mode="json") for u in bulk.users]
+    return _summarise(await run_in_threadpool(provision_users, session, rows))
+
+@router.post("/users/bulk/upload")
+async def bulk_create_users_upload(
+    current_user: Annotated[User, Depends(get_current_user)],
+    file: UploadFile = File(...),
+    session: Session = Depends(get_session)
+):
+    check_admin_role(current_user)
+    rows = await _read_upload(file)
+    return _summarise(await run_in_threadpool(provision_users, session, rows))
+
+@router.post("/enrollments/bulk")
+async def bulk_enroll_students(
+    bulk: BulkEnrollments,
+    current_user: Annotated[User, Depends(get_current_user)],
+    session: Session = Depends(get_session)
+):
+    check_admin_role(current_user)
+    rows = [e.model_dump() for e in bulk.enrollments]
+    return _summarise(await run_in_threadpool(enroll_students, session, rows))
+
+@router.post("/enrollments/bulk/upload")
+async def bulk_enroll_students_upload(
+    current_user: Annotated[User, Depends(get_current_user)],
+    file: UploadFile = File(...),
+    session: Session = Depends(get_session)
+):
+    check_admin_role(current_user)
+    rows = await _read_upload(file)
+    return _summarise(await run_in_threadpool(enroll_students, session, rows))
+
+# ==========================================
+# Agent replicas
+# ==========================================
+
+class AgentReplicaItem(SQLModel):
+    url: str
+
+def _agent_pool(agent: str):
+    pool = agent_registry.pools.get(agent)
+    if pool is None:
+        raise HTTPException(status_code=404, detail=f"Unknown agent {agent}")
+    return pool
+
+@router.get("/agents")
+def list_agent_replicas(current_user: Annotated[User, Depends(get_current_user)]):
+    check_admin_role(current_user)
+    return agent_registry.as_dict()
+
+@router.get("/agents/queues")
+def list_agent_queues(current_user: Annotated[User, Depends(get_current_user)]):
+    """
+    Each agent's scheduler state: calls in flight and waiting per priority
+    class, and the token budget left.
+    """
+    check_admin_role(current_user)
+    return agent_scheduler.as_dict()
+
+@router.post("/agents/{agent}/replicas")
+def add_agent_replica(
+    agent: str,
+    item: AgentReplicaItem,
+    current_user: Annotated[User, Depends(get_current_user)]
+):
+    check_admin_role(current_user)
+    pool = _agent_pool(agent)
+    pool.add(item.url)
+    return pool.as_dict()
+
+@router.delete("/agents/{agent}/replicas")
+def remove_agent_replica(
+    agent: str,
+    url: str,
+    current_user: Annotated[User, Depends(get_current_user)]
+):
+    check_admin_role(current_user)
+    pool = _agent_pool(agent)
+    try:
+        removed = pool.remove(url)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if not removed:
+        raise HTTPException(status_code=404, detail=f"{url} is not a replica of {agent}")
+    return pool.as_dict()
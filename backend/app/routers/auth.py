@@ -10,8 +10,8 @@ from ..auth import (
     ACCESS_TOKEN_EXPIRE_MINUTES,
     create_access_token,
     get_current_user,
-    get_password_hash,
-    verify_password,
+    get_password_hash_async,
+    verify_and_update_password_async,
 )
 
 router = APIRouter(prefix="/auth", tags=["auth"])
@@ -26,13 +26,23 @@ async def login_for_access_token(
     statement = select(User).where(User.username == form_data.username)
     user = session.exec(statement).first()
     
-    if not user or not verify_password(form_data.password, user.password_hash):
+    valid, new_hash = (False, None)
+    if user:
+        valid, new_hash = await verify_and_update_password_async(form_data.password, user.password_hash)
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
     
+    if new_hash:
+        # Stored hash used an old cost factor; swap it now that we know the password
+        user.password_hash = new_hash
+        session.add(user)
+        session.commit()
+        session.refresh(user)
+    
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
         data={"sub": user.username, "role": user.role}, expires_delta=access_token_expires
@@ -51,7 +61,7 @@ async def register(
         raise HTTPException(status_code=400, detail="Username already registered")
     
     # Hash password
-    hashed_password = get_password_hash(user_data.password_hash) # Use hash field for plain input temporarily or fix user model
+    hashed_password = await get_password_hash_async(user_data.password_hash) # Use hash field for plain input temporarily or fix user model
     # Wait, User model stores hash. Input should be plain. 
     # Let's assume for this simpler setup the client sends 'password_hash' as plain password, 
     # and we hash it here. In a stricter app, use separate Pydantic models (UserCreate vs UserRead).
@@ -0,0 +1,136 @@
+import json
+import asyncio
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, WebSocket, WebSocketDisconnect, status
+from fastapi.responses import StreamingResponse
+from sqlmodel import Session
+from typing import Optional
+
+from ..database import engine
+from ..auth import ACCESS_TOKEN_EXPIRE_MINUTES, get_current_user, oauth2_scheme, user_for_token
+from ..models import User
+from ..services.notification_service import hub
+
+router = APIRouter(
+    prefix="/notifications",
+    tags=["notifications"],
+)
+
+HEARTBEAT_SECONDS = 15
+# EventSource can't set headers, so the SSE stream reads the token from this
+# cookie (set by POST /notifications/session) rather than the query string,
+# which ends up in access and proxy logs
+TOKEN_COOKIE = "notifications_token"
+# Browser WebSockets can't set headers either, but can offer subprotocols:
+# new WebSocket(url, ["bearer", token])
+BEARER_PROTOCOL = "bearer"
+
+def _bearer(authorization: Optional[str]) -> Optional[str]:
+    if authorization and authorization.lower().startswith("bearer "):
+        return authorization[7:]
+    return None
+
+def _protocol_token(protocols: Optional[str]) -> Optional[str]:
+    offered = [p.strip() for p in (protocols or "").split(",")]
+    if BEARER_PROTOCOL in offered[:-1]:
+        return offered[offered.index(BEARER_PROTOCOL) + 1]
+    return None
+
+def _user_for_token(token: str) -> User:
+    # Short-lived session: a stream must not hold a pooled connection while it is open
+    with Session(engine) as session:
+        return user_for_token(token, session)
+
+async def _authenticate(token: Optional[str]) -> User:
+    if not token:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
+    return await asyncio.to_thread(_user_for_token, token)
+
+@router.post("/session", status_code=status.HTTP_204_NO_CONTENT)
+async def notification_session(request: Request, response: Response, token: str = Depends(oauth2_scheme),
+                               current_user: User = Depends(get_current_user)):
+    """
+    Sets the HttpOnly cookie /stream authenticates with, to the caller's
+    token. Call it with credentials before opening an EventSource with
+    withCredentials.
+    """
+    response.set_cookie(
+        TOKEN_COOKIE, token, max_age=ACCESS_TOKEN_EXPIRE_MINUTES * 60, path=router.prefix,
+        httponly=True, samesite="lax", secure=request.url.scheme == "https",
+    )
+
+@router.delete("/session", status_code=status.HTTP_204_NO_CONTENT)
+async def end_notification_session(response: Response):
+    response.delete_cookie(TOKEN_COOKIE, path=router.prefix)
+
+def _types(types: Optional[str]):
+    return set(t.strip() for t in types.split(",") if t.strip()) if types else None
+
+@router.get("/stream")
+async def notification_stream(request: Request, types: Optional[str] = None):
+    """
+    Server-sent events for the current user: grade.released, grade.updated,
+    comment.added, analysis.completed and analysis.failed, optionally filtered
+    with ?types=a,b. An "overflow" event means some were dropped; refetch.
+    Authenticated by the notifications cookie or an Authorization header.
+    """
+    user = await _authenticate(_bearer(request.headers.get("authorization")) or request.cookies.get(TOKEN_COOKIE))
+    subscription = hub.subscribe(user.id, _types(types))
+
+    async def events():
+        try:
+            yield ": connected\n\n"
+            while True:
+                try:
+                    message = await asyncio.wait_for(subscription.next(), HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n" # Keeps proxies from closing an idle stream
+                    continue
+                yield f"event: {message['type']}\ndata: {json.dumps(message['data'], default=str)}\n\n"
+        finally:
+            hub.unsubscribe(subscription)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.websocket("/ws")
+async def notification_socket(websocket: WebSocket, types: Optional[str] = None):
+    """
+    Same events as /stream, sent as {"type": ..., "data": ...} JSON messages.
+    Authenticated by the "bearer" subprotocol, an Authorization header or the
+    notifications cookie.
+    """
+    protocol_token = _protocol_token(websocket.headers.get("sec-websocket-protocol"))
+    try:
+        user = await _authenticate(protocol_token or _bearer(websocket.headers.get("authorization"))
+                                   or websocket.cookies.get(TOKEN_COOKIE))
+    except HTTPException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    # Browsers drop the connection unless one of the offered subprotocols is chosen
+    await websocket.accept(subprotocol=BEARER_PROTOCOL if protocol_token else None)
+    subscription = hub.subscribe(user.id, _types(types))
+
+    async def send_events():
+        while True:
+            await websocket.send_json(await subscription.next())
+
+    async def wait_for_close():
+        # Client messages are ignored; reading is how a disconnect is noticed
+        try:
+            while True:
+                await websocket.receive_text()
+        except WebSocketDisconnect:
+            pass
+
+    sender = asyncio.create_task(send_events())
+    receiver = asyncio.create_task(wait_for_close())
+    try:
+        await asyncio.wait({sender, receiver}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        sender.cancel()
+        receiver.cancel()
+        hub.unsubscribe(subscription)
@@ -1,12 +1,22 @@
+import json
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
 from sqlmodel import Session, select
 from sqlalchemy import func
 from typing import List, Annotated
 
 from pydantic import BaseModel
-from ..database import get_session
+from ..database import get_session, engine
 from ..models import User, UserRole, Class, Resource, Assignment, AssignmentGrade, ClassEnrollment, Question, QuestionResponse
 from ..auth import get_current_user
+from ..services.grade_service import (
+    build_review_responses, upsert_responses, grading_topics, questions_with_answers,
+    save_question_score, save_grading_result, grade_percentage,
+)
+from ..services.agent_service import stream_assignment_grading
+from ..services.agent_scheduler import INTERACTIVE, agent_work
+from ..services.notification_service import notify, question_teacher_id
+from ..query_stats import query_budget
 
 router = APIRouter(
     prefix="/student",
@@ -40,6 +50,7 @@ async def list_resources(
     return session.exec(statement).all()
 
 @router.get("/resources/{resource_id}/analysis")
+@query_budget(4)
 async def get_resource_analysis(
     resource_id: int,
     current_user: Annotated[User, Depends(get_current_user)],
@@ -54,16 +65,19 @@ async def get_resource_analysis(
         
     from ..models import Topic, Occurrence, KeyConcept
     
-    occurrences = session.exec(
-        select(Occurrence)
+    rows = session.exec(
+        select(Occurrence, Topic)
+        .join(Topic, Topic.id == Occurrence.topic_id)
         .where(Occurrence.resource_id == resource_id)
     ).all()
+    occ_ids = [occ.id for occ, _ in rows]
+    concepts_by_occ = {}
+    if occ_ids:
+        for kc in session.exec(select(KeyConcept).where(KeyConcept.occurrence_id.in_(occ_ids))).all():
+            concepts_by_occ.setdefault(kc.occurrence_id, []).append(kc)
     
     topics_map = {}
-    for occ in occurrences:
-        topic = session.get(Topic, occ.topic_id)
-        if not topic: continue
-        
+    for occ, topic in rows:
         if topic.id not in topics_map:
             topics_map[topic.id] = {
                 "id": topic.id,
@@ -71,9 +85,7 @@ async def get_resource_analysis(
                 "concepts": []
             }
             
-        key_concepts = session.exec(select(KeyConcept).where(KeyConcept.occurrence_id == occ.id)).all()
-        
-        for kc in key_concepts:
+        for kc in concepts_by_occ.get(occ.id, []):
             topics_map[topic.id]["concepts"].append({
                 "id": kc.id,
                 "name": kc.name,
@@ -123,6 +135,7 @@ async def get_assignment(
 
 
 @router.get("/classes/{class_id}/stats")
+@query_budget(6)
 async def get_student_stats(
     class_id: int,
     current_user: Annotated[User, Depends(get_current_user)],
@@ -244,141 +257,24 @@ async def submit_assignment(
         raise HTTPException(status_code=404, detail="Assignment not found")
         
     # --- UPSERT QUESTION RESPONSES ---
-    saved_responses = {}
-    for item in submission.responses:
-        # Check if response already exists
-        qr = session.exec(
-            select(QuestionResponse)
-            .where(
-                QuestionResponse.student_id == current_user.id,
-                QuestionResponse.question_id == item.question_id
-            )
-        ).first()
-
-        if qr:
-            qr.content = item.answer
-            qr.graded = False
-        else:
-            qr = QuestionResponse(
-                student_id=current_user.id,
-                question_id=item.question_id,
-                content=item.answer,
-                graded=False,
-                grader="ai"
-            )
-            session.add(qr)
-            
-        session.flush() 
-        saved_responses[item.question_id] = qr
-        
+    saved_responses = upsert_responses(session, current_user.id, submission.responses)
     session.commit()
     
-    class_id = assignment.class_id
-    resources = session.exec(select(Resource).where(Resource.class_id == class_id)).all()
-    resource_ids = [r.id for r in resources]
-    
-    topics_data = []
-    if resource_ids:
-        from ..models import Occurrence, Topic, KeyConcept
-        occurrences = session.exec(select(Occurrence).where(Occurrence.resource_id.in_(resource_ids))).all()
-        topic_ids = list(set([o.topic_id for o in occurrences]))
-        if topic_ids:
-            topics = session.exec(select(Topic).where(Topic.id.in_(topic_ids))).all()
-            for t in topics:
-                t_occs = [o for o in occurrences if o.topic_id == t.id]
-                t_occ_ids = [o.id for o in t_occs]
-                kcs = session.exec(select(KeyConcept).where(KeyConcept.occurrence_id.in_(t_occ_ids))).all()
-                kcs_data = [
-                    {
-                        "key_concept_id": kc.id,
-                        "key_concept_name": kc.name,
-                        "key_concept_description": kc.description
-                    }
-                    for kc in kcs
-                ]
-                topics_data.append({
-                    "topic_id": t.id,
-                    "topic_name": t.name,
-                    "topic_outline": t.outline,
-                    "key_concepts": kcs_data
-                })
-    
-    questions = session.exec(select(Question).where(Question.assignment_id == assignment_id)).all()
-    question_map = {q.id: q.content for q in questions}
-    
-    questions_with_answers = []
-    for item in submission.responses:
-        q_content = question_map.get(item.question_id, "Unknown Question")
-        questions_with_answers.append({
-            "question_id": item.question_id,
-            "question": q_content,
-            "answer": item.answer
-        })
+    topics_data = grading_topics(session, assignment.class_id)
+    qa = questions_with_answers(session, assignment_id, submission.responses)
         
     from ..services.agent_service import grade_assignment_submission
-    result = await grade_assignment_submission(assignment_id, current_user.id, questions_with_answers, topics_data)
+    # The student is waiting on the grade, so it goes ahead of analyses and bulk work
+    with agent_work(INTERACTIVE, f"class_{assignment.class_id}"):
+        result = await grade_assignment_submission(assignment_id, current_user.id, qa, topics_data, assignment.class_id, assignment.grading_model)
     
     if result:
-        from ..models import TopicScore
-        
-        # --- UPSERT ASSIGNMENT GRADE ---
-        grade = session.exec(
-            select(AssignmentGrade)
-            .where(
-                AssignmentGrade.assignment_id == assignment_id,
-                AssignmentGrade.student_id == current_user.id
-            )
-        ).first()
-        
-        if grade:
-            grade.marks = result.get("assignment_marks", 0.0)
-            grade.feedback = result.get("feedback", "")
-        else:
-            grade = AssignmentGrade(
-                assignment_id=assignment_id,
-                student_id=current_user.id,
-                marks=result.get("assignment_marks", 0.0),
-                feedback=result.get("feedback", "")
-            )
-            session.add(grade)
-        
-        for qs in result.get("question_scores", []):
-            qr = saved_responses.get(qs.get("question_id"))
-            if qr:
-                qr.marks = qs.get("marks", 0.0)
-                qr.feedback = qs.get("feedback", "")
-                
-        first_qr_id = None
-        for item in submission.responses:
-            first_qr_id = saved_responses[item.question_id].id
-            break
-            
-        if first_qr_id:
-            # Wipe old topic scores for this response before adding new ones
-            old_ts = session.exec(select(TopicScore).where(TopicScore.response_id == first_qr_id)).all()
-            for old in old_ts:
-                session.delete(old)
-                
-            for ts in result.get("topic_scores", []):
-                topic_score = TopicScore(
-                    topic_id=ts.get("topic_id"),
-                    response_id=first_qr_id,
-                    marks=ts.get("marks", 0.0)
-                )
-                session.add(topic_score)
-                
-        for qr in saved_responses.values():
-            qr.graded = True
-            session.add(qr)
-            
+        grade = save_grading_result(session, assignment, current_user.id, saved_responses, submission.responses, result)
         session.commit()
         
-        total_possible = len(questions_with_answers) * 10.0
-        percentage = (grade.marks / total_possible) * 100 if total_possible > 0 else 0
-        
         return {
             "status": "success", 
-            "marks": round(percentage, 1), 
+            "marks": grade_percentage(grade, len(qa)), 
             "feedback": grade.feedback, 
             "topic_scores": result.get("topic_scores", []),
             "question_scores": result.get("question_scores", [])
@@ -386,10 +282,95 @@ async def submit_assignment(
     else:
         return {"status": "pending", "message": "Agent grading failed or is pending background execution"}
 
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+@router.post("/assignments/{assignment_id}/submit/stream")
+async def submit_assignment_stream(
+    assignment_id: int,
+    submission: AssignmentSubmission,
+    current_user: Annotated[User, Depends(get_current_user)],
+    session: Session = Depends(get_session)
+):
+    """
+    Same as submit, but streams the grading back as server-sent events:
+    "submitted", one "question" per graded answer as the agent produces it,
+    then "result" (same body as submit) or "error". "escalated" means the
+    questions sent so far are being regraded by the pro model and new
+    "question" events will replace them. Each question's marks and feedback
+    are saved as its event is sent, still ungraded; the graded flags and the
+    grade are only set with "result".
+    """
+    check_student_role(current_user)
+    
+    assignment = session.get(Assignment, assignment_id)
+    if not assignment:
+        raise HTTPException(status_code=404, detail="Assignment not found")
+
+    saved_responses = upsert_responses(session, current_user.id, submission.responses)
+    session.commit()
+    topics_data = grading_topics(session, assignment.class_id)
+    qa = questions_with_answers(session, assignment_id, submission.responses)
+    response_ids = {question_id: qr.id for question_id, qr in saved_responses.items()}
+    class_id = assignment.class_id
+    grading_model = assignment.grading_model
+    student_id = current_user.id
+    items = submission.responses
+
+    async def events():
+        yield _sse("submitted", {"assignment_id": assignment_id, "questions": len(qa)})
+        # The request's session may be closed once the response starts, so
+        # results are written through a session owned by the stream
+        with Session(engine) as stream_session, agent_work(INTERACTIVE, f"class_{class_id}"):
+            responses = {qid: stream_session.get(QuestionResponse, rid) for qid, rid in response_ids.items()}
+            try:
+                async for kind, data in stream_assignment_grading(assignment_id, student_id, qa, topics_data, class_id, grading_model):
+                    if kind == "question":
+                        qr = save_question_score(responses, data)
+                        if qr is None:
+                            continue
+                        # Provisional until the result: graded stays False,
+                        # and there is no grade total yet
+                        stream_session.add(qr)
+                        stream_session.commit()
+                        yield _sse("question", {
+                            "question_id": qr.question_id,
+                            "response_id": qr.id,
+                            "marks": qr.marks,
+                            "feedback": qr.feedback
+                        })
+                    elif kind == "result":
+                        stream_assignment = stream_session.get(Assignment, assignment_id)
+                        grade = save_grading_result(stream_session, stream_assignment, student_id, responses, items, data)
+                        stream_session.commit()
+                        yield _sse("result", {
+                            "status": "success",
+                            "marks": grade_percentage(grade, len(qa)),
+                            "feedback": grade.feedback,
+                            "topic_scores": data.get("topic_scores", []),
+                            "question_scores": data.get("question_scores", [])
+                        })
+                    elif kind == "escalated":
+                        # The pro model's question events overwrite the fast grade's marks
+                        yield _sse("escalated", {"assignment_id": assignment_id, "reasons": data.get("reasons", [])})
+                    else:
+                        yield _sse("error", {"status": "pending", "message": data})
+            except BaseException:
+                # Failed, or the client disconnected: saved marks stay ungraded
+                stream_session.rollback()
+                raise
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 class CommentCreate(BaseModel):
     content: str
 
 @router.get("/assignments/{assignment_id}/review")
+@query_budget(6)
 async def get_assignment_review(
     assignment_id: int,
     current_user: Annotated[User, Depends(get_current_user)],
@@ -405,36 +386,8 @@ async def get_assignment_review(
         raise HTTPException(status_code=400, detail="Assignment not yet graded")
         
     questions = session.exec(select(Question).where(Question.assignment_id == assignment_id)).all()
-    
-    responses_data = []
-    for q in questions:
-        resp = session.exec(select(QuestionResponse).where(QuestionResponse.question_id == q.id, QuestionResponse.student_id == current_user.id)).first()
-        
-        if resp:
-            from ..models import GradeReviewComment, User
-            comments = session.exec(select(GradeReviewComment).where(GradeReviewComment.response_id == resp.id).order_by(GradeReviewComment.created_at)).all()
-            comments_data = []
-            for c in comments:
-                user = session.get(User, c.user_id)
-                comments_data.append({
-                    "id": c.id, 
-                    "content": c.content, 
-                    "user_id": c.user_id,
-                    "user_name": user.username if user else "Unknown",
-                    "user_role": user.role if user else "Unknown",
-                    "created_at": c.created_at
-                })
-            
-            responses_data.append({
-                "question_id": q.id,
-                "question_content": q.content,
-                "response_id": resp.id,
-                "response_content": resp.content,
-                "marks": resp.marks,
-                "feedback": resp.feedback,
-                "comments": comments_data
-            })
-            
+    responses_data = build_review_responses(session, questions, current_user.id)
+
     total_possible = len(questions) * 10.0
     percentage = (grade.marks / total_possible) * 100 if total_possible > 0 else 0
     
@@ -469,6 +422,9 @@ async def add_student_comment(
         content=comment.content
     )
     session.add(new_comment)
+    session.flush()
+    notify(session, [question_teacher_id(session, resp.question_id)], "comment.added",
+           {"response_id": response_id, "comment_id": new_comment.id, "student_id": current_user.id})
     session.commit()
     session.refresh(new_comment)
     
@@ -1,14 +1,19 @@
 from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, UploadFile, File, Form
 from ..services.gcs_service import upload_to_gcs
 from sqlmodel import Session, select
-from sqlalchemy import func
-from typing import List, Annotated
+from sqlalchemy import func, delete, case
+from typing import List, Annotated, Literal, Optional
 
 from ..database import get_session
 from ..models import User, UserRole, Class, Resource, Assignment, AssignmentGrade, ResourceType, KeyConcept, Topic, Occurrence, Question, QuestionResponse
 from pydantic import BaseModel
 from ..auth import get_current_user
 from ..services.agent_service import trigger_resource_analysis
+from ..services.agent_scheduler import ANALYSIS, agent_work
+from ..services.model_files import resource_model_files, delete_model_files
+from ..services.grade_service import apply_mark_changes, build_review_responses
+from ..query_stats import query_budget
+from ..services.notification_service import notify
 import logging
 
 logger = logging.getLogger(__name__)
@@ -56,7 +61,9 @@ async def add_resource(
         logger.info(f"Resource saved to DB: {resource_data.id}")
         
         try:
-            await trigger_resource_analysis(resource_data.id, resource_data.url)
+            # Queued behind students' gradings, and taking turns with other classes' analyses
+            with agent_work(ANALYSIS, f"class_{class_id}"):
+                await trigger_resource_analysis(resource_data.id, resource_data.url)
         except Exception as e:
             logger.error(f"Analysis trigger failed (non-blocking): {e}")
             pass
@@ -77,9 +84,13 @@ async def list_class_activities(
     # Optional: verify current_user is teacher for this class
     return session.exec(select(Assignment).where(Assignment.class_id == class_id)).all()
 
+# Which models grade an assignment; see grading_agent/router_agent.py
+GradingModel = Literal["fast", "pro", "tiered"]
+
 class AssignmentCreate(BaseModel):
     title: str
     questions: List[str]
+    grading_model: Optional[GradingModel] = None
 
 @router.post("/class/activity/{class_id}", response_model=Assignment)
 async def create_class_activity(
@@ -90,7 +101,7 @@ async def create_class_activity(
 ):
     check_teacher_role(current_user)
     
-    assignment = Assignment(class_id=class_id, title=assignment_data.title)
+    assignment = Assignment(class_id=class_id, title=assignment_data.title, grading_model=assignment_data.grading_model)
     session.add(assignment)
     session.commit()
     session.refresh(assignment)
@@ -103,6 +114,32 @@ async def create_class_activity(
     session.refresh(assignment)
     return assignment
 
+class GradingModelUpdate(BaseModel):
+    grading_model: Optional[GradingModel] = None # None: the grading agent's default strategy
+
+@router.put("/assignments/{assignment_id}/grading-model", response_model=Assignment)
+async def update_grading_model(
+    assignment_id: int,
+    update: GradingModelUpdate,
+    current_user: Annotated[User, Depends(get_current_user)],
+    session: Session = Depends(get_session)
+):
+    """
+    Sets which models grade the assignment's submissions from now on: always
+    the fast or the pro model, or fast first with escalation to pro (tiered).
+    """
+    check_teacher_role(current_user)
+    assignment = session.get(Assignment, assignment_id)
+    if not assignment:
+        raise HTTPException(status_code=404, detail="Assignment not found")
+
+    assignment.grading_model = update.grading_model
+    session.add(assignment)
+    session.commit()
+    session.refresh(assignment)
+    logger.info(f"Assignment {assignment_id} now graded with strategy {update.grading_model or 'default'}")
+    return assignment
+
 @router.post("/assignments/{assignment_id}/score/{student_id}", response_model=AssignmentGrade)
 async def grade_student(
     assignment_id: int,
@@ -120,6 +157,7 @@ async def grade_student(
         feedback=feedback
     )
     session.add(score)
+    notify(session, [student_id], "grade.updated", {"assignment_id": assignment_id})
     session.commit()
     session.refresh(score)
     return score
@@ -147,6 +185,7 @@ async def list_class_resources(
     resources = session.exec(select(Resource).where(Resource.class_id == class_id)).all()
     return resources
 @router.get("/resources/{resource_id}/analysis")
+@query_budget(4)
 async def get_resource_analysis(
     resource_id: int,
     current_user: Annotated[User, Depends(get_current_user)],
@@ -164,51 +203,30 @@ async def get_resource_analysis(
     # Let's verify if topics are linked.
     # Logic: Select Topic where Topic.id in (select topic_id from Occurrence where resource_id = X)
     
-    from ..models import Topic, Occurrence, KeyConcept
-    
-    # Fetch all occurrences for this resource, loading topic and key_concepts
-    occurrences = session.exec(
-        select(Occurrence)
+    # Occurrences with their topics in one join, then all key concepts in one
+    # IN query, rather than two lookups per occurrence
+    rows = session.exec(
+        select(Occurrence, Topic)
+        .join(Topic, Topic.id == Occurrence.topic_id)
         .where(Occurrence.resource_id == resource_id)
     ).all()
-    
+    occ_ids = [occ.id for occ, _ in rows]
+    concepts_by_occ = {}
+    if occ_ids:
+        for kc in session.exec(select(KeyConcept).where(KeyConcept.occurrence_id.in_(occ_ids))).all():
+            concepts_by_occ.setdefault(kc.occurrence_id, []).append(kc)
+
     # Group by Topic
     topics_map = {}
-    for occ in occurrences:
-        # Manually load topic if not lazy loaded? SQLModel relationships are lazy by default? 
-        # We need to ensure we have the topic.
-        # It's better to use explicit join or .options(selectinload(...))
-        # But for MVP loop is okay if volume is low.
-        
-        # Note: session.get(Topic, occ.topic_id) might be needed if relationship not loaded.
-        # Let's assume lazy loading works or we re-fetch.
-        
-        # Actually, let's just return the raw occurrences and let frontend group?
-        # Or construct a nice JSON.
-        
-        # Explicitly fetching to avoid N+1 if possible, but simplest is:
-        topic = session.get(Topic, occ.topic_id)
-        if not topic: continue
-        
+    for occ, topic in rows:
         if topic.id not in topics_map:
             topics_map[topic.id] = {
                 "id": topic.id,
                 "name": topic.name,
-                "concepts": [] # We called it "occurrences" in the prompt, but effectively key concepts are time-bound?
-                # Wait, Occurrence HAS KeyConcepts.
-                # So Topic -> Occurrence -> KeyConcepts.
+                "concepts": []
             }
-            
-        # Get KeyConcepts for this occurrence
-        key_concepts = session.exec(select(KeyConcept).where(KeyConcept.occurrence_id == occ.id)).all()
-        
-        # Add to the structure. 
-        # Frontend expects: Topic -> Concepts (with timestamps).
-        # Our model: Occurrence (with Topic) -> KeyConcepts.
-        # So multiple concepts in one occurrence share the same "time" roughly?
-        # But KeyConcept has timestamp_start.
-        
-        for kc in key_concepts:
+
+        for kc in concepts_by_occ.get(occ.id, []):
             topics_map[topic.id]["concepts"].append({
                 "id": kc.id,
                 "name": kc.name,
@@ -264,10 +282,35 @@ async def update_resource(
     session.refresh(resource)
     return resource
 
+@router.post("/resources/{resource_id}/analysis")
+async def retry_resource_analysis(
+    resource_id: int,
+    current_user: Annotated[User, Depends(get_current_user)],
+    session: Session = Depends(get_session)
+):
+    """
+    Runs the analysis again after it failed. The copy uploaded to the model
+    for the failed attempt is reused if it's still live.
+    """
+    check_teacher_role(current_user)
+    resource = session.get(Resource, resource_id)
+    if not resource:
+        raise HTTPException(status_code=404, detail="Resource not found")
+    class_obj = session.get(Class, resource.class_id)
+    if class_obj and class_obj.teacher_id != current_user.id and current_user.role != UserRole.ADMIN:
+        raise HTTPException(status_code=403, detail="Not authorized to analyse this resource")
+    if session.exec(select(Occurrence.id).where(Occurrence.resource_id == resource_id)).first() is not None:
+        raise HTTPException(status_code=409, detail="Resource has already been analysed")
+
+    with agent_work(ANALYSIS, f"class_{resource.class_id}"):
+        await trigger_resource_analysis(resource.id, resource.url)
+    return {"ok": True}
+
 @router.delete("/resources/{resource_id}")
 async def delete_resource(
     resource_id: int,
     current_user: Annotated[User, Depends(get_current_user)],
+    background_tasks: BackgroundTasks,
     session: Session = Depends(get_session)
 ):
     check_teacher_role(current_user)
@@ -281,25 +324,18 @@ async def delete_resource(
     if class_obj and class_obj.teacher_id != current_user.id and current_user.role != UserRole.ADMIN:
          raise HTTPException(status_code=403, detail="Not authorized to delete this resource")
 
-    # Manually delete related data (Occurrences -> KeyConcepts)
-    # 1. Get Occurrences
-    occurrences = session.exec(select(Occurrence).where(Occurrence.resource_id == resource_id)).all()
-    
-    for occ in occurrences:
-        # 2. Delete KeyConcepts for this occurrence
-        concepts = session.exec(select(KeyConcept).where(KeyConcept.occurrence_id == occ.id)).all()
-        for c in concepts:
-            session.delete(c)
-        # 3. Delete Occurrence
-        session.delete(occ)
-        
-    # 4. Delete Resource
-    session.delete(resource)
+    # Occurrences, KeyConcepts and ModelFiles are removed by ON DELETE CASCADE;
+    # the copies in the model's file store are deleted after the response
+    file_names = resource_model_files(session, [resource_id])
+    session.exec(delete(Resource).where(Resource.id == resource_id))
     session.commit()
+    if file_names:
+        background_tasks.add_task(delete_model_files, file_names)
     
     return {"ok": True}
 
 @router.get("/classes/{class_id}/stats")
+@query_budget(5)
 async def get_class_stats(
     class_id: int,
     current_user: Annotated[User, Depends(get_current_user)],
@@ -384,6 +420,7 @@ class MarkUpdate(BaseModel):
     marks: float
 
 @router.get("/assignments/{assignment_id}/submissions")
+@query_budget(7)
 async def list_assignment_submissions(
     assignment_id: int,
     current_user: Annotated[User, Depends(get_current_user)],
@@ -425,6 +462,7 @@ async def list_assignment_submissions(
     }
 
 @router.get("/assignments/{assignment_id}/submissions/{student_id}")
+@query_budget(7)
 async def get_student_submission_review(
     assignment_id: int,
     student_id: int,
@@ -443,36 +481,8 @@ async def get_student_submission_review(
     student = session.get(User, student_id)
         
     questions = session.exec(select(Question).where(Question.assignment_id == assignment_id)).all()
-    
-    responses_data = []
-    for q in questions:
-        resp = session.exec(select(QuestionResponse).where(QuestionResponse.question_id == q.id, QuestionResponse.student_id == student_id)).first()
-        
-        if resp:
-            from ..models import GradeReviewComment
-            comments = session.exec(select(GradeReviewComment).where(GradeReviewComment.response_id == resp.id).order_by(GradeReviewComment.created_at)).all()
-            comments_data = []
-            for c in comments:
-                c_user = session.get(User, c.user_id)
-                comments_data.append({
-                    "id": c.id, 
-                    "content": c.content, 
-                    "user_id": c.user_id,
-                    "user_name": c_user.username if c_user else "Unknown",
-                    "user_role": c_user.role if c_user else "Unknown",
-                    "created_at": c.created_at
-                })
-            
-            responses_data.append({
-                "question_id": q.id,
-                "question_content": q.content,
-                "response_id": resp.id,
-                "response_content": resp.content,
-                "marks": resp.marks,
-                "feedback": resp.feedback,
-                "comments": comments_data
-            })
-            
+    responses_data = build_review_responses(session, questions, student_id)
+
     total_possible = len(questions) * 10.0
     percentage = (grade.marks / total_possible) * 100 if total_possible > 0 else 0
     
@@ -506,6 +516,8 @@ async def add_teacher_comment(
         content=comment.content
     )
     session.add(new_comment)
+    session.flush()
+    notify(session, [resp.student_id], "comment.added", {"response_id": response_id, "comment_id": new_comment.id})
     session.commit()
     session.refresh(new_comment)
     
@@ -520,38 +532,44 @@ async def update_response_marks(
 ):
     check_teacher_role(current_user)
     
-    resp = session.get(QuestionResponse, response_id)
-    if not resp:
+    # Mark and grade total change in a single transaction
+    updated = apply_mark_changes(session, {response_id: mark_update.marks}, current_user)
+    if not updated:
         raise HTTPException(status_code=404, detail="Response not found")
-        
-    # Update the specific response's mark
-    resp.marks = mark_update.marks
-    session.add(resp)
     session.commit()
+            
+    return {"status": "success", "new_marks": mark_update.marks}
+
+class BulkMarkItem(BaseModel):
+    response_id: int
+    marks: float
+
+class BulkMarkUpdate(BaseModel):
+    updates: List[BulkMarkItem]
+
+@router.put("/responses/marks")
+async def bulk_update_response_marks(
+    bulk: BulkMarkUpdate,
+    current_user: Annotated[User, Depends(get_current_user)],
+    session: Session = Depends(get_session)
+):
+    check_teacher_role(current_user)
     
-    # Now recalculate the overall assignment grade
-    q = session.get(Question, resp.question_id)
-    if q:
-        assignment_id = q.assignment_id
-        student_id = resp.student_id
-        
-        # Get all questions for this assignment
-        questions = session.exec(select(Question).where(Question.assignment_id == assignment_id)).all()
-        q_ids = [q.id for q in questions]
-        
-        # Get all responses for this student for this assignment
-        all_resps = session.exec(select(QuestionResponse).where(QuestionResponse.question_id.in_(q_ids), QuestionResponse.student_id == student_id)).all()
+    new_marks = {item.response_id: item.marks for item in bulk.updates}
+    if not new_marks:
+        return {"status": "success", "updated": []}
         
-        total_marks = sum([r.marks for r in all_resps if r.marks is not None])
-        
-        # Update AssignmentGrade
-        grade = session.exec(select(AssignmentGrade).where(AssignmentGrade.assignment_id == assignment_id, AssignmentGrade.student_id == student_id)).first()
-        if grade:
-            grade.marks = total_marks
-            session.add(grade)
-            session.commit()
-            
-    return {"status": "success", "new_marks": resp.marks}
+    updated = apply_mark_changes(session, new_marks, current_user)
+    missing = sorted(set(new_marks) - {r.id for r in updated})
+    if missing:
+        session.rollback()
+        raise HTTPException(status_code=404, detail=f"Responses not found: {missing}")
+    session.commit()
+    
+    return {
+        "status": "success",
+        "updated": [{"response_id": rid, "new_marks": marks} for rid, marks in new_marks.items()]
+    }
 
 # ==========================================
 # Knowledge Customisation Capabilities
@@ -575,6 +593,7 @@ class ConceptUpdate(BaseModel):
     topic_id: int = None # Allowing re-assignment to another topic
 
 @router.get("/classes/{class_id}/knowledge")
+@query_budget(5)
 async def get_class_knowledge(
     class_id: int,
     current_user: Annotated[User, Depends(get_current_user)],
@@ -600,20 +619,23 @@ async def get_class_knowledge(
     # 3. Create a unique set of Topics
     topic_ids = list(set([o.topic_id for o in occurrences]))
     topics = session.exec(select(Topic).where(Topic.id.in_(topic_ids))).all()
+
+    # 4. KeyConcepts for all of this class's occurrences in one query. A topic
+    # can be linked to resources in other classes, so only these occurrences count
+    concepts_by_occ = {}
+    for kc in session.exec(select(KeyConcept).where(KeyConcept.occurrence_id.in_([o.id for o in occurrences]))).all():
+        concepts_by_occ.setdefault(kc.occurrence_id, []).append(kc)
+    occs_by_topic = {}
+    for o in occurrences:
+        occs_by_topic.setdefault(o.topic_id, []).append(o)
     
     for t in topics:
-        # 4. For each topic, find occurrences in THIS class context to get concepts
-        # A topic can theoretically be linked to resources in other classes, so we filter occurrences
-        class_occs = [o for o in occurrences if o.topic_id == t.id]
-        class_occ_ids = [o.id for o in class_occs]
-        
+        class_occs = occs_by_topic.get(t.id, [])
         topic_resource_names = list(set([resource_map[o.resource_id] for o in class_occs if o.resource_id in resource_map]))
-        
-        concepts = []
-        if class_occ_ids:
-            # 5. Fetch KeyConcepts for these occurrences
-            kcs = session.exec(select(KeyConcept).where(KeyConcept.occurrence_id.in_(class_occ_ids))).all()
-            concepts = [{"id": k.id, "name": k.name, "description": k.description} for k in kcs]
+        concepts = [
+            {"id": k.id, "name": k.name, "description": k.description}
+            for o in class_occs for k in concepts_by_occ.get(o.id, [])
+        ]
             
         topics_data.append({
             "id": t.id,
@@ -658,18 +680,67 @@ async def delete_topic(
     topic = session.get(Topic, topic_id)
     if not topic: raise HTTPException(status_code=404, detail="Topic not found")
     
-    # Cascading delete logic
-    occs = session.exec(select(Occurrence).where(Occurrence.topic_id == topic.id)).all()
-    occ_ids = [o.id for o in occs]
-    if occ_ids:
-        kcs = session.exec(select(KeyConcept).where(KeyConcept.occurrence_id.in_(occ_ids))).all()
-        for kc in kcs: session.delete(kc)
-        for o in occs: session.delete(o)
-        
-    session.delete(topic)
+    # Occurrences, KeyConcepts and TopicScores are removed by ON DELETE CASCADE
+    session.exec(delete(Topic).where(Topic.id == topic_id))
     session.commit()
     return {"status": "success"}
 
+class BulkDelete(BaseModel):
+    resource_ids: List[int] = []
+    topic_ids: List[int] = []
+
+@router.post("/bulk-delete")
+async def bulk_delete(
+    bulk: BulkDelete,
+    current_user: Annotated[User, Depends(get_current_user)],
+    background_tasks: BackgroundTasks,
+    session: Session = Depends(get_session)
+):
+    check_teacher_role(current_user)
+    
+    if bulk.resource_ids and current_user.role != UserRole.ADMIN:
+        # Every resource must belong to a class taught by the current teacher;
+        # the outer join keeps resources without a class in the check
+        foreign = session.exec(
+            select(Resource.id)
+            .outerjoin(Class, Resource.class_id == Class.id)
+            .where(Resource.id.in_(bulk.resource_ids))
+            .where((Class.teacher_id != current_user.id) | (Class.teacher_id == None))
+        ).all()
+        if foreign:
+            raise HTTPException(status_code=403, detail=f"Not authorized to delete resources: {list(foreign)}")
+    
+    if bulk.topic_ids and current_user.role != UserRole.ADMIN:
+        # Topics are shared between classes: a teacher may only delete topics
+        # whose occurrences are all in classes they teach. Topics without any
+        # such occurrence (unused, or added by hand) are left to admins.
+        in_own_class = (Class.teacher_id == current_user.id)
+        rows = session.exec(
+            select(Occurrence.topic_id, func.min(case((in_own_class, 1), else_=0)))
+            .outerjoin(Resource, Occurrence.resource_id == Resource.id)
+            .outerjoin(Class, Resource.class_id == Class.id)
+            .where(Occurrence.topic_id.in_(bulk.topic_ids))
+            .group_by(Occurrence.topic_id)
+        ).all()
+        owned = {topic_id for topic_id, all_own in rows if all_own == 1}
+        foreign = sorted(set(bulk.topic_ids) - owned)
+        if foreign:
+            raise HTTPException(status_code=403, detail=f"Not authorized to delete topics: {foreign}")
+    
+    # One statement per table, one transaction for the whole batch
+    deleted_resources = 0
+    deleted_topics = 0
+    file_names = resource_model_files(session, bulk.resource_ids)
+    if bulk.resource_ids:
+        deleted_resources = session.exec(delete(Resource).where(Resource.id.in_(bulk.resource_ids))).rowcount
+    if bulk.topic_ids:
+        deleted_topics = session.exec(delete(Topic).where(Topic.id.in_(bulk.topic_ids))).rowcount
+    session.commit()
+    if file_names:
+        background_tasks.add_task(delete_model_files, file_names)
+    
+    return {"status": "success", "deleted_resources": deleted_resources, "deleted_topics": deleted_topics}
+
 @router.post("/topics/{topic_id}/concepts")
 async def create_concept(
     topic_id: int,
@@ -0,0 +1,184 @@
+import os
+import json
+import gzip
+import queue
+import random
+import logging
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import List, Optional, Tuple
+
+from ..metrics import AGENT_DEBUG_RECORDS
+
+logger = logging.getLogger(__name__)
+
+# Agent responses are kept for debugging as JSON lines in AGENT_DEBUG_LOG,
+# rotated at AGENT_DEBUG_LOG_MAX_MB. Callers only put the response on a
+# queue; it is serialised, cut to AGENT_DEBUG_MAX_CHARS and written by a
+# listener thread. Failed responses are always kept, others with
+# AGENT_DEBUG_SAMPLE_RATE; the rest get a record without the payload.
+AGENT_DEBUG_LOG = os.getenv("AGENT_DEBUG_LOG", "agent_debug.jsonl") # Empty turns the log off
+AGENT_DEBUG_LOG_MAX_MB = float(os.getenv("AGENT_DEBUG_LOG_MAX_MB", "20"))
+AGENT_DEBUG_LOG_BACKUPS = int(os.getenv("AGENT_DEBUG_LOG_BACKUPS", "5"))
+AGENT_DEBUG_SAMPLE_RATE = float(os.getenv("AGENT_DEBUG_SAMPLE_RATE", "0.1"))
+AGENT_DEBUG_MAX_CHARS = int(os.getenv("AGENT_DEBUG_MAX_CHARS", "4000"))
+AGENT_DEBUG_QUEUE_MAX = int(os.getenv("AGENT_DEBUG_QUEUE_MAX", "1000")) # Records waiting to be written before new ones are dropped
+# Kept payloads can also be archived whole, gzipped, one file per response
+# under AGENT_DEBUG_ARCHIVE_DIR/<resource or job id>/; the oldest files go
+# once the archive passes AGENT_DEBUG_ARCHIVE_MAX_MB
+AGENT_DEBUG_ARCHIVE_DIR = os.getenv("AGENT_DEBUG_ARCHIVE_DIR", "")
+AGENT_DEBUG_ARCHIVE_MAX_MB = float(os.getenv("AGENT_DEBUG_ARCHIVE_MAX_MB", "500"))
+
+debug_logger = logging.getLogger("lms.agent_debug")
+debug_logger.setLevel(logging.INFO)
+debug_logger.propagate = False # Kept out of the application log
+
+def _payload_json(record: logging.LogRecord) -> str:
+    """
+    The record's payload serialised once, on the listener thread, and shared
+    by the handlers.
+    """
+    if not hasattr(record, "payload_json"):
+        record.payload_json = json.dumps(record.payload, default=str, separators=(",", ":"))
+    return record.payload_json
+
+def _safe_name(value: str) -> str:
+    return "".join(c if c.isalnum() or c in "-_." else "_" for c in value) or "unknown"
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    Puts records on the queue untouched, so formatting happens on the
+    listener thread, and drops them rather than wait when the queue is full.
+    """
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            AGENT_DEBUG_RECORDS.labels("dropped").inc()
+
+class JsonLinesFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "event": record.getMessage(),
+            **record.fields,
+        }
+        if record.payload is not None:
+            text = _payload_json(record)
+            entry["payload_chars"] = len(text)
+            if len(text) > AGENT_DEBUG_MAX_CHARS:
+                entry["payload_excerpt"] = text[:AGENT_DEBUG_MAX_CHARS]
+                entry["truncated"] = True
+            else:
+                entry["payload"] = record.payload
+        return json.dumps(entry, default=str)
+
+class ArchiveHandler(logging.Handler):
+    """
+    Writes each kept payload whole, gzipped, to <root>/<key>/<time>_<operation>.json.gz,
+    deleting the oldest files once the archive passes max_bytes.
+    """
+    def __init__(self, root: str, max_bytes: int):
+        super().__init__()
+        self.root = root
+        self.max_bytes = max_bytes
+        self.files: List[Tuple[str, int]] = [] # Oldest first
+        for dirpath, _, names in os.walk(root):
+            for name in names:
+                path = os.path.join(dirpath, name)
+                self.files.append((path, os.path.getsize(path)))
+        self.files.sort(key=lambda f: os.path.getmtime(f[0]))
+        self.total = sum(size for _, size in self.files)
+
+    def emit(self, record: logging.LogRecord):
+        if record.payload is None:
+            return
+        try:
+            stamp = datetime.fromtimestamp(record.created, timezone.utc).strftime("%Y%m%dT%H%M%S.%f")
+            directory = os.path.join(self.root, _safe_name(record.fields["key"]))
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, f"{stamp}_{_safe_name(record.fields['operation'])}.json.gz")
+            with gzip.open(path, "wt", encoding="utf-8") as f:
+                f.write(_payload_json(record))
+            size = os.path.getsize(path)
+            self.files.append((path, size))
+            self.total += size
+            AGENT_DEBUG_RECORDS.labels("archived").inc()
+            while self.total > self.max_bytes and len(self.files) > 1:
+                old, old_size = self.files.pop(0)
+                self.total -= old_size
+                try:
+                    os.remove(old)
+                except FileNotFoundError:
+                    pass
+        except Exception:
+            self.handleError(record)
+
+class CountingFileHandler(RotatingFileHandler):
+    def emit(self, record: logging.LogRecord):
+        super().emit(record)
+        AGENT_DEBUG_RECORDS.labels("logged").inc()
+
+class AgentDebugLog:
+    """
+    The queue and the listener thread that drains it; started and stopped
+    with the app. Records made while it isn't running are discarded.
+    """
+    def __init__(self):
+        self.listener: Optional[QueueListener] = None
+        self.handler: Optional[DroppingQueueHandler] = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self.listener is not None or not (AGENT_DEBUG_LOG or AGENT_DEBUG_ARCHIVE_DIR):
+                return
+            handlers = []
+            if AGENT_DEBUG_LOG:
+                file_handler = CountingFileHandler(AGENT_DEBUG_LOG, maxBytes=int(AGENT_DEBUG_LOG_MAX_MB * 1024 * 1024),
+                                                   backupCount=AGENT_DEBUG_LOG_BACKUPS, encoding="utf-8", delay=True)
+                file_handler.setFormatter(JsonLinesFormatter())
+                handlers.append(file_handler)
+            if AGENT_DEBUG_ARCHIVE_DIR:
+                handlers.append(ArchiveHandler(AGENT_DEBUG_ARCHIVE_DIR, int(AGENT_DEBUG_ARCHIVE_MAX_MB * 1024 * 1024)))
+            records = queue.Queue(maxsize=AGENT_DEBUG_QUEUE_MAX)
+            self.handler = DroppingQueueHandler(records)
+            self.listener = QueueListener(records, *handlers, respect_handler_level=False)
+            self.listener.start()
+            debug_logger.addHandler(self.handler)
+            logger.info(f"Agent debug log: {AGENT_DEBUG_LOG or 'off'}, archive: {AGENT_DEBUG_ARCHIVE_DIR or 'off'}")
+
+    def stop(self):
+        """
+        Writes out what is queued, then stops the listener.
+        """
+        with self._lock:
+            if self.listener is None:
+                return
+            debug_logger.removeHandler(self.handler)
+            self.listener.stop()
+            for handler in self.listener.handlers:
+                handler.close()
+            self.listener = self.handler = None
+
+    def record(self, agent: str, operation: str, key: str, response, ok: bool, **fields):
+        """
+        Queues a record of an agent's response, keyed by the resource or job
+        it was for. The payload is kept if ok is False, or for a sample of the
+        rest.
+        """
+        if self.listener is None:
+            return
+        keep = not ok or random.random() < AGENT_DEBUG_SAMPLE_RATE
+        if not keep:
+            AGENT_DEBUG_RECORDS.labels("sampled_out").inc()
+        debug_logger.info("agent_response", extra={
+            "fields": {"agent": agent, "operation": operation, "key": key, "ok": ok, "kept": keep, **fields},
+            "payload": response if keep else None,
+        })
+
+agent_debug_log = AgentDebugLog()
@@ -0,0 +1,367 @@
+import re
+import ast
+import json
+import logging
+from typing import List, Optional, Tuple, Type, Union
+from pydantic import AliasChoices, BaseModel, ConfigDict, Field, TypeAdapter, ValidationError, field_validator, model_validator
+
+from ..metrics import AGENT_OUTPUT_PARSE
+
+logger = logging.getLogger(__name__)
+
+# ==========================================
+# Schemas
+# ==========================================
+# Mirror agent_common/schemas.py, which the agents request as structured
+# output. Kept lenient on this side: ids may arrive as strings, unknown keys
+# are ignored and a bad list item is dropped rather than failing the reply.
+
+class AgentOutput(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+
+class QuestionScoreOutput(AgentOutput):
+    question_id: int
+    marks: float = 0.0
+    feedback: str = ""
+    confidence: Optional[float] = None
+
+    @field_validator("marks")
+    @classmethod
+    def clamp_marks(cls, v):
+        return min(max(v, 0.0), 10.0)
+
+class TopicScoreOutput(AgentOutput):
+    topic_id: int
+    marks: float = 0.0
+    feedback: str = ""
+
+    @field_validator("marks")
+    @classmethod
+    def clamp_marks(cls, v):
+        return min(max(v, 0.0), 10.0)
+
+class GradingOutput(AgentOutput):
+    question_scores: List[QuestionScoreOutput] = Field(min_length=1)
+    topic_scores: List[TopicScoreOutput] = []
+    assignment_marks: Optional[float] = None
+    feedback: str = ""
+
+    @model_validator(mode="after")
+    def total_from_questions(self):
+        # assignment_marks comes last, so it is the first thing lost when a reply is cut off
+        if self.assignment_marks is None:
+            self.assignment_marks = sum(q.marks for q in self.question_scores)
+        return self
+
+ClientId = Union[int, str]
+Timestamp = Optional[Union[int, float, str]]
+
+class AnalysisTopic(AgentOutput):
+    id: ClientId
+    name: str
+    outline: Optional[str] = None
+
+class AnalysisOccurrence(AgentOutput):
+    id: ClientId
+    topic_id: ClientId
+    resource_id: Optional[ClientId] = None
+
+class AnalysisKeyConcept(AgentOutput):
+    id: Optional[ClientId] = None
+    name: str
+    description: Optional[str] = None
+    occurrence_id: ClientId = Field(validation_alias=AliasChoices("occurrence_id", "occurence_id"))
+    timestamp_start: Timestamp = None
+    timestamp_end: Timestamp = None
+    page_number: Optional[ClientId] = None
+    section: Optional[str] = None
+
+class AnalysisOutput(AgentOutput):
+    summary: Optional[str] = None
+    topics: List[AnalysisTopic] = []
+    occurrences: List[AnalysisOccurrence] = []
+    key_concepts: List[AnalysisKeyConcept] = []
+
+# ==========================================
+# Extraction and repair
+# ==========================================
+
+FENCE_RE = re.compile(r"```(?:json)?\s*")
+
+class JsonRepairer:
+    """
+    Finds the first JSON object or array in model text and repairs the usual
+    damage: prose or a Markdown fence around it, trailing commas, and a reply
+    cut off part way. Text can be fed in chunks as it streams in.
+    """
+    def __init__(self):
+        self.text = ""
+        self.pos = 0
+        self.start = None
+        self.end = None
+        self.stack = []
+        self.in_string = False
+        self.escaped = False
+        self.last_comma = None # Comma not yet followed by a value
+        self.dead_commas = []
+        self.safe_cut = None # (position, open containers) where the text so far is complete JSON once closed
+
+    def feed(self, chunk: str):
+        self.text += chunk
+        if self.end is not None:
+            return
+        if self.start is None and not self._find_start():
+            return
+        text = self.text
+        while self.pos < len(text):
+            ch = text[self.pos]
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif ch == "\\":
+                    self.escaped = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == '"':
+                self.in_string = True
+                self.last_comma = None
+            elif ch in "{[":
+                self.stack.append("}" if ch == "{" else "]")
+                self.last_comma = None
+                self.safe_cut = (self.pos + 1, tuple(self.stack))
+            elif ch in "}]":
+                if self.last_comma is not None:
+                    self.dead_commas.append(self.last_comma)
+                    self.last_comma = None
+                if self.stack:
+                    self.stack.pop()
+                if not self.stack:
+                    self.end = self.pos + 1
+                    return
+                self.safe_cut = (self.pos + 1, tuple(self.stack))
+            elif ch == ",":
+                self.safe_cut = (self.pos, tuple(self.stack))
+                self.last_comma = self.pos
+            elif not ch.isspace():
+                self.last_comma = None
+            self.pos += 1
+
+    def _find_start(self) -> bool:
+        fence = FENCE_RE.search(self.text)
+        search_from = fence.end() if fence else 0
+        match = re.search(r"[{\[]", self.text[search_from:])
+        if not match:
+            return False
+        self.start = self.pos = search_from + match.start()
+        return True
+
+    def _without_dead_commas(self, end: int) -> str:
+        pieces = []
+        prev = self.start
+        for comma in self.dead_commas:
+            if comma >= end:
+                break
+            pieces.append(self.text[prev:comma])
+            prev = comma + 1
+        pieces.append(self.text[prev:end])
+        return "".join(pieces)
+
+    def candidates(self) -> List[str]:
+        """
+        Texts to try in order: the complete value if it closed, otherwise the
+        text closed where it stopped, then cut back to the last complete value.
+        """
+        if self.start is None:
+            return []
+        if self.end is not None:
+            return [self._without_dead_commas(self.end)]
+        body = self._without_dead_commas(len(self.text))
+        if self.in_string:
+            body += '"'
+        body = body.rstrip().rstrip(",")
+        result = []
+        # A number or literal at the cut may itself be cut short (4 of 45.5), so those are dropped
+        if body[-1:] in ('"', "}", "]", "{", "["):
+            result.append(body + "".join(reversed(self.stack)))
+        if self.safe_cut:
+            cut, stack = self.safe_cut
+            result.append(self._without_dead_commas(cut).rstrip().rstrip(",") + "".join(reversed(stack)))
+        return result
+
+    @property
+    def repaired(self) -> bool:
+        return self.end is None or bool(self.dead_commas)
+
+def extract_json(text: str) -> Tuple[Optional[Union[dict, list]], bool]:
+    """
+    (value, repaired) for the first JSON value in text, or (None, False).
+    """
+    if not text:
+        return None, False
+    try:
+        return json.loads(text), False
+    except json.JSONDecodeError:
+        pass
+    repairer = JsonRepairer()
+    repairer.feed(text)
+    for candidate in repairer.candidates():
+        try:
+            return json.loads(candidate), repairer.repaired
+        except json.JSONDecodeError:
+            continue
+    return None, False
+
+# ==========================================
+# Validation
+# ==========================================
+
+def _validate(data, schema: Type[AgentOutput]) -> Tuple[Optional[dict], int]:
+    """
+    (validated dict, dropped list items). Items failing validation are
+    dropped one by one so a single bad score doesn't lose the whole reply.
+    """
+    if not isinstance(data, dict):
+        return None, 0
+    dropped = 0
+    cleaned = dict(data)
+    for name, field in schema.model_fields.items():
+        value = data.get(name)
+        args = getattr(field.annotation, "__args__", ())
+        if not isinstance(value, list) or not args:
+            continue
+        adapter = TypeAdapter(args[0])
+        kept = []
+        for item in value:
+            try:
+                kept.append(adapter.validate_python(item))
+            except ValidationError as e:
+                dropped += 1
+                logger.warning(f"Dropping invalid {name} item {item!r}: {e.errors()[0]['msg']}")
+        cleaned[name] = kept
+    try:
+        return schema.model_validate(cleaned).model_dump(), dropped
+    except ValidationError as e:
+        logger.warning(f"Agent output failed {schema.__name__} validation: {e}")
+        return None, dropped
+
+def _parse(text: str, schema: Type[AgentOutput]) -> Tuple[Optional[dict], str]:
+    data, repaired = extract_json(text)
+    if data is None:
+        return None, "no_json"
+    validated, dropped = _validate(data, schema)
+    if validated is None:
+        return None, "invalid"
+    return validated, "repaired" if repaired or dropped else "ok"
+
+def parse_agent_output(text: str, schema: Type[AgentOutput], agent: str, operation: str) -> Optional[dict]:
+    """
+    Extracts, repairs and validates one reply text. Every call is counted in
+    lms_agent_output_parse by outcome: ok, repaired, no_json or invalid.
+    """
+    result, outcome = _parse(text, schema)
+    AGENT_OUTPUT_PARSE.labels(agent, operation, outcome).inc()
+    if result is None:
+        logger.error(f"Could not parse {agent} output ({outcome}): {(text or '')[:500]}")
+    return result
+
+def agent_result_texts(agent_result) -> List[str]:
+    """
+    Reply texts in an A2A result, most likely first: a Task's artifacts and
+    last history message, a bare Message's parts, or a plain string.
+    """
+    if isinstance(agent_result, str):
+        return [agent_result]
+    if not isinstance(agent_result, dict):
+        return []
+    if isinstance(agent_result.get("result"), dict): # Double-wrapped
+        agent_result = agent_result["result"]
+
+    part_lists = [artifact.get("parts", []) for artifact in agent_result.get("artifacts") or []]
+    history = agent_result.get("history") or []
+    if history:
+        part_lists.append(history[-1].get("parts", []))
+    status_message = (agent_result.get("status") or {}).get("message") or {}
+    part_lists.append(status_message.get("parts", []))
+    part_lists.append(agent_result.get("parts", []))
+
+    texts = [p["text"] for parts in part_lists for p in parts if p.get("kind") == "text" and p.get("text")]
+    if isinstance(agent_result.get("response"), str):
+        texts.append(agent_result["response"])
+    return texts
+
+def parse_agent_result(agent_result, schema: Type[AgentOutput], agent: str, operation: str) -> Optional[dict]:
+    """
+    parse_agent_output over the first reply text in an A2A result that yields
+    a valid schema, counted once per call.
+    """
+    outcome = "no_json"
+    for text in agent_result_texts(agent_result):
+        result, text_outcome = _parse(text, schema)
+        if result is not None:
+            AGENT_OUTPUT_PARSE.labels(agent, operation, text_outcome).inc()
+            return result
+        if text_outcome == "invalid":
+            outcome = "invalid"
+    AGENT_OUTPUT_PARSE.labels(agent, operation, outcome).inc()
+    logger.error(f"No valid {schema.__name__} in {agent} result: {str(agent_result)[:500]}")
+    return None
+
+def _adk_metadata(agent_result, name: str, key: Optional[str] = None) -> Optional[dict]:
+    """
+    The last `name` metadata dict (e.g. adk_usage_metadata) anywhere in an A2A
+    result, or the last one holding `key`: ADK attaches it to the status
+    message, the artifact or the task.
+    """
+    found = []
+    def walk(value):
+        if isinstance(value, dict):
+            metadata = value.get(name)
+            if isinstance(metadata, str):
+                # ADK sends dicts it doesn't know (custom_metadata) as their repr
+                try:
+                    metadata = ast.literal_eval(metadata)
+                except (ValueError, SyntaxError):
+                    metadata = None
+            if isinstance(metadata, dict) and (key is None or key in metadata):
+                found.append(metadata)
+            for v in value.values():
+                walk(v)
+        elif isinstance(value, list):
+            for v in value:
+                walk(v)
+    walk(agent_result)
+    return found[-1] if found else None
+
+def agent_result_usage(agent_result) -> Optional[dict]:
+    """
+    Token counts for the model call behind an A2A result, from the usage
+    metadata ADK attaches as adk_usage_metadata: {"cached", "uncached", "output"}.
+    """
+    usage = _adk_metadata(agent_result, "adk_usage_metadata")
+    if usage is None:
+        return None
+    def count(snake, camel):
+        return int(usage.get(snake) or usage.get(camel) or 0)
+    prompt = count("prompt_token_count", "promptTokenCount")
+    cached = count("cached_content_token_count", "cachedContentTokenCount")
+    return {
+        "cached": cached,
+        "uncached": max(0, prompt - cached),
+        "output": count("candidates_token_count", "candidatesTokenCount"),
+    }
+
+def agent_result_route(agent_result) -> Optional[dict]:
+    """
+    The grading agent's model routing decision for an A2A result, sent as
+    custom metadata: {"strategy", "tiers", "reasons", "tokens", "seconds"}.
+    """
+    custom = _adk_metadata(agent_result, "adk_custom_metadata", "grading_route")
+    return (custom or {}).get("grading_route")
+
+def agent_result_escalation(agent_result) -> Optional[dict]:
+    """
+    {"reasons": [...]} when an A2A stream event says the grading agent's
+    fast grade is being replaced by the pro model's; see grading_agent/router_agent.py.
+    """
+    custom = _adk_metadata(agent_result, "adk_custom_metadata", "grading_escalated")
+    return (custom or {}).get("grading_escalated")
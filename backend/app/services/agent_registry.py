@@ -0,0 +1,230 @@
+import os
+import time
+import random
+import asyncio
+import hashlib
+import logging
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional
+
+import httpx
+
+from ..metrics import AGENT_REPLICA_OUTSTANDING, AGENT_REPLICA_STATE, AGENT_REPLICA_CALLS, AGENT_REPLICA_EJECTIONS
+
+logger = logging.getLogger(__name__)
+
+REPLICA_EJECT_FAILURES = int(os.getenv("AGENT_REPLICA_EJECT_FAILURES", "3")) # Consecutive failures that eject a replica
+REPLICA_EJECT_SECONDS = float(os.getenv("AGENT_REPLICA_EJECT_SECONDS", "30")) # Doubles with each ejection in a row, up to 8x
+REPLICA_MAX_EJECTED = 0.5 # Never eject more than this share of an agent's replicas
+HEALTH_INTERVAL_SECONDS = float(os.getenv("AGENT_HEALTH_INTERVAL_SECONDS", "10"))
+HEALTH_TIMEOUT_SECONDS = 2.0
+HEALTH_PATH = "/.well-known/agent-card.json" # Served by ADK's A2A apps and the stub agents
+
+AVAILABLE, UNHEALTHY, EJECTED = 0, 1, 2
+
+def replica_urls(env_name: str, default: str) -> List[str]:
+    """
+    Comma-separated replica URLs from env_name (e.g. GRADING_AGENT_URLS), or
+    just `default`.
+    """
+    urls = [u.strip().rstrip("/") for u in os.getenv(env_name, "").split(",") if u.strip()]
+    return urls or [default.rstrip("/")]
+
+class AgentReplica:
+    def __init__(self, agent: str, url: str):
+        self.agent = agent
+        self.url = url.rstrip("/")
+        self.outstanding = 0
+        self.healthy = True
+        self.consecutive_failures = 0
+        self.ejections = 0 # In a row; a success resets it
+        self.ejected_until = 0.0
+        self.calls = 0
+        self.failures = 0
+        self.publish()
+
+    @property
+    def ejected(self) -> bool:
+        return time.monotonic() < self.ejected_until
+
+    @property
+    def state(self) -> int:
+        if self.ejected:
+            return EJECTED
+        return AVAILABLE if self.healthy else UNHEALTHY
+
+    def publish(self):
+        AGENT_REPLICA_STATE.labels(self.agent, self.url).set(self.state)
+
+    def as_dict(self) -> dict:
+        return {
+            "url": self.url,
+            "state": ("available", "unhealthy", "ejected")[self.state],
+            "outstanding": self.outstanding,
+            "calls": self.calls,
+            "failures": self.failures,
+            "ejected_for_seconds": round(max(0.0, self.ejected_until - time.monotonic()), 1),
+        }
+
+class ReplicaPool:
+    """
+    The replicas of one agent. Calls go to the available replica with the
+    fewest calls in flight. With affinity, a context's calls stick to one
+    replica (rendezvous hashing on the contextId) so an agent keeping session
+    history sees all of it, and move only when that replica is out. A replica
+    is out while it fails health checks, or for a while after
+    REPLICA_EJECT_FAILURES consecutive failed calls. If every replica is out,
+    all are used as if none were, and the agent's circuit breaker decides.
+    """
+    def __init__(self, agent: str, urls: Iterable[str], affinity: bool = False):
+        self.agent = agent
+        self.affinity = affinity
+        self.replicas: Dict[str, AgentReplica] = {}
+        for url in urls:
+            self.add(url)
+
+    def add(self, url: str) -> AgentReplica:
+        url = url.rstrip("/")
+        if url not in self.replicas:
+            self.replicas[url] = AgentReplica(self.agent, url)
+            logger.info(f"Added replica {url} of {self.agent} ({len(self.replicas)} in all)")
+        return self.replicas[url]
+
+    def remove(self, url: str) -> bool:
+        """
+        Takes a replica out of rotation; calls already sent to it finish. The
+        last replica can't be removed.
+        """
+        replica = self.replicas.get(url.rstrip("/"))
+        if replica is None:
+            return False
+        if len(self.replicas) == 1:
+            raise ValueError(f"{replica.url} is the only replica of {self.agent}")
+        del self.replicas[replica.url]
+        AGENT_REPLICA_STATE.remove(self.agent, replica.url)
+        logger.info(f"Removed replica {replica.url} of {self.agent} ({len(self.replicas)} left)")
+        return True
+
+    @staticmethod
+    def _weight(key: str, url: str) -> int:
+        return int.from_bytes(hashlib.blake2b(f"{key}|{url}".encode(), digest_size=8).digest(), "big")
+
+    def choose(self, key: Optional[str] = None, exclude: Iterable[AgentReplica] = ()) -> AgentReplica:
+        if not self.replicas:
+            raise LookupError(f"No replicas registered for {self.agent}")
+        others = [r for r in self.replicas.values() if r not in exclude] or list(self.replicas.values())
+        candidates = [r for r in others if r.state == AVAILABLE] or others
+        if self.affinity and key:
+            return max(candidates, key=lambda r: self._weight(key, r.url))
+        fewest = min(r.outstanding for r in candidates)
+        return random.choice([r for r in candidates if r.outstanding == fewest])
+
+    @contextmanager
+    def lease(self, replica: AgentReplica):
+        """
+        Counts a call as outstanding on the replica while it runs.
+        """
+        replica.outstanding += 1
+        replica.calls += 1
+        AGENT_REPLICA_OUTSTANDING.labels(self.agent, replica.url).inc()
+        try:
+            yield replica
+        finally:
+            replica.outstanding -= 1
+            AGENT_REPLICA_OUTSTANDING.labels(self.agent, replica.url).dec()
+
+    def record(self, replica: AgentReplica, ok: bool):
+        AGENT_REPLICA_CALLS.labels(self.agent, replica.url, "ok" if ok else "failed").inc()
+        if ok:
+            replica.consecutive_failures = 0
+            replica.ejections = 0
+            return
+        replica.failures += 1
+        replica.consecutive_failures += 1
+        if replica.consecutive_failures >= REPLICA_EJECT_FAILURES and not replica.ejected:
+            self._eject(replica)
+
+    def others_ok(self, replica: AgentReplica) -> bool:
+        """
+        Whether another replica is available and its last call succeeded.
+        """
+        return any(r is not replica and r.state == AVAILABLE and r.consecutive_failures == 0 for r in self.replicas.values())
+
+    def _eject(self, replica: AgentReplica):
+        ejected = sum(r.ejected for r in self.replicas.values())
+        if ejected + 1 > len(self.replicas) * REPLICA_MAX_EJECTED:
+            logger.warning(f"Replica {replica.url} of {self.agent} is failing, but too many are ejected already")
+            return
+        replica.ejections += 1
+        seconds = REPLICA_EJECT_SECONDS * min(2 ** (replica.ejections - 1), 8)
+        replica.ejected_until = time.monotonic() + seconds
+        replica.consecutive_failures = 0
+        replica.publish()
+        AGENT_REPLICA_EJECTIONS.labels(self.agent, replica.url).inc()
+        logger.warning(f"Ejected replica {replica.url} of {self.agent} for {seconds:.0f}s "
+                       f"after {REPLICA_EJECT_FAILURES} failed calls")
+
+    async def check_health(self, client: httpx.AsyncClient):
+        async def check(replica: AgentReplica):
+            try:
+                resp = await client.get(f"{replica.url}{HEALTH_PATH}", timeout=HEALTH_TIMEOUT_SECONDS)
+                healthy = resp.status_code == 200
+            except (httpx.HTTPError, OSError):
+                healthy = False
+            if healthy != replica.healthy:
+                logger.warning(f"Replica {replica.url} of {self.agent} is {'healthy' if healthy else 'failing health checks'}")
+            replica.healthy = healthy
+            replica.publish()
+
+        await asyncio.gather(*(check(r) for r in list(self.replicas.values())))
+
+    def as_dict(self) -> dict:
+        return {
+            "agent": self.agent,
+            "affinity": self.affinity,
+            "replicas": [r.as_dict() for r in self.replicas.values()],
+        }
+
+# ==========================================
+# Registry
+# ==========================================
+
+class AgentRegistry:
+    """
+    Every agent's replica pool, health-checked every HEALTH_INTERVAL_SECONDS
+    while the app runs. Replicas added at runtime (POST /admin/agents/...)
+    live in this process only.
+    """
+    def __init__(self):
+        self.pools: Dict[str, ReplicaPool] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def register(self, pool: ReplicaPool) -> ReplicaPool:
+        self.pools[pool.agent] = pool
+        return pool
+
+    async def check_health(self):
+        async with httpx.AsyncClient() as client:
+            await asyncio.gather(*(pool.check_health(client) for pool in self.pools.values()))
+
+    async def _run(self):
+        while True:
+            try:
+                await self.check_health()
+            except Exception as e:
+                logger.error(f"Agent health checks failed: {e}")
+            await asyncio.sleep(HEALTH_INTERVAL_SECONDS)
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def as_dict(self) -> List[dict]:
+        return [pool.as_dict() for pool in self.pools.values()]
+
+agent_registry = AgentRegistry()
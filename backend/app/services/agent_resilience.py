@@ -0,0 +1,437 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+import logging
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import List, Optional
+
+import httpx
+
+from ..metrics import AGENT_BREAKER_STATE, AGENT_BREAKER_TRANSITIONS, AGENT_TIMEOUT_SECONDS, AGENT_HEDGES
+from .agent_registry import AgentReplica, ReplicaPool, agent_registry
+from .agent_scheduler import AgentQueue, QueueRejected, Ticket, agent_scheduler, current_work
+from .agent_output import agent_result_usage
+
+logger = logging.getLogger(__name__)
+
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("AGENT_BREAKER_FAILURES", "5")) # Consecutive failures that open the breaker
+BREAKER_FAILURE_RATE = float(os.getenv("AGENT_BREAKER_FAILURE_RATE", "0.5")) # ...or this share of the recent calls
+BREAKER_WINDOW = 20
+BREAKER_RESET_SECONDS = float(os.getenv("AGENT_BREAKER_RESET_SECONDS", "30"))
+TIMEOUT_MULTIPLIER = 3.0 # Adaptive timeout = p99 of recent successes x this, within [min, max]
+LATENCY_WINDOW = 200
+LATENCY_MIN_SAMPLES = 20
+HEDGE_MAX_RATIO = 0.1 # At most one call in ten sends a hedge
+AGENT_HEDGING = os.getenv("AGENT_HEDGING", "false").lower() == "true"
+
+# Absolute (time.monotonic) deadline of the work the current request is doing;
+# agent calls never wait past it
+current_deadline: ContextVar[Optional[float]] = ContextVar("current_deadline", default=None)
+
+class AgentUnavailable(Exception):
+    """
+    The agent's circuit breaker is open, its queue is full, or the caller's
+    deadline has passed; the call was not attempted.
+    """
+
+class AgentCallFailed(Exception):
+    pass
+
+@contextmanager
+def deadline(seconds: float):
+    """
+    Bounds every agent call made inside the block, tightening any outer deadline.
+    """
+    outer = current_deadline.get()
+    new = time.monotonic() + seconds
+    token = current_deadline.set(min(outer, new) if outer else new)
+    try:
+        yield
+    finally:
+        current_deadline.reset(token)
+
+# ==========================================
+# Circuit breaker
+# ==========================================
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+class CircuitBreaker:
+    """
+    Opens after BREAKER_FAILURE_THRESHOLD consecutive failures, or when half of
+    the last BREAKER_WINDOW calls failed. While open, calls fail immediately;
+    after BREAKER_RESET_SECONDS one probe call is let through (half open) and
+    its outcome closes or re-opens the breaker.
+    """
+    def __init__(self, name: str):
+        self.name = name
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.recent = deque(maxlen=BREAKER_WINDOW) # True for success
+        self.opened_at = 0.0
+        self.probing = False
+        AGENT_BREAKER_STATE.labels(name).set(STATE_VALUES[CLOSED])
+
+    def _transition(self, state: str):
+        if state == self.state:
+            return
+        logger.warning(f"Circuit breaker for {self.name}: {self.state} -> {state}")
+        self.state = state
+        AGENT_BREAKER_STATE.labels(self.name).set(STATE_VALUES[state])
+        AGENT_BREAKER_TRANSITIONS.labels(self.name, state).inc()
+
+    def before_call(self):
+        if self.state == OPEN:
+            if time.monotonic() - self.opened_at < BREAKER_RESET_SECONDS:
+                raise AgentUnavailable(f"{self.name} circuit is open")
+            self._transition(HALF_OPEN)
+        if self.state == HALF_OPEN:
+            if self.probing:
+                raise AgentUnavailable(f"{self.name} circuit is half open; probe in progress")
+            self.probing = True
+
+    def record_success(self):
+        self.consecutive_failures = 0
+        self.recent.append(True)
+        self.probing = False
+        if self.state != CLOSED:
+            self.recent.clear()
+            self._transition(CLOSED)
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        self.recent.append(False)
+        self.probing = False
+        failure_rate = self.recent.count(False) / len(self.recent)
+        if (self.state == HALF_OPEN
+                or self.consecutive_failures >= BREAKER_FAILURE_THRESHOLD
+                or (len(self.recent) == BREAKER_WINDOW and failure_rate >= BREAKER_FAILURE_RATE)):
+            self.opened_at = time.monotonic()
+            self._transition(OPEN)
+
+    def release(self):
+        """
+        For calls that ended without telling us anything about the agent's
+        health (e.g. the caller went away).
+        """
+        self.probing = False
+
+# ==========================================
+# Adaptive timeouts
+# ==========================================
+
+class LatencyTracker:
+    """
+    Recent successful call latencies; the timeout follows their tail.
+    """
+    def __init__(self, default: float, minimum: float, adaptive: bool = True):
+        self.samples = deque(maxlen=LATENCY_WINDOW)
+        self.default = default
+        self.minimum = minimum
+        self.adaptive = adaptive
+
+    def observe(self, seconds: float):
+        self.samples.append(seconds)
+
+    def percentile(self, p: float) -> Optional[float]:
+        if len(self.samples) < LATENCY_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+    def timeout(self) -> float:
+        p99 = self.percentile(0.99) if self.adaptive else None
+        if p99 is None:
+            return self.default
+        return min(self.default, max(self.minimum, p99 * TIMEOUT_MULTIPLIER))
+
+# ==========================================
+# Agent endpoint
+# ==========================================
+
+class AgentEndpoint:
+    """
+    One A2A agent: its replicas (see agent_registry), its call queue (see
+    agent_scheduler) admitting `concurrency` calls per replica at once and
+    `tokens_per_minute` model tokens (0: no token limit), a circuit breaker
+    shared by all its operations, a latency tracker per operation, deadline
+    propagation and optional hedging.
+    """
+    def __init__(self, name: str, urls: List[str], default_timeout: float, min_timeout: float,
+                 adaptive: bool = True, affinity: bool = False, concurrency: int = 16, tokens_per_minute: int = 0):
+        self.name = name
+        self.replicas = agent_registry.register(ReplicaPool(name, urls, affinity))
+        self.queue = agent_scheduler.register(
+            AgentQueue(name, lambda: concurrency * len(self.replicas.replicas), tokens_per_minute)
+        )
+        self.default_timeout = default_timeout
+        self.min_timeout = min_timeout
+        self.adaptive = adaptive
+        self.breaker = CircuitBreaker(name)
+        self.latency = {}
+        self.calls = 0
+        self.hedges = 0
+
+    def tracker(self, operation: str) -> LatencyTracker:
+        if operation not in self.latency:
+            self.latency[operation] = LatencyTracker(self.default_timeout, self.min_timeout, self.adaptive)
+        return self.latency[operation]
+
+    def timeout(self, operation: str) -> float:
+        """
+        The adaptive timeout, cut short by the caller's deadline if sooner.
+        """
+        timeout = self.tracker(operation).timeout()
+        AGENT_TIMEOUT_SECONDS.labels(self.name, operation).set(timeout)
+        outer = current_deadline.get()
+        if outer is not None:
+            remaining = outer - time.monotonic()
+            if remaining <= 0:
+                raise AgentUnavailable(f"Deadline passed before calling {self.name}")
+            timeout = min(timeout, remaining)
+        return timeout
+
+    def _with_deadline(self, payload: dict, timeout: float):
+        # The agent gets its remaining budget both as a header (for its HTTP
+        # layer) and in the A2A request metadata
+        params = payload.get("params", {})
+        params["metadata"] = {**(params.get("metadata") or {}), "timeout_seconds": round(timeout, 1)}
+        return {"X-Request-Timeout": f"{timeout:.1f}"}
+
+    @asynccontextmanager
+    async def scheduled(self, payload: dict, operation: str):
+        """
+        Holds one of the agent's slots, queued as the current agent_work(), for
+        the block. Raises AgentUnavailable if the call isn't admitted in time.
+        """
+        priority, key = current_work.get()
+        # Until the operation has a history, its prompt text at four characters a token
+        tokens = self.queue.estimate(operation, len(json.dumps(payload.get("params", {}).get("message", {}))) / 4)
+        try:
+            async with self.queue.slot(priority, key, operation, tokens, current_deadline.get()) as ticket:
+                yield ticket
+        except QueueRejected as e:
+            raise AgentUnavailable(str(e)) from e
+
+    def choose_replica(self, payload: dict, exclude=()) -> AgentReplica:
+        return self.replicas.choose(payload.get("params", {}).get("message", {}).get("contextId"), exclude)
+
+    async def _post_once(self, client: httpx.AsyncClient, payload: dict, timeout: float,
+                         replica: Optional[AgentReplica] = None) -> httpx.Response:
+        replica = replica or self.choose_replica(payload)
+        headers = self._with_deadline(payload, timeout)
+        tried = []
+        while True:
+            tried.append(replica)
+            with self.replicas.lease(replica):
+                try:
+                    # httpx's timeout bounds each read, not the whole call
+                    resp = await asyncio.wait_for(
+                        client.post(f"{replica.url}/", json=payload, headers=headers, timeout=timeout), timeout
+                    )
+                    resp.raise_for_status()
+                except httpx.HTTPStatusError as e:
+                    if e.response.status_code >= 500:
+                        self.replicas.record(replica, ok=False)
+                    e.replica = replica
+                    raise
+                except httpx.ConnectError as e:
+                    self.replicas.record(replica, ok=False)
+                    # Nothing reached the agent, so another replica can take it
+                    untried = [r for r in self.replicas.replicas.values() if r not in tried]
+                    if not untried:
+                        e.replica = replica
+                        raise
+                    replica = self.choose_replica(payload, tried)
+                    continue
+                except (httpx.HTTPError, asyncio.TimeoutError, OSError) as e:
+                    self.replicas.record(replica, ok=False)
+                    e.replica = replica
+                    raise
+            self.replicas.record(replica, ok=True)
+            return resp
+
+    def _record_failure(self, replica: Optional[AgentReplica]):
+        """
+        A failure on one replica while the others are answering is that
+        replica's problem, and its ejection deals with it; the breaker is for
+        the agent as a whole failing.
+        """
+        if replica is not None and self.replicas.others_ok(replica):
+            self.breaker.release()
+        else:
+            self.breaker.record_failure()
+
+    def _hedge_delay(self, operation: str) -> Optional[float]:
+        if not AGENT_HEDGING or self.breaker.state != CLOSED or self.hedges >= self.calls * HEDGE_MAX_RATIO:
+            return None
+        return self.tracker(operation).percentile(0.95)
+
+    async def _post_hedged(self, client: httpx.AsyncClient, payload: dict, timeout: float, delay: float) -> httpx.Response:
+        """
+        Sends a second copy if the first hasn't answered within the p95 latency;
+        whichever succeeds first wins and the other is cancelled.
+        """
+        first_replica = self.choose_replica(payload)
+        first = asyncio.create_task(self._post_once(client, payload, timeout, first_replica))
+        done, _ = await asyncio.wait({first}, timeout=delay)
+        if done:
+            return first.result()
+
+        self.hedges += 1
+        AGENT_HEDGES.labels(self.name, "sent").inc()
+        hedge = {**payload, "params": {**payload["params"], "message": {
+            **payload["params"]["message"],
+            "messageId": uuid.uuid4().hex,
+            # Its own context so the two copies don't interleave in one agent session
+            "contextId": f"{payload['params']['message'].get('contextId')}_hedge",
+        }}}
+        # On another replica when there is one: the first may be the slow part
+        second = asyncio.create_task(self._post_once(client, hedge, timeout - delay, self.choose_replica(hedge, (first_replica,))))
+        pending = {first, second}
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is second:
+                            AGENT_HEDGES.labels(self.name, "won").inc()
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def post(self, client: httpx.AsyncClient, payload: dict, operation: str, hedge: bool = False) -> httpx.Response:
+        """
+        A JSON-RPC call, once the scheduler admits it, through the breaker.
+        Transport errors, timeouts, 5xx and JSON-RPC errors count as failures;
+        raises AgentUnavailable without calling when the breaker is open.
+        """
+        async with self.scheduled(payload, operation) as ticket:
+            resp = await self._post(client, payload, operation, hedge)
+            ticket.record_usage(agent_result_usage(resp.json().get("result")))
+            return resp
+
+    async def _post(self, client: httpx.AsyncClient, payload: dict, operation: str, hedge: bool) -> httpx.Response:
+        self.breaker.before_call()
+        try:
+            timeout = self.timeout(operation)
+        except AgentUnavailable:
+            self.breaker.release()
+            raise
+        self.calls += 1
+        started = time.monotonic()
+        try:
+            delay = self._hedge_delay(operation) if hedge else None
+            if delay is not None:
+                resp = await self._post_hedged(client, payload, timeout, delay)
+            else:
+                resp = await self._post_once(client, payload, timeout)
+            error = resp.json().get("error")
+            if error:
+                raise AgentCallFailed(error.get("message", "JSON-RPC error"))
+        except asyncio.CancelledError:
+            self.breaker.release()
+            raise
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code >= 500:
+                self._record_failure(getattr(e, "replica", None))
+            else:
+                self.breaker.release()
+            raise
+        except Exception as e:
+            self._record_failure(getattr(e, "replica", None))
+            raise
+        self.breaker.record_success()
+        self.tracker(operation).observe(time.monotonic() - started)
+        return resp
+
+    @asynccontextmanager
+    async def stream(self, client: httpx.AsyncClient, payload: dict, operation: str):
+        """
+        message/stream, once the scheduler admits it, through the breaker.
+        Yields a StreamCall whose lines() stop at the deadline; mark_failed()
+        records a JSON-RPC error sent mid-stream and record_usage() the
+        reply's token counts. The outcome is recorded on exit; exceptions the
+        block raises itself, rather than from lines(), are not held against
+        the agent.
+        """
+        async with self.scheduled(payload, operation) as ticket:
+            async with self._stream(client, payload, operation, ticket) as call:
+                yield call
+
+    @asynccontextmanager
+    async def _stream(self, client: httpx.AsyncClient, payload: dict, operation: str, ticket: Ticket):
+        self.breaker.before_call()
+        try:
+            timeout = self.timeout(operation)
+        except AgentUnavailable:
+            self.breaker.release()
+            raise
+        self.calls += 1
+        started = time.monotonic()
+        headers = {"Accept": "text/event-stream", **self._with_deadline(payload, timeout)}
+        replica = self.choose_replica(payload)
+        call = None
+        try:
+            with self.replicas.lease(replica):
+                async with client.stream("POST", f"{replica.url}/", json=payload, timeout=timeout, headers=headers) as resp:
+                    resp.raise_for_status()
+                    call = StreamCall(resp, started + timeout, ticket)
+                    yield call
+        except (asyncio.CancelledError, GeneratorExit):
+            self.breaker.release()
+            raise
+        except Exception:
+            # Only the agent's own errors count against it: the caller's block
+            # (parsing, saving to the database) can raise too
+            if call is None or call.broken:
+                self.replicas.record(replica, ok=False)
+                self._record_failure(replica)
+            else:
+                self.breaker.release()
+            raise
+        self.replicas.record(replica, ok=True)
+        if call.failed:
+            self.breaker.record_failure()
+            return
+        self.breaker.record_success()
+        self.tracker(operation).observe(time.monotonic() - started)
+
+class StreamCall:
+    def __init__(self, response: httpx.Response, deadline: float, ticket: Ticket):
+        self.response = response
+        self.deadline = deadline
+        self.ticket = ticket
+        self.failed = False
+        self.broken = False # The connection failed or the deadline passed mid-stream
+
+    def mark_failed(self):
+        self.failed = True
+
+    def record_usage(self, usage: Optional[dict]):
+        self.ticket.record_usage(usage)
+
+    async def lines(self):
+        lines = self.response.aiter_lines()
+        while True:
+            remaining = self.deadline - time.monotonic()
+            if remaining <= 0:
+                self.broken = True
+                raise asyncio.TimeoutError("Agent stream passed its deadline")
+            try:
+                line = await asyncio.wait_for(lines.__anext__(), remaining)
+            except StopAsyncIteration:
+                return
+            except (httpx.HTTPError, asyncio.TimeoutError, OSError):
+                self.broken = True
+                raise
+            yield line
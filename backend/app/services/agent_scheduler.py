@@ -0,0 +1,275 @@
+import os
+import time
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Optional, Tuple
+
+from ..metrics import AGENT_QUEUE_DEPTH, AGENT_QUEUE_WAIT, AGENT_QUEUE_REJECTED, AGENT_SCHEDULED_IN_FLIGHT, AGENT_TOKEN_BUDGET
+
+logger = logging.getLogger(__name__)
+
+# Priority classes, served in this order
+INTERACTIVE = "interactive" # Someone is waiting on the result: a student's submission
+ANALYSIS = "analysis" # A teacher's resource upload
+BULK = "bulk" # Regrades, imports and other batch work
+PRIORITIES = (INTERACTIVE, ANALYSIS, BULK)
+# Share of an agent's concurrency a class and those below it may hold at
+# once; the rest is kept free for the classes above
+CLASS_SHARE = {INTERACTIVE: 1.0, ANALYSIS: 0.75, BULK: 0.5}
+QUEUE_MAX = int(os.getenv("AGENT_QUEUE_MAX", "1000")) # Waiting calls per agent before new ones are turned away
+ESTIMATE_WEIGHT = 0.2 # Weight of the latest call in an operation's running token estimate
+
+# The priority class and fairness key (e.g. the LMS class) of the agent work
+# the current request does; set with agent_work()
+current_work: ContextVar[Tuple[str, str]] = ContextVar("current_work", default=(ANALYSIS, ""))
+
+@contextmanager
+def agent_work(priority: str, key: str = ""):
+    """
+    Agent calls made inside the block are queued as `priority` work for `key`.
+    Calls with the same priority are served round-robin between keys, so one
+    key's backlog doesn't hold up the others.
+    """
+    if priority not in PRIORITIES:
+        raise ValueError(f"Unknown priority {priority!r}")
+    token = current_work.set((priority, key))
+    try:
+        yield
+    finally:
+        current_work.reset(token)
+
+class QueueRejected(Exception):
+    """
+    The call was not admitted: the queue is full, or the caller's deadline
+    passed while it waited.
+    """
+
+class TokenBucket:
+    """
+    Model tokens an agent may use per minute, refilled continuously, with a
+    minute's worth as the burst. A call larger than the whole bucket runs once
+    the bucket is full and leaves it in debt.
+    """
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, tokens: float) -> bool:
+        self._refill()
+        if self.level < min(tokens, self.capacity):
+            return False
+        self.level -= tokens
+        return True
+
+    def adjust(self, tokens: float):
+        """
+        Charges (or refunds, if negative) the difference between a call's
+        estimate and what it actually used.
+        """
+        self._refill()
+        self.level = min(self.capacity, self.level - tokens)
+
+    def seconds_until(self, tokens: float) -> float:
+        self._refill()
+        return max(0.0, (min(tokens, self.capacity) - self.level) / self.rate)
+
+class Waiter:
+    def __init__(self, priority: str, key: str, tokens: float):
+        self.priority = priority
+        self.key = key
+        self.tokens = tokens
+        self.enqueued = time.monotonic()
+        self.future = asyncio.get_running_loop().create_future()
+
+class Ticket:
+    """
+    An admitted call. record_usage() settles its token charge against what the
+    model actually used.
+    """
+    def __init__(self, queue: "AgentQueue", priority: str, operation: str, tokens: float):
+        self.queue = queue
+        self.priority = priority
+        self.operation = operation
+        self.tokens = tokens
+        self.settled = False
+
+    def record_usage(self, usage: Optional[dict]):
+        if not usage or self.settled:
+            return
+        self.settled = True
+        self.queue.settle(self, sum(usage.values()))
+
+class AgentQueue:
+    """
+    Admission for one agent's calls. At most limit() calls run at once. A
+    free slot goes to the oldest waiting call of the highest priority class
+    with room under CLASS_SHARE, taking keys within a class in turn. With a
+    token budget, calls also wait until the agent's per-minute budget covers
+    their estimated tokens (the running average of their operation's recent
+    calls).
+    """
+    def __init__(self, agent: str, limit: Callable[[], int], tokens_per_minute: int = 0):
+        self.agent = agent
+        self.limit = limit
+        self.bucket = TokenBucket(tokens_per_minute) if tokens_per_minute > 0 else None
+        self.queues: Dict[str, "OrderedDict[str, deque]"] = {p: OrderedDict() for p in PRIORITIES}
+        self.waiting = {p: 0 for p in PRIORITIES}
+        self.in_flight = {p: 0 for p in PRIORITIES}
+        self.estimates: Dict[str, float] = {}
+        self._wake: Optional[asyncio.TimerHandle] = None
+
+    def estimate(self, operation: str, default: float) -> float:
+        return self.estimates.get(operation, default)
+
+    def _has_room(self, priority: str) -> bool:
+        limit = self.limit()
+        if sum(self.in_flight.values()) >= limit:
+            return False
+        # This class and the ones below it share CLASS_SHARE of the slots
+        below = PRIORITIES[PRIORITIES.index(priority):]
+        return sum(self.in_flight[p] for p in below) < max(1, int(limit * CLASS_SHARE[priority]))
+
+    def _start(self, priority: str):
+        self.in_flight[priority] += 1
+        AGENT_SCHEDULED_IN_FLIGHT.labels(self.agent, priority).inc()
+
+    def _dispatch(self):
+        for priority in PRIORITIES:
+            keys = self.queues[priority]
+            while keys and self._has_room(priority):
+                key, waiters = next(iter(keys.items()))
+                waiter = waiters[0]
+                if self.bucket is not None and not self.bucket.take(waiter.tokens):
+                    # Lower classes don't overtake a call waiting for tokens
+                    self._wake_in(self.bucket.seconds_until(waiter.tokens))
+                    return
+                waiters.popleft()
+                # Round-robin: the key goes to the back of its class
+                del keys[key]
+                if waiters:
+                    keys[key] = waiters
+                self._dequeued(waiter)
+                self._start(priority)
+                waiter.future.set_result(None)
+            if keys:
+                return # Nothing below may start while this class waits
+        self._publish_budget()
+
+    def _wake_in(self, seconds: float):
+        if self._wake is None:
+            def wake():
+                self._wake = None
+                self._dispatch()
+            self._wake = asyncio.get_running_loop().call_later(seconds, wake)
+        self._publish_budget()
+
+    def _publish_budget(self):
+        if self.bucket is not None:
+            AGENT_TOKEN_BUDGET.labels(self.agent).set(self.bucket.level)
+
+    def _enqueue(self, waiter: Waiter):
+        self.queues[waiter.priority].setdefault(waiter.key, deque()).append(waiter)
+        self.waiting[waiter.priority] += 1
+        AGENT_QUEUE_DEPTH.labels(self.agent, waiter.priority).inc()
+
+    def _dequeued(self, waiter: Waiter):
+        self.waiting[waiter.priority] -= 1
+        AGENT_QUEUE_DEPTH.labels(self.agent, waiter.priority).dec()
+        AGENT_QUEUE_WAIT.labels(self.agent, waiter.priority).observe(time.monotonic() - waiter.enqueued)
+
+    def _abandon(self, waiter: Waiter):
+        waiters = self.queues[waiter.priority].get(waiter.key)
+        if waiters is not None and waiter in waiters:
+            waiters.remove(waiter)
+            if not waiters:
+                del self.queues[waiter.priority][waiter.key]
+            self._dequeued(waiter)
+
+    def _release(self, priority: str):
+        self.in_flight[priority] -= 1
+        AGENT_SCHEDULED_IN_FLIGHT.labels(self.agent, priority).dec()
+        self._dispatch()
+
+    def settle(self, ticket: Ticket, used: float):
+        estimate = self.estimates.get(ticket.operation)
+        self.estimates[ticket.operation] = used if estimate is None else estimate + ESTIMATE_WEIGHT * (used - estimate)
+        if self.bucket is not None:
+            self.bucket.adjust(used - ticket.tokens)
+            self._publish_budget()
+
+    @asynccontextmanager
+    async def slot(self, priority: str, key: str, operation: str, tokens: float, deadline: Optional[float] = None):
+        """
+        Waits for the call's turn, or raises QueueRejected; yields a Ticket
+        and frees the slot on exit.
+        """
+        if sum(self.waiting.values()) >= QUEUE_MAX:
+            AGENT_QUEUE_REJECTED.labels(self.agent, priority, "queue_full").inc()
+            raise QueueRejected(f"{self.agent} has {QUEUE_MAX} calls waiting")
+        waiter = Waiter(priority, key, tokens)
+        self._enqueue(waiter)
+        self._dispatch()
+        if not waiter.future.done():
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter.future), timeout)
+            except asyncio.TimeoutError:
+                if waiter.future.done():
+                    self._release(priority)
+                self._abandon(waiter)
+                AGENT_QUEUE_REJECTED.labels(self.agent, priority, "deadline").inc()
+                raise QueueRejected(f"Deadline passed while queued for {self.agent}")
+            except asyncio.CancelledError:
+                if waiter.future.done():
+                    self._release(priority) # Admitted just as the caller went away
+                else:
+                    self._abandon(waiter)
+                    waiter.future.cancel()
+                raise
+        ticket = Ticket(self, priority, operation, tokens)
+        try:
+            yield ticket
+        finally:
+            self._release(priority)
+
+    def as_dict(self) -> dict:
+        return {
+            "agent": self.agent,
+            "limit": self.limit(),
+            "in_flight": dict(self.in_flight),
+            "waiting": dict(self.waiting),
+            "waiting_keys": {p: len(keys) for p, keys in self.queues.items()},
+            "token_budget": round(self.bucket.level) if self.bucket is not None else None,
+            "token_estimates": {op: round(t) for op, t in self.estimates.items()},
+        }
+
+# ==========================================
+# Scheduler
+# ==========================================
+
+class AgentScheduler:
+    """
+    Every agent's queue. Limits hold per backend process: with several
+    workers, each admits up to its own limits.
+    """
+    def __init__(self):
+        self.queues: Dict[str, AgentQueue] = {}
+
+    def register(self, queue: AgentQueue) -> AgentQueue:
+        self.queues[queue.agent] = queue
+        return queue
+
+    def as_dict(self) -> list:
+        return [queue.as_dict() for queue in self.queues.values()]
+
+agent_scheduler = AgentScheduler()
@@ -1,17 +1,102 @@
 import httpx
+import asyncio
 import logging
 import json
+import os
 import re
+import hashlib
+from typing import Optional
+from pydantic import ValidationError
 from sqlmodel import Session, select
 from ..database import engine
 from ..models import Topic, KeyConcept, Occurrence, Resource
+from ..metrics import ANALYSIS_PARTS, observe_agent_call, record_agent_error, record_agent_tokens, record_grading_route
+from ..tracing import traced, trace_context_metadata
+from .agent_output import (
+    GradingOutput, AnalysisOutput, QuestionScoreOutput, parse_agent_output, parse_agent_result, agent_result_usage,
+    agent_result_route, agent_result_escalation,
+)
+from .agent_resilience import AgentEndpoint
+from .agent_registry import replica_urls
+from .agent_debug_log import agent_debug_log
+from .notification_service import notify, class_teacher_id, publish_to_resource_teacher
 
 logger = logging.getLogger(__name__)
 
-AGENT_URL = "http://localhost:10000" # URL of the A2A agent service
-GRADING_AGENT_URL = "http://localhost:10001" # URL of the Grading A2A agent
+# Point these at agent_common.stub_agent to run without model access
+AGENT_URL = os.getenv("LEARNER_AGENT_URL", "http://localhost:10000") # URL of the A2A agent service
+GRADING_AGENT_URL = os.getenv("GRADING_AGENT_URL", "http://localhost:10001") # URL of the Grading A2A agent
+# Several replicas of an agent: comma-separated URLs, balanced by agent_registry
+LEARNER_AGENT_URLS = replica_urls("LEARNER_AGENT_URLS", AGENT_URL)
+GRADING_AGENT_URLS = replica_urls("GRADING_AGENT_URLS", GRADING_AGENT_URL)
 
-async def grade_assignment_submission(assignment_id: int, student_id: int, questions_with_answers: list, topics: list) -> dict:
+# Breakers, timeouts and hedging per agent. Analysis time grows with the
+# resource's length, so its timeout stays fixed rather than following recent calls.
+# The learner agent keeps each context's history, so a context sticks to one
+# replica; grading is stateless and goes wherever is least busy.
+# Calls in flight per replica and model tokens per minute (0: unlimited) are
+# enforced by agent_scheduler, interactive work first
+GRADING_AGENT = AgentEndpoint("grading_agent", GRADING_AGENT_URLS, default_timeout=60.0, min_timeout=10.0,
+                              concurrency=int(os.getenv("GRADING_AGENT_CONCURRENCY", "16")),
+                              tokens_per_minute=int(os.getenv("GRADING_AGENT_TOKENS_PER_MINUTE", "0")))
+LEARNER_AGENT = AgentEndpoint("learner_agent", LEARNER_AGENT_URLS, default_timeout=12000.0, min_timeout=600.0,
+                              adaptive=False, affinity=True,
+                              concurrency=int(os.getenv("LEARNER_AGENT_CONCURRENCY", "8")),
+                              tokens_per_minute=int(os.getenv("LEARNER_AGENT_TOKENS_PER_MINUTE", "0")))
+ANALYSIS_RETRY_BACKOFF_SECONDS = 5.0
+
+def knowledge_version(topics: list) -> str:
+    """
+    Content hash of a class's topics block: changes whenever its topics or key
+    concepts do, so the grading agent's cached prefix is never stale.
+    """
+    return hashlib.sha256(json.dumps(topics, sort_keys=True).encode()).hexdigest()[:16]
+
+def build_grading_payload(assignment_id: int, student_id: int, questions_with_answers: list, topics: list, method: str, class_id: Optional[int] = None, grading_model: Optional[str] = None) -> dict:
+    """
+    JSON-RPC request asking the Grading Agent to grade a submission, for
+    message/send or message/stream. With class_id the topics block is tagged
+    with the class and knowledge version, which the agent uses as its prompt
+    cache key. grading_model (fast, pro or tiered) overrides the agent's
+    model strategy for the assignment.
+    """
+    import uuid
+    message_id = uuid.uuid4().hex
+    
+    submission_data = []
+    for i, qa in enumerate(questions_with_answers, 1):
+        submission_data.append({
+            f"question{i}": qa["question"],
+            f"answer{i}": qa["answer"],
+            "question_id": qa["question_id"]
+        })
+        
+    topics_tag = f'<Topics class_id="{class_id}" version="{knowledge_version(topics)}">' if class_id is not None else "<Topics>"
+    # Topics first: the static part of the prompt leads, the per-student part follows
+    prompt_text = f"{topics_tag}\n{json.dumps(topics, indent=4)}\n</Topics>\n\n"
+    prompt_text += f"Please grade the following assignment submission based on the provided grading guide.\n\n"
+    prompt_text += f"<Submission>\n{json.dumps(submission_data, indent=4)}\n</Submission>"
+    if grading_model:
+        prompt_text += f'\n\n<GradingModel tier="{grading_model}"/>'
+        
+    return {
+        "jsonrpc": "2.0",
+        "method": method, 
+        "params": {
+            "message": {
+                "role": "user",
+                "parts": [{"kind": "text", "text": prompt_text}],
+                "messageId": message_id,
+                "contextId": f"grade_{assignment_id}_{student_id}"
+            },
+            "configuration": {},
+            "metadata": trace_context_metadata()
+        },
+        "id": f"grading_{assignment_id}_{student_id}"
+    }
+
+@traced("agent.grade_assignment_submission")
+async def grade_assignment_submission(assignment_id: int, student_id: int, questions_with_answers: list, topics: list, class_id: Optional[int] = None, grading_model: Optional[str] = None) -> dict:
     """
     Triggers the Grading Agent to evaluate a student's submission.
     questions_with_answers looks like: [{"question_id": 1, "question": "What is...", "answer": "It is..."}, ...]
@@ -19,112 +104,245 @@ async def grade_assignment_submission(assignment_id: int, student_id: int, quest
     """
     logger.info(f"Triggering grading for assignment {assignment_id} by student {student_id}")
     try:
-        import uuid
-        message_id = uuid.uuid4().hex
-        
-        submission_data = []
-        for i, qa in enumerate(questions_with_answers, 1):
-            submission_data.append({
-                f"question{i}": qa["question"],
-                f"answer{i}": qa["answer"],
-                "question_id": qa["question_id"]
-            })
-            
-        prompt_text = f"Please grade the following assignment submission based on the provided grading guide.\n\n"
-        prompt_text += f"<Submission>\n{json.dumps(submission_data, indent=4)}\n</Submission>\n\n"
-        prompt_text += f"<Topics>\n{json.dumps(topics, indent=4)}\n</Topics>"
-            
-        payload = {
-            "jsonrpc": "2.0",
-            "method": "message/send", 
-            "params": {
-                "message": {
-                    "role": "user",
-                    "parts": [{"kind": "text", "text": prompt_text}],
-                    "messageId": message_id,
-                    "contextId": f"grade_{assignment_id}_{student_id}"
-                },
-                "configuration": {} 
-            },
-            "id": f"grading_{assignment_id}_{student_id}"
-        }
+        payload = build_grading_payload(assignment_id, student_id, questions_with_answers, topics, "message/send", class_id, grading_model)
         
         async with httpx.AsyncClient() as client:
-             resp = await client.post(f"{GRADING_AGENT_URL}/", json=payload, timeout=60.0)
-             resp.raise_for_status()
+             with observe_agent_call("grading_agent", "grade_assignment_submission"):
+                 resp = await GRADING_AGENT.post(client, payload, "grade_assignment_submission", hedge=True)
              
              response_data = resp.json()
              agent_result = response_data.get("result")
-             parsed_data = None
-             
-             if isinstance(agent_result, dict):
-                 if "result" in agent_result and isinstance(agent_result["result"], dict):
-                     agent_result = agent_result["result"]
-
-                 if "history" in agent_result and isinstance(agent_result["history"], list) and len(agent_result["history"]) > 0:
-                     last_msg = agent_result["history"][-1]
-                     if "parts" in last_msg and len(last_msg["parts"]) > 0:
-                         for part in last_msg["parts"]:
-                             if part.get("kind") == "text":
-                                 parsed_data = parse_agent_response(part["text"])
-                                 if parsed_data: break
-                 
-                 if not parsed_data and "parts" in agent_result:
-                      for part in agent_result["parts"]:
-                          if part.get("kind") == "text":
-                              parsed_data = parse_agent_response(part["text"])
-                              if parsed_data: break
-
-                 if not parsed_data and "response" in agent_result:
-                      parsed_data = parse_agent_response(agent_result["response"])
-             
-             elif isinstance(agent_result, str):
-                 parsed_data = parse_agent_response(agent_result)
-             
-             if parsed_data:
-                 return parsed_data
-             else:
-                 logger.error(f"No valid data parsed from grading agent result: {agent_result}")
-                 return None
+             record_agent_tokens("grading_agent", agent_result_usage(agent_result))
+             record_grading_route(agent_result_route(agent_result), f"assignment {assignment_id} by student {student_id}")
+             parsed_data = parse_agent_result(agent_result, GradingOutput, "grading_agent", "grade_assignment_submission")
+             if not parsed_data:
+                 record_agent_error("grading_agent", "grade_assignment_submission", "unparseable_response")
+             return parsed_data
               
     except Exception as e:
         logger.error(f"Failed to trigger grading agent: {e}")
         return None
 
-def parse_agent_response(response_text: str):
+class QuestionScoreExtractor:
+    """
+    Pulls complete objects out of the "question_scores" array of a grading
+    reply while its text is still arriving. feed() returns the objects that
+    were completed by the new text.
+    """
+    def __init__(self):
+        self.text = ""
+        self.pos = None # Scan position inside the array, once found
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.obj_start = None
+        self.done = False
+
+    def feed(self, chunk: str) -> list:
+        self.text += chunk
+        if self.done:
+            return []
+        if self.pos is None:
+            match = re.search(r'"question_scores"\s*:\s*\[', self.text)
+            if not match:
+                return []
+            self.pos = match.end()
+
+        found = []
+        text = self.text
+        while self.pos < len(text):
+            ch = text[self.pos]
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif ch == "\\":
+                    self.escaped = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == '"':
+                self.in_string = True
+            elif ch == "{":
+                if self.depth == 0:
+                    self.obj_start = self.pos
+                self.depth += 1
+            elif ch == "}":
+                self.depth -= 1
+                if self.depth == 0 and self.obj_start is not None:
+                    try:
+                        found.append(json.loads(text[self.obj_start:self.pos + 1]))
+                    except json.JSONDecodeError:
+                        logger.warning("Skipping unparseable question score in grading stream")
+                    self.obj_start = None
+            elif ch == "]" and self.depth == 0:
+                self.done = True
+                self.pos += 1
+                break
+            self.pos += 1
+        return found
+
+def _stream_event_text(event: dict) -> tuple:
     """
-    Extracts JSON from the agent's response, handling Markdown code blocks.
+    (text, append) carried by one A2A stream result: artifact and status
+    updates both carry reply text. The task's first status update echoes the
+    request, as a user message, and is skipped.
+    """
+    kind = event.get("kind")
+    if kind == "artifact-update":
+        parts = (event.get("artifact") or {}).get("parts", [])
+        return "".join(p.get("text", "") for p in parts if p.get("kind") == "text"), event.get("append", False)
+    if kind == "status-update":
+        message = (event.get("status") or {}).get("message") or {}
+        if message.get("role") == "user":
+            return "", False
+        text = "".join(p.get("text", "") for p in message.get("parts", []) if p.get("kind") == "text")
+        return text, False
+    return "", True
+
+async def stream_assignment_grading(assignment_id: int, student_id: int, questions_with_answers: list, topics: list, class_id: Optional[int] = None, grading_model: Optional[str] = None):
     """
+    Grades a submission with A2A message/stream. Yields ("question", score)
+    for each question score as soon as the agent has written it, then
+    ("result", parsed_reply), or ("error", reason) if the stream fails or the
+    reply cannot be parsed. ("escalated", {"reasons": [...]}) means the fast
+    model's grade is being replaced: question scores yielded before it are
+    superseded, and the pro model's follow.
+    """
+    logger.info(f"Streaming grading for assignment {assignment_id} by student {student_id}")
+    payload = build_grading_payload(assignment_id, student_id, questions_with_answers, topics, "message/stream", class_id, grading_model)
+    extractor = QuestionScoreExtractor()
+    usage = None
+    route = None
+    reply = ""
+    complete = None
+    seen = set()
     try:
-        # Try to find JSON block
-        json_match = re.search(r"```json\s*(.*?)\s*```", response_text, re.DOTALL)
-        if json_match:
-            json_str = json_match.group(1)
-        else:
-            # Maybe the whole response is JSON
-            json_str = response_text
-        
-        return json.loads(json_str)
-    except json.JSONDecodeError as e:
-        logger.error(f"Failed to decode JSON: {e}")
-        return None
+        async with httpx.AsyncClient() as client:
+            with observe_agent_call("grading_agent", "stream_assignment_grading"):
+                async with GRADING_AGENT.stream(client, payload, "stream_assignment_grading") as call:
+                    async for line in call.lines():
+                        if not line.startswith("data:"):
+                            continue
+                        message = json.loads(line[5:].strip())
+                        if "error" in message:
+                            call.mark_failed()
+                            record_agent_error("grading_agent", "stream_assignment_grading", "stream_error")
+                            yield "error", message["error"].get("message", "Grading agent error")
+                            return
+                        usage = agent_result_usage(message.get("result")) or usage
+                        route = agent_result_route(message.get("result")) or route
+                        escalation = agent_result_escalation(message.get("result"))
+                        if escalation is not None:
+                            # Start over on the pro model's reply
+                            extractor = QuestionScoreExtractor()
+                            reply, complete, seen = "", None, set()
+                            yield "escalated", escalation
+                            continue
+                        text, append = _stream_event_text(message.get("result") or {})
+                        if not text:
+                            continue
+                        # Chunks arrive either as deltas or as the reply so far; the
+                        # final status update repeats the whole reply
+                        if not append and text.startswith(reply):
+                            new = text[len(reply):]
+                        else:
+                            new = text
+                        if not append and len(text) >= len(reply):
+                            complete = text
+                        reply += new
+                        for score in extractor.feed(new):
+                            try:
+                                score = QuestionScoreOutput.model_validate(score).model_dump()
+                            except ValidationError:
+                                logger.warning(f"Skipping invalid question score in grading stream: {score}")
+                                continue
+                            if score["question_id"] not in seen:
+                                seen.add(score["question_id"])
+                                yield "question", score
+                    call.record_usage(usage)
+    except Exception as e:
+        logger.error(f"Grading stream failed: {e}")
+        yield "error", "Grading agent unavailable"
+        return
+
+    record_agent_tokens("grading_agent", usage)
+    record_grading_route(route, f"assignment {assignment_id} by student {student_id}")
+    parsed = parse_agent_output(complete or reply, GradingOutput, "grading_agent", "stream_assignment_grading")
+    if not parsed:
+        record_agent_error("grading_agent", "stream_assignment_grading", "unparseable_response")
+        yield "error", "Grading agent returned an unreadable result"
+        return
+    for score in parsed.get("question_scores", []):
+        if score.get("question_id") not in seen: # e.g. no artifact chunks, only the final message
+            seen.add(score.get("question_id"))
+            yield "question", score
+    yield "result", parsed
+
+def analysis_payload(parts: list, context_id: str, request_id: str) -> dict:
+    """
+    message/send request asking the Learner Agent to analyse a resource.
+    """
+    import uuid
+    return {
+        "jsonrpc": "2.0",
+        "method": "message/send",
+        "params": {
+            "message": {
+                "role": "user",
+                "parts": parts,
+                "messageId": uuid.uuid4().hex,
+                "contextId": context_id
+            },
+            "configuration": {},
+            "metadata": trace_context_metadata()
+        },
+        "id": request_id
+    }
+
+async def analyse_part(client: httpx.AsyncClient, slots: asyncio.Semaphore, parts: list, context_id: str,
+                       request_id: str, operation: str, retries: int) -> Optional[dict]:
+    """
+    Analyses one part of a resource that is analysed in parallel parts (a
+    video segment, a range of PDF pages), retrying it on its own; the other
+    parts' results stand whatever happens here. None once the retries are
+    used up.
+    """
+    for attempt in range(retries + 1):
+        if attempt:
+            ANALYSIS_PARTS.labels(operation, "retried").inc()
+            await asyncio.sleep(ANALYSIS_RETRY_BACKOFF_SECONDS * 2 ** (attempt - 1))
+        # A fresh context per attempt, so a retry doesn't see the failed turn
+        payload = analysis_payload(parts, context_id + (f"_retry{attempt}" if attempt else ""), request_id)
+        try:
+            async with slots:
+                with observe_agent_call("learner_agent", operation):
+                    resp = await LEARNER_AGENT.post(client, payload, operation)
+        except Exception as e:
+            logger.warning(f"{request_id} failed (attempt {attempt + 1}): {e}")
+            continue
+        result = resp.json().get("result")
+        record_agent_tokens("learner_agent", agent_result_usage(result))
+        parsed = parse_agent_result(result, AnalysisOutput, "learner_agent", operation)
+        agent_debug_log.record("learner_agent", operation, request_id, result, ok=parsed is not None, attempt=attempt + 1)
+        if parsed:
+            ANALYSIS_PARTS.labels(operation, "ok").inc()
+            return parsed
+        record_agent_error("learner_agent", operation, "unparseable_response")
+        logger.warning(f"{request_id} gave no usable analysis (attempt {attempt + 1})")
+    ANALYSIS_PARTS.labels(operation, "failed").inc()
+    return None
 
+@traced("agent.trigger_resource_analysis")
 async def trigger_resource_analysis(resource_id: int, url: str):
     """
     Triggers the Learner Agent to analyze a resource.
     This sends a message to the agent acting as the 'User'.
     """
     logger.info(f"Triggering analysis for resource {resource_id} at {url}")
+    lease = None # The resource's model file in AI Studio mode
     try:
-        # Construct JSON-RPC 2.0 Request
-        # Based on error, method is required. Common methods: 'generate', 'chat', 'predict'.
-        # Assuming 'generate' or a similar method exposed by LlmAgent via to_a2a.
-        # Construct payload matching test_client.py
-        import uuid
-        message_id = uuid.uuid4().hex
-        
         # Check if URL is a GCS public URL
         parts = []
+        duration = None # Video length in seconds, when known
         if url and url.startswith("https://storage.googleapis.com/"):
             gs_uri = url.replace("https://storage.googleapis.com/", "gs://")
             
@@ -132,66 +350,55 @@ async def trigger_resource_analysis(resource_id: int, url: str):
             mime_type = "video/mp4" # Default fallback
             if url.lower().endswith(".pdf"):
                 mime_type = "application/pdf"
+
+            # PDFs are read locally and analysed in parallel page ranges; the
+            # whole file is only sent if it can't be read here
+            if mime_type == "application/pdf":
+                from .pdf_pages import PDF_CHUNK_PAGES, analyse_pdf_in_chunks
+                chunked = await analyse_pdf_in_chunks(resource_id, url) if PDF_CHUNK_PAGES else None
+                if chunked is not None:
+                    parsed_data, failed_chunks = chunked
+                    if parsed_data:
+                        save_analysis_results(resource_id, parsed_data, {"failed_page_ranges": failed_chunks})
+                    else:
+                        publish_to_resource_teacher(resource_id, "analysis.failed", {"reason": "all_page_ranges_failed"})
+                    return
             
             # Check if using Vertex AI or AI Studio
             import os
             if os.getenv("GOOGLE_GENAI_USE_VERTEXAI", "FALSE").upper() != "TRUE":
-                from google import genai
-                import httpx
-                import tempfile
-                import time
-
+                # Streamed from storage into the Files API without a local
+                # copy, or reused from an earlier analysis of the resource
+                from .model_files import lease_model_file
                 try:
-                    # Explicitly load root .env to get the API key if not in env
-                    from dotenv import load_dotenv
-                    root_env_path = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))), '.env')
-                    load_dotenv(root_env_path)
-                    
-                    api_key = os.getenv("GOOGLE_API_KEY")
-                    client = genai.Client(api_key=api_key)
-                    
-                    # 1. Download to local temp file
-                    ext = ".pdf" if mime_type == "application/pdf" else ".mp4"
-                    with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as tmp:
-                        tmp_path = tmp.name
-                    
-                    logger.info(f"Downloading {url} to {tmp_path} for AI Studio upload")
-                    async with httpx.AsyncClient(timeout=600.0) as http_client:
-                        async with http_client.stream("GET", url) as response:
-                            response.raise_for_status()
-                            with open(tmp_path, "wb") as f:
-                                async for chunk in response.aiter_bytes():
-                                    f.write(chunk)
-                    
-                    # 2. Upload to AI Studio
-                    logger.info(f"Uploading local file {tmp_path} to AI Studio GenAI File Storage")
-                    genai_file = client.files.upload(file=tmp_path, config={'mime_type': mime_type})
-                    
-                    # 3. Wait for processing if video
-                    while genai_file.state.name == "PROCESSING":
-                        logger.info(f"Waiting for AI Studio video processing... {genai_file.name}")
-                        time.sleep(5)
-                        genai_file = client.files.get(name=genai_file.name)
-                        
-                    if genai_file.state.name == "FAILED":
-                        raise ValueError(f"AI Studio File processing failed for {genai_file.name}")
-                        
-                    logger.info(f"Uploaded to AI Studio successfully: {genai_file.uri}")
-                    gs_uri = genai_file.uri
+                    lease = await lease_model_file(resource_id, url, mime_type)
                 except Exception as e:
                     logger.error(f"Failed to upload to AI Studio: {e}")
                     raise
-                finally:
-                    if 'tmp_path' in locals() and os.path.exists(tmp_path):
-                        os.remove(tmp_path)
+                from .video_segments import genai_file_duration
+                duration = genai_file_duration(lease.file)
             
-            parts.append({
+            # The lease's part has its URI kept fresh while calls are queued
+            parts.append(lease.part if lease else {
                 "kind": "file",
                 "file": {
                     "mime_type": mime_type,
                     "uri": gs_uri
                 }
             })
+
+            # Long videos are analysed in parallel segments rather than one call
+            if mime_type.startswith("video/"):
+                from .video_segments import VIDEO_SEGMENT_SECONDS, probe_video_duration, analyse_video_in_segments
+                if VIDEO_SEGMENT_SECONDS and duration is None:
+                    duration = await probe_video_duration(url)
+                if VIDEO_SEGMENT_SECONDS and duration and duration > VIDEO_SEGMENT_SECONDS:
+                    parsed_data, failed_segments = await analyse_video_in_segments(resource_id, parts[0], duration)
+                    if parsed_data:
+                        save_analysis_results(resource_id, parsed_data, {"failed_segments": failed_segments})
+                    else:
+                        publish_to_resource_teacher(resource_id, "analysis.failed", {"reason": "all_segments_failed"})
+                    return
         
         # Always append the text instruction
         parts.append({
@@ -199,80 +406,34 @@ async def trigger_resource_analysis(resource_id: int, url: str):
             "text": "Analyze this resource thoroughly." if parts else f"Analyze this resource: {url}"
         })
         
-        payload = {
-            "jsonrpc": "2.0",
-            "method": "message/send", 
-            "params": {
-                "message": {
-                    "role": "user",
-                    "parts": parts,
-                    "messageId": message_id,
-                    "contextId": f"ctx_{resource_id}"
-                },
-                "configuration": {} 
-            },
-            "id": f"resource_{resource_id}"
-        }
+        payload = analysis_payload(parts, f"ctx_{resource_id}", f"resource_{resource_id}")
         
         async with httpx.AsyncClient() as client:
-             # Increase timeout for complex video analysis
-             resp = await client.post(f"{AGENT_URL}/", json=payload, timeout=12000.0)
-             resp.raise_for_status()
+             with observe_agent_call("learner_agent", "trigger_resource_analysis"):
+                 resp = await LEARNER_AGENT.post(client, payload, "trigger_resource_analysis")
              
              response_data = resp.json()
-             logger.info(f"Agent response: {response_data}")
-             
-             # DEBUG: Write to file
-             with open("agent_debug.log", "a") as f:
-                 f.write(f"\n{'='*50}\nResource {resource_id} Response:\n{json.dumps(response_data, indent=2)}\n{'='*50}\n")
-             
-             logger.info(f"\n{'-'*30}\nAGENT RESPONSE:\n{json.dumps(response_data, indent=2)}\n{'-'*30}")
-             
-             # Extract result
-             agent_result = response_data.get("result")
-             logger.info(f"Result type: {type(agent_result)}")
-             
-             parsed_data = None
-             
-             if isinstance(agent_result, dict):
-                 # Check for 'result' wrapper inside result if double-wrapped
-                 if "result" in agent_result and isinstance(agent_result["result"], dict):
-                     agent_result = agent_result["result"]
-
-                 # Strategy 1: Look for 'history' (Task object)
-                 if "history" in agent_result and isinstance(agent_result["history"], list) and len(agent_result["history"]) > 0:
-                     last_msg = agent_result["history"][-1]
-                     if "parts" in last_msg and len(last_msg["parts"]) > 0:
-                         for part in last_msg["parts"]:
-                             if part.get("kind") == "text":
-                                 parsed_data = parse_agent_response(part["text"])
-                                 if parsed_data: break
-                 
-                 # Strategy 2: Look for direct 'message' (Message object)
-                 if not parsed_data and "parts" in agent_result:
-                      for part in agent_result["parts"]:
-                          if part.get("kind") == "text":
-                              parsed_data = parse_agent_response(part["text"])
-                              if parsed_data: break
-
-                 # Strategy 3: Fallback 'response' field
-                 if not parsed_data and "response" in agent_result:
-                      parsed_data = parse_agent_response(agent_result["response"])
-             
-             elif isinstance(agent_result, str):
-                 parsed_data = parse_agent_response(agent_result)
+             parsed_data = parse_agent_result(response_data.get("result"), AnalysisOutput, "learner_agent", "trigger_resource_analysis")
+             # Written to the debug log off the request path
+             agent_debug_log.record("learner_agent", "trigger_resource_analysis", f"resource_{resource_id}",
+                                    response_data, ok=parsed_data is not None)
              
              if parsed_data:
                  save_analysis_results(resource_id, parsed_data)
              else:
-                 logger.error(f"No valid data parsed from agent result: {agent_result}")
+                 record_agent_error("learner_agent", "trigger_resource_analysis", "unparseable_response")
+                 publish_to_resource_teacher(resource_id, "analysis.failed", {"reason": "unparseable_response"})
               
     except Exception as e:
         logger.error(f"Failed to trigger agent: {e}")
+        publish_to_resource_teacher(resource_id, "analysis.failed", {"reason": type(e).__name__})
+    finally:
+        if lease is not None:
+            lease.release()
 
 
 
-def save_analysis_results(resource_id: int, data: dict):
+def save_analysis_results(resource_id: int, data: dict, details: Optional[dict] = None):
     """
     Saves analysis results. Handles flattened structure from Agent prompt:
     {
@@ -280,6 +441,7 @@ def save_analysis_results(resource_id: int, data: dict):
         "key_concepts": [{"id":..., "occurrence_id":...}],
         "occurrences": [{"id":..., "topic_id":...}]
     }
+    details are added to the analysis.completed notification.
     """
     logger.info(f"Saving analysis results for resource {resource_id}")
     try:
@@ -341,15 +503,29 @@ def save_analysis_results(resource_id: int, data: dict):
                      description=kc.get("description"),
                      occurrence_id=db_occ.id,
                      timestamp_start=parse_timestamp(kc.get("timestamp_start")),
-                     timestamp_end=parse_timestamp(kc.get("timestamp_end"))
+                     timestamp_end=parse_timestamp(kc.get("timestamp_end")),
+                     page_number=parse_page_number(kc.get("page_number")),
+                     section=kc.get("section")
                  )
                  session.add(key_concept)
             
+            resource = session.get(Resource, resource_id)
+            if resource:
+                notify(session, [class_teacher_id(session, resource.class_id)], "analysis.completed",
+                       {"resource_id": resource_id, "topics": len(topic_map), **(details or {})})
             session.commit()
             logger.info("Analysis results saved successfully (Flattened Mode).")
 
     except Exception as e:
         logger.error(f"Failed to save analysis results: {e}")
+        publish_to_resource_teacher(resource_id, "analysis.failed", {"reason": "save_failed"})
+
+def parse_page_number(page):
+    """
+    Page numbers arrive as ints or strings ("12", "p. 12"); None if there isn't one.
+    """
+    match = re.search(r"\d+", str(page)) if page is not None else None
+    return int(match.group()) if match else None
 
 def parse_timestamp(ts):
     """
@@ -0,0 +1,102 @@
+import re
+from typing import List, Optional
+
+MERGE_GAP_SECONDS = 15 # Same-named video concepts this close together are one concept
+
+def normalize_name(name: Optional[str]) -> str:
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", (name or "").lower()).split())
+
+def namespace_ids(data: dict, prefix: str) -> dict:
+    """
+    Prefixes an analysis's client ids, which every agent call numbers from 1,
+    so several analyses of one resource can be merged.
+    """
+    def prefixed(client_id):
+        return None if client_id is None else f"{prefix}.{client_id}"
+
+    return {
+        "summary": data.get("summary"),
+        "topics": [{**t, "id": prefixed(t.get("id"))} for t in data.get("topics", [])],
+        "occurrences": [
+            {**o, "id": prefixed(o.get("id")), "topic_id": prefixed(o.get("topic_id"))}
+            for o in data.get("occurrences", [])
+        ],
+        "key_concepts": [
+            {**kc, "id": prefixed(kc.get("id")), "occurrence_id": prefixed(kc.get("occurrence_id"))}
+            for kc in data.get("key_concepts", [])
+        ],
+    }
+
+def _same_place(a: dict, b: dict) -> bool:
+    # Video concepts are placed by time, document concepts by page
+    if a.get("timestamp_start") is None or b.get("timestamp_start") is None:
+        if a.get("timestamp_start") is not None or b.get("timestamp_start") is not None:
+            return False
+        return a.get("page_number") == b.get("page_number")
+    a_end = a["timestamp_end"] if a.get("timestamp_end") is not None else a["timestamp_start"]
+    b_end = b["timestamp_end"] if b.get("timestamp_end") is not None else b["timestamp_start"]
+    return a["timestamp_start"] <= b_end + MERGE_GAP_SECONDS and b["timestamp_start"] <= a_end + MERGE_GAP_SECONDS
+
+def merge_analyses(analyses: List[dict]) -> dict:
+    """
+    Merges analyses of parts of one resource, in order and with namespaced
+    ids, into one in the flattened format save_analysis_results takes. A topic
+    several parts report (by name) becomes one topic with one occurrence; a
+    concept reported twice at the same place, as happens where video segments
+    overlap, is kept once with the wider time range and the fuller description.
+    """
+    topics, occurrences, concepts, summaries = [], [], [], []
+    topic_by_name = {} # normalized name -> merged topic
+    topic_alias = {} # part's topic id -> merged topic id
+    occurrence_by_topic = {} # merged topic id -> merged occurrence id
+    occurrence_alias = {} # part's occurrence id -> merged occurrence id
+    concepts_by_name = {} # (merged occurrence id, normalized name) -> merged concepts
+
+    for data in analyses:
+        if data.get("summary"):
+            summaries.append(data["summary"])
+
+        for t in data.get("topics", []):
+            key = normalize_name(t.get("name"))
+            if not key:
+                continue
+            merged = topic_by_name.get(key)
+            if merged is None:
+                merged = topic_by_name[key] = dict(t)
+                topics.append(merged)
+            elif len(t.get("outline") or "") > len(merged.get("outline") or ""):
+                merged["outline"] = t["outline"]
+            topic_alias[t["id"]] = merged["id"]
+
+        for o in data.get("occurrences", []):
+            topic_id = topic_alias.get(o["topic_id"])
+            if topic_id is None:
+                continue
+            if topic_id not in occurrence_by_topic:
+                occurrence_by_topic[topic_id] = o["id"]
+                occurrences.append({**o, "topic_id": topic_id})
+            occurrence_alias[o["id"]] = occurrence_by_topic[topic_id]
+
+        for kc in data.get("key_concepts", []):
+            occurrence_id = occurrence_alias.get(kc.get("occurrence_id"))
+            if occurrence_id is None:
+                continue
+            kc = {**kc, "occurrence_id": occurrence_id}
+            same_name = concepts_by_name.setdefault((occurrence_id, normalize_name(kc.get("name"))), [])
+            duplicate = next((c for c in same_name if _same_place(c, kc)), None)
+            if duplicate is None:
+                same_name.append(kc)
+                concepts.append(kc)
+                continue
+            if kc.get("timestamp_start") is not None:
+                duplicate["timestamp_start"] = min(duplicate["timestamp_start"], kc["timestamp_start"])
+                duplicate["timestamp_end"] = max(duplicate.get("timestamp_end") or 0, kc.get("timestamp_end") or 0) or None
+            if len(kc.get("description") or "") > len(duplicate.get("description") or ""):
+                duplicate["description"] = kc["description"]
+
+    return {
+        "summary": "\n\n".join(summaries),
+        "topics": topics,
+        "occurrences": occurrences,
+        "key_concepts": concepts,
+    }
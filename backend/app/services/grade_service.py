@@ -0,0 +1,279 @@
+import logging
+from typing import Dict, List, Optional
+from fastapi import HTTPException
+from sqlmodel import Session, select
+from sqlalchemy import update
+
+from ..models import (
+    Assignment, AssignmentGrade, Question, QuestionResponse, GradeReviewComment, User, UserRole,
+    Class, Resource, Occurrence, Topic, KeyConcept, TopicScore,
+)
+from .notification_service import notify, class_teacher_id
+
+logger = logging.getLogger(__name__)
+
+def apply_mark_changes(session: Session, new_marks: Dict[int, float], user: User) -> List[QuestionResponse]:
+    """
+    Sets QuestionResponse marks and moves each affected AssignmentGrade total by
+    the difference, without re-reading the rest of the submission. The grade
+    is the sum of its question marks (see save_grading_result), so it stays one.
+    new_marks maps response_id -> marks. Raises 403 if a response is in a class
+    the user doesn't teach, unless they are an admin. Does not commit; the
+    caller commits so the marks and grade totals land in one transaction.
+    """
+    rows = session.exec(
+        select(QuestionResponse, Question.assignment_id, Class.teacher_id)
+        .join(Question, QuestionResponse.question_id == Question.id)
+        .join(Assignment, Question.assignment_id == Assignment.id)
+        .join(Class, Assignment.class_id == Class.id)
+        .where(QuestionResponse.id.in_(list(new_marks.keys())))
+        .with_for_update(of=QuestionResponse) # Old marks must not change under us before the delta is applied
+    ).all()
+
+    if user.role != UserRole.ADMIN:
+        not_taught = sorted(resp.id for resp, _, teacher_id in rows if teacher_id != user.id)
+        if not_taught:
+            raise HTTPException(status_code=403, detail=f"Not authorized to mark responses: {not_taught}")
+
+    deltas = {} # (assignment_id, student_id) -> delta
+    responses = []
+    for resp, assignment_id, _ in rows:
+        marks = new_marks[resp.id]
+        delta = marks - (resp.marks or 0.0)
+        resp.marks = marks
+        session.add(resp)
+        responses.append(resp)
+
+        key = (assignment_id, resp.student_id)
+        deltas[key] = deltas.get(key, 0.0) + delta
+
+    session.flush()
+
+    for (assignment_id, student_id), delta in deltas.items():
+        if delta == 0:
+            continue
+        # Applied in the database so concurrent edits to the same grade can't lose updates
+        session.exec(
+            update(AssignmentGrade)
+            .where(AssignmentGrade.assignment_id == assignment_id, AssignmentGrade.student_id == student_id)
+            .values(marks=AssignmentGrade.marks + delta)
+        )
+
+    updated_by_student = {} # (assignment_id, student_id) -> response ids
+    for resp, assignment_id, _ in rows:
+        updated_by_student.setdefault((assignment_id, resp.student_id), []).append(resp.id)
+    for (assignment_id, student_id), response_ids in updated_by_student.items():
+        notify(session, [student_id], "grade.updated", {"assignment_id": assignment_id, "response_ids": response_ids})
+
+    return responses
+
+def build_review_responses(session: Session, questions: List[Question], student_id: int) -> List[dict]:
+    """
+    Review rows (response, marks, feedback and comment thread) for each answered
+    question. Two queries regardless of how many questions or comments there are.
+    """
+    question_ids = [q.id for q in questions]
+    if not question_ids:
+        return []
+
+    responses = {}
+    for resp in session.exec(
+        select(QuestionResponse)
+        .where(QuestionResponse.question_id.in_(question_ids), QuestionResponse.student_id == student_id)
+        .order_by(QuestionResponse.id)
+    ).all():
+        responses.setdefault(resp.question_id, resp)
+
+    comments_by_response = {}
+    if responses:
+        rows = session.exec(
+            select(GradeReviewComment, User)
+            .join(User, User.id == GradeReviewComment.user_id, isouter=True)
+            .where(GradeReviewComment.response_id.in_([r.id for r in responses.values()]))
+            .order_by(GradeReviewComment.created_at)
+        ).all()
+        for c, c_user in rows:
+            comments_by_response.setdefault(c.response_id, []).append({
+                "id": c.id,
+                "content": c.content,
+                "user_id": c.user_id,
+                "user_name": c_user.username if c_user else "Unknown",
+                "user_role": c_user.role if c_user else "Unknown",
+                "created_at": c.created_at
+            })
+
+    responses_data = []
+    for q in questions:
+        resp = responses.get(q.id)
+        if resp:
+            responses_data.append({
+                "question_id": q.id,
+                "question_content": q.content,
+                "response_id": resp.id,
+                "response_content": resp.content,
+                "marks": resp.marks,
+                "feedback": resp.feedback,
+                "comments": comments_by_response.get(resp.id, [])
+            })
+    return responses_data
+
+# ==========================================
+# Submissions
+# ==========================================
+
+def upsert_responses(session: Session, student_id: int, items: list) -> Dict[int, QuestionResponse]:
+    """
+    Saves the student's answers as ungraded responses, replacing earlier ones.
+    items have question_id and answer. Returns question_id -> response; flushed
+    so ids are set, not committed.
+    """
+    saved_responses = {}
+    for item in items:
+        # Check if response already exists
+        qr = session.exec(
+            select(QuestionResponse)
+            .where(
+                QuestionResponse.student_id == student_id,
+                QuestionResponse.question_id == item.question_id
+            )
+        ).first()
+
+        if qr:
+            qr.content = item.answer
+            qr.graded = False
+        else:
+            qr = QuestionResponse(
+                student_id=student_id,
+                question_id=item.question_id,
+                content=item.answer,
+                graded=False,
+                grader="ai"
+            )
+            session.add(qr)
+            
+        session.flush() 
+        saved_responses[item.question_id] = qr
+    return saved_responses
+
+def grading_topics(session: Session, class_id: int) -> List[dict]:
+    """
+    The class's topics and key concepts, in the shape the grading prompt uses.
+    """
+    resources = session.exec(select(Resource).where(Resource.class_id == class_id)).all()
+    resource_ids = [r.id for r in resources]
+    
+    # Ordered so the block is byte-identical between calls; it is the cached prompt prefix
+    topics_data = []
+    if resource_ids:
+        occurrences = session.exec(select(Occurrence).where(Occurrence.resource_id.in_(resource_ids)).order_by(Occurrence.id)).all()
+        topic_ids = list(set([o.topic_id for o in occurrences]))
+        if topic_ids:
+            topics = session.exec(select(Topic).where(Topic.id.in_(topic_ids)).order_by(Topic.id)).all()
+            concepts_by_occ = {}
+            for kc in session.exec(select(KeyConcept).where(KeyConcept.occurrence_id.in_([o.id for o in occurrences])).order_by(KeyConcept.id)).all():
+                concepts_by_occ.setdefault(kc.occurrence_id, []).append(kc)
+            for t in topics:
+                kcs = [kc for o in occurrences if o.topic_id == t.id for kc in concepts_by_occ.get(o.id, [])]
+                kcs_data = [
+                    {
+                        "key_concept_id": kc.id,
+                        "key_concept_name": kc.name,
+                        "key_concept_description": kc.description
+                    }
+                    for kc in kcs
+                ]
+                topics_data.append({
+                    "topic_id": t.id,
+                    "topic_name": t.name,
+                    "topic_outline": t.outline,
+                    "key_concepts": kcs_data
+                })
+    return topics_data
+
+def questions_with_answers(session: Session, assignment_id: int, items: list) -> List[dict]:
+    questions = session.exec(select(Question).where(Question.assignment_id == assignment_id)).all()
+    question_map = {q.id: q.content for q in questions}
+    
+    return [
+        {
+            "question_id": item.question_id,
+            "question": question_map.get(item.question_id, "Unknown Question"),
+            "answer": item.answer
+        }
+        for item in items
+    ]
+
+def save_question_score(saved_responses: Dict[int, QuestionResponse], score: dict) -> Optional[QuestionResponse]:
+    """
+    Applies one question's marks and feedback from the grading agent to its
+    response. Returns None for a question that isn't part of the submission.
+    """
+    qr = saved_responses.get(score.get("question_id"))
+    if qr:
+        qr.marks = score.get("marks", 0.0)
+        qr.feedback = score.get("feedback", "")
+    return qr
+
+def save_grading_result(session: Session, assignment: Assignment, student_id: int, saved_responses: Dict[int, QuestionResponse], items: list, result: dict) -> AssignmentGrade:
+    """
+    Stores the grading agent's full result: overall grade, question scores and
+    topic scores. The grade's marks are the sum of the question marks rather
+    than the agent's assignment_marks, which needn't add up, so a teacher's
+    mark edits can move the total by the difference. Does not commit.
+    """
+    for qs in result.get("question_scores", []):
+        save_question_score(saved_responses, qs)
+    marks = sum(qr.marks or 0.0 for qr in saved_responses.values())
+
+    # --- UPSERT ASSIGNMENT GRADE ---
+    grade = session.exec(
+        select(AssignmentGrade)
+        .where(
+            AssignmentGrade.assignment_id == assignment.id,
+            AssignmentGrade.student_id == student_id
+        )
+    ).first()
+    
+    if grade:
+        grade.marks = marks
+        grade.feedback = result.get("feedback", "")
+    else:
+        grade = AssignmentGrade(
+            assignment_id=assignment.id,
+            student_id=student_id,
+            marks=marks,
+            feedback=result.get("feedback", "")
+        )
+        session.add(grade)
+            
+    first_qr_id = None
+    for item in items:
+        first_qr_id = saved_responses[item.question_id].id
+        break
+        
+    if first_qr_id:
+        # Wipe old topic scores for this response before adding new ones
+        old_ts = session.exec(select(TopicScore).where(TopicScore.response_id == first_qr_id)).all()
+        for old in old_ts:
+            session.delete(old)
+            
+        for ts in result.get("topic_scores", []):
+            topic_score = TopicScore(
+                topic_id=ts.get("topic_id"),
+                response_id=first_qr_id,
+                marks=ts.get("marks", 0.0)
+            )
+            session.add(topic_score)
+            
+    for qr in saved_responses.values():
+        qr.graded = True
+        session.add(qr)
+        
+    notify(session, [student_id, class_teacher_id(session, assignment.class_id)], "grade.released",
+           {"assignment_id": assignment.id, "student_id": student_id})
+    return grade
+
+def grade_percentage(grade: AssignmentGrade, question_count: int) -> float:
+    total_possible = question_count * 10.0
+    percentage = (grade.marks / total_possible) * 100 if total_possible > 0 else 0
+    return round(percentage, 1)
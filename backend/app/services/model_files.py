@@ -0,0 +1,519 @@
+import os
+import time
+import asyncio
+import logging
+import tempfile
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, List, Optional
+
+import httpx
+from google.genai import types
+from sqlmodel import Session, delete, select
+
+from ..database import engine
+from ..models import ModelFile, Resource
+from ..metrics import MODEL_FILE_UPLOADS, MODEL_FILE_BYTES, MODEL_FILE_THROUGHPUT, MODEL_FILE_BUFFERED, MODEL_FILE_RETRIES, MODEL_FILE_CACHE
+
+logger = logging.getLogger(__name__)
+
+# Resources are copied from storage into the Gemini Files API (AI Studio
+# mode) as a stream: ranges of the object are downloaded in parallel and
+# sent on as the chunks of a resumable upload, so neither the whole file nor
+# a temporary copy of it is ever held. "tempfile" downloads to disk first, as
+# before; it is also used when storage doesn't report the object's size.
+MODEL_UPLOAD_MODE = os.getenv("MODEL_UPLOAD_MODE", "stream")
+GENAI_BASE_URL = os.getenv("GENAI_BASE_URL", "https://generativelanguage.googleapis.com")
+# Upload chunks must be a multiple of 256 KiB, except the last
+MODEL_UPLOAD_CHUNK_BYTES = int(os.getenv("MODEL_UPLOAD_CHUNK_MB", "8")) * 1024 * 1024
+# Range downloads in flight; memory held is at most this many chunks plus the one being uploaded
+MODEL_UPLOAD_PARALLEL_RANGES = int(os.getenv("MODEL_UPLOAD_PARALLEL_RANGES", "4"))
+MODEL_UPLOAD_RETRIES = int(os.getenv("MODEL_UPLOAD_RETRIES", "3")) # Per range or chunk
+MODEL_FILE_POLL_SECONDS = float(os.getenv("MODEL_FILE_POLL_SECONDS", "5"))
+MODEL_FILE_PROCESSING_TIMEOUT = float(os.getenv("MODEL_FILE_PROCESSING_TIMEOUT", "1800"))
+RETRY_BACKOFF = 0.5 # Seconds before the first retry, doubling after each
+# A resource's copy is reused by later analyses while the stored object is
+# unchanged and the copy has more than MODEL_FILE_REFRESH_MARGIN_SECONDS to
+# live; the Files API deletes files 48 hours after upload
+MODEL_FILE_CACHE_ENABLED = os.getenv("MODEL_FILE_CACHE", "on").lower() != "off"
+MODEL_FILE_REFRESH_MARGIN_SECONDS = float(os.getenv("MODEL_FILE_REFRESH_MARGIN_SECONDS", "3600"))
+MODEL_FILE_TTL_SECONDS = 48 * 3600 # When the API doesn't say when a file expires
+
+class ModelFileUploadError(Exception):
+    pass
+
+@dataclass
+class Transfer:
+    """
+    Progress of one copy, for the throughput log line and metrics.
+    """
+    mode: str
+    size: int
+    started: float = field(default_factory=time.perf_counter)
+    downloaded: int = 0
+    uploaded: int = 0
+    buffered: int = 0
+    peak_buffered: int = 0
+
+    def hold(self, n: int):
+        self.downloaded += n
+        self.buffered += n
+        self.peak_buffered = max(self.peak_buffered, self.buffered)
+        MODEL_FILE_BYTES.labels("download").inc(n)
+        MODEL_FILE_BUFFERED.inc(n)
+
+    def release(self, n: int):
+        self.uploaded += n
+        self.buffered -= n
+        MODEL_FILE_BYTES.labels("upload").inc(n)
+        MODEL_FILE_BUFFERED.dec(n)
+
+    def drop(self):
+        """
+        Frees whatever is still buffered when a copy fails.
+        """
+        MODEL_FILE_BUFFERED.dec(self.buffered)
+        self.buffered = 0
+
+    def as_dict(self) -> dict:
+        seconds = time.perf_counter() - self.started
+        return {
+            "mode": self.mode,
+            "bytes": self.size,
+            "seconds": round(seconds, 2),
+            "mb_per_second": round(self.size / 1e6 / seconds, 1) if seconds else None,
+            "peak_buffered_bytes": self.peak_buffered,
+        }
+
+def _api_key() -> Optional[str]:
+    if not os.getenv("GOOGLE_API_KEY"):
+        # Explicitly load root .env to get the API key if not in env
+        from dotenv import load_dotenv
+        load_dotenv(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))), '.env'))
+    return os.getenv("GOOGLE_API_KEY")
+
+def _retryable(e: Exception) -> bool:
+    if isinstance(e, httpx.HTTPStatusError):
+        return e.response.status_code >= 500 or e.response.status_code == 429
+    return isinstance(e, (httpx.TransportError, ModelFileUploadError))
+
+# ==========================================
+# Download side
+# ==========================================
+
+@dataclass
+class SourceObject:
+    size: Optional[int] # None when storage doesn't report it
+    ranges: bool # Byte ranges are served
+    version: Optional[str] # Generation, content hash or ETag, if storage reports one
+
+def source_version(headers: httpx.Headers) -> Optional[str]:
+    if headers.get("x-goog-generation"):
+        return f"generation:{headers['x-goog-generation']}"
+    for digest in headers.get_list("x-goog-hash", split_commas=True):
+        if digest.strip().startswith("md5="):
+            return digest.strip()
+    etag = headers.get("etag")
+    return f"etag:{etag.strip(chr(34))}" if etag and not etag.startswith("W/") else None
+
+async def probe_source(client: httpx.AsyncClient, url: str) -> SourceObject:
+    """
+    What a HEAD request tells about the object at url; nothing if it fails.
+    """
+    try:
+        response = await client.head(url)
+        response.raise_for_status()
+    except httpx.HTTPError as e:
+        logger.warning(f"HEAD {url} failed ({e})")
+        return SourceObject(None, False, None)
+    length = response.headers.get("content-length")
+    return SourceObject(
+        int(length) if length and length.isdigit() else None,
+        response.headers.get("accept-ranges", "").lower() == "bytes",
+        source_version(response.headers),
+    )
+
+async def _fetch_range(client: httpx.AsyncClient, url: str, first: int, last: int, transfer: Transfer) -> bytes:
+    for attempt in range(MODEL_UPLOAD_RETRIES + 1):
+        try:
+            response = await client.get(url, headers={"Range": f"bytes={first}-{last}"})
+            response.raise_for_status()
+            if response.status_code != 206 or len(response.content) != last - first + 1:
+                raise ModelFileUploadError(f"Expected bytes {first}-{last}, got {len(response.content)} bytes (HTTP {response.status_code})")
+            transfer.hold(len(response.content))
+            return response.content
+        except Exception as e:
+            if attempt == MODEL_UPLOAD_RETRIES or not _retryable(e):
+                raise
+            MODEL_FILE_RETRIES.labels("download").inc()
+            logger.warning(f"Range {first}-{last} of {url} failed ({e}); retrying")
+            await asyncio.sleep(RETRY_BACKOFF * 2 ** attempt)
+
+async def ranged_chunks(client: httpx.AsyncClient, url: str, transfer: Transfer) -> AsyncIterator[bytes]:
+    """
+    The object in upload-sized chunks, in order, downloaded as up to
+    MODEL_UPLOAD_PARALLEL_RANGES range requests at once.
+    """
+    starts = iter(range(0, transfer.size, MODEL_UPLOAD_CHUNK_BYTES))
+    window = deque()
+
+    def fetch_next():
+        start = next(starts, None)
+        if start is not None:
+            last = min(start + MODEL_UPLOAD_CHUNK_BYTES, transfer.size) - 1
+            window.append(asyncio.create_task(_fetch_range(client, url, start, last, transfer)))
+
+    for _ in range(max(1, MODEL_UPLOAD_PARALLEL_RANGES)):
+        fetch_next()
+    try:
+        while window:
+            data = await window.popleft()
+            fetch_next()
+            yield data
+    finally:
+        for task in window:
+            if task.done() and not task.cancelled():
+                task.exception() # Failed ahead of its turn; the copy has failed anyway
+            task.cancel()
+
+async def streamed_chunks(client: httpx.AsyncClient, url: str, transfer: Transfer) -> AsyncIterator[bytes]:
+    """
+    The object in upload-sized chunks from one GET, for storage that doesn't
+    serve ranges. Reading runs ahead of the upload by up to
+    MODEL_UPLOAD_PARALLEL_RANGES chunks.
+    """
+    chunks: asyncio.Queue = asyncio.Queue(maxsize=max(1, MODEL_UPLOAD_PARALLEL_RANGES))
+
+    async def read():
+        buffer = bytearray()
+        async with client.stream("GET", url) as response:
+            response.raise_for_status()
+            async for data in response.aiter_bytes():
+                buffer += data
+                while len(buffer) >= MODEL_UPLOAD_CHUNK_BYTES:
+                    chunk = bytes(buffer[:MODEL_UPLOAD_CHUNK_BYTES])
+                    del buffer[:MODEL_UPLOAD_CHUNK_BYTES]
+                    transfer.hold(len(chunk))
+                    await chunks.put(chunk)
+        if buffer:
+            transfer.hold(len(buffer))
+            await chunks.put(bytes(buffer))
+        await chunks.put(None)
+
+    reader = asyncio.create_task(read())
+    try:
+        while True:
+            get = asyncio.create_task(chunks.get())
+            await asyncio.wait([get, reader], return_when=asyncio.FIRST_COMPLETED)
+            if not get.done() and reader.exception() is not None:
+                get.cancel()
+                raise reader.exception()
+            chunk = await get # Once the read is done its chunks are all queued
+            if chunk is None:
+                return
+            yield chunk
+    finally:
+        reader.cancel()
+
+# ==========================================
+# Upload side
+# ==========================================
+
+async def start_upload(client: httpx.AsyncClient, size: int, mime_type: str, display_name: str) -> str:
+    """
+    Opens a resumable upload session with the Files API; returns its upload URL.
+    """
+    response = await client.post(
+        f"{GENAI_BASE_URL}/upload/v1beta/files",
+        headers={
+            "X-Goog-Upload-Protocol": "resumable",
+            "X-Goog-Upload-Command": "start",
+            "X-Goog-Upload-Header-Content-Length": str(size),
+            "X-Goog-Upload-Header-Content-Type": mime_type,
+        },
+        json={"file": {"displayName": display_name, "mimeType": mime_type, "sizeBytes": str(size)}},
+    )
+    response.raise_for_status()
+    upload_url = response.headers.get("x-goog-upload-url")
+    if not upload_url:
+        raise ModelFileUploadError("Files API returned no upload URL")
+    return upload_url
+
+async def _received(client: httpx.AsyncClient, upload_url: str) -> int:
+    response = await client.post(upload_url, headers={"X-Goog-Upload-Command": "query"})
+    response.raise_for_status()
+    return int(response.headers.get("x-goog-upload-size-received", "0"))
+
+async def upload_chunk(client: httpx.AsyncClient, upload_url: str, offset: int, data: bytes, last: bool) -> httpx.Response:
+    """
+    Sends data at offset, finalizing the upload if it is the last chunk. After
+    a failure the session is asked how much it received and the rest of the
+    chunk is resent.
+    """
+    sent = 0 # Bytes of data the session has confirmed
+    for attempt in range(MODEL_UPLOAD_RETRIES + 1):
+        try:
+            response = await client.post(upload_url, content=data[sent:], headers={
+                "X-Goog-Upload-Command": "upload, finalize" if last else "upload",
+                "X-Goog-Upload-Offset": str(offset + sent),
+            })
+            response.raise_for_status()
+            status = response.headers.get("x-goog-upload-status")
+            if status != ("final" if last else "active"):
+                raise ModelFileUploadError(f"Upload status {status!r} after the chunk at {offset}")
+            return response
+        except Exception as e:
+            if attempt == MODEL_UPLOAD_RETRIES or not _retryable(e):
+                raise
+            MODEL_FILE_RETRIES.labels("upload").inc()
+            logger.warning(f"Upload of the chunk at {offset} failed ({e}); resuming")
+            await asyncio.sleep(RETRY_BACKOFF * 2 ** attempt)
+            received = await _received(client, upload_url)
+            if not offset <= received <= offset + len(data):
+                raise ModelFileUploadError(f"Session has {received} bytes; expected {offset} to {offset + len(data)}") from e
+            sent = received - offset
+
+async def wait_until_processed(client: httpx.AsyncClient, name: str) -> types.File:
+    """
+    Polls the file until the Files API has processed it (videos take a while).
+    """
+    deadline = time.monotonic() + MODEL_FILE_PROCESSING_TIMEOUT
+    while True:
+        response = await client.get(f"{GENAI_BASE_URL}/v1beta/{name}")
+        response.raise_for_status()
+        genai_file = types.File._from_response(response=response.json(), kwargs={})
+        if genai_file.state is None or genai_file.state.name != "PROCESSING":
+            return genai_file
+        if time.monotonic() > deadline:
+            raise ModelFileUploadError(f"{name} still processing after {MODEL_FILE_PROCESSING_TIMEOUT:.0f}s")
+        logger.info(f"Waiting for AI Studio video processing... {name}")
+        await asyncio.sleep(MODEL_FILE_POLL_SECONDS)
+
+# ==========================================
+# Copies
+# ==========================================
+
+async def _stream_copy(client: httpx.AsyncClient, url: str, mime_type: str, transfer: Transfer, ranges: bool) -> dict:
+    upload_url = await start_upload(client, transfer.size, mime_type, os.path.basename(url.split("?")[0]))
+    chunks = ranged_chunks(client, url, transfer) if ranges else streamed_chunks(client, url, transfer)
+    offset, response = 0, None
+    try:
+        async for data in chunks:
+            response = await upload_chunk(client, upload_url, offset, data, offset + len(data) >= transfer.size)
+            offset += len(data)
+            transfer.release(len(data))
+    finally:
+        await chunks.aclose()
+    if response is None or offset != transfer.size:
+        raise ModelFileUploadError(f"Sent {offset} of {transfer.size} bytes")
+    return response.json()["file"]
+
+async def _temp_file_copy(url: str, mime_type: str, transfer: Transfer) -> types.File:
+    from google import genai
+
+    http_options = {"base_url": GENAI_BASE_URL} if os.getenv("GENAI_BASE_URL") else None
+    client = genai.Client(api_key=_api_key(), http_options=http_options)
+    ext = ".pdf" if mime_type == "application/pdf" else ".mp4"
+    with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as tmp:
+        tmp_path = tmp.name
+    try:
+        logger.info(f"Downloading {url} to {tmp_path} for AI Studio upload")
+        async with httpx.AsyncClient(timeout=600.0) as http_client:
+            async with http_client.stream("GET", url) as response:
+                response.raise_for_status()
+                with open(tmp_path, "wb") as f:
+                    async for chunk in response.aiter_bytes():
+                        f.write(chunk)
+        transfer.size = os.path.getsize(tmp_path)
+        MODEL_FILE_BYTES.labels("download").inc(transfer.size)
+        logger.info(f"Uploading local file {tmp_path} to AI Studio GenAI File Storage")
+        genai_file = await asyncio.to_thread(client.files.upload, file=tmp_path, config={'mime_type': mime_type})
+        MODEL_FILE_BYTES.labels("upload").inc(transfer.size)
+        while genai_file.state.name == "PROCESSING":
+            logger.info(f"Waiting for AI Studio video processing... {genai_file.name}")
+            await asyncio.sleep(MODEL_FILE_POLL_SECONDS)
+            genai_file = await asyncio.to_thread(client.files.get, name=genai_file.name)
+        return genai_file
+    finally:
+        os.remove(tmp_path)
+
+def _client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(120.0, connect=10.0),
+        limits=httpx.Limits(max_connections=max(1, MODEL_UPLOAD_PARALLEL_RANGES) + 2),
+        headers={"x-goog-api-key": _api_key() or ""},
+    )
+
+async def _copy(client: httpx.AsyncClient, url: str, mime_type: str, source: SourceObject) -> types.File:
+    size = source.size if MODEL_UPLOAD_MODE == "stream" else None
+    transfer = Transfer("tempfile" if size is None else "ranged" if source.ranges else "streamed", size or 0)
+    try:
+        if size is None:
+            genai_file = await _temp_file_copy(url, mime_type, transfer)
+        else:
+            logger.info(f"Streaming {url} ({size} bytes, {transfer.mode}) to AI Studio GenAI File Storage")
+            uploaded = types.File._from_response(response=await _stream_copy(client, url, mime_type, transfer, source.ranges), kwargs={})
+            genai_file = await wait_until_processed(client, uploaded.name)
+    except (Exception, asyncio.CancelledError):
+        transfer.drop()
+        MODEL_FILE_UPLOADS.labels(transfer.mode, "failed").inc()
+        raise
+    if genai_file.state.name == "FAILED":
+        MODEL_FILE_UPLOADS.labels(transfer.mode, "processing_failed").inc()
+        raise ValueError(f"AI Studio File processing failed for {genai_file.name}")
+    stats = transfer.as_dict()
+    MODEL_FILE_UPLOADS.labels(transfer.mode, "ok").inc()
+    if stats["mb_per_second"] is not None:
+        MODEL_FILE_THROUGHPUT.labels(transfer.mode).observe(stats["mb_per_second"])
+    logger.info(f"Uploaded to AI Studio successfully: {genai_file.uri} ({stats['bytes']} bytes in {stats['seconds']}s, "
+                f"{stats['mb_per_second']} MB/s, {transfer.mode}, peak buffer {stats['peak_buffered_bytes']} bytes)")
+    return genai_file
+
+async def upload_to_model_files(url: str, mime_type: str) -> types.File:
+    """
+    Copies the object at url into the Gemini Files API and returns the
+    processed file; raises if the copy or processing fails.
+    """
+    async with _client() as client:
+        return await _copy(client, url, mime_type, await probe_source(client, url))
+
+# ==========================================
+# Cache
+# ==========================================
+
+def source_key(url: str, source: SourceObject) -> Optional[str]:
+    """
+    Identifies this version of the stored object; None if storage gives no
+    version, as a changed object couldn't then be told apart.
+    """
+    return f"{url.split('?')[0]}#{source.version}" if source.version else None
+
+def expires_at(genai_file: types.File) -> datetime:
+    if genai_file.expiration_time:
+        return genai_file.expiration_time.astimezone(timezone.utc).replace(tzinfo=None)
+    return datetime.utcnow() + timedelta(seconds=MODEL_FILE_TTL_SECONDS)
+
+def _cached(resource_id: int, key: str) -> Optional[ModelFile]:
+    with Session(engine) as session:
+        return session.exec(
+            select(ModelFile)
+            .where(ModelFile.resource_id == resource_id, ModelFile.source_key == key)
+            .order_by(ModelFile.expires_at.desc())
+        ).first()
+
+def _store(resource_id: int, key: str, mime_type: str, genai_file: types.File):
+    """
+    Records the copy. The resource's expired copies are dropped; older live
+    ones are kept until they expire, as calls in flight may still use them.
+    """
+    with Session(engine) as session:
+        session.exec(delete(ModelFile).where(ModelFile.resource_id == resource_id, ModelFile.expires_at < datetime.utcnow()))
+        session.add(ModelFile(resource_id=resource_id, source_key=key, name=genai_file.name, uri=genai_file.uri,
+                              mime_type=mime_type, expires_at=expires_at(genai_file)))
+        session.commit()
+
+async def _remote_file(client: httpx.AsyncClient, name: str) -> Optional[types.File]:
+    """
+    The file, if the Files API still has it ready; it answers 403 for files it no longer has.
+    """
+    response = await client.get(f"{GENAI_BASE_URL}/v1beta/{name}")
+    if response.status_code in (403, 404):
+        return None
+    response.raise_for_status()
+    genai_file = types.File._from_response(response=response.json(), kwargs={})
+    return genai_file if genai_file.state is not None and genai_file.state.name == "ACTIVE" else None
+
+async def _model_file(client: httpx.AsyncClient, resource_id: int, url: str, mime_type: str, refresh: bool = False) -> types.File:
+    source = await probe_source(client, url)
+    key = source_key(url, source) if MODEL_FILE_CACHE_ENABLED else None
+    if key is None:
+        MODEL_FILE_CACHE.labels("uncacheable").inc()
+        return await _copy(client, url, mime_type, source)
+    # Sync database calls, so they run in a thread like the SDK's
+    entry = None if refresh else await asyncio.to_thread(_cached, resource_id, key)
+    if entry is None:
+        if not refresh:
+            MODEL_FILE_CACHE.labels("miss").inc()
+    elif (entry.expires_at - datetime.utcnow()).total_seconds() <= MODEL_FILE_REFRESH_MARGIN_SECONDS:
+        MODEL_FILE_CACHE.labels("stale").inc()
+    else:
+        genai_file = await _remote_file(client, entry.name)
+        if genai_file is not None:
+            MODEL_FILE_CACHE.labels("hit").inc()
+            logger.info(f"Reusing {entry.name} for resource {resource_id} (expires {entry.expires_at:%Y-%m-%d %H:%M} UTC)")
+            return genai_file
+        MODEL_FILE_CACHE.labels("gone").inc()
+    genai_file = await _copy(client, url, mime_type, source)
+    await asyncio.to_thread(_store, resource_id, key, mime_type, genai_file)
+    return genai_file
+
+class ModelFileLease:
+    """
+    A resource's model file for the length of an analysis. While it is held,
+    the copy is uploaded again MODEL_FILE_REFRESH_MARGIN_SECONDS before it
+    expires and part's URI updated, so calls still queued get a live copy.
+    """
+    def __init__(self, resource_id: int, url: str, mime_type: str, genai_file: types.File):
+        self.resource_id = resource_id
+        self.url = url
+        self.file = genai_file
+        self.part = {"kind": "file", "file": {"mime_type": mime_type, "uri": genai_file.uri}}
+        self._refresher = asyncio.create_task(self._keep_fresh())
+
+    async def _keep_fresh(self):
+        while True:
+            left = (expires_at(self.file) - datetime.utcnow()).total_seconds()
+            await asyncio.sleep(max(0.0, left - MODEL_FILE_REFRESH_MARGIN_SECONDS))
+            try:
+                async with _client() as client:
+                    self.file = await _model_file(client, self.resource_id, self.url, self.part["file"]["mime_type"], refresh=True)
+            except Exception as e:
+                logger.warning(f"Refreshing the model file of resource {self.resource_id} failed ({e}); retrying")
+                await asyncio.sleep(60)
+                continue
+            self.part["file"]["uri"] = self.file.uri
+            MODEL_FILE_CACHE.labels("refreshed").inc()
+
+    def release(self):
+        self._refresher.cancel()
+
+async def lease_model_file(resource_id: int, url: str, mime_type: str) -> ModelFileLease:
+    """
+    The resource's copy of the object at url in the Gemini Files API,
+    uploaded only if it has no usable one; release() the lease when done.
+    """
+    async with _client() as client:
+        genai_file = await _model_file(client, resource_id, url, mime_type)
+    return ModelFileLease(resource_id, url, mime_type, genai_file)
+
+def resource_model_files(session: Session, resource_ids: List[int]) -> List[str]:
+    """
+    Names of the resources' copies, collected before the resources are
+    deleted (the rows go with them by ON DELETE CASCADE).
+    """
+    if not resource_ids:
+        return []
+    return list(session.exec(select(ModelFile.name).where(ModelFile.resource_id.in_(resource_ids))).all())
+
+def class_model_files(session: Session, class_id: int) -> List[str]:
+    return list(session.exec(
+        select(ModelFile.name)
+        .join(Resource, ModelFile.resource_id == Resource.id)
+        .where(Resource.class_id == class_id)
+    ).all())
+
+async def delete_model_files(names: List[str]):
+    """
+    Deletes copies from the Files API, e.g. a deleted resource's. Best effort:
+    they expire anyway.
+    """
+    async with _client() as client:
+        for name in names:
+            try:
+                response = await client.delete(f"{GENAI_BASE_URL}/v1beta/{name}")
+                if response.status_code not in (403, 404):
+                    response.raise_for_status()
+                MODEL_FILE_CACHE.labels("deleted").inc()
+            except httpx.HTTPError as e:
+                logger.warning(f"Deleting model file {name} failed: {e}")
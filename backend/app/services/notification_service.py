@@ -0,0 +1,219 @@
+import os
+import json
+import asyncio
+import logging
+from typing import Dict, Iterable, Optional, Set
+from sqlalchemy import event, select, text
+from sqlalchemy.orm import Session as SASession
+
+from ..database import engine
+from ..models import Assignment, Class, Question, Resource
+from ..metrics import NOTIFICATIONS_SENT, NOTIFICATIONS_DROPPED, NOTIFICATION_CONNECTIONS
+
+logger = logging.getLogger(__name__)
+
+# Events are addressed to user ids. With Postgres every worker LISTENs on one
+# channel and each NOTIFY reaches whichever worker holds the user's
+# connections; other databases (tests) deliver within the process.
+NOTIFY_CHANNEL = os.getenv("NOTIFY_CHANNEL", "lms_notifications")
+NOTIFY_QUEUE_SIZE = int(os.getenv("NOTIFY_QUEUE_SIZE", "100"))
+NOTIFY_RECONNECT_SECONDS = 5.0
+PG_NOTIFY_MAX_BYTES = 7900 # Postgres rejects payloads of 8000 bytes or more
+
+USE_PG_NOTIFY = engine.dialect.name == "postgresql"
+
+class Subscription:
+    """
+    One open WebSocket/SSE connection. Its queue is bounded: when a slow
+    client falls behind, the oldest events are dropped and the next event it
+    reads is "overflow", telling it to refetch instead of trusting the stream.
+    """
+    def __init__(self, user_id: int, types: Optional[Set[str]] = None):
+        self.user_id = user_id
+        self.types = types
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=NOTIFY_QUEUE_SIZE)
+        self.dropped = 0
+
+    def offer(self, message: dict):
+        if self.types and message["type"] not in self.types:
+            return
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+            NOTIFICATIONS_DROPPED.inc()
+        self.queue.put_nowait(message)
+
+    async def next(self) -> dict:
+        if self.dropped:
+            dropped, self.dropped = self.dropped, 0
+            return {"type": "overflow", "data": {"dropped": dropped}}
+        return await self.queue.get()
+
+class NotificationHub:
+    """
+    Per-worker registry of subscriptions, fed by the LISTEN connection.
+    """
+    def __init__(self):
+        self.subscriptions: Dict[int, Set[Subscription]] = {}
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._listen_conn = None
+        self._reconnect: Optional[asyncio.TimerHandle] = None
+
+    def subscribe(self, user_id: int, types: Optional[Set[str]] = None) -> Subscription:
+        subscription = Subscription(user_id, types)
+        self.subscriptions.setdefault(user_id, set()).add(subscription)
+        NOTIFICATION_CONNECTIONS.inc()
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        subs = self.subscriptions.get(subscription.user_id)
+        if subs and subscription in subs:
+            subs.discard(subscription)
+            NOTIFICATION_CONNECTIONS.dec()
+            if not subs:
+                del self.subscriptions[subscription.user_id]
+
+    def dispatch(self, user_ids: Iterable[int], message: dict):
+        for user_id in user_ids:
+            for subscription in self.subscriptions.get(user_id, ()):
+                subscription.offer(message)
+                NOTIFICATIONS_SENT.labels(message["type"]).inc()
+
+    # ------------------------------------------
+    # Postgres LISTEN
+    # ------------------------------------------
+
+    async def start(self):
+        self.loop = asyncio.get_running_loop()
+        if USE_PG_NOTIFY:
+            self._listen()
+
+    async def stop(self):
+        if self._reconnect:
+            self._reconnect.cancel()
+        self._close_listener()
+
+    def _listen(self):
+        self._reconnect = None
+        try:
+            # A dedicated connection outside the pool; it sits in LISTEN for the worker's lifetime
+            conn = engine.raw_connection()
+            conn.detach()
+            dbapi_conn = conn.dbapi_connection
+            dbapi_conn.autocommit = True
+            with dbapi_conn.cursor() as cursor:
+                cursor.execute(f'LISTEN "{NOTIFY_CHANNEL}"')
+        except Exception as e:
+            logger.error(f"Notification listener could not connect: {e}")
+            self._schedule_reconnect()
+            return
+        self._listen_conn = dbapi_conn
+        self.loop.add_reader(dbapi_conn.fileno(), self._on_readable)
+        logger.info(f"Listening for notifications on channel {NOTIFY_CHANNEL}")
+
+    def _on_readable(self):
+        conn = self._listen_conn
+        try:
+            conn.poll()
+        except Exception as e:
+            logger.error(f"Notification listener lost its connection: {e}")
+            self._close_listener()
+            self._schedule_reconnect()
+            return
+        while conn.notifies:
+            notify = conn.notifies.pop(0)
+            try:
+                payload = json.loads(notify.payload)
+            except json.JSONDecodeError:
+                logger.warning(f"Ignoring malformed notification payload: {notify.payload[:200]}")
+                continue
+            self.dispatch(payload["users"], {"type": payload["type"], "data": payload["data"]})
+
+    def _close_listener(self):
+        conn, self._listen_conn = self._listen_conn, None
+        if conn is None:
+            return
+        try:
+            self.loop.remove_reader(conn.fileno())
+        except Exception:
+            pass
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _schedule_reconnect(self):
+        if self.loop is not None and self._reconnect is None:
+            self._reconnect = self.loop.call_later(NOTIFY_RECONNECT_SECONDS, self._listen)
+
+hub = NotificationHub()
+
+# ==========================================
+# Publishing
+# ==========================================
+
+def notify(session: SASession, user_ids: Iterable[int], type: str, data: dict):
+    """
+    Queues an event for the given users, sent when the session's transaction
+    commits and dropped if it rolls back. Keep data to ids and small values;
+    clients refetch the details.
+    """
+    users = sorted({u for u in user_ids if u is not None})
+    if users:
+        session.info.setdefault("pending_notifications", []).append({"users": users, "type": type, "data": data})
+
+def class_teacher_id(session: SASession, class_id: int) -> Optional[int]:
+    cls = session.get(Class, class_id)
+    return cls.teacher_id if cls else None
+
+def question_teacher_id(session: SASession, question_id: int) -> Optional[int]:
+    return session.execute(
+        select(Class.teacher_id)
+        .join(Assignment, Assignment.class_id == Class.id)
+        .join(Question, Question.assignment_id == Assignment.id)
+        .where(Question.id == question_id)
+    ).scalar()
+
+def publish_to_resource_teacher(resource_id: int, type: str, data: dict):
+    """
+    For background work with no session of its own, e.g. resource analysis.
+    """
+    try:
+        with SASession(engine) as session:
+            resource = session.get(Resource, resource_id)
+            if resource is None:
+                return
+            notify(session, [class_teacher_id(session, resource.class_id)], type, {"resource_id": resource_id, **data})
+            session.commit()
+    except Exception as e:
+        logger.error(f"Failed to publish {type} for resource {resource_id}: {e}")
+
+def _payload(notification: dict) -> str:
+    payload = json.dumps(notification, default=str)
+    if len(payload.encode()) > PG_NOTIFY_MAX_BYTES:
+        logger.warning(f"Notification {notification['type']} too large for NOTIFY; sending it without data")
+        payload = json.dumps({**notification, "data": {"truncated": True}})
+    return payload
+
+@event.listens_for(SASession, "before_commit")
+def _send_pending_notifications(session):
+    # NOTIFY inside the transaction is delivered by Postgres only if it commits
+    if not USE_PG_NOTIFY:
+        return
+    for notification in session.info.pop("pending_notifications", []):
+        session.execute(text("SELECT pg_notify(:channel, :payload)"),
+                        {"channel": NOTIFY_CHANNEL, "payload": _payload(notification)})
+
+@event.listens_for(SASession, "after_commit")
+def _deliver_local_notifications(session):
+    pending = session.info.pop("pending_notifications", [])
+    if not pending or hub.loop is None:
+        return
+    for notification in pending:
+        message = {"type": notification["type"], "data": notification["data"]}
+        # Commits can happen on threadpool threads; queues belong to the loop
+        hub.loop.call_soon_threadsafe(hub.dispatch, notification["users"], message)
+
+@event.listens_for(SASession, "after_rollback")
+def _discard_pending_notifications(session):
+    session.info.pop("pending_notifications", None)
@@ -0,0 +1,240 @@
+import io
+import os
+import time
+import base64
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+import httpx
+from pypdf import PdfReader, PdfWriter
+from sqlmodel import Session
+
+from ..database import engine
+from ..models import Resource
+from .agent_service import analyse_part
+from .analysis_merge import merge_analyses, namespace_ids
+
+logger = logging.getLogger(__name__)
+
+# PDFs are read locally, page by page, and analysed in ranges of
+# PDF_CHUNK_PAGES pages, one agent call each; 0 sends the whole file in one call
+PDF_CHUNK_PAGES = int(os.getenv("PDF_CHUNK_PAGES", "20"))
+PDF_CHUNK_CONCURRENCY = int(os.getenv("PDF_CHUNK_CONCURRENCY", "4")) # Page-range calls in flight per document
+PDF_CHUNK_RETRIES = int(os.getenv("PDF_CHUNK_RETRIES", "2"))
+# Pages with more painted vector paths than this are diagrams and are sent as
+# pages, not just their text
+PDF_VECTOR_PATHS = int(os.getenv("PDF_VECTOR_PATHS", "50"))
+# What the model charges for a PDF page sent as a document (Gemini 3 at its
+# default media resolution; 258 on Gemini 2). Its embedded text comes free.
+PDF_PAGE_TOKENS = int(os.getenv("PDF_PAGE_TOKENS", "560"))
+PAINT_OPERATORS = {b"S", b"s", b"f", b"F", b"f*", b"B", b"B*", b"b", b"b*"}
+
+@dataclass
+class PdfPage:
+    number: int
+    text: str
+    visual: bool # Has images or diagrams, so the model needs to see the page
+
+    @property
+    def attached(self) -> bool:
+        """
+        Sent as a page rather than as text: the model needs to see it, or its
+        text would cost more than the page.
+        """
+        return self.visual or len(self.text) // 4 >= PDF_PAGE_TOKENS
+
+@dataclass
+class PdfChunk:
+    pages: List[PdfPage]
+    parts: list = field(default_factory=list)
+    tokens: int = 0 # Estimated prompt tokens for the parts
+
+    @property
+    def numbers(self) -> List[int]:
+        return [p.number for p in self.pages]
+
+    @property
+    def attached_numbers(self) -> List[int]:
+        return [p.number for p in self.pages if p.attached]
+
+# ==========================================
+# Extraction
+# ==========================================
+
+def _has_images(resources, depth: int = 0) -> bool:
+    xobjects = (resources or {}).get("/XObject") or {}
+    for ref in xobjects.values():
+        xobject = ref.get_object()
+        if xobject.get("/Subtype") == "/Image":
+            return True
+        # Images are often wrapped in form XObjects
+        if xobject.get("/Subtype") == "/Form" and depth < 3 and _has_images(xobject.get("/Resources"), depth + 1):
+            return True
+    return False
+
+def _is_visual(page) -> bool:
+    if _has_images(page.get("/Resources")):
+        return True
+    contents = page.get_contents()
+    if contents is None:
+        return False
+    paths = 0
+    for _, operator in contents.operations:
+        if operator == b"INLINE IMAGE":
+            return True
+        if operator in PAINT_OPERATORS:
+            paths += 1
+            if paths > PDF_VECTOR_PATHS:
+                return True
+    return False
+
+def extract_pages(reader: PdfReader) -> List[PdfPage]:
+    """
+    Text of every page, and whether the page has images or diagrams. CPU
+    only; run it off the event loop.
+    """
+    pages = []
+    for number, page in enumerate(reader.pages, start=1):
+        try:
+            text = (page.extract_text() or "").strip()
+            visual = _is_visual(page)
+        except Exception as e:
+            # A page pypdf can't read is left for the model to look at
+            logger.warning(f"Could not read page {number}: {e}")
+            text, visual = "", True
+        pages.append(PdfPage(number, text, visual))
+    return pages
+
+def page_content(pages: List[PdfPage]) -> str:
+    """
+    Resource.content for a PDF: its text with page markers.
+    """
+    return "\n\n".join(f"[Page {p.number}]\n{p.text}" for p in pages if p.text)
+
+# ==========================================
+# Page-range requests
+# ==========================================
+
+def _chunk_parts(reader: PdfReader, chunk: PdfChunk) -> PdfChunk:
+    """
+    Attached pages go as a PDF of just those pages; the rest, text-only pages
+    whose text is cheaper than the page, go in the message as text.
+    """
+    first, last = chunk.numbers[0], chunk.numbers[-1]
+    attached = chunk.attached_numbers
+    lines = [f'<Pages first="{first}" last="{last}">']
+    if attached:
+        lines.append(f"The attached PDF holds pages {', '.join(map(str, attached))} of the document, in that order.")
+    lines += [
+        f'<Page number="{p.number}" attached="true"/>' if p.attached else f'<Page number="{p.number}">\n{p.text}\n</Page>'
+        for p in chunk.pages
+    ]
+    lines += ["</Pages>", "Analyze these pages of the resource thoroughly."]
+    text = "\n".join(lines)
+    chunk.tokens = len(text) // 4 + PDF_PAGE_TOKENS * len(attached)
+
+    if attached:
+        writer = PdfWriter()
+        for number in attached:
+            writer.add_page(reader.pages[number - 1])
+        buffer = io.BytesIO()
+        writer.write(buffer)
+        chunk.parts.append({
+            "kind": "file",
+            "file": {
+                "mime_type": "application/pdf",
+                "name": f"pages-{first}-{last}.pdf",
+                "bytes": base64.b64encode(buffer.getvalue()).decode()
+            }
+        })
+    chunk.parts.append({"kind": "text", "text": text})
+    return chunk
+
+def prepare_chunks(data: bytes, size: int = PDF_CHUNK_PAGES) -> Tuple[List[PdfPage], List[PdfChunk]]:
+    """
+    Reads the PDF and builds the page-range requests. Blank pages are left
+    out. CPU only; run it off the event loop.
+    """
+    reader = PdfReader(io.BytesIO(data))
+    pages = extract_pages(reader)
+    chunks = []
+    for start in range(0, len(pages), size):
+        kept = [p for p in pages[start:start + size] if p.text or p.visual]
+        if kept:
+            chunks.append(_chunk_parts(reader, PdfChunk(kept)))
+    return pages, chunks
+
+def _document_page(page_number, chunk: PdfChunk) -> Optional[int]:
+    try:
+        page_number = int(page_number)
+    except (TypeError, ValueError):
+        return None
+    if page_number in chunk.numbers:
+        return page_number
+    # Counted within the attached PDF rather than the document
+    attached = chunk.attached_numbers
+    if 1 <= page_number <= len(attached):
+        return attached[page_number - 1]
+    return None
+
+def map_chunk(data: dict, index: int, chunk: PdfChunk) -> dict:
+    """
+    Namespaces a chunk's client ids and makes its page numbers document pages.
+    """
+    data = namespace_ids(data, f"p{index}")
+    for kc in data["key_concepts"]:
+        kc["page_number"] = _document_page(kc.get("page_number"), chunk)
+    return data
+
+def store_page_text(resource_id: int, pages: List[PdfPage]):
+    with Session(engine) as session:
+        resource = session.get(Resource, resource_id)
+        if resource:
+            resource.content = page_content(pages)
+            session.add(resource)
+            session.commit()
+
+async def analyse_pdf_in_chunks(resource_id: int, url: str) -> Optional[Tuple[Optional[dict], int]]:
+    """
+    Extracts the PDF's text into Resource.content, then analyses it in page
+    ranges, PDF_CHUNK_CONCURRENCY at a time. Returns (merged analysis, number
+    of ranges that failed), the analysis being None only if all failed; or
+    None if the PDF couldn't be read locally, so the caller can send it whole.
+    """
+    started = time.monotonic()
+    try:
+        async with httpx.AsyncClient(timeout=600.0) as client:
+            resp = await client.get(url)
+            resp.raise_for_status()
+        pages, chunks = await asyncio.to_thread(prepare_chunks, resp.content)
+    except Exception as e:
+        logger.warning(f"Could not read PDF of resource {resource_id} locally, analysing it whole: {e}")
+        return None
+    store_page_text(resource_id, pages)
+    attached = sum(p.attached for p in pages)
+    tokens = sum(c.tokens for c in chunks)
+    logger.info(f"Read {len(pages)} pages of resource {resource_id} in {time.monotonic() - started:.1f}s; "
+                f"{attached} sent as pages, the rest as text: ~{tokens} prompt tokens against "
+                f"~{PDF_PAGE_TOKENS * len(pages)} for the whole document")
+
+    slots = asyncio.Semaphore(PDF_CHUNK_CONCURRENCY)
+    async with httpx.AsyncClient() as client:
+        results = await asyncio.gather(*(
+            analyse_part(
+                client, slots, chunk.parts,
+                f"ctx_{resource_id}_pages{index}", f"resource_{resource_id}_pages{index}",
+                "analyse_pdf_pages", PDF_CHUNK_RETRIES,
+            )
+            for index, chunk in enumerate(chunks)
+        ))
+    analyses = [map_chunk(result, index, chunk) for index, (chunk, result) in enumerate(zip(chunks, results)) if result is not None]
+    failed = len(chunks) - len(analyses)
+    logger.info(f"Analysed resource {resource_id} ({len(pages)} pages) in {len(chunks)} page ranges: "
+                f"{len(analyses)} ok, {failed} failed, {time.monotonic() - started:.1f}s")
+    if not analyses:
+        return None, failed
+    merged = merge_analyses(analyses)
+    merged["key_concepts"].sort(key=lambda c: c["page_number"] or 0)
+    return merged, failed
@@ -0,0 +1,184 @@
+import csv
+import io
+import json
+import os
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from typing import List, Dict, Any, Optional
+from sqlmodel import Session, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from ..models import User, UserRole, Class, ClassEnrollment
+from ..auth import pwd_context, BCRYPT_ROUNDS
+
+logger = logging.getLogger(__name__)
+
+# Imported passwords are hashed at BCRYPT_ROUNDS like any other. A lower cost
+# makes large imports faster but leaves weak hashes on accounts until their
+# first login, so it has to be asked for with BULK_BCRYPT_ROUNDS (or --rounds).
+BULK_BCRYPT_ROUNDS = int(os.getenv("BULK_BCRYPT_ROUNDS", str(BCRYPT_ROUNDS)))
+# Imports hash on a process pool of their own, one worker per core by
+# default, started for the import and shut down after it. At cost 12 a hash
+# takes about 0.35s of a core, so 10,000 users need about 58 cores to finish
+# in a minute (15 at cost 10)
+BULK_HASH_WORKERS = int(os.getenv("BULK_HASH_WORKERS", str(os.cpu_count() or 1)))
+BULK_HASH_CHUNK = 16
+INSERT_BATCH_SIZE = 1000
+
+def _text(value) -> str:
+    """
+    A CSV or JSON cell as stripped text; JSON may give numbers.
+    """
+    return "" if value is None else str(value).strip()
+
+def parse_rows(content: str, fmt: str) -> List[Dict[str, Any]]:
+    """
+    Parses an uploaded CSV (with a header row) or JSON list into dicts.
+    """
+    if fmt == "json":
+        data = json.loads(content)
+        if isinstance(data, dict):
+            # Accept {"users": [...]} / {"enrollments": [...]} as well as a bare list
+            data = next((v for v in data.values() if isinstance(v, list)), [])
+        return [dict(r) for r in data]
+    reader = csv.DictReader(io.StringIO(content))
+    return [{k.strip(): (v.strip() if isinstance(v, str) else v) for k, v in r.items() if k} for r in reader]
+
+def _hash_chunk(passwords: List[str], rounds: int) -> List[str]:
+    hasher = pwd_context.handler("bcrypt").using(rounds=rounds)
+    return [hasher.hash(p) for p in passwords]
+
+def hash_passwords(passwords: List[str], rounds: int = BULK_BCRYPT_ROUNDS, workers: int = BULK_HASH_WORKERS) -> List[str]:
+    """
+    Hashes passwords in chunks on a process pool of `workers`, preserving
+    order. Blocks, so callers in the app run it in a worker thread.
+    """
+    if rounds < BCRYPT_ROUNDS:
+        logger.warning(f"Hashing {len(passwords)} imported passwords at cost {rounds}, below BCRYPT_ROUNDS ({BCRYPT_ROUNDS}); "
+                       "they are raised on each user's first login")
+    chunks = [passwords[i:i + BULK_HASH_CHUNK] for i in range(0, len(passwords), BULK_HASH_CHUNK)]
+    if len(chunks) <= 1 or workers <= 1:
+        return [h for chunk in chunks for h in _hash_chunk(chunk, rounds)]
+    # spawn: the app's threads (and their locks) aren't forked into the workers
+    with ProcessPoolExecutor(max_workers=min(workers, len(chunks)), mp_context=multiprocessing.get_context("spawn")) as executor:
+        return [h for chunk in executor.map(_hash_chunk, chunks, repeat(rounds)) for h in chunk]
+
+def provision_users(session: Session, rows: List[Dict[str, Any]], rounds: int = BULK_BCRYPT_ROUNDS) -> List[Dict[str, Any]]:
+    """
+    Creates users from rows of {username, password, role?}. Existing usernames
+    are left untouched. Returns one report entry per input row, in order.
+    """
+    report: List[Optional[Dict[str, Any]]] = [None] * len(rows)
+    valid = [] # (row_index, username, password, role)
+    seen = set()
+    for i, row in enumerate(rows):
+        username = _text(row.get("username"))
+        password = _text(row.get("password") or row.get("password_hash"))
+        if not username or not password:
+            report[i] = {"row": i, "username": username, "status": "error", "detail": "username and password are required"}
+            continue
+        try:
+            role = UserRole((_text(row.get("role")) or UserRole.STUDENT.value).lower())
+        except ValueError:
+            report[i] = {"row": i, "username": username, "status": "error", "detail": f"Unknown role {row.get('role')!r}"}
+            continue
+        if username in seen:
+            report[i] = {"row": i, "username": username, "status": "error", "detail": "Duplicate username in upload"}
+            continue
+        seen.add(username)
+        valid.append((i, username, password, role))
+
+    hashes = hash_passwords([v[2] for v in valid], rounds=rounds)
+
+    created = {}
+    for start in range(0, len(valid), INSERT_BATCH_SIZE):
+        batch = valid[start:start + INSERT_BATCH_SIZE]
+        values = [
+            {"username": username, "role": role, "password_hash": hashes[start + j]}
+            for j, (_, username, _, role) in enumerate(batch)
+        ]
+        stmt = (
+            pg_insert(User)
+            .values(values)
+            .on_conflict_do_nothing(index_elements=["username"])
+            .returning(User.id, User.username)
+        )
+        created.update({username: user_id for user_id, username in session.exec(stmt).all()})
+    session.commit()
+
+    existing = {}
+    missing = [v[1] for v in valid if v[1] not in created]
+    if missing:
+        existing = dict(session.exec(select(User.username, User.id).where(User.username.in_(missing))).all())
+
+    for i, username, _, role in valid:
+        if username in created:
+            report[i] = {"row": i, "username": username, "status": "created", "id": created[username], "role": role.value}
+        else:
+            report[i] = {"row": i, "username": username, "status": "exists", "id": existing.get(username)}
+
+    logger.info(f"Bulk provisioning: {len(created)} created, {len(valid) - len(created)} existing, {len(rows) - len(valid)} rejected")
+    return report
+
+def enroll_students(session: Session, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Enrolls students from rows of {class_id, student_id} or {class_id, username}.
+    Returns one report entry per input row, in order.
+    """
+    report: List[Optional[Dict[str, Any]]] = [None] * len(rows)
+
+    usernames = {_text(r.get("username")) for r in rows if not r.get("student_id") and _text(r.get("username"))}
+    user_ids = dict(session.exec(select(User.username, User.id).where(User.username.in_(usernames))).all()) if usernames else {}
+    class_ids = {int(r["class_id"]) for r in rows if str(r.get("class_id") or "").strip().isdigit()}
+    known_classes = set(session.exec(select(Class.id).where(Class.id.in_(class_ids))).all()) if class_ids else set()
+
+    valid = [] # (row_index, class_id, student_id)
+    for i, row in enumerate(rows):
+        try:
+            class_id = int(row.get("class_id"))
+            student_id = int(row["student_id"]) if row.get("student_id") else user_ids.get(_text(row.get("username")))
+        except (TypeError, ValueError):
+            report[i] = {"row": i, "status": "error", "detail": "class_id and student_id must be integers"}
+            continue
+        if class_id not in known_classes:
+            report[i] = {"row": i, "class_id": class_id, "status": "error", "detail": "Class not found"}
+            continue
+        if student_id is None:
+            report[i] = {"row": i, "class_id": class_id, "username": row.get("username"), "status": "error", "detail": "Student not found"}
+            continue
+        valid.append((i, class_id, student_id))
+
+    roles = {}
+    student_ids = {v[2] for v in valid}
+    if student_ids:
+        roles = dict(session.exec(select(User.id, User.role).where(User.id.in_(student_ids))).all())
+    known_students = {user_id for user_id, role in roles.items() if role == UserRole.STUDENT}
+
+    inserted = set()
+    pending = [v for v in valid if v[2] in known_students]
+    for start in range(0, len(pending), INSERT_BATCH_SIZE):
+        batch = pending[start:start + INSERT_BATCH_SIZE]
+        values = list({(c, s): {"class_id": c, "student_id": s} for _, c, s in batch}.values())
+        stmt = (
+            pg_insert(ClassEnrollment)
+            .values(values)
+            .on_conflict_do_nothing(index_elements=["class_id", "student_id"])
+            .returning(ClassEnrollment.class_id, ClassEnrollment.student_id)
+        )
+        inserted.update(tuple(r) for r in session.exec(stmt).all())
+    session.commit()
+
+    for i, class_id, student_id in valid:
+        if student_id not in roles:
+            report[i] = {"row": i, "class_id": class_id, "student_id": student_id, "status": "error", "detail": "Student not found"}
+        elif student_id not in known_students:
+            report[i] = {"row": i, "class_id": class_id, "student_id": student_id, "status": "error", "detail": "User is not a student"}
+        elif (class_id, student_id) in inserted:
+            inserted.discard((class_id, student_id)) # Repeats later in the same upload report as existing
+            report[i] = {"row": i, "class_id": class_id, "student_id": student_id, "status": "enrolled"}
+        else:
+            report[i] = {"row": i, "class_id": class_id, "student_id": student_id, "status": "exists"}
+
+    return report
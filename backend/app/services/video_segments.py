@@ -0,0 +1,150 @@
+import os
+import time
+import json
+import shutil
+import asyncio
+import logging
+from typing import List, Optional, Tuple
+
+import httpx
+
+from .agent_service import analyse_part, parse_timestamp
+from .analysis_merge import merge_analyses, namespace_ids
+
+logger = logging.getLogger(__name__)
+
+# Videos longer than VIDEO_SEGMENT_SECONDS are analysed in overlapping
+# segments, one agent call each, instead of in one call; 0 turns this off
+VIDEO_SEGMENT_SECONDS = int(os.getenv("VIDEO_SEGMENT_SECONDS", "600"))
+VIDEO_SEGMENT_OVERLAP_SECONDS = int(os.getenv("VIDEO_SEGMENT_OVERLAP_SECONDS", "30")) # Covers concepts cut by a boundary
+VIDEO_SEGMENT_CONCURRENCY = int(os.getenv("VIDEO_SEGMENT_CONCURRENCY", "4")) # Segment calls in flight per video
+VIDEO_SEGMENT_RETRIES = int(os.getenv("VIDEO_SEGMENT_RETRIES", "2"))
+
+Segment = Tuple[int, int]
+
+def segment_tag(segment: Segment) -> str:
+    """
+    Names the segment for the agent; see agent_common/video_segments.py.
+    """
+    return f'<Segment start_seconds="{segment[0]}" end_seconds="{segment[1]}"/>'
+
+def plan_segments(duration: float, length: int = VIDEO_SEGMENT_SECONDS, overlap: int = VIDEO_SEGMENT_OVERLAP_SECONDS) -> List[Segment]:
+    """
+    Splits [0, duration] into the fewest segments of at most `length` seconds
+    that overlap their neighbours by `overlap`, all of about the same length
+    (no short tail segment).
+    """
+    duration = int(duration + 0.999)
+    if not length or duration <= length:
+        return [(0, duration)]
+    overlap = min(overlap, length // 2)
+    count = -(-(duration - overlap) // (length - overlap))
+    step = (duration - overlap) / count
+    return [(int(i * step), duration if i == count - 1 else int(i * step + step + overlap)) for i in range(count)]
+
+# ==========================================
+# Video duration
+# ==========================================
+
+def genai_file_duration(genai_file) -> Optional[float]:
+    """
+    Duration reported by the Gemini Files API once a video has been processed.
+    """
+    metadata = getattr(genai_file, "video_metadata", None) or {}
+    value = metadata.get("videoDuration") or metadata.get("video_duration")
+    if not value:
+        return None
+    try:
+        return float(str(value).rstrip("s"))
+    except ValueError:
+        return None
+
+async def probe_video_duration(url: str) -> Optional[float]:
+    """
+    Reads the duration from the video's headers with ffprobe, which fetches
+    only the ranges it needs. None when ffprobe isn't installed or fails.
+    """
+    if not shutil.which("ffprobe"):
+        return None
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            "ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "json", url,
+            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL,
+        )
+        stdout, _ = await asyncio.wait_for(proc.communicate(), 60)
+        return float(json.loads(stdout)["format"]["duration"])
+    except (asyncio.TimeoutError, OSError, ValueError, KeyError, TypeError) as e:
+        logger.warning(f"Could not probe duration of {url}: {e}")
+        return None
+
+# ==========================================
+# Stitching
+# ==========================================
+
+def offset_segment(data: dict, index: int, segment: Segment) -> dict:
+    """
+    Moves a segment's timestamps to video time and namespaces its client ids.
+    """
+    start, end = segment
+    stamps = [
+        parse_timestamp(kc[field])
+        for kc in data.get("key_concepts", [])
+        for field in ("timestamp_start", "timestamp_end")
+        if kc.get(field) is not None
+    ]
+    # Segments are asked for segment-relative times, so the start shift is
+    # always applied; stamps past the segment's length are clamped to its end
+    length = end - start
+    if stamps and max(stamps) > length:
+        logger.warning(f"Segment {index} ({start}-{end}s) returned timestamps up to {max(stamps):.0f}s, "
+                       f"past its {length}s length; clamping to the segment end")
+
+    def moved(ts):
+        return None if ts is None else min(parse_timestamp(ts) + start, end)
+
+    data = namespace_ids(data, f"s{index}")
+    for kc in data["key_concepts"]:
+        kc["timestamp_start"] = moved(kc.get("timestamp_start"))
+        kc["timestamp_end"] = moved(kc.get("timestamp_end"))
+    return data
+
+def merge_segment_results(results: List[Tuple[Segment, dict]]) -> dict:
+    """
+    Stitches per-segment analyses into one for the whole video, with concepts
+    in time order; see analysis_merge.merge_analyses.
+    """
+    ordered = sorted(results, key=lambda r: r[0])
+    merged = merge_analyses([offset_segment(data, index, segment) for index, (segment, data) in enumerate(ordered)])
+    merged["key_concepts"].sort(key=lambda c: c["timestamp_start"] or 0)
+    return merged
+
+# ==========================================
+# Segmented analysis
+# ==========================================
+
+async def analyse_video_in_segments(resource_id: int, file_part: dict, duration: float) -> Tuple[Optional[dict], int]:
+    """
+    Analyses the video segment by segment, VIDEO_SEGMENT_CONCURRENCY at a
+    time, and returns (merged analysis, number of segments that failed). The
+    analysis is None only if every segment failed.
+    """
+    segments = plan_segments(duration)
+    slots = asyncio.Semaphore(VIDEO_SEGMENT_CONCURRENCY)
+    started = time.monotonic()
+    async with httpx.AsyncClient() as client:
+        results = await asyncio.gather(*(
+            analyse_part(
+                client, slots,
+                [file_part, {"kind": "text", "text": f"{segment_tag(segment)}\nAnalyze this segment of the resource thoroughly."}],
+                f"ctx_{resource_id}_seg{index}", f"resource_{resource_id}_seg{index}",
+                "analyse_video_segment", VIDEO_SEGMENT_RETRIES,
+            )
+            for index, segment in enumerate(segments)
+        ))
+    done = [(segment, result) for segment, result in zip(segments, results) if result is not None]
+    failed = len(segments) - len(done)
+    logger.info(f"Analysed resource {resource_id} ({duration:.0f}s) in {len(segments)} segments: "
+                f"{len(done)} ok, {failed} failed, {time.monotonic() - started:.1f}s")
+    if not done:
+        return None, failed
+    return merge_segment_results(done), failed
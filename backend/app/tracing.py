@@ -0,0 +1,54 @@
+import functools
+import logging
+from opentelemetry import trace
+from opentelemetry.propagate import inject
+
+# The exporter and provider setup is shared with the agents and the MCP
+# server (agent_common, installed from requirements.txt)
+from agent_common.tracing import setup_tracing as setup_tracer_provider
+
+logger = logging.getLogger(__name__)
+
+# OTEL_TRACES_EXPORTER and the other switches are described in agent_common/tracing.py
+SERVICE_NAME = "lms-backend" # Unless OTEL_SERVICE_NAME is set
+
+tracer = trace.get_tracer("agentic_lms.backend")
+
+def setup_tracing(app, engine) -> bool:
+    """
+    Installs the tracer provider and instruments FastAPI, SQLAlchemy and httpx.
+    httpx instrumentation adds the W3C traceparent header to agent calls, so
+    the agents' spans join the request's trace.
+    """
+    if not setup_tracer_provider(SERVICE_NAME):
+        return False
+
+    from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
+    from opentelemetry.instrumentation.sqlalchemy import SQLAlchemyInstrumentor
+    from opentelemetry.instrumentation.httpx import HTTPXClientInstrumentor
+
+    FastAPIInstrumentor.instrument_app(app, excluded_urls="metrics")
+    SQLAlchemyInstrumentor().instrument(engine=engine)
+    HTTPXClientInstrumentor().instrument()
+    return True
+
+def trace_context_metadata() -> dict:
+    """
+    Current trace context as a dict, for the JSON-RPC params.metadata of A2A
+    calls. Empty when there is no active span.
+    """
+    carrier = {}
+    inject(carrier)
+    return carrier
+
+def traced(name: str):
+    """
+    Wraps an async function in a span of the given name.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            with tracer.start_as_current_span(name):
+                return await fn(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,4 @@
+"""
+Load and throughput benchmarks for the backend. Run modules from the backend
+directory, e.g. `python -m benchmarks.login`.
+"""
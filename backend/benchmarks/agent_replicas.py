@@ -0,0 +1,192 @@
+"""
+Runs grading calls through AgentEndpoint against local stub agent replicas,
+to show capacity scaling with replicas, ejection of a replica that dies, and
+context affinity:
+
+    python -m benchmarks.agent_replicas --replicas 1 2 4 --calls 400
+
+Each stub (agent_common.stub_agent) answers after --latency seconds with at
+most --stub-concurrency requests at once, so one replica serves about
+stub-concurrency / latency calls a second. Prints one JSON line per run.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import signal
+import asyncio
+import argparse
+import statistics
+import subprocess
+from collections import Counter
+
+import httpx
+
+from app.services.agent_resilience import AgentEndpoint
+from app.services.agent_registry import agent_registry
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def start_stubs(ports, args) -> dict:
+    procs = {}
+    for port in ports:
+        procs[port] = subprocess.Popen(
+            [sys.executable, "-m", "agent_common.stub_agent", "grading", "--port", str(port),
+             "--latency", f"fixed:{args.latency}", "--max-concurrency", str(args.stub_concurrency)],
+            cwd=REPO_ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+    for port in ports:
+        for _ in range(100):
+            try:
+                httpx.get(f"http://127.0.0.1:{port}/.well-known/agent-card.json", timeout=1).raise_for_status()
+                break
+            except httpx.HTTPError:
+                time.sleep(0.1)
+    return procs
+
+def stop_stubs(procs: dict):
+    for proc in procs.values():
+        if proc.poll() is None:
+            proc.send_signal(signal.SIGTERM)
+            proc.wait()
+
+def payload(context_id: str) -> dict:
+    text = ("<Topics>\n[]\n</Topics>\n\nPlease grade the following assignment submission.\n\n"
+            '<Submission>\n[{"question1": "Q?", "answer1": "A.", "question_id": 1}]\n</Submission>')
+    return {
+        "jsonrpc": "2.0",
+        "method": "message/send",
+        "params": {"message": {"role": "user", "parts": [{"kind": "text", "text": text}],
+                               "messageId": uuid.uuid4().hex, "contextId": context_id}},
+        "id": context_id,
+    }
+
+async def drive(endpoint: AgentEndpoint, contexts: list, concurrency: int, during=None) -> dict:
+    """
+    Sends one call per entry of contexts, `concurrency` at a time; `during`
+    runs alongside. Returns latencies, failures and the replica of each call.
+    """
+    queue = asyncio.Queue()
+    for context_id in contexts:
+        queue.put_nowait(context_id)
+    latencies, failed, served = [], 0, []
+
+    async def worker(client):
+        nonlocal failed
+        while not queue.empty():
+            context_id = queue.get_nowait()
+            started = time.perf_counter()
+            try:
+                resp = await endpoint.post(client, payload(context_id), "demo")
+                served.append((context_id, str(resp.request.url).rstrip("/")))
+                latencies.append(time.perf_counter() - started)
+            except Exception:
+                failed += 1
+
+    async def health():
+        while True:
+            await agent_registry.check_health()
+            await asyncio.sleep(0.5)
+
+    started = time.perf_counter()
+    async with httpx.AsyncClient(limits=httpx.Limits(max_connections=concurrency * 2)) as client:
+        side = [asyncio.create_task(health())] + ([asyncio.create_task(during())] if during else [])
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        for task in side:
+            task.cancel()
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "calls": len(contexts),
+        "failed": failed,
+        "seconds": round(elapsed, 2),
+        "calls_per_second": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000) if latencies else None,
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1] * 1000) if latencies else None,
+        "served": served,
+    }
+
+def by_replica(served) -> dict:
+    return dict(sorted(Counter(url.rsplit(":", 1)[1] for _, url in served).items()))
+
+async def scaling(args):
+    for count in args.replicas:
+        ports = [args.base_port + i for i in range(count)]
+        procs = start_stubs(ports, args)
+        try:
+            endpoint = AgentEndpoint(f"demo_scaling_{count}", [f"http://127.0.0.1:{p}" for p in ports], 30.0, 5.0)
+            result = await drive(endpoint, [f"grade_{i}" for i in range(args.calls)], args.concurrency)
+            served = result.pop("served")
+            agent_registry.pools.pop(endpoint.name)
+            print(json.dumps({"run": "scaling", "replicas": count, **result, "calls_by_port": by_replica(served)}))
+        finally:
+            stop_stubs(procs)
+
+async def failover(args):
+    ports = [args.base_port + i for i in range(3)]
+    procs = start_stubs(ports, args)
+    victim = ports[-1]
+    try:
+        endpoint = AgentEndpoint("demo_failover", [f"http://127.0.0.1:{p}" for p in ports], 30.0, 5.0)
+
+        async def kill_one():
+            await asyncio.sleep(args.kill_after)
+            procs[victim].kill()
+
+        result = await drive(endpoint, [f"grade_{i}" for i in range(args.calls * 2)], args.concurrency, kill_one)
+        served = result.pop("served")
+        agent_registry.pools.pop(endpoint.name)
+        pool = endpoint.replicas.as_dict()["replicas"]
+        print(json.dumps({"run": "failover", "replicas": 3, "killed_port": victim, "killed_after_seconds": args.kill_after,
+                          **result, "calls_by_port": by_replica(served),
+                          "victim": next(r for r in pool if r["url"].endswith(str(victim)))}))
+    finally:
+        stop_stubs(procs)
+
+async def affinity(args):
+    ports = [args.base_port + i for i in range(3)]
+    procs = start_stubs(ports, args)
+    try:
+        endpoint = AgentEndpoint("demo_affinity", [f"http://127.0.0.1:{p}" for p in ports], 30.0, 5.0, affinity=True)
+        contexts = [f"ctx_{i % 60}" for i in range(240)]
+        before = await drive(endpoint, contexts, args.concurrency)
+        home = {}
+        for context_id, url in before["served"]:
+            home.setdefault(context_id, set()).add(url)
+        # Take one replica away: only its contexts should move
+        victim = f"http://127.0.0.1:{ports[0]}"
+        endpoint.replicas.remove(victim)
+        after = await drive(endpoint, contexts, args.concurrency)
+        agent_registry.pools.pop(endpoint.name)
+        moved = {c for c, url in after["served"] if url not in home[c]}
+        print(json.dumps({
+            "run": "affinity", "replicas": 3, "contexts": 60, "calls": len(contexts),
+            "contexts_on_one_replica": sum(len(urls) == 1 for urls in home.values()),
+            "calls_by_port": by_replica(before["served"]),
+            "removed_port": ports[0],
+            "contexts_on_removed": sum(victim in urls for urls in home.values()),
+            "contexts_moved": len(moved),
+            "moved_only_from_removed": all(victim in home[c] for c in moved),
+        }))
+    finally:
+        stop_stubs(procs)
+
+def main():
+    parser = argparse.ArgumentParser(description="Agent replica balancing demo on stub agents")
+    parser.add_argument("--run", choices=["scaling", "failover", "affinity", "all"], default="all")
+    parser.add_argument("--replicas", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--calls", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=64, help="Calls in flight from the backend")
+    parser.add_argument("--latency", type=float, default=0.25, help="Stub reply time, seconds")
+    parser.add_argument("--stub-concurrency", type=int, default=4, help="Requests each stub serves at once")
+    parser.add_argument("--kill-after", type=float, default=1.0, help="Failover run: seconds before a replica is killed")
+    parser.add_argument("--base-port", type=int, default=10201)
+    args = parser.parse_args()
+
+    for run in (scaling, failover, affinity):
+        if args.run in (run.__name__, "all"):
+            asyncio.run(run(args))
+
+if __name__ == "__main__":
+    main()
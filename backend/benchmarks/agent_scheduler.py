@@ -0,0 +1,130 @@
+"""
+Runs grading calls through AgentEndpoint's scheduler against a local stub
+agent, to show what priority classes, per-key fairness and token budgets do
+under contention:
+
+    python -m benchmarks.agent_scheduler --run all
+
+priority: a bulk backlog (a class's regrade) is queued, then students submit
+    at --rate a second. Once with every call in one class and key (first come,
+    first served, as before the scheduler) and once with the students'
+    calls as interactive work.
+fairness: one class queues a large analysis backlog just before another
+    class queues a few; once with one shared key, once keyed by class.
+tokens: a backlog under a --tokens-per-minute budget, which starts full.
+
+Prints one JSON line per run.
+"""
+import json
+import time
+import random
+import asyncio
+import argparse
+import statistics
+
+import httpx
+
+from app.services.agent_resilience import AgentEndpoint
+from app.services.agent_registry import agent_registry
+from app.services.agent_scheduler import INTERACTIVE, ANALYSIS, BULK, agent_work, agent_scheduler
+from .agent_replicas import payload, start_stubs, stop_stubs
+
+def percentiles(values: list) -> dict:
+    if not values:
+        return {}
+    values = sorted(values)
+    return {
+        "p50_ms": round(statistics.median(values) * 1000),
+        "p95_ms": round(values[max(0, int(len(values) * 0.95) - 1)] * 1000),
+        "max_ms": round(values[-1] * 1000),
+    }
+
+def endpoint(name: str, args, tokens_per_minute: int = 0) -> AgentEndpoint:
+    return AgentEndpoint(name, [f"http://127.0.0.1:{args.port}"], 60.0, 10.0,
+                         concurrency=args.concurrency, tokens_per_minute=tokens_per_minute)
+
+def retire(agent: AgentEndpoint):
+    agent_registry.pools.pop(agent.name)
+    agent_scheduler.queues.pop(agent.name)
+
+async def call(client, agent: AgentEndpoint, context_id: str, priority: str, key: str) -> float:
+    started = time.perf_counter()
+    with agent_work(priority, key):
+        await agent.post(client, payload(context_id), "demo")
+    return time.perf_counter() - started
+
+async def priority(args, client):
+    for mode in ("fifo", "priority"):
+        agent = endpoint(f"demo_priority_{mode}", args)
+        student_class = INTERACTIVE if mode == "priority" else BULK
+        bulk = [asyncio.create_task(call(client, agent, f"bulk_{i}", BULK, "" if mode == "fifo" else "class_1"))
+                for i in range(args.backlog)]
+        await asyncio.sleep(0.1)
+        rng = random.Random(args.seed)
+        students = []
+        for i in range(int(args.rate * args.seconds)):
+            students.append(asyncio.create_task(call(client, agent, f"student_{i}", student_class,
+                                                     "" if mode == "fifo" else f"class_{2 + i % 4}")))
+            await asyncio.sleep(rng.expovariate(args.rate))
+        student_latency = await asyncio.gather(*students)
+        bulk_latency = await asyncio.gather(*bulk)
+        retire(agent)
+        print(json.dumps({"run": "priority", "mode": mode, "bulk_calls": args.backlog,
+                          "student_calls": len(students), "student": percentiles(student_latency),
+                          "bulk_done_seconds": round(max(bulk_latency), 1)}))
+
+async def fairness(args, client):
+    for mode in ("shared_key", "per_class"):
+        agent = endpoint(f"demo_fairness_{mode}", args)
+        big = [asyncio.create_task(call(client, agent, f"a_{i}", ANALYSIS, "" if mode == "shared_key" else "class_a"))
+               for i in range(args.backlog)]
+        await asyncio.sleep(0.1)
+        small = [asyncio.create_task(call(client, agent, f"b_{i}", ANALYSIS, "" if mode == "shared_key" else "class_b"))
+                 for i in range(args.backlog // 20)]
+        small_latency = await asyncio.gather(*small)
+        big_latency = await asyncio.gather(*big)
+        retire(agent)
+        print(json.dumps({"run": "fairness", "mode": mode, "class_a_calls": len(big), "class_b_calls": len(small),
+                          "class_b": percentiles(small_latency), "class_a_done_seconds": round(max(big_latency), 1)}))
+
+async def tokens(args, client):
+    agent = endpoint("demo_tokens", args, args.tokens_per_minute)
+    started = time.perf_counter()
+    await asyncio.gather(*(call(client, agent, f"t_{i}", BULK, "") for i in range(args.backlog // 4)))
+    elapsed = time.perf_counter() - started
+    state = agent.queue.as_dict()
+    retire(agent)
+    per_call = state["token_estimates"].get("demo")
+    used = per_call * (args.backlog // 4) if per_call else 0
+    # The bucket starts full, so the first minute's worth goes at once
+    print(json.dumps({"run": "tokens", "calls": args.backlog // 4, "tokens_per_minute": args.tokens_per_minute,
+                      "tokens_per_call": per_call, "seconds": round(elapsed, 1),
+                      "tokens_per_minute_after_burst": round((used - args.tokens_per_minute) / elapsed * 60)}))
+
+async def run(args):
+    procs = start_stubs([args.port], args)
+    try:
+        async with httpx.AsyncClient(limits=httpx.Limits(max_connections=args.concurrency * 2)) as client:
+            for scenario in (priority, fairness, tokens):
+                if args.run in (scenario.__name__, "all"):
+                    await scenario(args, client)
+    finally:
+        stop_stubs(procs)
+
+def main():
+    parser = argparse.ArgumentParser(description="Agent scheduler demo on a stub agent")
+    parser.add_argument("--run", choices=["priority", "fairness", "tokens", "all"], default="all")
+    parser.add_argument("--backlog", type=int, default=400, help="Calls queued at once by the bulk class")
+    parser.add_argument("--rate", type=float, default=4.0, help="Student submissions a second")
+    parser.add_argument("--seconds", type=float, default=10.0, help="How long students keep submitting")
+    parser.add_argument("--concurrency", type=int, default=8, help="Scheduler slots (the stub serves as many)")
+    parser.add_argument("--latency", type=float, default=0.25, help="Stub reply time, seconds")
+    parser.add_argument("--tokens-per-minute", type=int, default=60000)
+    parser.add_argument("--port", type=int, default=10301)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    args.stub_concurrency = args.concurrency
+    asyncio.run(run(args))
+
+if __name__ == "__main__":
+    main()
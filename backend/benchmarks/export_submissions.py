@@ -0,0 +1,68 @@
+"""
+Exports graded submissions as JSON lines, for replaying them through the
+grading agent's model strategies offline (python -m grading_agent.replay):
+
+    python -m benchmarks.export_submissions --output submissions.jsonl --limit 500
+
+Each line has the grading request's inputs (questions_with_answers and topics,
+as the submit route builds them) and the marks recorded for each question,
+which include any changes a teacher made in review.
+"""
+import json
+import argparse
+
+from sqlmodel import Session, select
+
+from app.database import engine
+from app.models import Assignment, AssignmentGrade, Question, QuestionResponse
+from app.services.grade_service import grading_topics
+
+def export(session: Session, out, class_id=None, limit=None) -> int:
+    query = select(AssignmentGrade, Assignment).join(Assignment, AssignmentGrade.assignment_id == Assignment.id)
+    if class_id is not None:
+        query = query.where(Assignment.class_id == class_id)
+    query = query.order_by(AssignmentGrade.id.desc())
+    if limit:
+        query = query.limit(limit)
+
+    topics_by_class = {} # A class's topics block is shared by all its submissions
+    written = 0
+    for grade, assignment in session.exec(query).all():
+        rows = session.exec(
+            select(QuestionResponse, Question)
+            .join(Question, QuestionResponse.question_id == Question.id)
+            .where(Question.assignment_id == assignment.id, QuestionResponse.student_id == grade.student_id)
+            .order_by(Question.id)
+        ).all()
+        if not rows:
+            continue
+        if assignment.class_id not in topics_by_class:
+            topics_by_class[assignment.class_id] = grading_topics(session, assignment.class_id)
+        out.write(json.dumps({
+            "assignment_id": assignment.id,
+            "student_id": grade.student_id,
+            "class_id": assignment.class_id,
+            "grading_model": assignment.grading_model,
+            "questions_with_answers": [
+                {"question_id": q.id, "question": q.content, "answer": qr.content} for qr, q in rows
+            ],
+            "topics": topics_by_class[assignment.class_id],
+            "marks": {str(q.id): qr.marks for qr, q in rows if qr.marks is not None},
+            "assignment_marks": grade.marks,
+        }) + "\n")
+        written += 1
+    return written
+
+def main():
+    parser = argparse.ArgumentParser(description="Export graded submissions for the grading replay")
+    parser.add_argument("--output", default="submissions.jsonl")
+    parser.add_argument("--class-id", type=int)
+    parser.add_argument("--limit", type=int, help="Most recent submissions only")
+    args = parser.parse_args()
+
+    with Session(engine) as session, open(args.output, "w") as out:
+        written = export(session, out, args.class_id, args.limit)
+    print(f"Wrote {written} submissions to {args.output}")
+
+if __name__ == "__main__":
+    main()
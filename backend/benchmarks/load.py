@@ -0,0 +1,302 @@
+"""
+Scripted load test against a running backend.
+
+Teachers and students from a dataset made by benchmarks.seed log in, then loop
+over weighted actions with exponential think time until --duration runs out:
+
+    teacher: class stats, knowledge view, resource analysis, submission list, submission review
+    student: class stats, resource analysis, open assignment, submit, review
+    both:    re-login
+
+    python -m benchmarks.load --url http://localhost:8000 --teachers 20 --students 300 --duration 120 --output run.json
+    python -m benchmarks.load ... --compare baseline.json
+
+Results are keyed by route template ("GET /teacher/classes/{id}/stats"), so
+reports from different runs line up. Submissions go through grading, so point
+the backend at stub agents when the real models should stay out of the numbers.
+"""
+import argparse
+import asyncio
+import json
+import random
+import subprocess
+import time
+from datetime import datetime, timezone
+
+import httpx
+
+class Recorder:
+    """
+    Collects per-endpoint latencies and status codes.
+    """
+    def __init__(self):
+        self.latencies = {}
+        self.statuses = {}
+        self.failures = {}
+
+    def record(self, name: str, seconds: float, status, ok: bool):
+        self.latencies.setdefault(name, []).append(seconds)
+        codes = self.statuses.setdefault(name, {})
+        codes[str(status)] = codes.get(str(status), 0) + 1
+        if not ok:
+            self.failures[name] = self.failures.get(name, 0) + 1
+
+def percentile(ordered: list, p: float) -> float:
+    return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+def summarise(latencies: list, failures: int, elapsed: float) -> dict:
+    ordered = sorted(latencies)
+    return {
+        "requests": len(ordered),
+        "failures": failures,
+        "rps": round(len(ordered) / elapsed, 2),
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 1),
+        "p50_ms": round(percentile(ordered, 0.50) * 1000, 1),
+        "p95_ms": round(percentile(ordered, 0.95) * 1000, 1),
+        "p99_ms": round(percentile(ordered, 0.99) * 1000, 1),
+        "max_ms": round(ordered[-1] * 1000, 1),
+    }
+
+class VirtualUser:
+    role = None
+    actions = []
+
+    def __init__(self, client: httpx.AsyncClient, recorder: Recorder, username: str, password: str, rng: random.Random):
+        self.client = client
+        self.recorder = recorder
+        self.username = username
+        self.password = password
+        self.rng = rng
+        self.headers = {}
+        self.class_ids = []
+        self.resources = {} # class_id -> [resource_id]
+        self.assignments = {} # class_id -> [assignment_id]
+
+    async def request(self, name: str, method: str, path: str, ok=(200,), **kwargs):
+        started = time.perf_counter()
+        try:
+            resp = await self.client.request(method, path, headers=self.headers, **kwargs)
+        except httpx.HTTPError as e:
+            self.recorder.record(name, time.perf_counter() - started, type(e).__name__, False)
+            return None
+        self.recorder.record(name, time.perf_counter() - started, resp.status_code, resp.status_code in ok)
+        return resp if resp.status_code in ok else None
+
+    async def login(self):
+        resp = await self.request("POST /auth/token", "POST", "/auth/token",
+                                  data={"username": self.username, "password": self.password})
+        if resp is None:
+            raise RuntimeError(f"Login failed for {self.username}")
+        self.headers = {"Authorization": f"Bearer {resp.json()['access_token']}"}
+
+    def pick(self, items: list):
+        return self.rng.choice(items) if items else None
+
+    async def run(self, deadline: float, think_ms: float):
+        await self.login()
+        await self.setup()
+        weights = [w for _, w in self.actions]
+        while time.monotonic() < deadline:
+            action = self.rng.choices(self.actions, weights=weights)[0][0]
+            await getattr(self, action)()
+            if think_ms > 0:
+                await asyncio.sleep(self.rng.expovariate(1000.0 / think_ms))
+
+    async def relogin(self):
+        await self.login()
+
+class Teacher(VirtualUser):
+    role = "teacher"
+    actions = [("class_stats", 3), ("knowledge", 2), ("analysis", 3), ("submissions", 1), ("review", 2), ("relogin", 1)]
+
+    async def setup(self):
+        resp = await self.request("GET /teacher/classes", "GET", "/teacher/classes")
+        self.class_ids = [c["id"] for c in resp.json()] if resp else []
+        self.submitted = {} # assignment_id -> [student_id]
+        for class_id in self.class_ids:
+            resp = await self.request("GET /teacher/classes/{id}/resources", "GET", f"/teacher/classes/{class_id}/resources")
+            self.resources[class_id] = [r["id"] for r in resp.json()] if resp else []
+            resp = await self.request("GET /teacher/class/activity/{id}", "GET", f"/teacher/class/activity/{class_id}")
+            self.assignments[class_id] = [a["id"] for a in resp.json()] if resp else []
+
+    async def class_stats(self):
+        class_id = self.pick(self.class_ids)
+        if class_id is not None:
+            await self.request("GET /teacher/classes/{id}/stats", "GET", f"/teacher/classes/{class_id}/stats")
+
+    async def knowledge(self):
+        class_id = self.pick(self.class_ids)
+        if class_id is not None:
+            await self.request("GET /teacher/classes/{id}/knowledge", "GET", f"/teacher/classes/{class_id}/knowledge")
+
+    async def analysis(self):
+        resource_id = self.pick(self.resources.get(self.pick(self.class_ids), []))
+        if resource_id is not None:
+            await self.request("GET /teacher/resources/{id}/analysis", "GET", f"/teacher/resources/{resource_id}/analysis")
+
+    async def submissions(self, assignment_id=None):
+        assignment_id = assignment_id or self.pick(self.assignments.get(self.pick(self.class_ids), []))
+        if assignment_id is None:
+            return
+        resp = await self.request("GET /teacher/assignments/{id}/submissions", "GET", f"/teacher/assignments/{assignment_id}/submissions")
+        if resp:
+            self.submitted[assignment_id] = [s["student_id"] for s in resp.json()["submissions"] if s["submitted"]]
+
+    async def review(self):
+        assignment_id = self.pick(self.assignments.get(self.pick(self.class_ids), []))
+        if assignment_id is None:
+            return
+        if assignment_id not in self.submitted:
+            await self.submissions(assignment_id)
+        student_id = self.pick(self.submitted.get(assignment_id, []))
+        if student_id is not None:
+            await self.request("GET /teacher/assignments/{id}/submissions/{student_id}", "GET",
+                               f"/teacher/assignments/{assignment_id}/submissions/{student_id}")
+
+class Student(VirtualUser):
+    role = "student"
+    actions = [("class_stats", 3), ("analysis", 3), ("open_assignment", 2), ("submit", 1), ("review", 2), ("relogin", 1)]
+
+    async def setup(self):
+        resp = await self.request("GET /student/classes", "GET", "/student/classes")
+        self.class_ids = [c["id"] for c in resp.json()] if resp else []
+        for class_id in self.class_ids:
+            resp = await self.request("GET /student/classes/{id}/resources", "GET", f"/student/classes/{class_id}/resources")
+            self.resources[class_id] = [r["id"] for r in resp.json()] if resp else []
+            resp = await self.request("GET /student/classes/{id}/assignments", "GET", f"/student/classes/{class_id}/assignments")
+            self.assignments[class_id] = [a["id"] for a in resp.json()] if resp else []
+
+    def pick_assignment(self):
+        return self.pick(self.assignments.get(self.pick(self.class_ids), []))
+
+    async def class_stats(self):
+        class_id = self.pick(self.class_ids)
+        if class_id is not None:
+            await self.request("GET /student/classes/{id}/stats", "GET", f"/student/classes/{class_id}/stats")
+
+    async def analysis(self):
+        resource_id = self.pick(self.resources.get(self.pick(self.class_ids), []))
+        if resource_id is not None:
+            await self.request("GET /student/resources/{id}/analysis", "GET", f"/student/resources/{resource_id}/analysis")
+
+    async def open_assignment(self, assignment_id=None):
+        assignment_id = assignment_id or self.pick_assignment()
+        if assignment_id is None:
+            return None
+        resp = await self.request("GET /student/assignments/{id}", "GET", f"/student/assignments/{assignment_id}")
+        return resp.json() if resp else None
+
+    async def submit(self):
+        assignment = await self.open_assignment()
+        if not assignment or not assignment["questions"]:
+            return
+        answers = [
+            {"question_id": q["id"], "answer": f"Load test answer from {self.username} to question {q['id']}."}
+            for q in assignment["questions"]
+        ]
+        await self.request("POST /student/assignments/{id}/submit", "POST",
+                           f"/student/assignments/{assignment['id']}/submit", json={"responses": answers})
+
+    async def review(self):
+        assignment_id = self.pick_assignment()
+        if assignment_id is not None:
+            # 400 is the endpoint's answer for a not yet graded assignment
+            await self.request("GET /student/assignments/{id}/review", "GET",
+                               f"/student/assignments/{assignment_id}/review", ok=(200, 400))
+
+async def run_load(args) -> dict:
+    recorder = Recorder()
+    rng = random.Random(args.seed)
+    limits = httpx.Limits(max_connections=args.max_connections)
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout, limits=limits) as client:
+        users = [Teacher(client, recorder, f"{args.tag}_teacher_{i}", args.password, random.Random(rng.random()))
+                 for i in range(1, args.teachers + 1)]
+        users += [Student(client, recorder, f"{args.tag}_student_{i}", args.password, random.Random(rng.random()))
+                  for i in range(1, args.students + 1)]
+
+        started = time.monotonic()
+        deadline = started + args.duration
+
+        async def start(user, delay):
+            await asyncio.sleep(delay)
+            await user.run(deadline, args.think_ms)
+
+        # Users start spread over the ramp rather than all in the same tick
+        results = await asyncio.gather(
+            *[start(u, args.ramp * i / max(1, len(users))) for i, u in enumerate(users)],
+            return_exceptions=True,
+        )
+        elapsed = time.monotonic() - started
+
+    aborted = [str(r) for r in results if isinstance(r, Exception)]
+    all_latencies = [s for samples in recorder.latencies.values() for s in samples]
+    endpoints = {
+        name: {**summarise(samples, recorder.failures.get(name, 0), elapsed), "statuses": recorder.statuses[name]}
+        for name, samples in sorted(recorder.latencies.items())
+    }
+    return {
+        "meta": {
+            "url": args.url,
+            "tag": args.tag,
+            "teachers": args.teachers,
+            "students": args.students,
+            "duration_s": args.duration,
+            "think_ms": args.think_ms,
+            "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "git_rev": _git_rev(),
+            "aborted_users": len(aborted),
+        },
+        "totals": summarise(all_latencies, sum(recorder.failures.values()), elapsed) if all_latencies else {},
+        "endpoints": endpoints,
+        "errors": aborted[:20],
+    }
+
+def _git_rev():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(report: dict, baseline: dict):
+    print(f"{'endpoint':<58} {'rps':>16} {'p50 ms':>18} {'p95 ms':>18} {'p99 ms':>18}")
+    rows = [("TOTAL", report["totals"], baseline.get("totals", {}))]
+    rows += [(name, stats, baseline["endpoints"].get(name, {})) for name, stats in report["endpoints"].items()]
+    for name, now, before in rows:
+        cells = []
+        for key in ("rps", "p50_ms", "p95_ms", "p99_ms"):
+            if key in before and before[key]:
+                change = (now[key] - before[key]) / before[key] * 100
+                cells.append(f"{now[key]:>8} ({change:+6.1f}%)")
+            else:
+                cells.append(f"{now[key]:>8} (    new)")
+        print(f"{name:<58} {cells[0]:>16} {cells[1]:>18} {cells[2]:>18} {cells[3]:>18}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Backend load test")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--tag", default="bench", help="Tag the dataset was seeded with")
+    parser.add_argument("--password", default="benchpass")
+    parser.add_argument("--teachers", type=int, default=10, help="Concurrent teacher users")
+    parser.add_argument("--students", type=int, default=100, help="Concurrent student users")
+    parser.add_argument("--duration", type=float, default=60.0, help="Seconds of load")
+    parser.add_argument("--ramp", type=float, default=10.0, help="Seconds over which users start")
+    parser.add_argument("--think-ms", type=float, default=500.0, help="Mean pause between a user's actions")
+    parser.add_argument("--max-connections", type=int, default=200)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Write the JSON report here")
+    parser.add_argument("--compare", help="Baseline report to print per-endpoint changes against")
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(run_load(args))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+    else:
+        print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Login throughput benchmark.
+
+In-process mode (default) measures password verification through the same
+pool the /auth/token route uses, pinned to 1, 4 and 16 cores:
+
+    python -m benchmarks.login --logins 300 --cores 1 4 16
+
+The hash's cost is BCRYPT_ROUNDS, as in the app (BCRYPT_ROUNDS=10 python -m
+benchmarks.login for cost 10).
+
+HTTP mode drives a running backend with concurrent logins instead:
+
+    python -m benchmarks.login --url http://localhost:8000 --username student1 --password password --concurrency 64
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+
+from app import auth
+
+# Captured once so later runs can widen the affinity again after a narrow one
+_ALL_CORES = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else None
+
+def _pin_to_cores(cores: int) -> int:
+    # Threads inherit the creating thread's affinity, so pin before building the pool
+    if _ALL_CORES is None:
+        return os.cpu_count() or 1
+    os.sched_setaffinity(0, set(_ALL_CORES[:cores]))
+    return min(cores, len(_ALL_CORES))
+
+async def _run_in_process(logins: int, cores: int, executor_kind: str, password: str, stored_hash: str) -> dict:
+    effective = _pin_to_cores(cores)
+    auth.configure_password_executor(workers=cores, kind=executor_kind)
+    # Warm the pool so worker start-up isn't counted
+    await asyncio.gather(*[auth.verify_and_update_password_async(password, stored_hash) for _ in range(cores)])
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*[auth.verify_and_update_password_async(password, stored_hash) for _ in range(logins)])
+    elapsed = time.perf_counter() - started
+
+    # A rehash would mean timing hash + verify, not a login's verify
+    assert all(valid and new_hash is None for valid, new_hash in results)
+    return {
+        "cores": cores,
+        "effective_cores": effective,
+        "logins": logins,
+        "seconds": round(elapsed, 3),
+        "logins_per_sec": round(logins / elapsed, 1),
+    }
+
+async def _run_http(url: str, username: str, password: str, logins: int, concurrency: int) -> dict:
+    import httpx
+
+    sem = asyncio.Semaphore(concurrency)
+    latencies = []
+    failures = 0
+
+    async with httpx.AsyncClient(base_url=url, timeout=60.0, limits=httpx.Limits(max_connections=concurrency)) as client:
+        async def one_login():
+            nonlocal failures
+            async with sem:
+                t0 = time.perf_counter()
+                resp = await client.post("/auth/token", data={"username": username, "password": password})
+                latencies.append(time.perf_counter() - t0)
+                if resp.status_code != 200:
+                    failures += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*[one_login() for _ in range(logins)])
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    pct = lambda p: round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000, 1)
+    return {
+        "concurrency": concurrency,
+        "logins": logins,
+        "failures": failures,
+        "seconds": round(elapsed, 3),
+        "logins_per_sec": round(logins / elapsed, 1),
+        "p50_ms": pct(0.50),
+        "p95_ms": pct(0.95),
+        "p99_ms": pct(0.99),
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Login throughput benchmark")
+    parser.add_argument("--logins", type=int, default=300, help="Logins per run (a class arriving at once)")
+    parser.add_argument("--cores", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--executor", choices=["thread", "process"], default=auth.PASSWORD_HASH_EXECUTOR)
+    parser.add_argument("--rounds", type=int, default=auth.BCRYPT_ROUNDS,
+                        help="bcrypt cost of the benchmark hash; must match BCRYPT_ROUNDS")
+    parser.add_argument("--url", help="Benchmark a running backend over HTTP instead")
+    parser.add_argument("--username", default="student1")
+    parser.add_argument("--password", default="password")
+    parser.add_argument("--concurrency", type=int, default=64)
+    args = parser.parse_args(argv)
+    if args.rounds != auth.BCRYPT_ROUNDS:
+        # The pool verifies with auth.pwd_context, which would rehash any other
+        # cost on every login; BCRYPT_ROUNDS sets it in worker processes too
+        parser.error(f"--rounds {args.rounds} differs from BCRYPT_ROUNDS={auth.BCRYPT_ROUNDS}; "
+                     f"run with BCRYPT_ROUNDS={args.rounds} instead")
+
+    if args.url:
+        result = asyncio.run(_run_http(args.url, args.username, args.password, args.logins, args.concurrency))
+        print(json.dumps(result, indent=2))
+        return
+
+    stored_hash = auth.pwd_context.handler("bcrypt").using(rounds=args.rounds).hash(args.password)
+    report = []
+    for cores in args.cores:
+        result = asyncio.run(_run_in_process(args.logins, cores, args.executor, args.password, stored_hash))
+        print(f"{cores:>3} cores ({result['effective_cores']} available): {result['logins_per_sec']:>8} logins/sec")
+        report.append(result)
+    print(json.dumps({"bcrypt_rounds": args.rounds, "executor": args.executor, "runs": report}, indent=2))
+
+if __name__ == "__main__":
+    main()
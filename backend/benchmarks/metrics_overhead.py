@@ -0,0 +1,74 @@
+"""
+Measures what MetricsMiddleware adds per request.
+
+Wraps a stub ASGI app that resolves a route and sends a response, and
+compares it with and without the middleware, so the difference is the
+instrumentation alone rather than FastAPI routing noise:
+
+    python -m benchmarks.metrics_overhead --requests 20000
+
+The acceptance bar is < 1% overhead at 1,000 rps, i.e. under 10 microseconds of
+added CPU per request on one core.
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from app.metrics import MetricsMiddleware
+
+class _Route:
+    path = "/items/{item_id}"
+
+async def stub_app(scope, receive, send):
+    scope["route"] = _Route
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"{}"})
+
+async def drive(app, requests: int) -> float:
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    for _ in range(200): # warm-up (label children)
+        await app({"type": "http", "method": "GET"}, receive, send)
+
+    started = time.perf_counter()
+    for _ in range(requests):
+        await app({"type": "http", "method": "GET"}, receive, send)
+    return time.perf_counter() - started
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Metrics middleware overhead")
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--rps", type=int, default=1000, help="Request rate the overhead budget is stated at")
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    instrumented = MetricsMiddleware(stub_app)
+    base_runs, inst_runs = [], []
+    # Interleaved, best-of-N to keep scheduler noise out of the difference
+    for _ in range(args.repeats):
+        base_runs.append(asyncio.run(drive(stub_app, args.requests)))
+        inst_runs.append(asyncio.run(drive(instrumented, args.requests)))
+
+    base_us = min(base_runs) / args.requests * 1e6
+    inst_us = min(inst_runs) / args.requests * 1e6
+    added_us = inst_us - base_us
+    overhead_pct = added_us * args.rps / 1e6 * 100
+    report = {
+        "requests": args.requests,
+        "baseline_us_per_request": round(base_us, 2),
+        "instrumented_us_per_request": round(inst_us, 2),
+        "added_us_per_request": round(added_us, 2),
+        "rps": args.rps,
+        # Share of one core spent on instrumentation at the target rate
+        "cpu_overhead_pct_at_rps": round(overhead_pct, 3),
+        "within_budget": overhead_pct < 1.0,
+    }
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+"""
+Copies an object from a storage stand-in into a Files API stand-in with each
+of the model file upload modes (app.services.model_files), and compares
+them:
+
+    python -m benchmarks.model_upload --size-mb 256
+
+tempfile: download the whole object to disk, then upload it with the genai
+    SDK, as before.
+streamed: one GET piped into the resumable upload (storage without ranges).
+ranged: --parallel range GETs at once, piped into the resumable upload.
+
+The storage stand-in serves a generated object at --storage-mbps per
+connection, with HEAD and byte ranges (or without them, under /plain/). The
+Files API stand-in speaks the resumable upload protocol (start, upload,
+finalize and query) at --upload-mbps, serves file GETs and DELETEs, and
+reports the sha256 of what it received, which is checked against the
+object's. --fail-every N fails every Nth range GET and, halfway through its
+body, every Nth upload chunk, to exercise the retries and resumes (tempfile
+is skipped then).
+
+Prints one JSON line per mode.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import signal
+import asyncio
+import hashlib
+import argparse
+import subprocess
+
+import httpx
+
+from app.services import model_files
+
+PIECE = 256 * 1024 # Storage stand-in's write size
+
+# ==========================================
+# Stand-ins
+# ==========================================
+
+def object_bytes(args) -> bytes:
+    rng = random.Random(args.seed)
+    return b"".join(rng.randbytes(1024 * 1024) for _ in range(args.size_mb))
+
+def stand_in_app(args):
+    from starlette.applications import Starlette
+    from starlette.requests import Request
+    from starlette.responses import JSONResponse, Response, StreamingResponse
+    from starlette.routing import Route
+
+    data = object_bytes(args)
+    sessions, files, counts = {}, {}, {"range": 0, "chunk": 0}
+
+    async def paced(view, rate: float):
+        started = time.perf_counter()
+        for offset in range(0, len(view), PIECE):
+            yield bytes(view[offset:offset + PIECE])
+            ahead = started + (offset + PIECE) / rate - time.perf_counter()
+            if ahead > 0:
+                await asyncio.sleep(ahead)
+
+    async def storage(request: Request):
+        ranges = not request.url.path.startswith("/plain/")
+        headers = {"Content-Type": "video/mp4"}
+        if ranges:
+            headers["Accept-Ranges"] = "bytes"
+        headers["x-goog-generation"] = str(args.seed) # Same object, same generation
+        if request.method == "HEAD":
+            return Response(headers={**headers, "Content-Length": str(len(data))})
+        view, status = memoryview(data), 200
+        requested = request.headers.get("range")
+        if ranges and requested:
+            counts["range"] += 1
+            if args.fail_every and counts["range"] % args.fail_every == 0:
+                return Response(status_code=503)
+            first, last = (int(n) for n in requested.split("=")[1].split("-"))
+            view, status = view[first:last + 1], 206
+            headers["Content-Range"] = f"bytes {first}-{last}/{len(data)}"
+        headers["Content-Length"] = str(len(view))
+        return StreamingResponse(paced(view, args.storage_mbps * 1e6), status_code=status, headers=headers)
+
+    async def start(request: Request):
+        if request.headers.get("x-goog-upload-command") != "start":
+            return Response(status_code=400)
+        session_id = uuid.uuid4().hex
+        sessions[session_id] = {"size": int(request.headers["x-goog-upload-header-content-length"]),
+                                "mime_type": request.headers["x-goog-upload-header-content-type"],
+                                "received": 0, "sha256": hashlib.sha256()}
+        return Response(headers={"X-Goog-Upload-URL": f"{request.base_url}upload/sessions/{session_id}",
+                                 "X-Goog-Upload-Status": "active"})
+
+    async def chunk(request: Request):
+        session = sessions[request.path_params["session_id"]]
+        command = request.headers.get("x-goog-upload-command", "")
+        if command == "query":
+            return Response(headers={"X-Goog-Upload-Status": "active",
+                                     "X-Goog-Upload-Size-Received": str(session["received"])})
+        if int(request.headers["x-goog-upload-offset"]) != session["received"]:
+            return Response(status_code=400, headers={"X-Goog-Upload-Status": "active"})
+        body = await request.body()
+        counts["chunk"] += 1
+        failing = args.fail_every and counts["chunk"] % args.fail_every == 0
+        if failing:
+            body = body[:len(body) // 2] # Half arrived before the connection dropped
+        await asyncio.sleep(len(body) / (args.upload_mbps * 1e6))
+        session["sha256"].update(body)
+        session["received"] += len(body)
+        if failing:
+            return Response(status_code=503)
+        if "finalize" not in command:
+            return Response(headers={"X-Goog-Upload-Status": "active"})
+        if session["received"] != session["size"]:
+            return Response(status_code=400, headers={"X-Goog-Upload-Status": "final"})
+        name = f"files/{uuid.uuid4().hex[:12]}"
+        files[name] = {"name": name, "uri": f"{request.base_url}v1beta/{name}", "mimeType": session["mime_type"],
+                       "sizeBytes": str(session["size"]), "sha256Hash": session["sha256"].hexdigest(),
+                       "state": "PROCESSING", "videoMetadata": {"videoDuration": "600s"},
+                       "expirationTime": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(time.time() + 48 * 3600))}
+        return JSONResponse({"file": files[name]}, headers={"X-Goog-Upload-Status": "final"})
+
+    async def get_file(request: Request):
+        name = f"files/{request.path_params['file_id']}"
+        if name not in files:
+            return Response(status_code=403) # As the Files API answers for files it doesn't have
+        if request.method == "DELETE":
+            del files[name]
+            return JSONResponse({})
+        files[name]["state"] = "ACTIVE" # Processed by the first poll
+        return JSONResponse(files[name])
+
+    return Starlette(routes=[
+        Route("/object.mp4", storage, methods=["GET", "HEAD"]),
+        Route("/plain/object.mp4", storage, methods=["GET", "HEAD"]),
+        Route("/upload/v1beta/files", start, methods=["POST"]),
+        Route("/upload/sessions/{session_id}", chunk, methods=["POST"]),
+        Route("/v1beta/files/{file_id}", get_file, methods=["GET", "DELETE"]),
+    ])
+
+def start_stand_ins(args) -> subprocess.Popen:
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.model_upload", "--serve", "--port", str(args.port),
+         "--size-mb", str(args.size_mb), "--storage-mbps", str(args.storage_mbps),
+         "--upload-mbps", str(args.upload_mbps), "--fail-every", str(args.fail_every), "--seed", str(args.seed)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    for _ in range(300):
+        try:
+            httpx.head(f"http://127.0.0.1:{args.port}/object.mp4", timeout=1).raise_for_status()
+            break
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    return proc
+
+# ==========================================
+# Runs
+# ==========================================
+
+async def copy(args, mode: str, expected_sha256: str) -> dict:
+    base = f"http://127.0.0.1:{args.port}"
+    model_files.MODEL_UPLOAD_MODE = "tempfile" if mode == "tempfile" else "stream"
+    url = f"{base}/plain/object.mp4" if mode == "streamed" else f"{base}/object.mp4"
+    retries_before = {d: model_files.MODEL_FILE_RETRIES.labels(d)._value.get() for d in ("download", "upload")}
+    peak = 0.0
+
+    async def sample_buffer():
+        nonlocal peak
+        while True:
+            peak = max(peak, model_files.MODEL_FILE_BUFFERED._value.get())
+            await asyncio.sleep(0.005)
+
+    sampler = asyncio.create_task(sample_buffer())
+    started = time.perf_counter()
+    try:
+        genai_file = await model_files.upload_to_model_files(url, "video/mp4")
+    finally:
+        sampler.cancel()
+    seconds = time.perf_counter() - started
+    size = args.size_mb * 1024 * 1024
+    return {
+        "mode": mode,
+        "mb": args.size_mb,
+        "seconds": round(seconds, 2),
+        "mb_per_second": round(size / 1e6 / seconds, 1),
+        # The whole file on disk for tempfile; the chunk window in memory, sampled, otherwise
+        "disk_bytes": size if mode == "tempfile" else 0,
+        "peak_buffered_bytes": int(peak),
+        "retries": {d: model_files.MODEL_FILE_RETRIES.labels(d)._value.get() - n for d, n in retries_before.items()},
+        "sha256_matches": genai_file.sha256_hash == expected_sha256,
+        "state": genai_file.state.name,
+    }
+
+async def run(args):
+    expected = hashlib.sha256(object_bytes(args)).hexdigest()
+    for mode in args.modes:
+        if mode == "tempfile" and args.fail_every:
+            # The SDK resends a failed chunk whole rather than resuming it
+            print(json.dumps({"mode": mode, "skipped": "the SDK upload doesn't resume partial chunks"}))
+            continue
+        print(json.dumps(await copy(args, mode, expected)))
+
+def main():
+    parser = argparse.ArgumentParser(description="Model file upload modes against local stand-ins")
+    parser.add_argument("--modes", nargs="+", choices=["tempfile", "streamed", "ranged"],
+                        default=["tempfile", "streamed", "ranged"])
+    parser.add_argument("--size-mb", type=int, default=256)
+    parser.add_argument("--storage-mbps", type=float, default=50.0, help="Storage stand-in MB/s per connection")
+    parser.add_argument("--upload-mbps", type=float, default=150.0, help="Files API stand-in MB/s")
+    parser.add_argument("--chunk-mb", type=int, default=8)
+    parser.add_argument("--parallel", type=int, default=4, help="Range GETs in flight")
+    parser.add_argument("--fail-every", type=int, default=0, help="Fail every Nth range GET and upload chunk")
+    parser.add_argument("--port", type=int, default=10401)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--serve", action="store_true", help="Run the stand-ins (started by the benchmark)")
+    args = parser.parse_args()
+
+    if args.serve:
+        import uvicorn
+        uvicorn.run(stand_in_app(args), host="127.0.0.1", port=args.port, log_level="warning")
+        return
+
+    os.environ["GENAI_BASE_URL"] = model_files.GENAI_BASE_URL = f"http://127.0.0.1:{args.port}"
+    os.environ.setdefault("GOOGLE_API_KEY", "stand-in")
+    model_files.MODEL_UPLOAD_CHUNK_BYTES = args.chunk_mb * 1024 * 1024
+    model_files.MODEL_UPLOAD_PARALLEL_RANGES = args.parallel
+    model_files.MODEL_FILE_POLL_SECONDS = 0.1
+    model_files.RETRY_BACKOFF = 0.05
+    proc = start_stand_ins(args)
+    try:
+        asyncio.run(run(args))
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        proc.wait()
+
+if __name__ == "__main__":
+    main()
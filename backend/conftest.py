@@ -0,0 +1,98 @@
+import os
+from contextlib import contextmanager
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.pool import StaticPool
+from sqlmodel import SQLModel, Session, create_engine
+
+# Requests use the engine fixture's database instead, so the app's own
+# engine only needs to be creatable
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from app.main import app
+from app.auth import get_current_user
+from app.database import get_session
+from app.query_stats import RequestDBStats, current_db_stats, instrument_engine
+
+class QueryBudget:
+    """
+    Checks SQL statement counts against a budget.
+
+        def test_knowledge(client, query_budget):
+            query_budget.check(client.get("/teacher/classes/1/knowledge", headers=auth))
+
+        def test_service(session, query_budget):
+            with query_budget.limit(3):
+                apply_mark_changes(session, {1: 5.0})
+
+    check() compares a response's X-Query-Count with the budget declared on
+    the endpoint via @query_budget (sent as X-Query-Budget), or an explicit one.
+    """
+    def check(self, response, budget: int = None):
+        count = response.headers.get("x-query-count")
+        if count is None:
+            pytest.fail("Response has no X-Query-Count header; is APP_ENV set to production?")
+        if budget is None:
+            declared = response.headers.get("x-query-budget")
+            if declared is None:
+                pytest.fail("Endpoint declares no @query_budget and no budget was given")
+            budget = int(declared)
+        if int(count) > budget:
+            pytest.fail(f"{response.request.method} {response.request.url.path} ran {count} queries, budget is {budget}")
+        return int(count)
+
+    @contextmanager
+    def limit(self, budget: int):
+        stats = RequestDBStats()
+        token = current_db_stats.set(stats)
+        try:
+            yield stats
+        finally:
+            current_db_stats.reset(token)
+        if stats.queries > budget:
+            pytest.fail(f"Ran {stats.queries} queries, budget is {budget}")
+
+@pytest.fixture
+def query_budget():
+    return QueryBudget()
+
+@pytest.fixture
+def engine():
+    """
+    An in-memory database shared by the test session and the app, with the
+    query counting the app's own engine gets.
+    """
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    instrument_engine(engine)
+    SQLModel.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+@pytest.fixture
+def session(engine):
+    with Session(engine, expire_on_commit=False) as session:
+        yield session
+
+@pytest.fixture
+def client(engine):
+    """
+    A TestClient on the test database. Startup hooks don't run, so no agents
+    or notification hub are needed; use log_in to pick who is calling.
+    """
+    def get_test_session():
+        with Session(engine) as session:
+            yield session
+
+    app.dependency_overrides[get_session] = get_test_session
+    yield TestClient(app)
+    app.dependency_overrides.clear()
+
+@pytest.fixture
+def log_in(client):
+    """
+    log_in(user) makes the client's requests run as that user.
+    """
+    def log_in(user):
+        app.dependency_overrides[get_current_user] = lambda: user
+    return log_in
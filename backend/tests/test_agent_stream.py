@@ -0,0 +1,48 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app.services.agent_resilience import AgentEndpoint
+
+def agent(name, body):
+    """
+    A one-replica endpoint and a client whose agent answers message/stream
+    with body, an async iterator of bytes.
+    """
+    endpoint = AgentEndpoint(name, [f"http://{name}"], default_timeout=5.0, min_timeout=1.0)
+    transport = httpx.MockTransport(lambda request: httpx.Response(200, content=body()))
+    return endpoint, httpx.AsyncClient(transport=transport)
+
+async def read(endpoint, client, handle):
+    async with client:
+        async with endpoint._stream(client, {"params": {"message": {}}}, "stream", ticket=None) as call:
+            async for line in call.lines():
+                handle(line)
+
+async def events():
+    yield b'data: {"result": {}}\n\n'
+
+async def broken():
+    yield b'data: {"result": {}}\n\n'
+    raise httpx.ReadError("Connection reset")
+
+def test_caller_errors_are_not_agent_failures():
+    endpoint, client = agent("stream_caller_error", events)
+    def handle(line):
+        raise ValueError("The backend couldn't save the score")
+
+    with pytest.raises(ValueError):
+        asyncio.run(read(endpoint, client, handle))
+    replica, = endpoint.replicas.replicas.values()
+    assert replica.failures == 0
+    assert endpoint.breaker.consecutive_failures == 0 and not endpoint.breaker.probing
+
+def test_broken_streams_are_agent_failures():
+    endpoint, client = agent("stream_broken", broken)
+
+    with pytest.raises(httpx.ReadError):
+        asyncio.run(read(endpoint, client, lambda line: None))
+    replica, = endpoint.replicas.replicas.values()
+    assert replica.failures == 1
+    assert endpoint.breaker.consecutive_failures == 1
@@ -0,0 +1,87 @@
+from types import SimpleNamespace
+
+import pytest
+from sqlmodel import select
+
+from app.models import User, UserRole, Class, Assignment, Question, QuestionResponse, AssignmentGrade
+from app.services.grade_service import save_grading_result
+
+@pytest.fixture
+def graded(session):
+    """
+    A two-question submission graded by the agent, whose overall marks (15)
+    don't add up to its question marks (7 + 5).
+    """
+    teacher = User(username="teacher", password_hash="x", role=UserRole.TEACHER)
+    other_teacher = User(username="other", password_hash="x", role=UserRole.TEACHER)
+    admin = User(username="admin", password_hash="x", role=UserRole.ADMIN)
+    student = User(username="student", password_hash="x", role=UserRole.STUDENT)
+    session.add_all([teacher, other_teacher, admin, student])
+    session.flush()
+    class_ = Class(name="Physics", course_name="PHY101", teacher_id=teacher.id)
+    session.add(class_)
+    session.flush()
+    assignment = Assignment(class_id=class_.id, title="Week 1")
+    session.add(assignment)
+    session.flush()
+    questions = [Question(assignment_id=assignment.id, content=f"Question {i}") for i in range(2)]
+    session.add_all(questions)
+    session.flush()
+    responses = {q.id: QuestionResponse(student_id=student.id, question_id=q.id, content="An answer") for q in questions}
+    session.add_all(responses.values())
+    session.flush()
+
+    items = [SimpleNamespace(question_id=q.id, answer="An answer") for q in questions]
+    grade = save_grading_result(session, assignment, student.id, responses, items, {
+        "question_scores": [
+            {"question_id": questions[0].id, "marks": 7.0, "feedback": "Good"},
+            {"question_id": questions[1].id, "marks": 5.0, "feedback": "Fair"},
+        ],
+        "assignment_marks": 15.0,
+        "feedback": "Well done",
+    })
+    session.commit()
+    return SimpleNamespace(teacher=teacher, other_teacher=other_teacher, admin=admin, grade=grade,
+                           responses=[responses[q.id] for q in questions])
+
+def grade_marks(session, grade_id):
+    session.expire_all()
+    return session.exec(select(AssignmentGrade.marks).where(AssignmentGrade.id == grade_id)).one()
+
+def test_grade_is_the_sum_of_question_marks(session, graded):
+    assert grade_marks(session, graded.grade.id) == 12.0
+    assert all(r.graded for r in graded.responses)
+
+def test_mark_edits_keep_the_grade_a_sum(client, log_in, session, graded):
+    first, second = graded.responses
+    log_in(graded.teacher)
+    response = client.put("/teacher/responses/marks", json={"updates": [
+        {"response_id": first.id, "marks": 9.0},
+        {"response_id": second.id, "marks": 4.0},
+    ]})
+    assert response.status_code == 200
+    assert grade_marks(session, graded.grade.id) == 13.0
+
+    response = client.put(f"/teacher/responses/{second.id}/marks", json={"marks": 6.0})
+    assert response.status_code == 200
+    assert grade_marks(session, graded.grade.id) == 15.0
+
+@pytest.mark.parametrize("path", ["/teacher/responses/marks", "/teacher/responses/{id}/marks"])
+def test_other_teachers_cannot_mark(client, log_in, session, graded, path):
+    first = graded.responses[0]
+    log_in(graded.other_teacher)
+    if "{id}" in path:
+        response = client.put(path.format(id=first.id), json={"marks": 10.0})
+    else:
+        response = client.put(path, json={"updates": [{"response_id": first.id, "marks": 10.0}]})
+    assert response.status_code == 403
+
+    session.expire_all()
+    assert session.get(QuestionResponse, first.id).marks == 7.0
+    assert grade_marks(session, graded.grade.id) == 12.0
+
+def test_admins_can_mark_any_class(client, log_in, session, graded):
+    log_in(graded.admin)
+    response = client.put("/teacher/responses/marks", json={"updates": [{"response_id": graded.responses[0].id, "marks": 10.0}]})
+    assert response.status_code == 200
+    assert grade_marks(session, graded.grade.id) == 15.0
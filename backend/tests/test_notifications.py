@@ -0,0 +1,56 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from starlette.requests import Request
+from starlette.websockets import WebSocketDisconnect
+
+from app.auth import create_access_token
+from app.models import User, UserRole
+from app.routers import notifications
+from app.services.notification_service import hub
+
+@pytest.fixture
+def student(session, engine, monkeypatch):
+    """
+    A student and their login token. The streams look users up on their own
+    short sessions, so they are pointed at the test database.
+    """
+    monkeypatch.setattr(notifications, "engine", engine)
+    user = User(username="student", password_hash="x", role=UserRole.STUDENT)
+    session.add(user)
+    session.commit()
+    return SimpleNamespace(id=user.id, token=create_access_token({"sub": user.username, "role": user.role}))
+
+def test_socket_takes_the_token_as_a_subprotocol(client, student):
+    with client.websocket_connect("/notifications/ws", subprotocols=["bearer", student.token]) as ws:
+        assert ws.accepted_subprotocol == "bearer"
+        assert student.id in hub.subscriptions
+    assert student.id not in hub.subscriptions
+
+def test_socket_ignores_query_tokens(client, student):
+    with pytest.raises(WebSocketDisconnect) as e:
+        with client.websocket_connect(f"/notifications/ws?token={student.token}"):
+            pass
+    assert e.value.code == 1008
+
+def test_stream_authenticates_with_the_session_cookie(client, student):
+    assert client.get(f"/notifications/stream?token={student.token}").status_code == 401
+
+    response = client.post("/notifications/session", headers={"Authorization": f"Bearer {student.token}"})
+    assert response.status_code == 204
+    cookie = response.headers["set-cookie"]
+    assert cookie.startswith(f"{notifications.TOKEN_COOKIE}={student.token};")
+    assert "HttpOnly" in cookie and "Path=/notifications" in cookie
+
+    # Called directly: the TestClient can't hang up on an endless stream
+    request = Request({"type": "http", "method": "GET", "path": "/notifications/stream", "query_string": b"",
+                       "headers": [(b"cookie", f"{notifications.TOKEN_COOKIE}={student.token}".encode())]})
+    response = asyncio.run(notifications.notification_stream(request))
+    assert response.media_type == "text/event-stream"
+    subscription, = hub.subscriptions[student.id]
+    hub.unsubscribe(subscription)
+
+    response = client.delete("/notifications/session")
+    assert response.status_code == 204
+    assert notifications.TOKEN_COOKIE in response.headers["set-cookie"]
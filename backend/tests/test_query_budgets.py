@@ -0,0 +1,148 @@
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+from sqlmodel import select
+
+from app.models import (
+    User, UserRole, Class, ClassEnrollment, Resource, ResourceType, Topic, Occurrence, KeyConcept,
+    Assignment, Question, QuestionResponse, AssignmentGrade, GradeReviewComment,
+)
+from app.services.grade_service import build_review_responses
+
+# Enough rows that a query per resource, occurrence, question or comment
+# would run past every endpoint's budget
+RESOURCES = 3
+TOPICS_PER_RESOURCE = 3
+CONCEPTS_PER_OCCURRENCE = 2
+STUDENTS = 3
+QUESTIONS = 4
+
+@pytest.fixture
+def school(session):
+    """
+    One teacher's class with analysed resources (topics shared between them)
+    and an assignment every student has submitted and had graded, with a
+    comment thread on each response.
+    """
+    teacher = User(username="teacher", password_hash="x", role=UserRole.TEACHER)
+    students = [User(username=f"student{i}", password_hash="x", role=UserRole.STUDENT) for i in range(STUDENTS)]
+    session.add_all([teacher, *students])
+    session.flush()
+
+    class_ = Class(name="Physics", course_name="PHY101", teacher_id=teacher.id)
+    session.add(class_)
+    session.flush()
+    session.add_all([ClassEnrollment(class_id=class_.id, student_id=s.id) for s in students])
+
+    topics = [Topic(name=f"Topic {i}", outline="...") for i in range(RESOURCES + TOPICS_PER_RESOURCE)]
+    resources = [Resource(title=f"Lecture {i}", type=ResourceType.VIDEO, url=f"gs://lms/{i}.mp4", class_id=class_.id)
+                 for i in range(RESOURCES)]
+    session.add_all([*topics, *resources])
+    session.flush()
+    for i, resource in enumerate(resources):
+        for topic in topics[i:i + TOPICS_PER_RESOURCE]:
+            occurrence = Occurrence(topic_id=topic.id, resource_id=resource.id)
+            session.add(occurrence)
+            session.flush()
+            session.add_all([
+                KeyConcept(name=f"{topic.name} concept {j}", description="...", occurrence_id=occurrence.id, timestamp_start=j * 60)
+                for j in range(CONCEPTS_PER_OCCURRENCE)
+            ])
+
+    asked = datetime(2025, 3, 1, 9, 0, tzinfo=timezone.utc)
+    assignment = Assignment(class_id=class_.id, title="Week 1")
+    session.add(assignment)
+    session.flush()
+    questions = [Question(assignment_id=assignment.id, content=f"Question {i}") for i in range(QUESTIONS)]
+    session.add_all(questions)
+    session.flush()
+    for student in students:
+        for question in questions:
+            response = QuestionResponse(student_id=student.id, question_id=question.id, content="An answer",
+                                        graded=True, marks=7.0, feedback="Good")
+            session.add(response)
+            session.flush()
+            session.add_all([
+                GradeReviewComment(response_id=response.id, user_id=student.id, content="Why not 10?", created_at=asked),
+                GradeReviewComment(response_id=response.id, user_id=teacher.id, content="See the rubric",
+                                   created_at=asked + timedelta(hours=1)),
+            ])
+        session.add(AssignmentGrade(assignment_id=assignment.id, student_id=student.id, marks=7.0 * QUESTIONS, feedback="Well done"))
+    session.commit()
+
+    return SimpleNamespace(teacher=teacher, students=students, class_=class_, resources=resources,
+                           assignment=assignment, questions=questions)
+
+def test_resource_analysis(client, log_in, school, query_budget):
+    log_in(school.teacher)
+    response = client.get(f"/teacher/resources/{school.resources[1].id}/analysis")
+    assert response.status_code == 200
+    query_budget.check(response)
+
+    topics = response.json()["topics"]
+    assert len(topics) == TOPICS_PER_RESOURCE
+    assert all(len(t["concepts"]) == CONCEPTS_PER_OCCURRENCE for t in topics)
+
+def test_class_knowledge(client, log_in, school, query_budget):
+    log_in(school.teacher)
+    response = client.get(f"/teacher/classes/{school.class_.id}/knowledge")
+    assert response.status_code == 200
+    query_budget.check(response)
+
+    topics = {t["name"]: t for t in response.json()["topics"]}
+    assert len(topics) == RESOURCES + TOPICS_PER_RESOURCE - 1
+    shared = topics["Topic 2"] # Linked to all three lectures
+    assert sorted(shared["resource_names"]) == ["Lecture 0", "Lecture 1", "Lecture 2"]
+    assert len(shared["concepts"]) == RESOURCES * CONCEPTS_PER_OCCURRENCE
+
+def test_assignment_submissions(client, log_in, school, query_budget):
+    log_in(school.teacher)
+    response = client.get(f"/teacher/assignments/{school.assignment.id}/submissions")
+    assert response.status_code == 200
+    query_budget.check(response)
+
+    submissions = response.json()["submissions"]
+    assert len(submissions) == STUDENTS
+    assert all(s["submitted"] and s["marks"] == 70.0 for s in submissions)
+
+def test_teacher_submission_review(client, log_in, school, query_budget):
+    student = school.students[0]
+    log_in(school.teacher)
+    response = client.get(f"/teacher/assignments/{school.assignment.id}/submissions/{student.id}")
+    assert response.status_code == 200
+    query_budget.check(response)
+
+    body = response.json()
+    assert body["student_name"] == student.username
+    assert len(body["responses"]) == QUESTIONS
+
+def test_student_assignment_review(client, log_in, school, query_budget):
+    log_in(school.students[1])
+    response = client.get(f"/student/assignments/{school.assignment.id}/review")
+    assert response.status_code == 200
+    query_budget.check(response)
+
+    responses = response.json()["responses"]
+    assert len(responses) == QUESTIONS
+    assert [c["user_name"] for c in responses[0]["comments"]] == ["student1", "teacher"]
+
+def test_build_review_responses(session, school, query_budget):
+    student = school.students[2]
+    with query_budget.limit(2):
+        rows = build_review_responses(session, school.questions, student.id)
+
+    assert [r["question_id"] for r in rows] == [q.id for q in school.questions]
+    assert all(len(r["comments"]) == 2 for r in rows)
+    own = session.exec(select(QuestionResponse.id).where(QuestionResponse.student_id == student.id)).all()
+    assert sorted(r["response_id"] for r in rows) == sorted(own)
+
+def test_build_review_responses_unanswered(session, school, query_budget):
+    newcomer = User(username="newcomer", password_hash="x", role=UserRole.STUDENT)
+    session.add(newcomer)
+    session.commit()
+
+    with query_budget.limit(1):
+        assert build_review_responses(session, school.questions, newcomer.id) == []
+    with query_budget.limit(0):
+        assert build_review_responses(session, [], newcomer.id) == []
@@ -22,6 +22,7 @@ export default function StudentAssignmentPage() {
     const [isLoading, setIsLoading] = useState(true);
     const [isSubmitting, setIsSubmitting] = useState(false);
     const [result, setResult] = useState<any>(null);
+    const [streamedScores, setStreamedScores] = useState<any[]>([]);
 
     const router = useRouter();
     const params = useParams();
@@ -56,12 +57,42 @@ export default function StudentAssignmentPage() {
             answer: ans
         }));
 
+        setStreamedScores([]);
         try {
-            const res = await api.post(`/student/assignments/${assignment.id}/submit`, { responses });
-            if (res.data) {
-                setResult(res.data);
-            } else {
+            // Graded answers arrive one by one as server-sent events
+            const res = await fetch(`${api.defaults.baseURL}/student/assignments/${assignment.id}/submit/stream`, {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                    Authorization: `Bearer ${localStorage.getItem('token')}`,
+                },
+                body: JSON.stringify({ responses }),
+            });
+            if (!res.ok || !res.body) {
                 console.error("Submission failed");
+                return;
+            }
+
+            const reader = res.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            while (true) {
+                const { done, value } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+                const events = buffer.split('\n\n');
+                buffer = events.pop() || '';
+                for (const raw of events) {
+                    const event = raw.match(/^event: (.*)$/m)?.[1];
+                    const data = raw.match(/^data: (.*)$/m)?.[1];
+                    if (!event || !data) continue;
+                    const payload = JSON.parse(data);
+                    if (event === 'question') {
+                        setStreamedScores(prev => [...prev, payload]);
+                    } else if (event === 'result' || event === 'error') {
+                        setResult(payload);
+                    }
+                }
             }
         } catch (err) {
             console.error("Submit error", err);
@@ -120,6 +151,25 @@ export default function StudentAssignmentPage() {
                             {isSubmitting ? <><Loader2 className="w-5 h-5 animate-spin mr-2" /> Grading in Progress...</> : "Submit Assignment"}
                         </button>
                     </div>
+
+                    {isSubmitting && streamedScores.length > 0 && (
+                        <div className="space-y-4">
+                            <h3 className="text-xl font-semibold">Feedback so far ({streamedScores.length} of {assignment.questions.length})</h3>
+                            {streamedScores.map((qs: any) => (
+                                <div key={qs.question_id} className="p-4 bg-white border border-gray-200 rounded-lg shadow-sm">
+                                    <div className="flex justify-between items-center mb-2 gap-2">
+                                        <span className="font-semibold text-gray-800">
+                                            Question {assignment.questions.findIndex(q => q.id === qs.question_id) + 1}
+                                        </span>
+                                        <span className={`px-3 py-1 rounded-full text-sm font-bold w-fit ${qs.marks >= 8 ? 'bg-green-100 text-green-700' : qs.marks >= 5 ? 'bg-yellow-100 text-yellow-700' : 'bg-red-100 text-red-700'}`}>
+                                            {qs.marks} / 10
+                                        </span>
+                                    </div>
+                                    <p className="text-gray-600 text-sm italic mt-1 leading-relaxed">{qs.feedback}</p>
+                                </div>
+                            ))}
+                        </div>
+                    )}
                 </div>
             ) : (
                 <div className="border-t-4 border-t-green-500 shadow-lg bg-white rounded-lg overflow-hidden">
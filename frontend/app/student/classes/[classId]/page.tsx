@@ -100,6 +100,7 @@ export default function StudentClassDashboard() {
                             <span className="text-gray-600">Student: {user?.username}</span>
                             <button
                                 onClick={() => {
+                                    api.delete('/notifications/session', { withCredentials: true }).catch(() => {});
                                     localStorage.removeItem('token');
                                     router.push('/login');
                                 }}
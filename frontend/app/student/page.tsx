@@ -54,6 +54,7 @@ export default function StudentDashboard() {
                             <span className="text-gray-600">Welcome, {user?.username}</span>
                             <button
                                 onClick={() => {
+                                    api.delete('/notifications/session', { withCredentials: true }).catch(() => {});
                                     localStorage.removeItem('token');
                                     router.push('/login');
                                 }}
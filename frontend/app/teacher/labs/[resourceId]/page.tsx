@@ -55,11 +55,27 @@ export default function LabPage() {
 
         fetchData();
 
-        // Poll for updates if analysis is empty?
-        const interval = setInterval(() => {
-            // fetchData(); 
-        }, 10000);
-        return () => clearInterval(interval);
+        // Reload when the analysis for this resource finishes instead of polling.
+        // The stream authenticates with a cookie, keeping the token out of its URL
+        let events: EventSource | undefined;
+        let closed = false;
+        const onAnalysis = (e: MessageEvent) => {
+            if (String(JSON.parse(e.data).resource_id) === String(resourceId)) fetchData();
+        };
+        api.post('/notifications/session', null, { withCredentials: true }).then(() => {
+            if (closed) return;
+            events = new EventSource(
+                `${api.defaults.baseURL}/notifications/stream?types=analysis.completed,analysis.failed`,
+                { withCredentials: true }
+            );
+            events.addEventListener('analysis.completed', onAnalysis);
+            events.addEventListener('analysis.failed', onAnalysis);
+            events.addEventListener('overflow', () => fetchData());
+        }).catch(console.error);
+        return () => {
+            closed = true;
+            events?.close();
+        };
     }, [resourceId]);
 
     const formatTime = (seconds: number) => {
@@ -1,9 +1,14 @@
 import logging
-# import os
+import os
 
 from dotenv import load_dotenv
 from google.adk.agents import LlmAgent
-from google.adk.a2a.utils.agent_to_a2a import to_a2a
+from agent_common.context_cache import create_prompt_cache, prompt_cache_callbacks
+from agent_common.schemas import GradingResult
+from agent_common.deadline import with_deadlines
+from agent_common.sessions import create_session_service, to_a2a
+from agent_common.tracing import instrument_a2a_app
+from .router_agent import TieredGradingAgent
 # from google.adk.tools.mcp_tool import MCPToolset, StreamableHTTPConnectionParams
 
 logger = logging.getLogger(__name__)
@@ -15,12 +20,40 @@ load_dotenv()
 logger.info("--- 🤖 Creating ADK Grading Agent... ---")
 from . import prompt
 
-root_agent = LlmAgent(
-    model="gemini-3.1-pro-preview",
+# Instruction + class topics are sent as cached content; see agent_common.context_cache
+prompt_cache = create_prompt_cache()
+before_model_callback, after_model_callback = prompt_cache_callbacks(prompt_cache)
+
+def grader(name: str, model: str) -> LlmAgent:
+    return LlmAgent(
+        model=model,
+        name=name,
+        description="An agent that can help with grading responses from quizzes abd activities",
+        instruction=prompt.GRADING_AGENT_PROMPT,
+        output_schema=GradingResult, # JSON mode with the schema enforced by the model API
+        disallow_transfer_to_parent=True, # The router picks the grader; output_schema rules out transfers anyway
+        disallow_transfer_to_peers=True,
+        before_model_callback=before_model_callback,
+        after_model_callback=after_model_callback,
+    )
+
+
+# A fast model grades first; the pro model only when that grade is in doubt
+# (GRADING_STRATEGY and the thresholds: see router_agent)
+fast_grader = grader("grading_fast_agent", os.getenv("GRADING_FAST_MODEL", "gemini-3-flash-preview"))
+pro_grader = grader("grading_pro_agent", os.getenv("GRADING_PRO_MODEL", "gemini-3.1-pro-preview"))
+
+root_agent = TieredGradingAgent(
     name="grading_agent",
     description="An agent that can help with grading responses from quizzes abd activities",
-    instruction=prompt.GRADING_AGENT_PROMPT,
+    fast_grader=fast_grader,
+    pro_grader=pro_grader,
+    sub_agents=[fast_grader, pro_grader],
 )
 
+# Each submission is graded on its own: the agent keeps no history between
+# requests of a context (AGENT_SESSIONS overrides; see agent_common.sessions)
+session_service = create_session_service("stateless")
+
 # Make the agent A2A-compatible
-a2a_app = to_a2a(root_agent, port=10001)
\ No newline at end of file
+a2a_app = instrument_a2a_app(with_deadlines(to_a2a(root_agent, port=10001, session_service=session_service, streaming=True)), "grading-agent")
\ No newline at end of file
@@ -7,13 +7,14 @@ You will be provided with:
     1. You'll be given questions paired with answers in the following format <Submission>.
     2. You will also be given a list of topics and key concepts in the following format <Topics>.
     3. Use the steps in <GradingGuide> to evaluate the student's assignment.
-    4. You must generate a response in the following format <OutputFormat>.
+    4. You must generate a response in the following format <OutputFormat>, keeping its key order: write each question's score as soon as you have graded it, before the topic scores and overall marks.
 
 <GradingGuide>
    1. **Analyze the Submission**: 
         - Review each of the student's answers carefully. 
         - Evaluate their accuracy, depth of understanding, and relevance to the question asked.
         - Provide a mark for each question/answer on a strict scale from 0.0 to 10.0.
+        - Give your confidence in each mark from 0.0 to 1.0: lower it when the answer is ambiguous, partly off-topic, or could fairly earn a noticeably different mark.
    2. **Evaluate against Topics**: 
         - Determine which of the provided topics and key concepts are relevant to each question/answer. 
         - Assess the student's mastery of these specific topics and key concepts based on their responses.
@@ -32,13 +33,12 @@ You will be provided with:
 
 <OutputFormat>
 {
-  "assignment_marks": <float representing total marks attained by student out of (10.0 * number of questions)>,
-  "feedback": "<A concise paragraph of constructive feedback for the overall assignment>",
   "question_scores": [
     {
       "question_id": <int representing the question ID>,
       "marks": <float between 0.0 and 10.0>,
-      "feedback": "<A concise paragraph of constructive feedback for this specific question>"
+      "feedback": "<A concise paragraph of constructive feedback for this specific question>",
+      "confidence": <float between 0.0 and 1.0: how sure you are of this mark>
     }
   ],
   "topic_scores": [
@@ -47,7 +47,9 @@ You will be provided with:
       "marks": <float between 0.0 and 10.0>,
       "feedback": "<A concise paragraph of constructive feedback>"
     }
-  ]
+  ],
+  "assignment_marks": <float representing total marks attained by student out of (10.0 * number of questions)>,
+  "feedback": "<A concise paragraph of constructive feedback for the overall assignment>"
 }
 </OutputFormat>
 
@@ -0,0 +1,223 @@
+"""Offline replay of recorded submissions through the grading strategies.
+
+    python -m grading_agent.replay --input submissions.jsonl
+    python -m grading_agent.replay --synthetic 300 --stub
+
+grades every submission with each GRADING_STRATEGY (`pro`, `fast`, `tiered`)
+and prints one JSON line per strategy: latency (mean and p95 per
+submission), tokens, cost at PRICES, how often and why `tiered` escalated,
+and how its marks agree with the `pro` strategy's and with the recorded
+marks (mean absolute difference, share within one mark, share on the same
+side of the pass mark).
+
+--input takes the JSON lines of backend/benchmarks/export_submissions.py.
+Assignment overrides in the records are ignored, so every strategy grades
+every submission. Without --stub the real models are called. With --stub
+each tier is an agent_common.stub_model.StubLlm: the fast one quicker and
+with noisier marks (--fast-noise) than the pro one (--pro-noise).
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import statistics
+import time
+from collections import Counter
+
+STRATEGIES = ("pro", "fast", "tiered")
+# USD per million (input, output) tokens; cached input is billed at CACHED_PRICE_FRACTION
+PRICES = {
+    "gemini-3.1-pro-preview": (2.00, 12.00),
+    "gemini-3-flash-preview": (0.50, 3.00),
+}
+CACHED_PRICE_FRACTION = 0.1
+
+SHORT_ANSWER = "It is the {0} of the system, defined by its inputs."
+ESSAY_SENTENCE = "The {0} depends on how the parts interact, which the student explains with an example. "
+
+
+def request_text(record: dict) -> str:
+    """The backend's grading prompt (agent_service.build_grading_payload) for a record."""
+    submission = [
+        {f"question{i}": qa["question"], f"answer{i}": qa["answer"], "question_id": qa["question_id"]}
+        for i, qa in enumerate(record["questions_with_answers"], 1)
+    ]
+    topics = record.get("topics", [])
+    version = hashlib.sha256(json.dumps(topics, sort_keys=True).encode()).hexdigest()[:16]
+    return (f'<Topics class_id="{record.get("class_id")}" version="{version}">\n{json.dumps(topics, indent=4)}\n</Topics>\n\n'
+            "Please grade the following assignment submission based on the provided grading guide.\n\n"
+            f"<Submission>\n{json.dumps(submission, indent=4)}\n</Submission>")
+
+
+def synthetic_records(count: int, seed: int) -> list:
+    """Submissions like a class's: mostly one-line answers, some paragraphs, a few essays."""
+    rng = random.Random(seed)
+    records = []
+    for n in range(count):
+        assignment = n % 20
+        qa = []
+        for q in range(rng.randint(1, 5)):
+            kind = rng.choices(["short", "paragraph", "essay"], weights=[6, 3, 1])[0]
+            term = f"concept {assignment}.{q}"
+            if kind == "short":
+                answer = SHORT_ANSWER.format(term)
+            else:
+                answer = (ESSAY_SENTENCE.format(term) * (rng.randint(4, 8) if kind == "paragraph" else rng.randint(14, 30))).strip()
+            qa.append({"question_id": assignment * 10 + q, "question": f"Explain {term}.", "answer": f"{answer} ({n})"})
+        records.append({
+            "assignment_id": assignment,
+            "student_id": n,
+            "class_id": assignment % 4,
+            "questions_with_answers": qa,
+            "topics": [{"topic_id": assignment % 4 * 10 + t, "topic_name": f"Topic {t}",
+                        "key_concepts": [f"Concept {t}.{c}" for c in range(3)]} for t in range(3)],
+            "marks": {},
+        })
+    return records
+
+
+def load_records(args) -> list:
+    if args.synthetic:
+        return synthetic_records(args.synthetic, args.seed)
+    with open(args.input) as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    return records[:args.limit] if args.limit else records
+
+
+def cost(tokens: dict, model: str) -> float:
+    price_in, price_out = PRICES.get(model, (0.0, 0.0))
+    uncached = tokens["prompt"] - tokens["cached"]
+    return (uncached * price_in + tokens["cached"] * price_in * CACHED_PRICE_FRACTION + tokens["output"] * price_out) / 1e6
+
+
+def _marks(reply: str) -> dict:
+    try:
+        return {str(q["question_id"]): float(q["marks"]) for q in json.loads(reply)["question_scores"]}
+    except (ValueError, KeyError, TypeError):
+        return {}
+
+
+def agreement(marks: dict, reference: dict, pass_mark: float) -> dict:
+    """How a strategy's per-question marks compare with reference marks, over the questions both have."""
+    pairs = [(marks[key][q], mark) for key, ref in reference.items() for q, mark in ref.items() if q in marks.get(key, {})]
+    if not pairs:
+        return {}
+    return {
+        "questions": len(pairs),
+        "mean_abs_difference": round(statistics.mean(abs(a - b) for a, b in pairs), 3),
+        "within_1_mark": round(sum(abs(a - b) <= 1.0 for a, b in pairs) / len(pairs), 3),
+        "same_pass_fail": round(sum((a >= pass_mark) == (b >= pass_mark) for a, b in pairs) / len(pairs), 3),
+    }
+
+
+async def run_strategy(strategy: str, records: list, runner, root_agent, concurrency: int) -> dict:
+    from google.genai import types
+
+    root_agent.strategy = strategy
+    slots = asyncio.Semaphore(concurrency)
+    results = {}
+
+    async def grade(key: str, record: dict):
+        async with slots:
+            session = await runner.session_service.create_session(app_name=runner.app_name, user_id="replay")
+            message = types.Content(role="user", parts=[types.Part(text=request_text(record))])
+            started = time.perf_counter()
+            reply, route = "", {}
+            async for event in runner.run_async(user_id="replay", session_id=session.id, new_message=message):
+                if event.is_final_response() and event.content and event.content.parts:
+                    reply = "".join(p.text or "" for p in event.content.parts)
+                    route = (event.custom_metadata or {}).get("grading_route", route)
+            results[key] = {"seconds": time.perf_counter() - started, "marks": _marks(reply), "route": route}
+
+    await asyncio.gather(*(grade(f"{r['assignment_id']}_{r['student_id']}", r) for r in records))
+    return results
+
+
+def summarise(strategy: str, results: dict, records: list, reference: dict, models: dict, pass_mark: float) -> dict:
+    latencies = sorted(r["seconds"] for r in results.values())
+    tokens = {"prompt": 0, "cached": 0, "output": 0}
+    usd = 0.0
+    reasons = Counter()
+    to_pro = 0
+    for result in results.values():
+        route = result["route"]
+        for tier, counts in route.get("tokens", {}).items():
+            usd += cost(counts, models[tier])
+            for name in tokens:
+                tokens[name] += counts[name]
+        to_pro += "pro" in route.get("tiers", [])
+        reasons.update(route.get("reasons", []))
+    marks = {key: r["marks"] for key, r in results.items()}
+    recorded = {f"{r['assignment_id']}_{r['student_id']}": r.get("marks") or {} for r in records}
+    return {
+        "strategy": strategy,
+        "submissions": len(results),
+        "unparsed": sum(not r["marks"] for r in results.values()),
+        "latency_mean_seconds": round(statistics.mean(latencies), 3),
+        "latency_p95_seconds": round(latencies[max(0, int(len(latencies) * 0.95) - 1)], 3),
+        **{f"{name}_tokens": count for name, count in tokens.items()},
+        "cost_usd": round(usd, 4),
+        "cost_per_1k_submissions_usd": round(usd / len(results) * 1000, 2),
+        "pro_share": round(to_pro / len(results), 3),
+        "escalation_reasons": dict(reasons),
+        "vs_pro": agreement(marks, reference, pass_mark) if strategy != "pro" else {},
+        "vs_recorded": agreement(marks, recorded, pass_mark),
+    }
+
+
+async def replay(args) -> list:
+    if args.stub:
+        os.environ.setdefault("GOOGLE_API_KEY", "stub")
+        os.environ["PROMPT_CACHE"] = "off"
+    from google.adk.runners import Runner
+    from google.adk.sessions import InMemorySessionService
+
+    from agent_common.stub_model import StubLlm
+    from grading_agent.agent import root_agent
+    from grading_agent.router_agent import GRADING_PASS_FRACTION
+
+    fast, pro = root_agent.fast_grader, root_agent.pro_grader
+    models = {"fast": fast.model, "pro": pro.model}  # Priced as the real models either way
+    if args.stub:
+        fast.model = StubLlm(model="stub-fast", mark_noise=args.fast_noise, base_latency=args.fast_latency,
+                             seconds_per_1k_output_tokens=args.fast_latency * 4)
+        pro.model = StubLlm(model="stub-pro", mark_noise=args.pro_noise, base_latency=args.pro_latency,
+                            seconds_per_1k_output_tokens=args.pro_latency * 4)
+    runner = Runner(app_name=root_agent.name, agent=root_agent, session_service=InMemorySessionService())
+    records = load_records(args)
+    pass_mark = 10.0 * GRADING_PASS_FRACTION
+
+    reference, summaries = {}, []
+    for strategy in args.strategies:
+        results = await run_strategy(strategy, records, runner, root_agent, args.concurrency)
+        if strategy == "pro":
+            reference = {key: r["marks"] for key, r in results.items()}
+        summaries.append(summarise(strategy, results, records, reference, models, pass_mark))
+    return summaries
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--input", help="JSON lines from benchmarks.export_submissions")
+    source.add_argument("--synthetic", type=int, help="Generate this many submissions instead")
+    parser.add_argument("--limit", type=int)
+    parser.add_argument("--strategies", nargs="+", choices=STRATEGIES, default=list(STRATEGIES),
+                        help="pro first, as the others are compared with it")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--stub", action="store_true", help="Stub models instead of the real ones")
+    parser.add_argument("--fast-noise", type=float, default=1.5, help="Stub fast model: largest mark error")
+    parser.add_argument("--pro-noise", type=float, default=0.3, help="Stub pro model: largest mark error")
+    parser.add_argument("--fast-latency", type=float, default=0.4, help="Stub fast model: seconds per call")
+    parser.add_argument("--pro-latency", type=float, default=2.0, help="Stub pro model: seconds per call")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args(argv)
+
+    for summary in asyncio.run(replay(args)):
+        print(json.dumps(summary))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+"""Tiered model routing for grading.
+
+Most submissions are short answers that a fast model grades as well as the
+pro model does, in a fraction of the time and cost. GRADING_STRATEGY picks
+how a submission is graded:
+
+* `tiered` (default): the fast model grades first, and its grade stands
+  unless its reply isn't a valid grade, it is unsure of a question
+  (confidence below GRADING_MIN_CONFIDENCE), or a question's or the
+  assignment's marks are within GRADING_BORDERLINE_MARKS (out of 10) of the
+  pass mark, GRADING_PASS_FRACTION of full marks. Then the pro model grades
+  the submission again and its grade is the reply. A submission with an
+  answer longer than GRADING_LONG_ANSWER_CHARS goes straight to the pro
+  model.
+* `fast` or `pro`: one model grades everything.
+
+An assignment can override the strategy: the backend then adds
+`<GradingModel tier="fast|pro|tiered"/>` to its grading requests. Each
+decision is logged and sent back with the reply as the event's custom
+metadata, which reaches the backend as adk_custom_metadata.grading_route,
+with the tokens each tier used (a superseded fast grade's included).
+
+The fast model's events are passed on as they come, so a message/stream
+client sees its per-question grades straight away. When the pro model
+takes over, an event with adk_custom_metadata.grading_escalated comes
+first: grades streamed before it are superseded by the pro model's reply.
+"""
+import json
+import logging
+import os
+import re
+import time
+from typing import AsyncGenerator, List, Optional, Tuple
+
+from google.adk.agents import BaseAgent
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.events import Event
+from google.genai import types
+from pydantic import ValidationError
+
+from agent_common.schemas import GradingResult
+
+logger = logging.getLogger(__name__)
+
+STRATEGIES = ("tiered", "fast", "pro")
+GRADING_STRATEGY = os.getenv("GRADING_STRATEGY", "tiered").lower()
+GRADING_LONG_ANSWER_CHARS = int(os.getenv("GRADING_LONG_ANSWER_CHARS", "1200"))
+GRADING_MIN_CONFIDENCE = float(os.getenv("GRADING_MIN_CONFIDENCE", "0.75"))
+GRADING_PASS_FRACTION = float(os.getenv("GRADING_PASS_FRACTION", "0.5"))
+GRADING_BORDERLINE_MARKS = float(os.getenv("GRADING_BORDERLINE_MARKS", "0.5"))
+
+OVERRIDE_RE = re.compile(r'<GradingModel tier="(?P<tier>[a-z]+)"\s*/>')
+SUBMISSION_RE = re.compile(r"<Submission>(.*?)</Submission>", re.DOTALL)
+
+
+def requested_strategy(text: str) -> Optional[str]:
+    """The strategy an assignment override in the request asks for, if any."""
+    match = OVERRIDE_RE.search(text)
+    if match and match["tier"] in STRATEGIES:
+        return match["tier"]
+    return None
+
+
+def longest_answer(text: str) -> int:
+    """Length in characters of the longest answer in the request's <Submission> block."""
+    match = SUBMISSION_RE.search(text)
+    try:
+        submission = json.loads(match.group(1)) if match else []
+    except json.JSONDecodeError:
+        return 0
+    return max(
+        (len(str(v)) for item in submission if isinstance(item, dict) for k, v in item.items() if k.startswith("answer")),
+        default=0,
+    )
+
+
+def escalation_reasons(reply: str, min_confidence: float = GRADING_MIN_CONFIDENCE,
+                       pass_fraction: float = GRADING_PASS_FRACTION,
+                       borderline: float = GRADING_BORDERLINE_MARKS) -> List[str]:
+    """Why a fast model's grade needs a second opinion; empty if it can stand."""
+    try:
+        result = GradingResult.model_validate_json(reply)
+    except ValidationError:
+        return ["invalid_reply"]
+    if not result.question_scores:
+        return ["invalid_reply"]
+    reasons = []
+    if min(q.confidence for q in result.question_scores) < min_confidence:
+        reasons.append("low_confidence")
+    pass_mark = 10.0 * pass_fraction
+    if any(abs(q.marks - pass_mark) <= borderline for q in result.question_scores):
+        reasons.append("borderline_question")
+    # Overall marks are out of 10 per question; scaled back to one question's range
+    overall = result.assignment_marks / len(result.question_scores)
+    if abs(overall - pass_mark) <= borderline:
+        reasons.append("borderline_assignment")
+    return reasons
+
+
+def _tokens(events: List[Event]) -> dict:
+    usage = [e.usage_metadata for e in events if e.usage_metadata and not e.partial]
+    return {
+        "prompt": sum(u.prompt_token_count or 0 for u in usage),
+        "cached": sum(u.cached_content_token_count or 0 for u in usage),
+        "output": sum(u.candidates_token_count or 0 for u in usage),
+    }
+
+
+def _reply_text(events: List[Event]) -> str:
+    final = [e for e in events if e.is_final_response() and e.content and e.content.parts]
+    return "".join(p.text or "" for p in final[-1].content.parts) if final else ""
+
+
+class TieredGradingAgent(BaseAgent):
+    """Grades with the fast model, escalating to the pro model; see the module docstring."""
+
+    fast_grader: BaseAgent
+    pro_grader: BaseAgent
+    strategy: str = GRADING_STRATEGY
+
+    def plan(self, text: str) -> Tuple[str, str, List[str]]:
+        """(strategy, first tier, reasons) for a request."""
+        override = requested_strategy(text)
+        strategy = override or self.strategy
+        reasons = ["assignment_override"] if override else []
+        if strategy == "tiered" and longest_answer(text) > GRADING_LONG_ANSWER_CHARS:
+            return strategy, "pro", reasons + ["long_answer"]
+        return strategy, "pro" if strategy == "pro" else "fast", reasons
+
+    async def _run_async_impl(self, ctx: InvocationContext) -> AsyncGenerator[Event, None]:
+        parts = (ctx.user_content.parts or []) if ctx.user_content else []
+        strategy, tier, reasons = self.plan("\n".join(p.text for p in parts if p.text))
+        route = {"strategy": strategy, "tiers": [], "reasons": reasons, "tokens": {}}
+        started = time.perf_counter()
+
+        if tier == "fast":
+            # Streamed as it comes, so the backend can show each question's
+            # grade; only the reply waits, for the route to go on it
+            events, held = [], []
+            async for event in self.fast_grader.run_async(ctx):
+                events.append(event)
+                if event.is_final_response():
+                    held.append(event)
+                    continue
+                yield event
+            route["tiers"].append("fast")
+            route["tokens"]["fast"] = _tokens(events)
+            escalate = escalation_reasons(_reply_text(events)) if strategy == "tiered" else []
+            if not escalate:
+                self._finish(held, route, started)
+                for event in held:
+                    yield event
+                return
+            route["reasons"] += escalate
+            for event in held:
+                # Sent as partial so it isn't saved to the session, where the
+                # pro model would read the fast grade as history
+                yield event.model_copy(update={"partial": True})
+            # Tells a streaming client to discard the fast grade: the pro
+            # model's reply replaces it (and is the task's final artifact)
+            yield Event(
+                author=self.name,
+                invocation_id=ctx.invocation_id,
+                branch=ctx.branch,
+                partial=True,
+                content=types.Content(role="model", parts=[types.Part(text=f"Escalated to the pro model: {', '.join(escalate)}", thought=True)]),
+                custom_metadata={"grading_escalated": {"reasons": escalate}},
+            )
+
+        events, held = [], []
+        async for event in self.pro_grader.run_async(ctx):
+            events.append(event)
+            if event.is_final_response():
+                # Kept back so the route can go on the reply
+                held.append(event)
+                continue
+            yield event
+        route["tiers"].append("pro")
+        route["tokens"]["pro"] = _tokens(events)
+        self._finish(held, route, started)
+        for event in held:
+            yield event
+
+    def _finish(self, events: List[Event], route: dict, started: float):
+        route["seconds"] = round(time.perf_counter() - started, 3)
+        logger.info(f"Grading route: {json.dumps(route)}")
+        final = [e for e in events if e.is_final_response()]
+        if final:
+            final[-1].custom_metadata = {**(final[-1].custom_metadata or {}), "grading_route": route}
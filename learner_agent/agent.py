@@ -1,9 +1,11 @@
 import logging
-# import os
+import os
 
 from dotenv import load_dotenv
 from google.adk.agents import LlmAgent
-from google.adk.a2a.utils.agent_to_a2a import to_a2a
+from agent_common.deadline import with_deadlines
+from agent_common.sessions import create_session_service, to_a2a
+from agent_common.tracing import instrument_a2a_app
 # from google.adk.tools.mcp_tool import MCPToolset, StreamableHTTPConnectionParams
 
 logger = logging.getLogger(__name__)
@@ -16,17 +18,39 @@ logger.info("--- 🤖 Creating ADK Le arner Agent... ---")
 from . import prompt
 from .analyser_agent.agent import analyser_agent
 from .evaluator_agent.agent import evaluator_agent
+from .router_agent import ResourceRouterAgent
 
-root_agent = LlmAgent(
-    model="gemini-3.1-pro-preview",
-    name="learner_agent",
-    description="An agent that can help with learning from resources",
-    instruction=prompt.ROOT_PROMPT,
-    sub_agents=[
-        analyser_agent,
-        evaluator_agent,
-    ],
-)
+# `code` routes by the resource's MIME type (see router_agent); `llm` lets the
+# root and analyser agents choose, one model call each
+LEARNER_ROUTING = os.getenv("LEARNER_ROUTING", "code").lower()
+
+if LEARNER_ROUTING == "llm":
+    root_agent = LlmAgent(
+        model="gemini-3.1-pro-preview",
+        name="learner_agent",
+        description="An agent that can help with learning from resources",
+        instruction=prompt.ROOT_PROMPT,
+        sub_agents=[
+            analyser_agent,
+            evaluator_agent,
+        ],
+    )
+else:
+    root_agent = ResourceRouterAgent(
+        name="learner_agent",
+        description="An agent that can help with learning from resources",
+        pdf_analyser=analyser_agent.find_sub_agent("pdf_analyser_agent"),
+        video_analyser=analyser_agent.find_sub_agent("video_analyser_agent"),
+        fallback=analyser_agent,
+        evaluator=evaluator_agent,
+        sub_agents=[
+            analyser_agent,
+            evaluator_agent,
+        ],
+    )
+
+# Sessions are bounded in number, idle time and history; see agent_common.sessions
+session_service = create_session_service("memory")
 
 # Make the agent A2A-compatible
-a2a_app = to_a2a(root_agent, port=10000)
+a2a_app = instrument_a2a_app(with_deadlines(to_a2a(root_agent, port=10000, session_service=session_service)), "learner-agent")
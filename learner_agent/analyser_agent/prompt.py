@@ -7,6 +7,8 @@ Please follow these steps to accomplish the task at hand:
 2. store the resource data in a structured format based on the format in <Format> section.
 3. Based on the type of resource, call the video_analyser_agent or pdf_analyser_agent to extract information from the resource.
 4. Also pass the resource data to the video_analyser_agent or pdf_analyser_agent. IF there is an attached file, ensure you pass the attached file unmodified to the sub-agent.
+   IF the request contains a <Segment .../> tag, the video_analyser_agent must receive it unmodified as well.
+   IF the request contains a <Pages> block, the resource is a pdf: pass the whole block unmodified to the pdf_analyser_agent.
 5. Relay the extracted information to the root agent in JSON format.
 
 <Identify Resource Type>
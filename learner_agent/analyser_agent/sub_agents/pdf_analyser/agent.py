@@ -1,5 +1,7 @@
 from google.adk.agents.llm_agent import Agent
 
+from agent_common.schemas import AnalysisResult
+
 from . import prompt
 
 pdf_analyser_agent = Agent(
@@ -7,4 +9,5 @@ pdf_analyser_agent = Agent(
     name="pdf_analyser_agent",
     description="A helpful agent to analyse pdf.",
     instruction=prompt.PDF_ANALYSER_PROMPT,
+    output_schema=AnalysisResult,
 )
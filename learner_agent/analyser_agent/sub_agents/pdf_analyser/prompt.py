@@ -14,6 +14,13 @@ PDF_ANALYSER_PROMPT = """
     4. Refer to the <Format> section to understand the format of the output.
     5. Please adhere to <Key Constraints> when you attempt to answer the user's query.
 
+    <Pages>
+        * Long documents are analysed in parts. If the request contains a <Pages first=".." last=".."> block, you are given only those pages of the document.
+        * Text-only pages are given as their extracted text in a <Page number="N"> tag. Other pages, including every page with images or diagrams, are listed as <Page number="N" attached="true"/> and attached, in order, as a PDF holding just those pages.
+        * Set `page_number` to the document page number from the <Page number="N"> tag, never a page's position in the attached PDF.
+        * Other parts are analysed separately and the results merged, so name topics by their subject, never by where they appear in the document.
+    </Pages>
+
     <Context>
         * A pdf will dicuss many topics and key concepts. A topic can consist of many key concepts. 
             ** Example 1: A chemistry lecture pdf will have topics such as atom.
@@ -1,5 +1,8 @@
 from google.adk.agents.llm_agent import Agent
 
+from agent_common.schemas import AnalysisResult
+from agent_common.video_segments import segment_clip_callback
+
 from . import prompt
 
 video_analyser_agent = Agent(
@@ -7,4 +10,6 @@ video_analyser_agent = Agent(
     name="video_analyser_agent",
     description="A helpful agent to analyse video.",
     instruction=prompt.VIDEO_ANALYSER_PROMPT,
+    output_schema=AnalysisResult,
+    before_model_callback=segment_clip_callback,
 )
@@ -22,6 +22,13 @@ VIDEO_ANALYSER_PROMPT = """
             - You MUST maintain a continuous timeline. Do not jump around.
             - Ensure `timestamp_start` and `timestamp_end` are highly accurate to when the concept is on screen or spoken.
     </LearningGuide>
+
+    <Segments>
+        * Long videos are analysed in parts. If the request contains a tag like <Segment start_seconds="570" end_seconds="1170"/>, you are only shown that part of the video.
+        * Analyse the segment you are shown from start to finish, as if it were the whole video.
+        * Give `timestamp_start` and `timestamp_end` in seconds from the start of the segment (0 is the segment's first frame).
+        * Other segments are analysed separately and the results merged, so name topics by their subject, never by their position in the video.
+    </Segments>
     
     <Context>
         * A video will discuss many topics and key concepts. A topic can consist of many key concepts. 
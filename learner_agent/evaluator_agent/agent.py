@@ -1,5 +1,7 @@
 from google.adk.agents.llm_agent import Agent
 
+from agent_common.schemas import AnalysisEvaluation
+
 from . import prompt
 
 evaluator_agent = Agent(
@@ -7,4 +9,5 @@ evaluator_agent = Agent(
     name="evaluator_agent",
     description="A helpful agent to evaluate the content.",
     instruction=prompt.EVALUATOR_AGENT_PROMPT,
+    output_schema=AnalysisEvaluation,
 )
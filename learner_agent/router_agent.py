@@ -0,0 +1,84 @@
+"""Code-driven routing for resource analysis.
+
+The analyser to use follows from the resource's MIME type, which the backend
+sends in the A2A file part, so no model call is spent choosing it:
+`application/pdf` (or a <Pages> block of extracted PDF text) goes to the pdf
+analyser and `video/*` to the video analyser. A request the router can't
+place (a bare URL of unknown type, or no resource at all) goes to the LLM
+analyser agent, which decides as before.
+
+A share of requests, EVALUATOR_SAMPLE_RATE (default 0), is also checked by
+the evaluator agent after the analysis. Its verdict is logged and kept in
+session state as `analysis_evaluation`; it never replaces the analysis as
+the reply.
+"""
+import logging
+import mimetypes
+import os
+import random
+import re
+from typing import AsyncGenerator, Optional
+
+from google.adk.agents import BaseAgent
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.events import Event, EventActions
+from google.genai import types
+
+logger = logging.getLogger(__name__)
+
+EVALUATOR_SAMPLE_RATE = float(os.getenv("EVALUATOR_SAMPLE_RATE", "0"))
+URL_RE = re.compile(r"(?:https?|gs)://\S+")
+
+
+def resource_mime_type(content: Optional[types.Content]) -> Optional[str]:
+    """MIME type of the resource in a request: the file part's, else guessed from a URL."""
+    parts = (content.parts or []) if content else []
+    for part in parts:
+        data = part.file_data or part.inline_data
+        if data and data.mime_type:
+            return data.mime_type
+    text = "\n".join(p.text for p in parts if p.text)
+    if "<Pages " in text:
+        return "application/pdf"
+    url = URL_RE.search(text)
+    return mimetypes.guess_type(url.group().split("?")[0])[0] if url else None
+
+
+class ResourceRouterAgent(BaseAgent):
+    """Runs the analyser for the resource's type, then maybe the evaluator."""
+
+    pdf_analyser: BaseAgent
+    video_analyser: BaseAgent
+    fallback: BaseAgent
+    evaluator: Optional[BaseAgent] = None
+    evaluator_sample_rate: float = EVALUATOR_SAMPLE_RATE
+
+    def route(self, mime_type: Optional[str]) -> BaseAgent:
+        if mime_type == "application/pdf":
+            return self.pdf_analyser
+        if mime_type and mime_type.startswith("video/"):
+            return self.video_analyser
+        return self.fallback
+
+    async def _run_async_impl(self, ctx: InvocationContext) -> AsyncGenerator[Event, None]:
+        mime_type = resource_mime_type(ctx.user_content)
+        analyser = self.route(mime_type)
+        logger.info(f"Routing {mime_type or 'unknown'} resource to {analyser.name}")
+        async for event in analyser.run_async(ctx):
+            yield event
+
+        if self.evaluator is None or random.random() >= self.evaluator_sample_rate:
+            return
+        # The evaluator's events aren't passed on: the reply is the last
+        # message, and that has to stay the analysis
+        verdict = None
+        async for event in self.evaluator.run_async(ctx):
+            if event.is_final_response() and event.content and event.content.parts:
+                verdict = "".join(p.text or "" for p in event.content.parts)
+        logger.info(f"Evaluation of {analyser.name}'s analysis: {verdict}")
+        yield Event(
+            invocation_id=ctx.invocation_id,
+            author=self.name,
+            branch=ctx.branch,
+            actions=EventActions(state_delta={"analysis_evaluation": verdict}),
+        )
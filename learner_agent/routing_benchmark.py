@@ -0,0 +1,110 @@
+"""Per-resource latency and tokens of learner_agent's routing modes, on a stub model.
+
+    python -m learner_agent.routing_benchmark --resources 20 --seconds-per-1k-tokens 0.01
+
+runs the same PDF and video analysis requests through the code router
+(LEARNER_ROUTING=code) and the LLM chain (LEARNER_ROUTING=llm), each in its
+own process since the mode is fixed when learner_agent is imported, with
+agent_common.stub_model.StubLlm standing in for Gemini.
+"""
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+MODES = ("code", "llm")
+
+
+async def run_mode(args) -> dict:
+    from google.adk.runners import Runner
+    from google.adk.sessions import InMemorySessionService
+    from google.genai import types
+
+    from agent_common.stub_model import StubLlm, use_stub_model
+
+    agent_module = importlib.import_module("learner_agent.agent")
+    if agent_module.LEARNER_ROUTING != args.mode:
+        raise SystemExit(f"Run with LEARNER_ROUTING={args.mode} to benchmark that mode")
+    root_agent = agent_module.root_agent
+    if args.mode == "code":
+        root_agent.evaluator_sample_rate = args.evaluator_rate
+    model = use_stub_model(root_agent, StubLlm(
+        base_latency=args.latency,
+        seconds_per_1k_tokens=args.seconds_per_1k_tokens,
+        pdf_pages=args.pdf_pages,
+        video_seconds=args.video_seconds,
+    ))
+    runner = Runner(app_name="routing_benchmark", agent=root_agent, session_service=InMemorySessionService())
+
+    latencies, calls, tokens, answered = [], [], [], 0
+    for i in range(args.resources):
+        mime_type = "application/pdf" if i % 2 else "video/mp4"
+        message = types.Content(role="user", parts=[
+            types.Part(file_data=types.FileData(file_uri=f"gs://bench/resource-{i}", mime_type=mime_type)),
+            types.Part(text="Analyze this resource thoroughly."),
+        ])
+        session = await runner.session_service.create_session(app_name="routing_benchmark", user_id="bench")
+        calls_before, tokens_before = model.calls, model.prompt_tokens
+        started = time.perf_counter()
+        reply = None
+        async for event in runner.run_async(user_id="bench", session_id=session.id, new_message=message):
+            if event.content and event.content.parts and event.content.parts[0].text:
+                reply = event.content.parts[0].text
+        latencies.append(time.perf_counter() - started)
+        calls.append(model.calls - calls_before)
+        tokens.append(model.prompt_tokens - tokens_before)
+        answered += bool(reply and '"topics"' in reply)
+
+    return {
+        "mode": args.mode,
+        "resources": args.resources,
+        "answered": answered,
+        "latency_mean_seconds": round(statistics.mean(latencies), 3),
+        "model_calls_per_resource": statistics.mean(calls),
+        "prompt_tokens_per_resource": round(statistics.mean(tokens)),
+    }
+
+
+def compare(args) -> list:
+    results = []
+    for mode in MODES:
+        cmd = [sys.executable, "-m", "learner_agent.routing_benchmark", "--mode", mode] + [
+            f"--{name.replace('_', '-')}={value}" for name, value in vars(args).items() if name != "mode"
+        ]
+        env = {**os.environ, "LEARNER_ROUTING": mode}
+        out = subprocess.run(cmd, check=True, capture_output=True, text=True, env=env).stdout
+        results.append(json.loads(out.strip().splitlines()[-1]))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mode", choices=MODES + ("both",), default="both")
+    parser.add_argument("--resources", type=int, default=10, help="Alternately videos and PDFs")
+    parser.add_argument("--latency", type=float, default=0.5, help="Stub model latency per call, seconds")
+    parser.add_argument("--seconds-per-1k-tokens", type=float, default=0.005)
+    parser.add_argument("--pdf-pages", type=int, default=40)
+    parser.add_argument("--video-seconds", type=int, default=600)
+    parser.add_argument("--evaluator-rate", type=float, default=0.0)
+    args = parser.parse_args(argv)
+
+    if args.mode != "both":
+        print(json.dumps(asyncio.run(run_mode(args))))
+        return
+    results = compare(args)
+    for result in results:
+        print(json.dumps(result))
+    code, llm = results
+    print(f"Code routing saves {llm['latency_mean_seconds'] - code['latency_mean_seconds']:.2f}s "
+          f"({1 - code['latency_mean_seconds'] / llm['latency_mean_seconds']:.0%}) and "
+          f"{llm['prompt_tokens_per_resource'] - code['prompt_tokens_per_resource']} prompt tokens "
+          f"({1 - code['prompt_tokens_per_resource'] / llm['prompt_tokens_per_resource']:.0%}) per resource")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,23 @@
 import asyncio
+import functools
 import logging
 import os
 import json
+import time
 from fastmcp import FastMCP
+from opentelemetry import trace
+from prometheus_client import Counter, Histogram, generate_latest, CONTENT_TYPE_LATEST
 from sqlmodel import create_engine, Session, select
+from starlette.requests import Request
+from starlette.responses import Response
 from typing import List, Dict, Any
 
 from models import * # From copied models.py
 
+# Tracing setup is shared with the backend and the agents (agent_common, a
+# path dependency in pyproject.toml)
+from agent_common.tracing import setup_tracing as setup_tracer_provider
+
 # Initialize Logger
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -22,7 +32,61 @@ def get_session():
     with Session(engine) as session:
         yield session
 
+TOOL_LATENCY = Histogram(
+    "mcp_tool_duration_seconds",
+    "Latency of MCP tool calls",
+    ["tool"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+TOOL_ERRORS = Counter(
+    "mcp_tool_errors_total",
+    "MCP tool calls that raised or returned an error message",
+    ["tool"],
+)
+
+tracer = trace.get_tracer("agentic_lms.mcp")
+
+def setup_tracing():
+    """
+    Enables tracing when OTEL_TRACES_EXPORTER is otlp, file or console (see
+    agent_common/tracing.py). Returns ASGI middleware that continues the
+    caller's trace, or [] when off.
+    """
+    if not setup_tracer_provider("mcp-server"):
+        return []
+
+    from opentelemetry.instrumentation.asgi import OpenTelemetryMiddleware
+    from starlette.middleware import Middleware
+    return [Middleware(OpenTelemetryMiddleware)]
+
+def instrumented(fn):
+    """
+    Records latency, errors and a span for a tool. Tools report failures as
+    "Error..." strings rather than raising, so those count as errors too.
+    """
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        with tracer.start_as_current_span(f"mcp.tool.{fn.__name__}") as span:
+            try:
+                result = fn(*args, **kwargs)
+            except Exception:
+                TOOL_ERRORS.labels(fn.__name__).inc()
+                raise
+            finally:
+                TOOL_LATENCY.labels(fn.__name__).observe(time.perf_counter() - started)
+            if isinstance(result, str) and result.startswith("Error"):
+                TOOL_ERRORS.labels(fn.__name__).inc()
+                span.set_status(trace.Status(trace.StatusCode.ERROR, result[:200]))
+            return result
+    return wrapper
+
+@mcp.custom_route("/metrics", methods=["GET"])
+async def metrics(request: Request) -> Response:
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
 @mcp.tool()
+@instrumented
 def get_resource_content(resource_id: int) -> str:
     """
     Retrieves the content of a resource (text) from the database to be analyzed.
@@ -45,6 +109,7 @@ def get_resource_content(resource_id: int) -> str:
         return resource.content
 
 @mcp.tool()
+@instrumented
 def save_study_lab(resource_id: int, topics: List[Dict[str, Any]], key_concepts: List[Dict[str, Any]], occurrences: List[Dict[str, Any]]) -> str:
     """
     Saves the analysis results (Topics, Key Concepts, Occurrences) to the database.
@@ -89,4 +154,4 @@ if __name__ == "__main__":
     port = int(os.getenv("PORT", 8080))
     logger.info(f"🚀 MCP server starting on port {port}")
     # Run simple uvicorn for FastMCP (it has .run() but explicitly controlling it is fine)
-    mcp.run(transport="sse", port=port, host="0.0.0.0")
+    mcp.run(transport="sse", port=port, host="0.0.0.0", middleware=setup_tracing())
@@ -16,6 +16,18 @@ echo "🐘 Starting PostgreSQL (Docker)..."
 docker-compose up -d
 sleep 3 # Wait for DB
 
+# Grading agent replicas on ports 10001, 10011, 10021, ...; the backend
+# balances between them (see backend/app/services/agent_registry.py)
+GRADING_AGENT_REPLICAS=${GRADING_AGENT_REPLICAS:-1}
+GRADING_AGENT_PORTS=$(seq 10001 10 $((10001 + 10 * (GRADING_AGENT_REPLICAS - 1))))
+export GRADING_AGENT_URLS=$(for p in $GRADING_AGENT_PORTS; do printf "http://localhost:%s," $p; done | sed 's/,$//')
+# Set GRADING_AGENT_RELOAD=1 to restart the replicas on code changes; each
+# one then runs its own file watcher and reloader process
+GRADING_AGENT_RELOAD_FLAG=""
+if [ "${GRADING_AGENT_RELOAD:-0}" = "1" ]; then
+  GRADING_AGENT_RELOAD_FLAG="--reload"
+fi
+
 # 2. Start Backend
 echo "🔙 Starting Backend (Port 8000)..."
 cd backend
@@ -41,10 +53,13 @@ uv run uvicorn learner_agent.agent:a2a_app --port 10000 --reload &
 LEARNER_AGENT_PID=$!
 
 # 5. Start Grading Agent
-echo "🤖 Starting Grading Agent (Port 10001)..."
-# Using uv run to execute in the root environment
-uv run uvicorn grading_agent.agent:a2a_app --port 10001 --reload &
-GRADING_AGENT_PID=$!
+GRADING_AGENT_PIDS=()
+for port in $GRADING_AGENT_PORTS; do
+  echo "🤖 Starting Grading Agent (Port $port)..."
+  # Using uv run to execute in the root environment
+  uv run uvicorn grading_agent.agent:a2a_app --port $port $GRADING_AGENT_RELOAD_FLAG &
+  GRADING_AGENT_PIDS+=($!)
+done
 
 # 6. Start Frontend
 echo "🎨 Starting Frontend (Port 3000)..."